@@ -2,6 +2,9 @@ import sqlite3
 import os
 from datetime import datetime, timedelta
 import random
+
+from base_donnees import migrer_schema
+from categories import classer_produits, creer_chemins
 # Chemin absolu vers la base
 db_path = os.path.join(os.path.dirname(__file__), '../data/vente.db')
 def create_db():
@@ -14,6 +17,21 @@ def create_db():
     cursor.execute("DROP TABLE IF EXISTS ventes")
     cursor.execute("DROP TABLE IF EXISTS produits")
     cursor.execute("DROP TABLE IF EXISTS clients")
+    cursor.execute("DROP TABLE IF EXISTS mouvements_stock")
+    cursor.execute("DROP TABLE IF EXISTS snapshots_stock")
+    cursor.execute("DROP TABLE IF EXISTS prix_produits")
+    cursor.execute("DROP TABLE IF EXISTS categories")
+    cursor.execute("DROP TABLE IF EXISTS strates_echantillon")
+    cursor.execute("DROP TABLE IF EXISTS echantillon_ventes")
+    cursor.execute("DROP TABLE IF EXISTS esquisses_jour")
+    cursor.execute("DROP TABLE IF EXISTS esquisses_a_recalculer")
+    for table in ('palmares', 'planchers_palmares', 'palmares_a_recalculer', 'totaux_produits', 'magasins',
+                  'archives_ventes', 'rfm_clients', 'rfm_a_recalculer', 'rfm_version', 'clients_actifs_mois',
+                  'cohortes_a_recalculer', 'tickets'):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    for table in ('produits', 'clients'):
+        for index in ('mots', 'trigrammes'):
+            cursor.execute(f"DROP TABLE IF EXISTS recherche_{table}_{index}")
     # Création des tables
     cursor.execute("""
     CREATE TABLE produits (
@@ -73,6 +91,21 @@ def create_db():
         )
 
     conn.commit()
+    migrer_schema(conn)
+
+    # Rangement des produits de test dans l'arborescence des catégories
+    categories = {
+        1: "Informatique > Ordinateurs",
+        2: "Téléphonie > Smartphones",
+        3: "Image et son > Audio",
+        4: "Informatique > Périphériques > Souris",
+        5: "Informatique > Périphériques > Claviers",
+        6: "Informatique > Périphériques > Écrans",
+        7: "Informatique > Stockage",
+        8: "Image et son > Vidéo",
+    }
+    ids = creer_chemins(conn, categories.values())
+    classer_produits(conn, {produit: ids[chemin] for produit, chemin in categories.items()})
     conn.close()
     print(f"Base créée avec succès : {db_path}")
 
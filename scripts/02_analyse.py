@@ -1,13 +1,26 @@
+import argparse
 import sqlite3
 import pandas as pd
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Tuple, Optional
 import logging
 
+from archives import attacher as attacher_archives
+from base_donnees import migrer_schema
+from categories import ca_par_categorie
+from cohortes import actualiser as actualiser_cohortes, cohortes, retention_moyenne
+from comparaison import MODES, comparer, periodes
+from devises import DEVISE_BASE, DEVISE_RAPPORT, Convertisseur, symbole
+from echanges import publier
+from echantillon import Echantillon
+from esquisses import actualiser as actualiser_esquisses, resume as resume_esquisses
+from palmares import actualiser as actualiser_palmares, meilleurs as meilleurs_palmares
+from segmentation import actualiser as actualiser_segments, calculer as calculer_segments, resumer as resumer_segments
+
 # Configuration
-TAUX_EURO_CFA = 655.96  # Taux de conversion BCEAO
 BASE_DIR = Path(__file__).parent
 DB_PATH = BASE_DIR / "../data/vente.db"
 OUTPUT_DIR = BASE_DIR / "../output"
@@ -33,7 +46,7 @@ class DatabaseError(Exception):
 def verify_database_schema(conn: sqlite3.Connection) -> None:
     """Vérifie que le schéma de la base correspond aux attentes"""
     required_tables = {
-        'ventes': {'id', 'produit_id', 'client_id', 'date', 'quantite'},
+        'ventes': {'id', 'produit_id', 'client_id', 'date', 'quantite', 'prix_unitaire'},
         'produits': {'id', 'nom', 'prix'},
         'clients': {'id', 'nom'}
     }
@@ -69,54 +82,153 @@ def get_db_connection() -> sqlite3.Connection:
     try:
         conn = sqlite3.connect(DB_PATH)
         conn.row_factory = sqlite3.Row
+        migrer_schema(conn)
         verify_database_schema(conn)
+        attacher_archives(conn)  # Les ventes archivées restent dans les indicateurs
         return conn
-    except sqlite3.Error as e:
+    except (sqlite3.Error, ValueError) as e:
         logger.error(f"Erreur de connexion à la base: {e}")
         raise DatabaseError(f"Impossible de se connecter à la base: {e}")
 
 
-def calculate_kpis(conn: sqlite3.Connection) -> Tuple[pd.DataFrame, pd.DataFrame]:
-    """Calcule les indicateurs clés de performance"""
+def calculate_kpis(conn: sqlite3.Connection, devise: str = DEVISE_RAPPORT) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Calcule les indicateurs clés de performance
+
+    Les montants sont agrégés en euros puis convertis dans `devise` : par un
+    facteur unique si le taux n'a pas varié sur la période, sinon à partir
+    des sous-totaux journaliers.
+    """
     try:
-        # CA Total
+        # CA Total (prix en vigueur à la date de chaque vente, sans jointure)
         ca_query = """
         SELECT 
-            SUM(p.prix * v.quantite) as ca_eur,
-            SUM(p.prix * v.quantite) * ? as ca_cfa,
+            SUM(v.prix_unitaire * v.quantite) as ca_eur,
             COUNT(DISTINCT v.client_id) as clients_uniques,
-            AVG(p.prix * v.quantite) as panier_moyen_eur
-        FROM ventes v 
-        JOIN produits p ON v.produit_id = p.id
+            AVG(v.prix_unitaire * v.quantite) as panier_moyen_eur,
+            COUNT(*) as nb_ventes,
+            MIN(v.date) as debut,
+            MAX(v.date) as fin
+        FROM ventes v
         """
-        ca_total = pd.read_sql(ca_query, conn, params=(TAUX_EURO_CFA,))
+        ca_total = pd.read_sql(ca_query, conn)
 
         # Validation des données
         if ca_total.isnull().any().any():
             logger.warning("Certaines valeurs KPIs sont nulles - vérifiez les données source")
 
-        # Top produits
-        top_produits_query = """
-        SELECT 
-            p.nom as produit,
-            SUM(v.quantite) as quantite,
-            SUM(p.prix * v.quantite) as ca_eur,
-            SUM(p.prix * v.quantite) * ? as ca_cfa,
-            ROUND(SUM(p.prix * v.quantite) * 100.0 / 
-                (SELECT SUM(p.prix * v.quantite) FROM ventes v JOIN produits p ON v.produit_id = p.id), 2) as part_marche
-        FROM ventes v
-        JOIN produits p ON v.produit_id = p.id
-        GROUP BY p.nom
-        ORDER BY ca_eur DESC
-        LIMIT 5
-        """
-        top_produits = pd.read_sql(top_produits_query, conn, params=(TAUX_EURO_CFA,))
+        # Top produits : palmarès maintenu par jour et par mois (résumés fusionnés)
+        actualiser_palmares(conn)
+        top_produits = meilleurs_palmares(conn, 'produit', k=5)[['produit', 'quantite', 'ca_eur']]
+        top_produits['quantite'] = top_produits['quantite'].astype(int)
+        ca_eur = ca_total.iloc[0]['ca_eur']
+        top_produits['part_marche'] = (top_produits['ca_eur'] * 100.0 / ca_eur).round(2) if ca_eur else 0.0
 
+        convertir_montants(conn, ca_total, top_produits, devise)
         return ca_total, top_produits
 
     except sqlite3.Error as e:
         logger.error(f"Erreur lors du calcul des KPIs: {e}")
         raise DatabaseError(f"Erreur d'exécution des requêtes: {e}")
+    except KeyError as e:
+        logger.error(f"Conversion impossible: {e}")
+        raise DatabaseError(f"Taux de change manquant: {e}")
+
+
+def convertir_montants(conn: sqlite3.Connection, ca_total: pd.DataFrame, top_produits: pd.DataFrame,
+                       devise: str) -> None:
+    """Ajoute les colonnes ca_devise/devise aux agrégats calculés en euros"""
+    convertisseur = Convertisseur(conn)
+    debut, fin = ca_total.iloc[0]['debut'], ca_total.iloc[0]['fin']
+    facteur = convertisseur.facteur_constant(DEVISE_BASE, devise, debut, fin) if debut else 1.0
+
+    if facteur is not None:
+        ca_total['ca_devise'] = ca_total['ca_eur'] * facteur
+        top_produits['ca_devise'] = top_produits['ca_eur'] * facteur
+    else:
+        # Taux variable : conversion des sous-totaux journaliers
+        par_jour = pd.read_sql(
+            """SELECT p.nom as produit, v.date, SUM(v.prix_unitaire * v.quantite) as ca_eur
+            FROM ventes v JOIN produits p ON v.produit_id = p.id
+            GROUP BY p.nom, v.date""",
+            conn
+        )
+        par_jour['ca_devise'] = convertisseur.convertir(par_jour['ca_eur'], par_jour['date'], DEVISE_BASE, devise)
+        ca_total['ca_devise'] = par_jour['ca_devise'].sum()
+        top_produits['ca_devise'] = top_produits['produit'].map(par_jour.groupby('produit')['ca_devise'].sum())
+
+    ca_total['panier_moyen_devise'] = ca_total['ca_devise'] / ca_total['nb_ventes']
+    ca_total['devise'] = devise
+    top_produits['devise'] = devise
+
+
+def calculate_categories(conn: sqlite3.Connection, devise: str = DEVISE_RAPPORT) -> pd.DataFrame:
+    """CA par catégorie de premier niveau (lisible quel que soit le nombre de produits)"""
+    try:
+        arbre = ca_par_categorie(conn, devise=devise)
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Erreur d'agrégation par catégorie: {e}")
+    except KeyError as e:
+        raise DatabaseError(f"Taux de change manquant: {e}")
+    racines = arbre[arbre['profondeur'] == 0].rename(columns={'nom': 'categorie'})
+    racines = racines[racines['ca_eur'] > 0].sort_values('ca_eur', ascending=False)
+    return racines[['categorie', 'quantite', 'ca_eur', 'ca_devise']].assign(devise=devise)
+
+
+def calculate_distributions(conn: sqlite3.Connection, devise: str = DEVISE_RAPPORT) -> pd.DataFrame:
+    """Clients distincts et quantiles des paniers, par fusion des esquisses journalières"""
+    try:
+        actualiser_esquisses(conn)
+        return pd.DataFrame([resume_esquisses(conn, devise=devise)])
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Erreur de calcul des esquisses: {e}")
+    except KeyError as e:
+        raise DatabaseError(f"Taux de change manquant: {e}")
+
+
+def calculate_evolutions(conn: sqlite3.Connection, devise: str = DEVISE_RAPPORT) -> pd.DataFrame:
+    """
+    Évolution du CA par produit jusqu'au jour de la dernière vente : mois
+    en cours et cumul annuel, chacun face à sa période de référence (totaux
+    par produit enregistrés, sans relecture des ventes)
+    """
+    colonnes = ['mode', 'debut', 'fin', 'debut_reference', 'fin_reference', 'produit',
+                'ca_courant', 'ca_reference', 'ecart', 'evolution']
+    evolutions = []
+    try:
+        dernier = conn.execute("SELECT MAX(date) FROM ventes").fetchone()[0]
+        convertisseur = Convertisseur(conn)
+        for mode in ('mois', 'cumul_annuel') if dernier else ():
+            courante, reference = periodes(mode, dernier[:10])
+            evolution = comparer(conn, 'produit', courante, reference, devise, convertisseur)
+            evolutions.append(evolution.assign(mode=mode, debut=courante[0], fin=courante[1],
+                                               debut_reference=reference[0], fin_reference=reference[1]))
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Erreur de comparaison des périodes: {e}")
+    except KeyError as e:
+        raise DatabaseError(f"Taux de change manquant: {e}")
+    if not evolutions:
+        return pd.DataFrame(columns=colonnes + ['devise'])
+    return pd.concat(evolutions, ignore_index=True)[colonnes].assign(devise=devise)
+
+
+def calculate_segments(conn: sqlite3.Connection, devise: str = DEVISE_RAPPORT) -> pd.DataFrame:
+    """Segments RFM des clients, enregistrés après recalcul des seuls clients touchés"""
+    try:
+        actualiser_segments(conn)
+        return resumer_segments(calculer_segments(conn), conn, devise).assign(devise=devise)
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Erreur de segmentation des clients: {e}")
+    except KeyError as e:
+        raise DatabaseError(f"Taux de change manquant: {e}")
+
+
+def calculate_cohortes(conn: sqlite3.Connection) -> pd.DataFrame:
+    """Clients actifs par cohorte de premier achat et ancienneté, après recalcul des seuls mois touchés"""
+    try:
+        actualiser_cohortes(conn)
+        return cohortes(conn)
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Erreur de calcul des cohortes: {e}")
 
 
 def export_results(df: pd.DataFrame, filename: str, output_dir: Path = OUTPUT_DIR) -> None:
@@ -138,7 +250,9 @@ def export_results(df: pd.DataFrame, filename: str, output_dir: Path = OUTPUT_DI
         raise
 
 
-def generate_report(ca_total: pd.DataFrame, top_produits: pd.DataFrame) -> str:
+def generate_report(ca_total: pd.DataFrame, top_produits: pd.DataFrame,
+                    paniers: Optional[pd.DataFrame] = None, evolutions: Optional[pd.DataFrame] = None,
+                    segments: Optional[pd.DataFrame] = None, effectifs: Optional[pd.DataFrame] = None) -> str:
     """Génère un rapport textuel des résultats"""
     report = []
     report.append("\n=== RAPPORT D'ANALYSE ===")
@@ -146,20 +260,97 @@ def generate_report(ca_total: pd.DataFrame, top_produits: pd.DataFrame) -> str:
 
     if not ca_total.empty:
         report.append("\n=== INDICATEURS CLÉS ===")
-        report.append(f"• CA Total: {ca_total.iloc[0]['ca_eur']:,.2f} € ({ca_total.iloc[0]['ca_cfa']:,.0f} FCFA)")
-        report.append(f"• Clients uniques: {ca_total.iloc[0]['clients_uniques']}")
-        report.append(f"• Panier moyen: {ca_total.iloc[0]['panier_moyen_eur']:,.2f} €")
+        kpis = ca_total.iloc[0]
+        libelle = symbole(kpis['devise'])
+        report.append(f"• CA Total: {kpis['ca_eur']:,.2f} € ({kpis['ca_devise']:,.0f} {libelle})")
+        report.append(f"• Clients uniques: {kpis['clients_uniques']}")
+        report.append(f"• Panier moyen: {kpis['panier_moyen_eur']:,.2f} € ({kpis['panier_moyen_devise']:,.0f} {libelle})")
 
     if not top_produits.empty:
         report.append("\n=== TOP 5 PRODUITS ===")
         with pd.option_context('display.float_format', '{:,.2f}'.format):
-            report.append(top_produits.to_string(index=False))
+            report.append(top_produits.drop(columns=['devise']).to_string(index=False))
+
+    if paniers is not None and not paniers.empty and paniers.iloc[0]['nb_ventes']:
+        report.append("\n=== CLIENTS ET PANIERS (esquisses) ===")
+        p = paniers.iloc[0]
+        libelle = symbole(p['devise'])
+        report.append(f"• Clients distincts: ~{p['clients_uniques']:,.0f} (erreur type {p['erreur_clients']:.1%})")
+        report.append(f"• Valeur des paniers: médiane {p['panier_p50']:,.0f}, p90 {p['panier_p90']:,.0f}, "
+                      f"p99 {p['panier_p99']:,.0f} {libelle} (à {p['erreur_quantiles']:.0%} près)")
+        report.append(f"• Articles par panier: médiane {p['quantite_p50']:.0f}, p90 {p['quantite_p90']:.0f}, "
+                      f"p99 {p['quantite_p99']:.0f}")
+
+    if evolutions is not None and not evolutions.empty:
+        report.append("\n=== ÉVOLUTION ===")
+        libelle = symbole(evolutions['devise'].iloc[0])
+        for mode, evolution in evolutions.groupby('mode', sort=False):
+            e = evolution.iloc[0]
+            courant, reference = evolution['ca_courant'].sum(), evolution['ca_reference'].sum()
+            variation = f"{courant / reference - 1:+.1%}" if reference else "n.d."
+            report.append(f"• {MODES[mode]} ({e['debut']} au {e['fin']} / {e['debut_reference']} au "
+                          f"{e['fin_reference']}): {courant:,.0f} {libelle} contre {reference:,.0f} ({variation})")
+            for titre, lignes in (("hausses", evolution[evolution['ecart'] > 0].nlargest(3, 'ecart')),
+                                  ("baisses", evolution[evolution['ecart'] < 0].nsmallest(3, 'ecart'))):
+                if not lignes.empty:
+                    report.append(f"    Plus fortes {titre}: " + ", ".join(
+                        f"{l.produit} ({l.ecart:+,.0f} {libelle}"
+                        + (f", {l.evolution:+.1%})" if pd.notna(l.evolution) else ")")
+                        for l in lignes.itertuples()))
+
+    if segments is not None and not segments.empty:
+        report.append("\n=== SEGMENTS CLIENTS (RFM) ===")
+        libelle = symbole(segments['devise'].iloc[0])
+        for seg in segments.itertuples():
+            report.append(f"• {seg.segment}: {seg.clients:,} clients ({seg.part:.0%}), {seg.frequence:.1f} achats "
+                          f"en moyenne, dernier il y a {seg.recence:.0f} jours, {seg.montant_moyen:,.0f} {libelle} par client")
+
+    if effectifs is not None and not effectifs.empty:
+        report.append("\n=== RÉTENTION PAR COHORTE ===")
+        report.append(f"• {len(effectifs)} cohortes ({effectifs.index[0]} à {effectifs.index[-1]}), "
+                      f"{effectifs[0].sum():,} clients")
+        moyennes = retention_moyenne(effectifs)
+        if not moyennes.empty:
+            report.append("• Encore actifs après " + ", ".join(f"{n} mois: {part:.0%}" for n, part in moyennes.items()))
 
     return "\n".join(report)
 
 
-def analyser_ventes() -> Optional[bool]:
-    """Workflow principal d'analyse avec gestion complète des erreurs"""
+def generate_approximate_report(echantillon: Echantillon) -> str:
+    """Rapport provisoire estimé sur l'échantillon stratifié, avec intervalles à 95 %"""
+    estimations = echantillon.estimer()
+    libelle = symbole(echantillon.devise)
+    report = [
+        "\n=== ESTIMATIONS PROVISOIRES ===",
+        f"Échantillon: {len(echantillon.ventes):,} ventes sur {echantillon.nb_ventes:,} (IC 95 %)",
+    ]
+    ca, marge_ca = estimations['ca']
+    panier, marge_panier = estimations['panier_moyen']
+    report.append(f"• CA Total: {ca:,.0f} ± {marge_ca:,.0f} {libelle}")
+    report.append(f"• Panier moyen: {panier:,.0f} ± {marge_panier:,.0f} {libelle}")
+    report.append("• Parts de CA:")
+    for ligne in echantillon.parts().head(5).itertuples():
+        report.append(f"    {ligne.produit}: {ligne.part:.1%} ± {ligne.marge_part:.1%}")
+    return "\n".join(report)
+
+
+def calculate_exact() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Indicateurs exacts sur une connexion dédiée (utilisable depuis un autre thread)"""
+    conn = get_db_connection()
+    try:
+        ca_total, top_produits = calculate_kpis(conn)
+        return ca_total, top_produits, calculate_categories(conn)
+    finally:
+        conn.close()
+
+
+def analyser_ventes(approche: bool = False, csv: bool = False) -> Optional[bool]:
+    """Workflow principal d'analyse avec gestion complète des erreurs
+
+    En mode approché, des estimations sur l'échantillon sont affichées
+    immédiatement pendant que les indicateurs exacts sont calculés en fond.
+    Avec `csv`, les tables publiées sont aussi exportées en CSV.
+    """
     conn = None
     try:
         logger.info("Début de l'analyse des ventes")
@@ -169,16 +360,34 @@ def analyser_ventes() -> Optional[bool]:
         logger.info("Connexion à la base établie avec succès")
 
         # 2. Calcul des indicateurs
-        ca_total, top_produits = calculate_kpis(conn)
+        if approche:
+            with ThreadPoolExecutor(max_workers=1) as executeur:
+                calcul = executeur.submit(calculate_exact)
+                try:
+                    print(generate_approximate_report(Echantillon(conn)))
+                except (sqlite3.Error, KeyError) as e:
+                    logger.warning(f"Estimations indisponibles: {e}")
+                ca_total, top_produits, ca_categories = calcul.result()
+        else:
+            ca_total, top_produits = calculate_kpis(conn)
+            ca_categories = calculate_categories(conn)
+        paniers = calculate_distributions(conn)
+        evolutions = calculate_evolutions(conn)
+        segments = calculate_segments(conn)
+        effectifs = calculate_cohortes(conn)
         logger.info("Calcul des indicateurs terminé")
 
         # 3. Génération et affichage du rapport
-        report = generate_report(ca_total, top_produits)
+        report = generate_report(ca_total, top_produits, paniers, evolutions, segments, effectifs)
         print(report)
 
-        # 4. Export des résultats
-        export_results(top_produits, 'top_produits.csv')
-        export_results(ca_total, 'ca_total.csv')
+        # 4. Publication des résultats pour les étapes suivantes (CSV en option, pour lecture humaine)
+        for nom, table in (('top_produits', top_produits), ('ca_total', ca_total),
+                           ('ca_categories', ca_categories), ('distribution_paniers', paniers),
+                           ('evolution_produits', evolutions)):
+            publier(table, nom)
+            if csv:
+                export_results(table, f'{nom}.csv')
 
         # 5. Export du rapport texte
         with open(OUTPUT_DIR / 'rapport_analyse.txt', 'w', encoding='utf-8') as f:
@@ -200,8 +409,15 @@ def analyser_ventes() -> Optional[bool]:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse des ventes")
+    parser.add_argument("--approche", action="store_true",
+                        help="Affiche d'abord des estimations sur l'échantillon, puis les valeurs exactes")
+    parser.add_argument("--csv", action="store_true",
+                        help="Exporte aussi les résultats en CSV (top_produits.csv, ca_total.csv...)")
+    args = parser.parse_args()
+
     print("=== DÉBUT DE L'ANALYSE ===")
-    success = analyser_ventes()
+    success = analyser_ventes(args.approche, args.csv)
     status = "SUCCÈS" if success else "ÉCHEC"
     print(f"\n=== ANALYSE TERMINÉE - {status} ===")
     if not success:
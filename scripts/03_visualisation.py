@@ -1,10 +1,12 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 import sys
 from pathlib import Path
 
+from devises import DEVISE_RAPPORT, symbole
+from echanges import lire
+
 # Configuration
 output_dir = Path(__file__).parent.parent / 'output'
 os.makedirs(output_dir, exist_ok=True)
@@ -26,26 +28,32 @@ def setup_plot_style():
 
 
 def load_and_validate_data():
-    """Charge et valide les données d'entrée"""
-    input_file = output_dir / 'top_produits.csv'
-    if not input_file.exists():
-        raise FileNotFoundError(f"Fichier {input_file} introuvable. Exécutez d'abord 02_analyse.py")
-
-    df = pd.read_csv(input_file)
+    """Charge les produits publiés par 02_analyse.py (schéma contrôlé à la publication)"""
+    df = lire('top_produits')
     print("Colonnes détectées:", list(df.columns))
+    return df.sort_values('ca_devise', ascending=False)
 
-    required_cols = ['produit', 'ca_cfa']
-    missing_cols = [col for col in required_cols if col not in df.columns]
-    if missing_cols:
-        raise KeyError(f"Colonnes manquantes: {missing_cols}. Colonnes disponibles: {list(df.columns)}")
 
-    return df.sort_values('ca_cfa', ascending=False)
+def load_categories():
+    """Charge le CA par catégorie de premier niveau s'il a été publié"""
+    try:
+        categories = lire('ca_categories')
+    except FileNotFoundError:
+        return None
+    return categories if not categories.empty else None
 
 
-def create_visualizations(df):
+def create_visualizations(df, categories=None):
     """Crée les visualisations"""
+    libelle = symbole(df['devise'].iloc[0] if 'devise' in df.columns else DEVISE_RAPPORT)
+
+    # Le camembert porte sur les catégories de premier niveau quand elles
+    # existent : il reste lisible quel que soit le nombre de produits
+    parts = categories.rename(columns={'categorie': 'produit'}) if categories is not None else df.copy()
+    detail = 'catégorie' if categories is not None else 'produit'
+
     # Calcul des pourcentages
-    df['pourcentage'] = df['ca_cfa'] / df['ca_cfa'].sum() * 100
+    parts['pourcentage'] = parts['ca_devise'] / parts['ca_devise'].sum() * 100
 
     # Création de la figure
     fig, (ax1, ax2) = plt.subplots(1, 2)
@@ -55,11 +63,11 @@ def create_visualizations(df):
     bar_plot = sns.barplot(
         data=df,
         x='produit',
-        y='ca_cfa',
+        y='ca_devise',
         palette='viridis',
         ax=ax1
     )
-    ax1.set(title='CA par Produit (FCFA)', xlabel='', ylabel='Montant en FCFA')
+    ax1.set(title=f'CA par Produit ({libelle})', xlabel='', ylabel=f'Montant en {libelle}')
     ax1.tick_params(axis='x', rotation=45)
 
     # Ajout des valeurs sur les barres
@@ -74,21 +82,22 @@ def create_visualizations(df):
 
     # Camembert
     pie_wedges, _, _ = ax2.pie(
-        df['ca_cfa'],
-        labels=df['produit'],
+        parts['ca_devise'],
+        labels=parts['produit'],
         autopct='%1.1f%%',
         startangle=90,
         colors=sns.color_palette('pastel'),
         textprops={'fontsize': 10},
         wedgeprops={'linewidth': 1, 'edgecolor': 'white'}
     )
-    ax2.set_title('Répartition du CA')
+    ax2.set_title(f'Répartition du CA par {detail}')
 
     # Légende
     ax2.legend(
         pie_wedges,
-        [f"{n}: {v:,.0f} FCFA ({p:.1f}%)" for n, v, p in zip(df['produit'], df['ca_cfa'], df['pourcentage'])],
-        title='Détail par produit',
+        [f"{n}: {v:,.0f} {libelle} ({p:.1f}%)"
+         for n, v, p in zip(parts['produit'], parts['ca_devise'], parts['pourcentage'])],
+        title=f'Détail par {detail}',
         loc='center left',
         bbox_to_anchor=(1, 0.5)
     )
@@ -109,7 +118,7 @@ def visualiser_cfa():
         df = load_and_validate_data()
 
         # Visualisation
-        fig = create_visualizations(df)
+        fig = create_visualizations(df, load_categories())
 
         # Sauvegarde
         output_file = output_dir / 'repartition_ca.png'
@@ -1,9 +1,11 @@
 from fpdf import FPDF
-import pandas as pd
 from pathlib import Path
 import logging
 from datetime import datetime
 
+from devises import DEVISE_RAPPORT, symbole
+from echanges import lire
+
 # Configuration du logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -45,38 +47,28 @@ def generer_rapport():
         OUTPUT_DIR = BASE_DIR.parent / "output"
         OUTPUT_DIR.mkdir(exist_ok=True)
 
-        csv_path = OUTPUT_DIR / "top_produits.csv"
-        logger.info(f"Recherche du fichier de donnees: {csv_path}")
-
-        if not csv_path.exists():
-            raise FileNotFoundError(f"Fichier {csv_path} introuvable")
-
         # Initialisation PDF
         pdf = PDFReport()
         pdf.add_page()
 
         # 1. Chargement des donnees
-        df = pd.read_csv(csv_path)
+        df = lire('top_produits')  # Colonnes et types garantis à la publication
         logger.info("Donnees chargees avec succes")
 
-        # Verification des colonnes requises
-        required_columns = {'produit', 'quantite', 'ca_cfa'}
-        if not required_columns.issubset(df.columns):
-            missing = required_columns - set(df.columns)
-            raise ValueError(f"Colonnes manquantes: {missing}. Colonnes disponibles: {list(df.columns)}")
-
         # 2. Metriques principales
         pdf.add_section_title("Resultats Cles")
         pdf.set_font("helvetica", size=12)
 
         # Calcul des metriques
-        ca_total = df['ca_cfa'].sum()
-        produit_phare = df.loc[df['ca_cfa'].idxmax(), 'produit']
+        devise = df['devise'].iloc[0] if 'devise' in df.columns else DEVISE_RAPPORT
+        libelle = symbole(devise) if symbole(devise).isascii() else devise  # Polices core PDF
+        ca_total = df['ca_devise'].sum()
+        produit_phare = df.loc[df['ca_devise'].idxmax(), 'produit']
         quantite_totale = df['quantite'].sum()
 
         # Utilisation de caracteres simples
         texte_metriques = (
-            f"- Chiffre d'affaires total : {ca_total:,.0f} FCFA\n"
+            f"- Chiffre d'affaires total : {ca_total:,.0f} {libelle}\n"
             f"- Produit phare : {produit_phare}\n"
             f"- Quantite totale vendue : {quantite_totale:,.0f} unites"
         )
@@ -103,7 +95,7 @@ def generer_rapport():
         pdf.set_font("helvetica", "B", 12)
         col_widths = [80, 40, 60]
 
-        for col, width in zip(["Produit", "Quantite", "CA (FCFA)"], col_widths):
+        for col, width in zip(["Produit", "Quantite", f"CA ({libelle})"], col_widths):
             pdf.cell(width, 10, col, border=1, align="C", fill=True)
         pdf.ln()
 
@@ -112,8 +104,37 @@ def generer_rapport():
         for _, row in df.iterrows():
             pdf.cell(col_widths[0], 10, row["produit"], border=1)
             pdf.cell(col_widths[1], 10, f"{row['quantite']:,}", border=1, align="R")
-            pdf.cell(col_widths[2], 10, f"{row['ca_cfa']:,.0f}", border=1, align="R")
+            pdf.cell(col_widths[2], 10, f"{row['ca_devise']:,.0f}", border=1, align="R")
+            pdf.ln()
+
+        # 5. Evolution sur un an (cumul annuel face a la meme periode de l'an dernier)
+        try:
+            evolutions = lire('evolution_produits')
+        except FileNotFoundError as e:
+            logger.warning(f"Evolution non disponible: {e}")
+            evolutions = None
+        cumul = evolutions[evolutions['mode'] == 'cumul_annuel'] if evolutions is not None else None
+        if cumul is not None and not cumul.empty:
+            pdf.add_page()
+            pdf.add_section_title("Evolution par Produit")
+            pdf.set_font("helvetica", size=10)
+            e = cumul.iloc[0]
+            pdf.multi_cell(0, 8, f"Du {e['debut']} au {e['fin']}, par rapport au {e['debut_reference']} "
+                                 f"au {e['fin_reference']}")
+            pdf.ln(2)
+            pdf.set_font("helvetica", "B", 12)
+            col_widths = [70, 45, 45, 30]
+            for col, width in zip(["Produit", f"CA ({libelle})", "Reference", "Evolution"], col_widths):
+                pdf.cell(width, 10, col, border=1, align="C", fill=True)
             pdf.ln()
+            pdf.set_font("helvetica", size=10)
+            for _, row in cumul.head(10).iterrows():
+                pdf.cell(col_widths[0], 10, row["produit"], border=1)
+                pdf.cell(col_widths[1], 10, f"{row['ca_courant']:,.0f}", border=1, align="R")
+                pdf.cell(col_widths[2], 10, f"{row['ca_reference']:,.0f}", border=1, align="R")
+                evolution = f"{row['evolution']:+.1%}" if row['evolution'] == row['evolution'] else "n.d."
+                pdf.cell(col_widths[3], 10, evolution, border=1, align="R")
+                pdf.ln()
 
         # Sauvegarde du rapport
         rapport_path = OUTPUT_DIR / "rapport_ventes.pdf"
@@ -1,4 +1,5 @@
 # 1. Importations standards
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import sys
 from pathlib import Path
@@ -13,9 +14,38 @@ import plotly.express as px
 
 # 3. Importations locales (vos modules)
 from report_generator import ReportGenerator
+from archives import attacher as attacher_archives
+from associations import CONFIANCE_MIN, SUPPORT_MIN, analyser as analyser_paniers
+from base_donnees import connecter
+from categories import ca_par_categorie, ca_produits_categorie, chemin_categorie
+from cohortes import cohortes, retention, retention_moyenne
+from colonnaire import partager
+from comparaison import MODES, comparer, periodes
+from devises import DEVISE_BASE, DEVISE_RAPPORT, Convertisseur, symbole
+from echantillon import Echantillon
+from esquisses import resume as resume_esquisses
+from federation import RESEAU, interroger, magasins
+from filtres_croises import MoteurFiltres
+from palmares import par_mois
+from recherche import rechercher
+from segmentation import CLASSES, calculer as calculer_segments, resumer as resumer_segments
+from sous_echantillonnage import LARGEUR_GRAPHIQUE, fenetre, sous_echantillonner
+from stock import etat_stock, points_de_commande
 # Configuration des chemins
 output_dir = Path(__file__).parent.parent / 'output'
 DB_PATH = Path(__file__).parent.parent / 'data' / 'users.db'
+# Fragments (reruns partiels) : st.fragment, ou st.experimental_fragment avant Streamlit 1.37
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda f: f)
+
+
+def fragment_periodique(secondes):
+    """Fragment relancé toutes les `secondes` (simple fonction sans support des fragments)"""
+    decorateur = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+    return decorateur(run_every=secondes) if decorateur else (lambda f: f)
+
+
+PRODUITS_GRAPHIQUE = 30  # Barres affichées dans la répartition par produit
+LIGNES_TABLE = 10_000  # Lignes envoyées au navigateur dans le tableau détaillé
 
 
 # ---- PARTIE AUTHENTIFICATION ----
@@ -104,47 +134,146 @@ def login_page():
                 st.error("Identifiants incorrects")
 
 # ---- PARTIE DASHBOARD ----
+@st.cache_resource(ttl=600)
+def charger_convertisseur():
+    """Charge la table des taux de change (partagée entre les sessions)"""
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        return Convertisseur(conn)
+    finally:
+        conn.close()
+
+
+def devise_affichage():
+    """Devise choisie dans la barre latérale"""
+    return st.session_state.get('devise', DEVISE_RAPPORT)
+
+
+def libelle_devise():
+    """Libellé de la devise d'affichage"""
+    return symbole(devise_affichage())
+
+
 def load_data():
     """
     Charge les données depuis la base SQLite et les prépare pour l'analyse.
     Retourne un DataFrame consolidé avec les ventes, produits et clients.
+
+    Exécutée dans le thread de fond de calcul_ventes, où st.error n'a pas de
+    contexte de script : les erreurs remontent par le Future et sont
+    affichées par le script principal (main_dashboard).
     """
+    db_path = Path(__file__).parent / "../data/vente.db"
+    conn = sqlite3.connect(db_path)
     try:
-        db_path = Path(__file__).parent / "../data/vente.db"
-        conn = sqlite3.connect(db_path)
+        attacher_archives(conn)
 
         # Chargement des tables avec des alias pour éviter les conflits de noms
         df_ventes = pd.read_sql("SELECT * FROM ventes", conn)
         df_produits = pd.read_sql("SELECT id as produit_id, nom, prix FROM produits", conn)
         df_clients = pd.read_sql("SELECT id as client_id, nom FROM clients", conn)
+    finally:
+        conn.close()
+
+    # Sans vente : DataFrame vide, signalé par le script principal
+    if df_ventes.empty:
+        return pd.DataFrame()
 
-        # Fusion des DataFrames en vérifiant les colonnes
-        if not df_ventes.empty:
-            df = pd.merge(df_ventes, df_produits, on="produit_id")
-            df = pd.merge(df, df_clients, on="client_id")
+    # Fusion des DataFrames en vérifiant les colonnes
+    df = pd.merge(df_ventes, df_produits, on="produit_id")
+    df = pd.merge(df, df_clients, on="client_id")
+
+    # Conversion des dates et calculs
+    df['date'] = pd.to_datetime(df['date'])
+    df['mois'] = df['date'].dt.strftime('%Y-%m')
+    df['jour'] = df['date'].dt.normalize()
+    # Prix facturé à la date de la vente, prix catalogue à défaut
+    prix_vente = df['prix_unitaire'].fillna(df['prix']) if 'prix_unitaire' in df.columns else df['prix']
+    df['chiffre_affaires'] = df['quantite'] * prix_vente
+
+    # Suppression uniquement des colonnes existantes
+    cols_to_drop = [col for col in ['id', 'id_vente'] if col in df.columns]
+    if cols_to_drop:
+        df = df.drop(columns=cols_to_drop)
+    return df
+
+def version_donnees():
+    """Empreinte de la base : change à chaque écriture (fichier principal ou journal WAL)"""
+    base = Path(__file__).parent / "../data/vente.db"
+    return tuple(
+        f.stat().st_mtime_ns if f.exists() else 0 for f in (base, base.with_name(base.name + '-wal'))
+    )
 
-            # Conversion des dates et calculs
-            df['date'] = pd.to_datetime(df['date'])
-            df['mois'] = df['date'].dt.strftime('%Y-%m')
-            df['chiffre_affaires'] = df['quantite'] * df['prix']
 
-            # Suppression uniquement des colonnes existantes
-            cols_to_drop = [col for col in ['id', 'id_vente'] if col in df.columns]
-            if cols_to_drop:
-                df = df.drop(columns=cols_to_drop)
+@st.cache_resource
+def executeur_calculs():
+    """Thread de fond des chargements complets, partagé entre sessions"""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="calcul-exact")
 
-            conn.close()
-            return df
-        else:
-            st.warning("Aucune donnée de vente trouvée dans la base.")
-            return pd.DataFrame()
 
-    except sqlite3.Error as e:
-        st.error(f"Erreur de base de données : {str(e)}")
-        return pd.DataFrame()
-    except Exception as e:
-        st.error(f"Erreur de traitement : {str(e)}")
-        return pd.DataFrame()
+@st.cache_resource(max_entries=2)
+def calcul_ventes(version, devise):
+    """
+    Chargement complet des ventes, lancé en fond une seule fois par état de
+    la base et par devise : le mode approché répond pendant ce temps.
+
+    Le premier processus qui charge un état l'écrit en instantané colonnaire ;
+    les autres (workers, redémarrages) le projettent en mémoire sans copie.
+    """
+    return executeur_calculs().submit(partager, (version, devise), lambda: charger_ventes(devise))
+
+
+def preparer_ventes(version, devise):
+    """
+    Ventes préparées, partagées entre reruns, sessions et processus (ni
+    rechargées ni copiées). Attend la fin du chargement de fond si besoin.
+    Le DataFrame retourné est en lecture seule ; produits, clients et mois
+    y sont des catégories.
+    """
+    calcul = calcul_ventes(version, devise)
+    if calcul.exception() is not None:
+        calcul_ventes.clear()  # Ne pas garder un échec en cache
+    return calcul.result()
+
+
+def charger_ventes(devise):
+    """Charge les ventes et ajoute le CA dans la devise d'affichage"""
+    df = load_data()
+    if df.empty:
+        return df
+
+    # Vérification et renommage des colonnes
+    if 'nom_x' in df.columns and 'nom_y' in df.columns:
+        df = df.rename(columns={'nom_x': 'produit', 'nom_y': 'client'})
+    elif 'nom_x' in df.columns:
+        df = df.rename(columns={'nom_x': 'produit'})
+
+    # Conversion du CA (en euros) dans la devise d'affichage, au taux de la date de vente
+    if 'chiffre_affaires' in df.columns:
+        df['ca_devise'] = charger_convertisseur().convertir(
+            df['chiffre_affaires'], df['date'], DEVISE_BASE, devise
+        )
+    return df
+
+
+@st.cache_resource(max_entries=2)
+def charger_echantillon(version, devise):
+    """Échantillon stratifié des ventes et ses index de filtres (chargement rapide)"""
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        echantillon = Echantillon(conn, devise, charger_convertisseur())
+    finally:
+        conn.close()
+    return echantillon, MoteurFiltres(echantillon.ventes)
+
+
+def relancer_panneau():
+    """Relance uniquement le fragment courant quand Streamlit le permet"""
+    try:
+        st.rerun(scope="fragment")
+    except TypeError:
+        st.rerun()
+
 
 def display_metrics(df):
     """Affiche les indicateurs clés"""
@@ -157,9 +286,9 @@ def display_metrics(df):
 
     try:
         metrics = {
-            "CA Total": f"{df['ca_cfa'].sum():,.0f} FCFA",
-            "Produit Phare": df.loc[df['ca_cfa'].idxmax(), 'produit'],
-            "Panier Moyen": f"{df['ca_cfa'].sum() / df['quantite'].sum():,.0f} FCFA",
+            "CA Total": f"{df['ca_devise'].sum():,.0f} {libelle_devise()}",
+            "Produit Phare": df.loc[df['ca_devise'].idxmax(), 'produit'],
+            "Panier Moyen": f"{df['ca_devise'].sum() / df['quantite'].sum():,.0f} {libelle_devise()}",
             "Transactions": f"{df['quantite'].sum():,.0f}"
         }
 
@@ -194,7 +323,7 @@ def display_charts(df):
         try:
             fig = px.pie(
                 df,
-                values='ca_cfa',
+                values='ca_devise',
                 names='produit',
                 title='Répartition du CA par Produit',
                 hole=0.4,
@@ -208,14 +337,14 @@ def display_charts(df):
     with tab2:
         try:
             if 'mois' in df.columns:
-                monthly = df.groupby('mois', as_index=False).agg({'ca_cfa': 'sum', 'quantite': 'sum'})
+                monthly = df.groupby('mois', as_index=False).agg({'ca_devise': 'sum', 'quantite': 'sum'})
                 fig = px.line(
                     monthly,
                     x='mois',
-                    y='ca_cfa',
+                    y='ca_devise',
                     title='Évolution Mensuelle du CA',
                     markers=True,
-                    labels={'ca_cfa': 'CA (FCFA)', 'mois': 'Mois'}
+                    labels={'ca_devise': f'CA ({libelle_devise()})', 'mois': 'Mois'}
                 )
                 st.plotly_chart(fig, use_container_width=True)
             else:
@@ -226,9 +355,9 @@ def display_charts(df):
     with tab3:
         try:
             fig = px.bar(
-                df.sort_values('ca_cfa', ascending=False),
+                df.sort_values('ca_devise', ascending=False),
                 x='produit',
-                y=['ca_cfa', 'quantite'],
+                y=['ca_devise', 'quantite'],
                 barmode='group',
                 title='Comparaison Produits',
                 labels={'value': 'Valeur', 'variable': 'Métrique'},
@@ -249,7 +378,7 @@ def display_data_table(df):
     with st.expander("🔎 Filtres", expanded=True):
         col1, col2 = st.columns(2)
         with col1:
-            min_ca = st.slider("CA Minimum (FCFA)", 0, int(df['ca_cfa'].max()), 0)
+            min_ca = st.slider(f"CA Minimum ({libelle_devise()})", 0, int(df['ca_devise'].max()), 0)
         with col2:
             selected = st.multiselect(
                 "Produits",
@@ -257,13 +386,13 @@ def display_data_table(df):
                 default=df['produit'].unique()
             )
 
-    filtered = df[(df['ca_cfa'] >= min_ca) & (df['produit'].isin(selected))]
+    filtered = df[(df['ca_devise'] >= min_ca) & (df['produit'].isin(selected))]
 
     try:
         st.dataframe(
             filtered.style
-            .background_gradient(subset=['ca_cfa'], cmap='Blues')
-            .format({'ca_cfa': '{:,.0f} FCFA'}),
+            .background_gradient(subset=['ca_devise'], cmap='Blues')
+            .format({'ca_devise': '{:,.0f} ' + libelle_devise()}),
             height=500,
             use_container_width=True
         )
@@ -363,13 +492,46 @@ def main_dashboard():
         # Section administration
         admin_section()
 
+        # Devise d'affichage
+        devises = charger_convertisseur().devises()
+        st.selectbox(
+            "Devise",
+            devises,
+            index=devises.index(DEVISE_RAPPORT) if DEVISE_RAPPORT in devises else 0,
+            format_func=lambda d: f"{d} ({symbole(d)})",
+            key='devise'
+        )
+
+        st.checkbox(
+            "Mode approché",
+            key='approche',
+            help="Estimations immédiates sur un échantillon des ventes, "
+                 "remplacées par les valeurs exactes dès qu'elles sont calculées"
+        )
+
         # Menu de navigation
         st.markdown("### 📂 Navigation")
         page_options = ["Tableau de bord", "Gestion PDF"]
         selected_page = st.radio("", page_options, label_visibility="collapsed")
 
-    # Chargement des données (une seule fois)
-    df = load_data()
+    # Chargement des données (une seule fois par état de la base, en fond)
+    version, devise = version_donnees(), devise_affichage()
+    calcul = calcul_ventes(version, devise)
+    if st.session_state.get('approche') and not calcul.done() and selected_page == "Tableau de bord":
+        display_apercu(version, devise)
+        attendre_calcul_exact(calcul)
+        return
+    try:
+        df = preparer_ventes(version, devise)
+    except KeyError as e:
+        st.error(f"Taux de change manquant: {e}")
+        return
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        st.error(f"Erreur de base de données : {str(e)}")
+        return
+    except Exception as e:
+        st.error(f"Erreur de traitement : {str(e)}")
+        return
 
     if df.empty:
         st.warning("Aucune donnée disponible pour l'analyse")
@@ -389,133 +551,688 @@ def display_dashboard_content(df):
         st.warning("Aucune donnée disponible pour l'analyse")
         return
 
-    # Vérification et renommage des colonnes
-    if 'nom_x' in df.columns and 'nom_y' in df.columns:
-        df = df.rename(columns={'nom_x': 'produit', 'nom_y': 'client'})
-    elif 'nom_x' in df.columns:
-        df = df.rename(columns={'nom_x': 'produit'})
-
-    # Création de la colonne ca_cfa si elle n'existe pas
-    if 'chiffre_affaires' in df.columns:
-        df['ca_cfa'] = df['chiffre_affaires']
-    else:
+    if 'ca_devise' not in df.columns:
         st.error("Colonne 'chiffre_affaires' manquante - impossible de calculer le CA")
         return
 
+    # Filtres croisés : appliqués une fois, partagés par tous les panneaux
+    moteur = construire_moteur(df, (version_donnees(), devise_affichage()))
+    filtres = display_filtres(df, moteur)
+    selection = moteur.selectionner(filtres)
+
     # Section des métriques
     st.write("📈 Analyse des Ventes")
 
     try:
-        # Calcul des indicateurs clés
-        total_ca = df['ca_cfa'].sum()
-        avg_ca = df['ca_cfa'].mean()
-        nb_transactions = len(df)
+        # Calcul des indicateurs clés sur la sélection
+        total_ca, nb_transactions = selection.total()
+        avg_ca = total_ca / nb_transactions if nb_transactions else 0.0
 
         col1, col2, col3 = st.columns(3)
-        col1.metric("CA Total", f"{total_ca:,.0f} FCFA")
-        col2.metric("CA Moyen", f"{avg_ca:,.0f} FCFA")
+        col1.metric("CA Total", f"{total_ca:,.0f} {libelle_devise()}")
+        col2.metric("CA Moyen", f"{avg_ca:,.0f} {libelle_devise()}")
         col3.metric("Nombre de ventes", nb_transactions)
 
     except Exception as e:
         st.error(f"Erreur dans l'affichage des métriques: {str(e)}")
 
-    # Section des visualisations
-    tab1, tab2, tab3 = st.tabs(["Répartition", "Évolution", "Comparaison"])
+    display_panneaux(df, moteur, selection)
 
-    with tab1:
-        try:
-            if 'produit' in df.columns:
-                st.subheader("Répartition du CA par produit")
-                ca_par_produit = df.groupby('produit')['ca_cfa'].sum().sort_values(ascending=False)
-                st.bar_chart(ca_par_produit)
-            else:
-                st.warning("Colonne 'produit' manquante pour la répartition")
-        except Exception as e:
-            st.error(f"Erreur dans le graphique de répartition: {str(e)}")
 
-    with tab2:
-        try:
-            # Vérifier si la colonne mois existe ou créer une colonne mois à partir de la date
-            if 'date' in df.columns:
-                df['mois'] = pd.to_datetime(df['date']).dt.to_period('M').astype(str)
+def display_apercu(version, devise):
+    """Indicateurs estimés sur l'échantillon, avec leurs intervalles de confiance"""
+    try:
+        echantillon, moteur = charger_echantillon(version, devise)
+    except (sqlite3.Error, KeyError) as e:
+        st.warning(f"Échantillon indisponible, calcul exact en cours: {e}")
+        return
 
-            if 'mois' in df.columns:
-                st.subheader("Évolution du CA par mois")
-                ca_par_mois = df.groupby('mois')['ca_cfa'].sum().sort_index()
-                st.line_chart(ca_par_mois)
-            else:
-                st.warning("Colonne 'mois' ou 'date' manquante pour l'évolution temporelle")
-        except Exception as e:
-            st.error(f"Erreur dans le graphique d'évolution: {str(e)}")
+    filtres = display_filtres(echantillon.ventes, moteur)
+    lignes = moteur.selectionner(filtres).lignes()
+    estimations = echantillon.estimer(lignes)
+
+    st.write("📈 Analyse des Ventes (estimations)")
+    libelle = libelle_devise()
+    colonnes = st.columns(3)
+    for col, (titre, cle, unite) in zip(colonnes, (
+        ("CA Total", 'ca', libelle), ("CA Moyen", 'panier_moyen', libelle), ("Nombre de ventes", 'nb_ventes', ""),
+    )):
+        valeur, marge = estimations[cle]
+        col.metric(f"{titre} (≈)", f"{valeur:,.0f} {unite}")
+        col.caption(f"± {marge:,.0f} {unite} (IC 95 %)")
+
+    st.subheader("Part du CA par produit (estimée)")
+    parts = echantillon.parts(lignes).head(PRODUITS_GRAPHIQUE)
+    fig = px.bar(parts, x='produit', y='part', error_y='marge_part',
+                 labels={'produit': '', 'part': 'Part du CA'})
+    fig.update_layout(yaxis_tickformat='.0%')
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"Estimations sur {len(echantillon.ventes):,} ventes échantillonnées "
+               f"parmi {echantillon.nb_ventes:,}")
+
+
+@fragment_periodique(1)
+def attendre_calcul_exact(calcul):
+    """Bascule sur les valeurs exactes dès que le chargement de fond est terminé"""
+    if calcul.done():
+        st.rerun()
+    st.caption("⏳ Calcul exact en cours : la page passera aux valeurs exactes automatiquement")
+
+
+@fragment
+def display_panneaux(df, moteur, selection):
+    """
+    Affiche le seul panneau choisi. Contrairement à des onglets, dont le
+    contenu est calculé à chaque rerun même s'ils restent fermés, un panneau
+    n'est calculé que s'il est affiché ; changer de panneau ou manipuler ses
+    widgets ne relance que ce fragment, pas le chargement ni les filtres.
+    """
+    panneaux = {
+        "Répartition": lambda: display_repartition(moteur, selection),
+        "Évolution": lambda: display_evolution(moteur, selection),
+        "Comparaison": lambda: display_comparaison(df, moteur, selection),
+        "Stock": display_stock_section,
+        "Catégories": display_categories_section,
+        "Clients & paniers": lambda: display_esquisses_section(df),
+        "Réseau": display_reseau_section,
+        "Périodes": lambda: display_periodes_section(df),
+        "Segments": display_segments_section,
+        "Cohortes": display_cohortes_section,
+        "Associations": lambda: display_associations_section(df),
+        "Données": lambda: display_data_table(df, selection),
+    }
+    vue = st.radio("Vue", list(panneaux), horizontal=True, key='vue', label_visibility="collapsed")
+    try:
+        panneaux[vue]()
+    except Exception as e:
+        st.error(f"Erreur dans le panneau {vue}: {str(e)}")
 
-    with tab3:
-        try:
-            st.subheader("Comparaisons")
 
-            # Exemple de comparaison entre produits et clients
-            if 'produit' in df.columns and 'client' in df.columns:
-                option = st.selectbox(
-                    "Choisir une comparaison:",
-                    ("Top 10 Produits", "Top 10 Clients", "CA par Produit et Client")
-                )
+def display_repartition(moteur, selection):
+    if 'produit' not in moteur.index:
+        st.warning("Colonne 'produit' manquante pour la répartition")
+        return
+    st.subheader("Répartition du CA par produit")
+    # Sous les autres filtres : les produits non sélectionnés restent visibles
+    ca_par_produit = selection.agreger('produit')
+    st.bar_chart(ca_par_produit[ca_par_produit > 0].nlargest(PRODUITS_GRAPHIQUE))
 
-                if option == "Top 10 Produits":
-                    top_produits = df.groupby('produit')['ca_cfa'].sum().nlargest(10)
-                    st.bar_chart(top_produits)
-                elif option == "Top 10 Clients":
-                    top_clients = df.groupby('client')['ca_cfa'].sum().nlargest(10)
-                    st.bar_chart(top_clients)
-                else:
-                    pivot_table = df.pivot_table(values='ca_cfa', index='produit', columns='client', aggfunc='sum')
-                    st.write(pivot_table)
-            else:
-                st.warning("Colonnes manquantes pour les comparaisons")
-        except Exception as e:
-            st.error(f"Erreur dans les comparaisons: {str(e)}")
 
-    # Section des données détaillées
-    st.write("🔍 Données Détailées")
-    try:
-        display_data_table(df)
-    except Exception as e:
-        st.error(f"Erreur dans l'affichage des données: {str(e)}")
+def display_evolution(moteur, selection):
+    if 'mois' not in moteur.index:
+        st.warning("Colonne 'mois' ou 'date' manquante pour l'évolution temporelle")
+        return
+    st.subheader("Évolution du CA")
+    col1, col2 = st.columns([1, 3])
+    pas = col1.radio("Pas", ("Auto", "Mois", "Jour"), horizontal=True, key='pas_evolution')
+
+    # Zoom sur une plage de dates : seul le fragment est relancé
+    zoom = None
+    if 'jour' in moteur.index and len(moteur.index['jour'].valeurs) > 1:
+        jours = moteur.index['jour'].valeurs
+        premier, dernier = jours[0].to_pydatetime(), jours[-1].to_pydatetime()
+        zoom = col2.slider("Zoom", min_value=premier, max_value=dernier, value=(premier, dernier),
+                           format="DD/MM/YYYY", key='zoom_evolution')
+
+    # Auto : le jour dès que la fenêtre tient dans la largeur du graphique
+    if pas == "Auto":
+        pas = "Jour" if zoom and (zoom[1] - zoom[0]).days < LARGEUR_GRAPHIQUE else "Mois"
+    if pas == "Jour" and zoom:
+        serie = fenetre(selection.agreger('jour'), *zoom)
+    else:
+        serie = selection.agreger('mois').sort_index()
+        if zoom:
+            serie = serie.loc[zoom[0].strftime('%Y-%m'):zoom[1].strftime('%Y-%m')]
 
+    # Nombre de points envoyés au navigateur borné quelle que soit la période
+    affichee = sous_echantillonner(serie)
+    st.line_chart(affichee)
+    if len(affichee) < len(serie):
+        st.caption(f"{len(affichee):,} points affichés sur {len(serie):,} : zoomer pour voir le détail")
 
-def display_data_table(df):
-    """Affiche le tableau de données avec filtres"""
-    st.write("🔎 Filtres")
 
-    # Vérification des colonnes avant filtrage
-    available_columns = df.columns.tolist()
+def display_comparaison(df, moteur, selection):
+    st.subheader("Comparaisons")
 
-    col1, col2 = st.columns(2)
+    # Exemple de comparaison entre produits et clients
+    if 'produit' not in moteur.index or 'client' not in moteur.index:
+        st.warning("Colonnes manquantes pour les comparaisons")
+        return
+    option = st.selectbox(
+        "Choisir une comparaison:",
+        ("Top 10 Produits", "Top 10 Clients", "Top 10 par mois", "CA par Produit et Client")
+    )
+    if option == "Top 10 par mois":
+        display_palmares_mois()
+        return
+
+    top_produits = selection.agreger('produit', croise=False).nlargest(10)
+    top_clients = selection.agreger('client', croise=False).nlargest(10)
+    if option == "Top 10 Produits":
+        st.bar_chart(top_produits)
+    elif option == "Top 10 Clients":
+        st.bar_chart(top_clients)
+    else:
+        st.write(pivot_comparaison(df, selection, tuple(top_produits.index), tuple(top_clients.index)))
+
+
+def pivot_comparaison(df, selection, produits, clients):
+    """Croisement produits x clients de la sélection, mémorisé avec elle"""
+    def calcul():
+        lignes = df.iloc[selection.lignes()]
+        lignes = lignes[lignes['produit'].isin(produits) & lignes['client'].isin(clients)]
+        return lignes.pivot_table(values='ca_devise', index='produit', columns='client', aggfunc='sum')
+    return selection.memoriser(('pivot', produits, clients), calcul)
+
+
+@st.cache_resource(max_entries=2)
+def construire_moteur(_df, cle):
+    """Index bitmap des ventes, reconstruits seulement si les données ou la devise changent"""
+    return MoteurFiltres(_df, dimensions=('produit', 'client', 'mois', 'jour'))
+
+
+def display_filtres(df, moteur):
+    """Filtres communs à tous les onglets ; retourne le jeu de filtres du moteur"""
+    st.write("🔎 Filtres")
+    filtres = {}
+    col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        if 'produit' in available_columns:
-            produits = df['produit'].unique()
-            sel_produit = st.multiselect("Produits", produits, default=produits)
-        else:
-            st.warning("Colonne 'produit' non disponible")
+        if 'produit' in moteur.index:
+            filtres['produit'] = selecteur_recherche("Produits", 'produits', 'filtre_produits')
 
     with col2:
-        if 'ca_cfa' in available_columns:
-            min_ca = st.slider("CA Minimum (FCFA)", 0, int(df['ca_cfa'].max()), 0)
-        else:
-            st.warning("Colonne 'ca_cfa' non disponible")
+        if 'client' in moteur.index:
+            filtres['client'] = selecteur_recherche("Clients", 'clients', 'filtre_clients')
 
-    # Application des filtres
-    filtered_df = df.copy()
+    with col3:
+        if 'mois' in moteur.index and len(moteur.index['mois'].valeurs) > 1:
+            mois = list(moteur.index['mois'].valeurs)
+            debut, fin = st.select_slider("Période", options=mois, value=(mois[0], mois[-1]))
+            if (debut, fin) != (mois[0], mois[-1]):
+                filtres['mois'] = mois[mois.index(debut):mois.index(fin) + 1]
 
-    if 'produit' in available_columns and len(sel_produit) > 0:
-        filtered_df = filtered_df[filtered_df['produit'].isin(sel_produit)]
+    with col4:
+        filtres['ca_min'] = st.slider(f"CA Minimum ({libelle_devise()})", 0, int(df['ca_devise'].max()), 0)
 
-    if 'ca_cfa' in available_columns:
-        filtered_df = filtered_df[filtered_df['ca_cfa'] >= min_ca]
+    return filtres
 
-    st.dataframe(filtered_df)
 
+@st.cache_data(ttl=300, max_entries=4)
+def charger_stock(version):
+    """État du stock et points de commande, recalculés seulement si la base a changé"""
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        return etat_stock(conn), points_de_commande(conn)
+    finally:
+        conn.close()
 
 
+def display_stock_section():
+    """Affiche le stock en rayon et les produits à réapprovisionner"""
+    try:
+        etat, reappro = charger_stock(version_donnees())
+    except sqlite3.Error as e:
+        st.warning(f"Stock indisponible (exécutez stock.py pour initialiser le journal): {e}")
+        return
+
+    if etat.empty:
+        st.info("Aucun produit suivi en stock : enregistrez une réception pour commencer le suivi")
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Stock en rayon")
+        st.dataframe(etat[['nom', 'stock']], hide_index=True, use_container_width=True)
+    with col2:
+        st.subheader("À réapprovisionner")
+        a_commander = reappro[reappro['a_commander']]
+        st.dataframe(
+            a_commander[['nom', 'stock', 'point_commande', 'demande_jour']],
+            hide_index=True, use_container_width=True
+        )
+
+
+def version_reseau():
+    """Empreinte des bases du réseau : registre local et base de chaque magasin"""
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        chemins = magasins(conn)
+    finally:
+        conn.close()
+    return tuple(
+        f.stat().st_mtime_ns if f.exists() else 0
+        for chemin in chemins.values() for f in (chemin, chemin.with_name(chemin.name + '-wal'))
+    )
+
+
+@st.cache_data(ttl=300, max_entries=4)
+def charger_reseau(devise, version):
+    """Agrégats de tous les magasins, interrogés en parallèle chacun sur sa base"""
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        chemins = magasins(conn)
+    finally:
+        conn.close()
+    return interroger(chemins, devise=devise, convertisseur=charger_convertisseur())
+
+
+def display_reseau_section():
+    """Indicateurs consolidés du réseau, détaillés par magasin"""
+    try:
+        reseau = charger_reseau(devise_affichage(), version_reseau())
+    except sqlite3.Error as e:
+        st.warning(f"Réseau indisponible: {e}")
+        return
+    for nom, erreur in reseau.echecs.items():
+        st.warning(f"Magasin {nom} écarté: {erreur}")
+    noms = [nom for nom in reseau.par_magasin.index if nom != RESEAU]
+    if len(noms) < 2:
+        st.info("Un seul magasin : enregistrez les autres avec federation.py enregistrer <nom> <base>")
+    choix = st.multiselect("Magasins", noms, default=noms, key='magasins_reseau')
+    if not choix:
+        return
+
+    libelle = libelle_devise()
+    par_magasin = reseau.par_magasin.loc[choix]
+    ca, nb_ventes = par_magasin['ca_devise'].sum(), par_magasin['nb_ventes'].sum()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("CA des magasins", f"{ca:,.0f} {libelle}")
+    col2.metric("Nombre de ventes", f"{nb_ventes:,}")
+    col3.metric("Panier moyen", f"{ca / nb_ventes if nb_ventes else 0:,.0f} {libelle}")
+    st.dataframe(
+        par_magasin[['ca_devise', 'nb_ventes', 'panier_moyen_devise', 'clients', 'debut', 'fin']],
+        use_container_width=True
+    )
+
+    mensuel = reseau.mensuel[reseau.mensuel['magasin'].isin(choix)]
+    st.plotly_chart(px.bar(mensuel, x='mois', y='ca_devise', color='magasin', title="CA mensuel par magasin",
+                           labels={'ca_devise': f"CA ({libelle})"}), use_container_width=True)
+
+    produits = reseau.produits[reseau.produits['magasin'].isin(choix)]
+    top = produits.groupby('produit')['ca_devise'].sum().nlargest(10).index
+    st.plotly_chart(px.bar(produits[produits['produit'].isin(top)], x='produit', y='ca_devise', color='magasin',
+                           title="Top 10 produits du réseau", labels={'ca_devise': f"CA ({libelle})"},
+                           category_orders={'produit': list(top)}), use_container_width=True)
+    st.caption(f"{len(choix)} magasins interrogés en parallèle ; le plus lent a répondu en "
+               f"{par_magasin['duree_s'].max():.2f} s")
+
+
+@st.cache_data(ttl=300, max_entries=16)
+def charger_periodes(dimension, mode, jour, devise, version):
+    """Période courante et de référence, et leur comparaison (totaux par produit enregistrés, sinon une requête)"""
+    courante, reference = periodes(mode, jour)
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        attacher_archives(conn, min(courante[0], reference[0]), max(courante[1], reference[1]))
+        comparaison = comparer(conn, dimension, courante, reference, devise, charger_convertisseur())
+        return courante, reference, comparaison
+    finally:
+        conn.close()
+
+
+def display_periodes_section(df):
+    """Période en cours face à sa période de référence, par produit, client ou magasin (hors filtres)"""
+    col1, col2, col3 = st.columns(3)
+    dimension = col1.radio("Par", ("produit", "client", "magasin"), horizontal=True,
+                           format_func=lambda d: f"{d.capitalize()}s", key='dimension_periodes')
+    mode = col2.selectbox("Comparer", list(MODES), format_func=MODES.get, key='mode_periodes')
+    dernier = df['date'].max().date()
+    jour = col3.date_input("Jusqu'au", value=dernier, max_value=dernier, key='jour_periodes')
+    version = version_reseau() if dimension == 'magasin' else version_donnees()
+    try:
+        courante, reference, comparaison = charger_periodes(dimension, mode, str(jour), devise_affichage(), version)
+    except sqlite3.Error as e:
+        st.warning(f"Comparaison indisponible (exécutez palmares.py actualiser): {e}")
+        return
+    st.caption(f"Du {courante[0]} au {courante[1]}, face au {reference[0]} au {reference[1]} ; "
+               "toutes les ventes, indépendamment des filtres de la barre latérale")
+    if comparaison.empty:
+        st.info("Aucune vente sur ces périodes")
+        return
+
+    libelle = libelle_devise()
+    totaux = comparaison[comparaison['magasin'] == RESEAU] if dimension == 'magasin' else comparaison
+    ca, ca_reference = totaux['ca_courant'].sum(), totaux['ca_reference'].sum()
+    ventes, ventes_reference = totaux['nb_ventes_courant'].sum(), totaux['nb_ventes_reference'].sum()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("CA", f"{ca:,.0f} {libelle}", f"{ca - ca_reference:+,.0f} {libelle}")
+    col2.metric("Ventes", f"{ventes:,}", f"{ventes - ventes_reference:+,}")
+    col3.metric("Évolution du CA", f"{ca / ca_reference - 1:+.1%}" if ca_reference else "n.d.")
+
+    lignes = comparaison.drop(columns='cle', errors='ignore')
+    st.dataframe(lignes, hide_index=True, use_container_width=True)
+    if dimension == 'magasin':
+        lignes = lignes[lignes['magasin'] != RESEAU]
+    extremes = pd.concat([lignes.nlargest(10, 'ecart'), lignes.nsmallest(10, 'ecart')])
+    extremes = extremes[~extremes.index.duplicated() & (extremes['ecart'] != 0)].sort_values('ecart')
+    st.plotly_chart(px.bar(extremes, x='ecart', y=dimension, orientation='h', color='ecart',
+                           color_continuous_scale='RdYlGn', color_continuous_midpoint=0,
+                           hover_data=['ca_courant', 'ca_reference', 'evolution'],
+                           labels={'ecart': f"Écart ({libelle})"}, title="Plus fortes hausses et baisses"),
+                    use_container_width=True)
+
+
+@st.cache_data(ttl=300, max_entries=4)
+def charger_segments(devise, version, par_segment=20):
+    """
+    Segmentation RFM à jour (segments enregistrés, clients touchés recalculés
+    à la volée) : profil des segments, effectifs par score R x F et meilleurs
+    clients de chaque segment
+    """
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        scores = calculer_segments(conn)
+        resume = resumer_segments(scores, conn, devise, charger_convertisseur())
+        grille = pd.crosstab(scores['r'], scores['f']).reindex(
+            index=range(CLASSES, 0, -1), columns=range(1, CLASSES + 1), fill_value=0)
+        meilleurs = scores.sort_values('montant', ascending=False).groupby('segment').head(par_segment)
+        cles = [int(c) for c in meilleurs.index]
+        noms = dict(conn.execute(f"SELECT id, nom FROM clients WHERE id IN ({','.join('?' * len(cles))})", cles)
+                    .fetchall()) if cles else {}
+        meilleurs = meilleurs.assign(client=meilleurs.index.map(noms)).reset_index()
+        return resume, grille, meilleurs
+    finally:
+        conn.close()
+
+
+def display_segments_section():
+    """Segments RFM de tous les clients (hors filtres), avec leurs meilleurs clients"""
+    try:
+        resume, grille, meilleurs = charger_segments(devise_affichage(), version_donnees())
+    except sqlite3.Error as e:
+        st.warning(f"Segmentation indisponible (exécutez segmentation.py actualiser): {e}")
+        return
+    if resume.empty:
+        st.info("Aucun client avec des achats")
+        return
+    libelle = libelle_devise()
+    st.caption("Tous les clients, indépendamment des filtres de la barre latérale ; scores de 1 à "
+               f"{CLASSES} par quintile de récence, fréquence et montant")
+    col1, col2 = st.columns(2)
+    col1.plotly_chart(px.bar(resume, x='segment', y='clients', hover_data=['part', 'montant'],
+                             title="Clients par segment"), use_container_width=True)
+    col2.plotly_chart(px.imshow(grille, text_auto=True, aspect='auto', color_continuous_scale='Blues',
+                                labels={'x': "Fréquence (F)", 'y': "Récence (R)", 'color': "Clients"},
+                                title="Clients par score R x F"), use_container_width=True)
+    st.dataframe(resume.rename(columns={'recence': 'recence_jours', 'montant_moyen': f'montant_moyen ({libelle})',
+                                        'montant': f'montant ({libelle})'}),
+                 hide_index=True, use_container_width=True)
+    segment = st.selectbox("Meilleurs clients du segment", resume['segment'], key='segment_rfm')
+    st.dataframe(
+        meilleurs[meilleurs['segment'] == segment][
+            ['client', 'dernier_achat', 'recence', 'frequence', 'montant', 'r', 'f', 'm']
+        ].rename(columns={'montant': f'montant ({symbole(DEVISE_BASE)})'}),
+        hide_index=True, use_container_width=True
+    )
+
+
+@st.cache_data(ttl=300, max_entries=4)
+def charger_cohortes(version):
+    """
+    Clients actifs par cohorte de premier achat et ancienneté, à jour (mois
+    enregistrés, mois touchés recalculés à la volée) : une matrice par version des données
+    """
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        return cohortes(conn)
+    finally:
+        conn.close()
+
+
+def display_cohortes_section():
+    """Rétention de chaque cohorte de premier achat, mois après mois (hors filtres)"""
+    try:
+        effectifs = charger_cohortes(version_donnees())
+    except sqlite3.Error as e:
+        st.warning(f"Cohortes indisponibles (exécutez cohortes.py actualiser): {e}")
+        return
+    if effectifs.empty:
+        st.info("Aucun client avec des achats")
+        return
+    st.caption("Tous les clients, indépendamment des filtres de la barre latérale ; cohorte = mois du premier "
+               "achat, ancienneté en mois depuis")
+    moyennes = retention_moyenne(effectifs)
+    for colonne, (n, part) in zip(st.columns(max(len(moyennes), 1)), moyennes.items()):
+        colonne.metric(f"Actifs après {n} mois", f"{part:.0%}")
+    en_effectifs = st.checkbox("Nombres de clients", key='effectifs_cohortes')
+    valeurs = effectifs.where(retention(effectifs).notna()) if en_effectifs else retention(effectifs)
+    fig = px.imshow(valeurs, aspect='auto', color_continuous_scale='Blues',
+                    text_auto=True if en_effectifs else '.0%',
+                    labels={'x': "Ancienneté (mois)", 'y': "Cohorte",
+                            'color': "Clients" if en_effectifs else "Rétention"},
+                    title="Clients actifs par cohorte et ancienneté")
+    fig.update_layout(height=max(400, 22 * len(valeurs)))
+    st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(effectifs.rename(columns=str), use_container_width=True)
+
+
+@st.cache_data(ttl=300, max_entries=8)
+def charger_associations(debut, fin, support, confiance, version):
+    """Itemsets fréquents et règles d'association des paniers de la période"""
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        return analyser_paniers(conn, debut, fin, support, confiance)
+    finally:
+        conn.close()
+
+
+def display_associations_section(df):
+    """Produits achetés ensemble : règles d'association sur les paniers d'une période (hors filtres)"""
+    premier, dernier = df['date'].min().date(), df['date'].max().date()
+    col1, col2, col3 = st.columns([2, 1, 1])
+    periode = col1.date_input("Période", value=(max(premier, dernier - pd.Timedelta(days=364)), dernier),
+                              min_value=premier, max_value=dernier, key='periode_associations')
+    support = col2.number_input("Support minimum (%)", min_value=0.01, max_value=50.0, value=SUPPORT_MIN * 100,
+                                step=0.1, key='support_associations') / 100
+    confiance = col3.slider("Confiance minimum", 0.0, 1.0, CONFIANCE_MIN, 0.05, key='confiance_associations')
+    if len(periode) != 2:
+        st.info("Choisissez la date de fin de la période")
+        return
+    try:
+        itemsets, regles, nb_paniers = charger_associations(str(periode[0]), str(periode[1]), support, confiance,
+                                                            version_donnees())
+    except sqlite3.Error as e:
+        st.warning(f"Analyse des paniers indisponible: {e}")
+        return
+    st.caption("Un panier par ticket (par client et par jour pour les ventes sans ticket) ; toutes les ventes, "
+               "indépendamment des filtres de la barre latérale. Lift > 1 : achetés ensemble plus que par hasard")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Paniers", f"{nb_paniers:,}")
+    col2.metric("Combinaisons fréquentes", f"{(itemsets['taille'] > 1).sum():,}")
+    col3.metric("Règles", f"{len(regles):,}")
+    if regles.empty:
+        st.info("Aucune règle à ces seuils : abaissez le support ou la confiance")
+        return
+    st.plotly_chart(px.scatter(regles.head(500), x='support', y='confiance', color='lift', size='paniers',
+                               hover_data=['antecedent', 'consequent'], color_continuous_scale='Viridis',
+                               title="Règles : support, confiance et lift"), use_container_width=True)
+    st.dataframe(regles.head(200), hide_index=True, use_container_width=True)
+    st.dataframe(itemsets[itemsets['taille'] > 1].head(200), hide_index=True, use_container_width=True)
+
+
+@st.cache_data(ttl=300, max_entries=8)
+def charger_palmares_mois(dimension, devise, version):
+    """Top 10 de chaque mois, lu sur les palmarès mensuels (quelques dizaines de millisecondes)"""
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        return par_mois(conn, dimension, 10, devise=devise, convertisseur=charger_convertisseur())
+    finally:
+        conn.close()
+
+
+def display_palmares_mois():
+    """Classement mensuel des produits ou des clients sur tout l'historique (hors filtres)"""
+    dimension = st.radio("Classer", ("produit", "client"), horizontal=True,
+                         format_func=lambda d: f"{d.capitalize()}s", key='dimension_palmares')
+    try:
+        classement = charger_palmares_mois(dimension, devise_affichage(), version_donnees())
+    except sqlite3.Error as e:
+        st.warning(f"Palmarès indisponible (exécutez palmares.py actualiser): {e}")
+        return
+    if classement.empty:
+        st.info("Aucune vente")
+        return
+    st.caption("Toutes les ventes, indépendamment des filtres de la barre latérale")
+    noms = classement.pivot(index='mois', columns='rang', values=dimension)
+    st.dataframe(noms.sort_index(ascending=False), use_container_width=True)
+    fig = px.bar(
+        classement[classement['rang'] <= 3], x='mois', y='ca_devise', color=dimension,
+        hover_data=['rang', 'quantite'], labels={'ca_devise': f"CA ({libelle_devise()})"},
+        title="Podium mensuel"
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+
+@st.cache_data(ttl=300, max_entries=16)
+def charger_resume_esquisses(debut, fin, magasins, devise, version):
+    """Fusion des esquisses journalières d'une période (quelques millisecondes)"""
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        magasins_connus = [m for (m,) in conn.execute("SELECT DISTINCT magasin FROM esquisses_jour ORDER BY 1")]
+        resume = resume_esquisses(conn, debut, fin, list(magasins) or None, devise, charger_convertisseur())
+        return resume, magasins_connus
+    finally:
+        conn.close()
+
+
+def display_esquisses_section(df):
+    """Clients distincts et distribution des paniers sur une période et des magasins au choix"""
+    premier, dernier = df['date'].min().date(), df['date'].max().date()
+    periode = st.date_input("Période", value=(premier, dernier), min_value=premier, max_value=dernier,
+                            key='periode_esquisses')
+    if len(periode) != 2:
+        st.info("Choisissez la date de fin de la période")
+        return
+    magasins = st.session_state.get('magasins_esquisses', [])
+    try:
+        resume, magasins_connus = charger_resume_esquisses(
+            str(periode[0]), str(periode[1]), tuple(magasins), devise_affichage(), version_donnees()
+        )
+    except sqlite3.Error as e:
+        st.warning(f"Esquisses indisponibles (exécutez esquisses.py actualiser): {e}")
+        return
+    if len(magasins_connus) > 1:
+        st.multiselect("Magasins (tous par défaut)", magasins_connus, key='magasins_esquisses')
+    if not resume['nb_ventes']:
+        st.info("Aucune vente sur la période")
+        return
+
+    libelle = libelle_devise()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Clients distincts", f"~{resume['clients_uniques']:,.0f}")
+    col1.caption(f"± {2 * resume['erreur_clients']:.1%} (IC 95 %)")
+    col2.metric("Panier médian", f"{resume['panier_p50']:,.0f} {libelle}")
+    col3.metric("Panier p90", f"{resume['panier_p90']:,.0f} {libelle}")
+    col3.caption(f"p99 : {resume['panier_p99']:,.0f} {libelle}")
+    col4.metric("Articles par panier (médiane)", f"{resume['quantite_p50']:.0f}")
+    col4.caption(f"p90 : {resume['quantite_p90']:.0f}, p99 : {resume['quantite_p99']:.0f}")
+    st.caption(f"{resume['nb_ventes']:,} ventes ; quantiles à {resume['erreur_quantiles']:.0%} près, "
+               "calculés par fusion des esquisses journalières")
+
+
+@st.cache_data(ttl=300, max_entries=4)
+def charger_arbre_categories(devise, version):
+    """CA cumulé de toutes les catégories (une agrégation, partagée entre les sessions)"""
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        attacher_archives(conn)
+        return ca_par_categorie(conn, devise=devise, convertisseur=charger_convertisseur())
+    finally:
+        conn.close()
+
+
+@st.cache_data(ttl=300, max_entries=64)
+def charger_produits_categorie(categorie_id, devise, version):
+    """Meilleurs produits d'une catégorie et de ses sous-catégories"""
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        attacher_archives(conn)
+        return ca_produits_categorie(conn, categorie_id, devise=devise, convertisseur=charger_convertisseur())
+    finally:
+        conn.close()
+
+
+def display_categories_section():
+    """Exploration du CA catégorie par catégorie, de la racine jusqu'aux produits"""
+    try:
+        arbre = charger_arbre_categories(devise_affichage(), version_donnees())
+    except (sqlite3.Error, KeyError) as e:
+        st.warning(f"CA par catégorie indisponible: {e}")
+        return
+
+    courante = st.session_state.get('categorie')
+    if courante is not None and courante not in set(arbre['id']):
+        courante = None
+
+    # Fil d'Ariane : chaque niveau permet de remonter
+    niveaux = [(None, "Toutes")] + [
+        (id_, arbre.loc[arbre['id'] == id_, 'nom'].iloc[0]) for id_ in chemin_categorie(arbre, courante)
+    ]
+    colonnes_ariane = st.columns(len(niveaux))
+    for col, (id_, nom) in zip(colonnes_ariane, niveaux):
+        if col.button(nom, key=f"ariane_{id_}", disabled=id_ == courante):
+            st.session_state['categorie'] = id_
+            relancer_panneau()
+
+    if courante is None:
+        enfants = arbre[arbre['parent_id'].isna()]
+    else:
+        enfants = arbre[arbre['parent_id'] == courante]
+    enfants = enfants[enfants['quantite'] > 0].sort_values('ca_devise', ascending=False)
+
+    if not enfants.empty:
+        st.subheader(f"CA par sous-catégorie ({libelle_devise()})")
+        fig = px.bar(enfants, x='nom', y='ca_devise', labels={'nom': '', 'ca_devise': f'CA ({libelle_devise()})'})
+        st.plotly_chart(fig, use_container_width=True)
+        choix = st.selectbox(
+            "Détailler",
+            [None] + enfants['id'].tolist(),
+            format_func=lambda id_: "—" if id_ is None else enfants.loc[enfants['id'] == id_, 'nom'].iloc[0],
+            key=f"detail_{courante}"
+        )
+        if choix is not None:
+            st.session_state['categorie'] = choix
+            relancer_panneau()
+
+    if courante is not None:
+        st.subheader("Meilleurs produits")
+        produits = charger_produits_categorie(courante, devise_affichage(), version_donnees())
+        st.dataframe(
+            produits[['produit', 'quantite', 'ca_devise']].style.format({'ca_devise': '{:,.0f} ' + libelle_devise()}),
+            hide_index=True, use_container_width=True
+        )
+
+
+@st.cache_data(ttl=60, max_entries=2000)
+def chercher_noms(table, texte):
+    """Noms correspondant à une saisie partielle (index plein texte)"""
+    conn = connecter(Path(__file__).parent / "../data/vente.db", lecture_seule=True)
+    try:
+        return [nom for _, nom in rechercher(conn, table, texte)]
+    finally:
+        conn.close()
+
+
+def selecteur_recherche(libelle, table, cle):
+    """
+    Sélection multiple alimentée par la recherche : seules les meilleures
+    correspondances de la saisie (et les valeurs déjà choisies) sont
+    proposées, jamais la liste complète.
+    """
+    texte = st.text_input(f"Rechercher ({libelle.lower()})", key=f"{cle}_texte",
+                          placeholder="Début de nom, ex: sou fil")
+    choisis = st.session_state.get(cle, [])
+    trouves = chercher_noms(table, texte.strip()) if texte.strip() else []
+    return st.multiselect(libelle, list(dict.fromkeys(choisis + trouves)), key=cle)
+
+
+def display_data_table(df, selection):
+    """Affiche les ventes de la sélection courante"""
+    lignes = selection.lignes()
+    if len(lignes) > LIGNES_TABLE:
+        st.caption(f"{LIGNES_TABLE:,} premières ventes sur {len(lignes):,} sélectionnées")
+    st.dataframe(df.iloc[lignes[:LIGNES_TABLE]])
 
 
 def display_export_section(df):
@@ -0,0 +1,432 @@
+# scripts/archives.py
+"""Archivage des ventes anciennes par année ou par mois, dans des bases en lecture seule"""
+import argparse
+import logging
+import os
+import sqlite3
+import stat
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import pandas as pd
+
+from base_donnees import DB_PATH, connecter, dossier_base, migrer_schema, table_existe
+from esquisses import actualiser as actualiser_esquisses
+from palmares import actualiser as actualiser_palmares
+
+logger = logging.getLogger(__name__)
+
+DOSSIER_ARCHIVES = Path(DB_PATH).parent / "archives"
+PREFIXE = 'archive_'  # Nom des bases attachées : archive_2021, archive_2021_03, archive_1...
+ARCHIVES_MAX = 8  # Bases d'archive au plus, regroupées au-delà : SQLite en attache 10 par connexion
+
+
+def _bornes(periode: str) -> tuple:
+    """Premier jour de la période (AAAA ou AAAA-MM) et premier jour de la suivante"""
+    if len(periode) == 4:
+        return f"{periode}-01-01", f"{int(periode) + 1}-01-01"
+    mois = pd.Period(periode, 'M')
+    return f"{periode}-01", str((mois + 1).start_time.date())
+
+
+def _periodes(conn: sqlite3.Connection, avant: str, granularite: str) -> List[str]:
+    longueur = 4 if granularite == 'annee' else 7
+    return [p for (p,) in conn.execute(
+        f"SELECT DISTINCT substr(date, 1, {longueur}) FROM main.ventes WHERE date < ? ORDER BY 1", (avant,)
+    )]
+
+
+def limite_archives(conn: sqlite3.Connection) -> Optional[str]:
+    """Date (exclue) jusqu'à laquelle les ventes sont archivées, None sans archive"""
+    if not table_existe(conn, 'archives_ventes'):
+        return None
+    return conn.execute("SELECT MAX(fin) FROM archives_ventes").fetchone()[0]
+
+
+def chemin_archive(conn: sqlite3.Connection, chemin: str) -> Path:
+    """Fichier d'une archive enregistrée, relatif au dossier de la base (ou absolu hors de celui-ci)"""
+    return dossier_base(conn) / chemin
+
+
+def _enregistrement(conn: sqlite3.Connection, chemin: Path) -> str:
+    """Chemin à enregistrer pour une archive : relatif au dossier de la base quand elle s'y trouve"""
+    if chemin.is_relative_to(dossier_base(conn)):
+        return chemin.relative_to(dossier_base(conn)).as_posix()
+    return str(chemin)
+
+
+def _creer_archive(chemin: Path, colonnes_ventes: list) -> None:
+    """Base d'archive vide, avec la table des ventes et ses index de lecture"""
+    definitions = ", ".join(
+        f"{nom} INTEGER PRIMARY KEY" if pk else f"{nom} {type_}" for _, nom, type_, _, _, pk in colonnes_ventes
+    )
+    archive = sqlite3.connect(chemin)
+    try:
+        archive.executescript(f"""
+        CREATE TABLE ventes ({definitions});
+        CREATE INDEX idx_ventes_date ON ventes(date);
+        CREATE INDEX idx_ventes_produit ON ventes(produit_id);
+        CREATE INDEX idx_ventes_client ON ventes(client_id);
+        """)
+    finally:
+        archive.close()
+
+
+def _figer(chemin: Path) -> None:
+    """Compacte l'archive (pages pleines, statistiques à jour) puis la rend non modifiable"""
+    archive = sqlite3.connect(chemin)
+    try:
+        archive.execute("PRAGMA journal_mode=DELETE")  # Pas de fichiers -wal/-shm à côté d'une base figée
+        archive.execute("ANALYZE")
+        archive.execute("VACUUM")
+    finally:
+        archive.close()
+    os.chmod(chemin, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+
+def _synchroniser(chemin: Path) -> None:
+    """Force l'écriture sur disque du fichier et de son entrée de dossier"""
+    with open(chemin, 'rb') as f:
+        os.fsync(f.fileno())
+    try:
+        dossier = os.open(chemin.parent, os.O_RDONLY)
+    except OSError:
+        return  # Windows : un dossier ne s'ouvre pas, l'entrée est écrite avec le fichier
+    try:
+        os.fsync(dossier)
+    finally:
+        os.close(dossier)
+
+
+def _supprimer(chemin: Path) -> None:
+    """Supprime une archive, figée en lecture seule ou non"""
+    if chemin.exists():
+        os.chmod(chemin, stat.S_IRUSR | stat.S_IWUSR)
+        chemin.unlink()
+
+
+def _nombre_ventes(chemin: Path) -> int:
+    archive = sqlite3.connect(f"file:{chemin.as_posix()}?mode=ro", uri=True)
+    try:
+        return archive.execute("SELECT COUNT(*) FROM ventes").fetchone()[0]
+    finally:
+        archive.close()
+
+
+def _copier_periode(conn: sqlite3.Connection, periode: str, chemin: Path, colonnes_ventes: list) -> int:
+    """
+    Écrit les ventes de la période dans une archive neuve, validée, figée
+    et synchronisée sur disque ; retourne le nombre de ventes copiées.
+    La transaction n'écrit que dans l'archive : sa validation est atomique.
+    """
+    noms = ", ".join(c[1] for c in colonnes_ventes)
+    debut, fin = _bornes(periode)
+    schema = f"{PREFIXE}{periode.replace('-', '_')}"
+    _creer_archive(chemin, colonnes_ventes)
+    conn.execute("ATTACH DATABASE ? AS ?", (str(chemin), schema))
+    try:
+        with conn:
+            nb = conn.execute(
+                f"INSERT INTO {schema}.ventes ({noms}) SELECT {noms} FROM main.ventes "
+                f"WHERE date >= ? AND date < ? ORDER BY date",
+                (debut, fin)
+            ).rowcount
+    finally:
+        conn.execute(f"DETACH DATABASE {schema}")
+    _figer(chemin)
+    _synchroniser(chemin)
+    relues = _nombre_ventes(chemin)
+    if relues != nb:
+        raise sqlite3.DatabaseError(f"Archive {chemin.name} incomplète : {relues} ventes relues pour {nb} copiées")
+    return nb
+
+
+def archiver(conn: sqlite3.Connection, avant: str, granularite: str = 'annee',
+             dossier: Path = DOSSIER_ARCHIVES) -> List[str]:
+    """
+    Déplace les ventes antérieures à `avant` (début d'année ou de mois) dans
+    une base par période, puis ferme ces périodes à l'écriture.
+
+    Les esquisses et palmarès des jours archivés sont actualisés avant le
+    déplacement et restent valables : aucune vente ne pouvant plus être
+    ajoutée, modifiée ou supprimée dans une période archivée, ils ne seront
+    plus recalculés. La suppression des lignes déplacées ne déclenche pas
+    les triggers de suppression (stock, échantillon, esquisses, palmarès) :
+    ce n'est pas une annulation de vente.
+
+    SQLite ne garantit pas la validation atomique de plusieurs bases quand
+    la base principale est en WAL : chaque archive est d'abord écrite,
+    validée et synchronisée sur disque seule, puis les ventes sont
+    supprimées de la base courante dans une transaction distincte, après
+    contrôle de leur nombre. Une interruption entre les deux laisse les
+    ventes en place et une archive non enregistrée, remplacée au prochain
+    archivage.
+
+    Returns:
+        Les périodes archivées (AAAA ou AAAA-MM)
+    """
+    if granularite not in ('annee', 'mois'):
+        raise ValueError(f"Granularité inconnue: {granularite}")
+    debut_periode = f"{avant[:4]}-01-01" if granularite == 'annee' else f"{avant[:7]}-01"
+    if avant != debut_periode:
+        raise ValueError(f"La limite doit être un début de période ({debut_periode})")
+    limite = limite_archives(conn)
+    if limite and avant <= limite:
+        raise ValueError(f"Ventes déjà archivées jusqu'au {limite}")
+
+    actualiser_esquisses(conn)
+    actualiser_palmares(conn)
+    periodes = _periodes(conn, avant, granularite)
+    if not periodes:
+        return []
+    dossier.mkdir(parents=True, exist_ok=True)
+    colonnes_ventes = conn.execute("PRAGMA main.table_info(ventes)").fetchall()
+    enregistrees = {chemin_archive(conn, c) for (c,) in conn.execute("SELECT chemin FROM archives_ventes")}
+
+    copies, crees = {}, []
+    reussi = False
+    try:
+        for periode in periodes:
+            chemin = (dossier / f"ventes_{periode}.db").resolve()
+            if chemin in enregistrees:
+                raise ValueError(f"L'archive {chemin} existe déjà")
+            if chemin.exists():
+                logger.warning(f"Archive non enregistrée d'un archivage interrompu remplacée: {chemin.name}")
+                _supprimer(chemin)
+            crees.append(chemin)
+            copies[periode] = (chemin, _copier_periode(conn, periode, chemin, colonnes_ventes))
+
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for periode, (chemin, nb) in copies.items():
+                debut, fin = _bornes(periode)
+                courantes = conn.execute(
+                    "SELECT COUNT(*) FROM main.ventes WHERE date >= ? AND date < ?", (debut, fin)
+                ).fetchone()[0]
+                if courantes != nb:
+                    raise ValueError(f"Ventes de {periode} modifiées pendant l'archivage "
+                                     f"({courantes} pour {nb} archivées) : relancez l'archivage")
+                conn.execute("INSERT INTO archives_ventes VALUES (?, ?, ?, ?, ?)",
+                             (periode, _enregistrement(conn, chemin), debut, fin, nb))
+            declencheurs = conn.execute(
+                """SELECT name, sql FROM main.sqlite_master
+                WHERE type = 'trigger' AND tbl_name = 'ventes' AND sql LIKE '%AFTER DELETE ON ventes%'"""
+            ).fetchall()
+            for nom, _ in declencheurs:
+                conn.execute(f"DROP TRIGGER main.{nom}")
+            conn.execute("DELETE FROM main.ventes WHERE date < ?", (avant,))
+            for _, sql in declencheurs:
+                conn.execute(sql)
+        reussi = True
+    finally:
+        if not reussi:
+            for chemin in crees:
+                _supprimer(chemin)
+    regrouper(conn, dossier=dossier)
+    return periodes
+
+
+def _fusionner(conn: sqlite3.Connection, bases: list, dossier: Path) -> Path:
+    """
+    Réunit des archives (chemin, première période, dernière période, ventes)
+    dans une base neuve, figée et synchronisée, enregistrée à leur place ;
+    les anciennes bases sont ensuite supprimées.
+    """
+    chemin = (dossier / f"ventes_{bases[0][1]}_{bases[-1][2]}.db").resolve()
+    enregistrement = _enregistrement(conn, chemin)
+    if conn.execute("SELECT 1 FROM archives_ventes WHERE chemin = ?", (enregistrement,)).fetchone():
+        raise ValueError(f"L'archive {chemin} existe déjà")
+    _supprimer(chemin)  # Reste éventuel d'une fusion interrompue, jamais enregistré
+    colonnes_ventes = conn.execute("PRAGMA main.table_info(ventes)").fetchall()
+    _creer_archive(chemin, colonnes_ventes)
+    try:
+        fusion = sqlite3.connect(chemin)
+        try:
+            for source, *_ in bases:
+                fusion.execute("ATTACH DATABASE ? AS source",
+                               (f"file:{chemin_archive(conn, source).as_posix()}?mode=ro",))
+                # Colonnes ajoutées après l'archivage de la source : NULL
+                noms = ", ".join(c[1] for c in fusion.execute("PRAGMA source.table_info(ventes)"))
+                with fusion:
+                    fusion.execute(f"INSERT INTO main.ventes ({noms}) SELECT {noms} FROM source.ventes ORDER BY date")
+                fusion.execute("DETACH DATABASE source")
+        finally:
+            fusion.close()
+        _figer(chemin)
+        _synchroniser(chemin)
+        attendues = sum(b[3] for b in bases)
+        if _nombre_ventes(chemin) != attendues:
+            raise sqlite3.DatabaseError(f"Fusion {chemin.name} incomplète : {attendues} ventes attendues")
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("UPDATE archives_ventes SET chemin = ? WHERE chemin = ?",
+                             [(enregistrement, b[0]) for b in bases])
+    except BaseException:
+        _supprimer(chemin)
+        raise
+    for source, *_ in bases:
+        try:
+            _supprimer(chemin_archive(conn, source))
+        except OSError as e:
+            # Windows : archive encore attachée par une session, supprimée à la main plus tard
+            logger.warning(f"Ancienne archive {Path(source).name} non supprimée: {e}")
+    return chemin
+
+
+def regrouper(conn: sqlite3.Connection, maximum: int = ARCHIVES_MAX, dossier: Path = DOSSIER_ARCHIVES) -> int:
+    """
+    Fusionne des archives tant qu'il y en a plus que `maximum` : d'abord les
+    bases d'une même année (archives mensuelles), la plus ancienne année en
+    premier, puis les deux plus anciennes. Les lecteurs attachent ainsi
+    toujours tout l'historique, quelle que soit la granularité d'archivage.
+
+    Returns:
+        Le nombre de fusions
+    """
+    fusions = 0
+    while True:
+        bases = conn.execute(
+            """SELECT chemin, MIN(periode), MAX(periode), SUM(nb_ventes) FROM archives_ventes
+            GROUP BY chemin ORDER BY MIN(debut)"""
+        ).fetchall()
+        if len(bases) <= maximum:
+            return fusions
+        annees = {}
+        for base in bases:
+            annees.setdefault(base[1][:4], []).append(base)
+        groupe = next((g for g in annees.values() if len(g) > 1), bases[:2])
+        chemin = _fusionner(conn, groupe, dossier)
+        logger.info(f"{len(groupe)} archives regroupées dans {chemin.name}")
+        fusions += 1
+
+
+def detacher(conn: sqlite3.Connection) -> None:
+    """Retire la vue des ventes archivées et détache les archives : `ventes` redevient la table courante"""
+    conn.execute("DROP VIEW IF EXISTS temp.ventes")
+    for nom in [r[1] for r in conn.execute("PRAGMA database_list")]:
+        if nom.startswith(PREFIXE):
+            conn.execute(f"DETACH DATABASE {nom}")
+
+
+def attacher(conn: sqlite3.Connection, debut: Optional[str] = None, fin: Optional[str] = None) -> List[str]:
+    """
+    Attache en lecture seule les archives qui recoupent [debut, fin] (toutes
+    par défaut) et masque la table `ventes` par une vue temporaire du même
+    nom, réunion de la table courante et de ces archives : les requêtes
+    existantes lisent tout l'historique sans changement. Une condition sur
+    la date est propagée dans chaque branche et y utilise l'index.
+
+    À appeler après migrer_schema, sur une connexion qui n'écrit plus dans
+    `ventes` (la vue n'est pas modifiable). Rappeler la fonction remplace
+    les archives attachées ; sans archive concernée, la vue est retirée.
+
+    Une base d'archive (éventuellement regroupée, voir `regrouper`) est
+    attachée une fois, quel que soit le nombre de ses périodes.
+
+    Returns:
+        Les périodes attachées
+    """
+    detacher(conn)
+    if not table_existe(conn, 'archives_ventes'):
+        return []
+
+    archives = conn.execute(
+        "SELECT periode, chemin FROM archives_ventes WHERE fin > ? AND debut < date(?, '+1 day') ORDER BY debut",
+        (debut or '0000-01-01', fin or '9999-12-30')
+    ).fetchall()
+    if not archives:
+        return []
+    chemins = list(dict.fromkeys(chemin for _, chemin in archives))
+    limite = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(chemins) > limite:
+        raise ValueError(f"{len(chemins)} archives concernées pour {limite} bases attachables : "
+                         f"regroupez-les (archives.py regrouper)")
+
+    colonnes_courantes = [c[1] for c in conn.execute("PRAGMA main.table_info(ventes)")]
+    branches = [f"SELECT {', '.join(colonnes_courantes)} FROM main.ventes"]
+    for numero, chemin in enumerate(chemins, 1):
+        schema = f"{PREFIXE}{numero}"
+        conn.execute("ATTACH DATABASE ? AS ?",
+                     (f"file:{chemin_archive(conn, chemin).as_posix()}?mode=ro&immutable=1", schema))
+        # Colonnes ajoutées après l'archivage : NULL dans l'archive
+        archivees = {c[1] for c in conn.execute(f"PRAGMA {schema}.table_info(ventes)")}
+        selection = ", ".join(c if c in archivees else f"NULL AS {c}" for c in colonnes_courantes)
+        branches.append(f"SELECT {selection} FROM {schema}.ventes")
+    conn.execute(f"CREATE TEMP VIEW ventes AS {' UNION ALL '.join(branches)}")
+    return [periode for periode, _ in archives]
+
+
+@contextmanager
+def historique_complet(conn: sqlite3.Connection, debut: Optional[str] = None,
+                       fin: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+    """
+    Le temps du bloc, `ventes` couvre aussi les ventes archivées (celles de
+    [debut, fin] seulement si précisés) : les archives sont attachées si la
+    connexion ne l'a pas déjà fait, puis détachées en sortie. Pour les
+    calculs sur tout l'historique d'un client.
+    """
+    vue = conn.execute("SELECT 1 FROM temp.sqlite_master WHERE type = 'view' AND name = 'ventes'").fetchone()
+    attachees = not vue and limite_archives(conn) is not None and attacher(conn, debut, fin)
+    try:
+        yield conn
+    finally:
+        if attachees:
+            detacher(conn)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Archivage des ventes anciennes")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    p = sous.add_parser("archiver", help="Déplace les ventes antérieures à une date dans des bases figées")
+    p.add_argument("avant", help="Début d'année (AAAA-01-01) ou de mois (AAAA-MM-01)")
+    p.add_argument("--granularite", choices=('annee', 'mois'), default='annee')
+    p.add_argument("--compacter", action="store_true", help="VACUUM de la base courante après déplacement")
+
+    sous.add_parser("liste", help="Archives enregistrées")
+
+    p = sous.add_parser("regrouper", help=f"Fusionne les archives au-delà de {ARCHIVES_MAX} bases")
+    p.add_argument("--maximum", type=int, default=ARCHIVES_MAX)
+
+    p = sous.add_parser("banc", help="Durée d'une requête sur les derniers jours, avec et sans archives")
+    p.add_argument("--jours", type=int, default=30)
+    p.add_argument("--fin", default=None, help="Dernier jour de la fenêtre (dernière vente par défaut)")
+
+    args = parser.parse_args()
+    conn = connecter(DB_PATH)
+    try:
+        migrer_schema(conn)
+        if args.commande == "archiver":
+            debut = time.perf_counter()
+            periodes = archiver(conn, args.avant, args.granularite)
+            logger.info(f"{len(periodes)} périodes archivées en {time.perf_counter() - debut:.1f} s: "
+                        f"{', '.join(periodes) or 'aucune'}")
+            if args.compacter and periodes:
+                conn.execute("VACUUM")
+        elif args.commande == "regrouper":
+            logger.info(f"{regrouper(conn, args.maximum)} fusions d'archives")
+        elif args.commande == "liste":
+            print(pd.read_sql("SELECT * FROM archives_ventes ORDER BY debut", conn).to_string(index=False))
+        else:
+            fin = args.fin or conn.execute("SELECT MAX(date) FROM main.ventes").fetchone()[0][:10]
+            debut = str((pd.Timestamp(fin) - pd.Timedelta(days=args.jours - 1)).date())
+            requete = """SELECT produit_id, COUNT(*), SUM(prix_unitaire * quantite) FROM ventes
+                WHERE date >= ? AND date < date(?, '+1 day') GROUP BY produit_id"""
+            for libelle, attacher_archives in (("table courante", lambda: detacher(conn)),
+                                               ("toutes les archives", lambda: attacher(conn)),
+                                               ("archives de la période", lambda: attacher(conn, debut, fin))):
+                nb_archives = len(attacher_archives() or [])
+                mesure = time.perf_counter()
+                for _ in range(10):
+                    conn.execute(requete, (debut, fin)).fetchall()
+                print(f"{libelle:>24}: {(time.perf_counter() - mesure) * 100:.2f} ms "
+                      f"({nb_archives} archives attachées)")
+    except (sqlite3.Error, ValueError, OSError) as e:
+        logger.error(f"Erreur d'archivage: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,419 @@
+# scripts/associations.py
+"""Analyse des paniers : itemsets fréquents et règles d'association entre produits achetés ensemble"""
+import argparse
+import itertools
+import logging
+import math
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from archives import historique_complet
+from base_donnees import DB_PATH, connecter, migrer_schema
+
+logger = logging.getLogger(__name__)
+
+SUPPORT_MIN = 0.01  # Part minimale des paniers contenant un itemset
+CONFIANCE_MIN = 0.2  # Confiance minimale d'une règle
+LONGUEUR_MAX = 4  # Articles au plus par itemset
+PAIRES_PAR_LOT = 4_000_000  # Paires générées par tâche de comptage : mémoire bornée quelle que soit la taille
+SEUIL_PARALLELE = 500_000  # Paniers en dessous desquels le calcul reste dans le processus
+COMPTAGE_DENSE = 1 << 24  # Paires possibles jusqu'auxquelles elles sont comptées dans un tableau
+JOURS_PAR_CLIENT = 1 << 22  # Au-delà de tout jour julien : clé client-jour des ventes sans ticket
+
+Source = Union[str, Dict[str, np.ndarray]]
+Itemsets = Dict[Tuple[int, ...], int]
+
+_PROJECTIONS: Dict[Tuple[str, str], np.ndarray] = {}
+
+
+def lire_lignes(conn: sqlite3.Connection, debut: Optional[str] = None,
+                fin: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Panier et produit de chaque vente de [debut, fin] (tout l'historique par
+    défaut, archives comprises). Le panier est le ticket ; les ventes
+    enregistrées avant les tickets sont regroupées par client et par jour,
+    sous des clés négatives qui ne rencontrent aucun ticket.
+    """
+    with historique_complet(conn, debut, fin):
+        lignes = pd.read_sql(
+            f"""SELECT COALESCE(ticket_id, -(client_id * {JOURS_PAR_CLIENT}
+                    + CAST(julianday(substr(date, 1, 10)) AS INTEGER))) AS panier, produit_id
+            FROM ventes
+            WHERE date >= ? AND date < date(?, '+1 day') AND produit_id IS NOT NULL
+                AND (ticket_id IS NOT NULL OR client_id IS NOT NULL)""",
+            conn, params=(debut or '0000-01-01', fin or '9999-12-30')
+        )
+    return lignes['panier'].to_numpy(np.int64), lignes['produit_id'].to_numpy(np.int64)
+
+
+def _numeroter(valeurs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Numéro (0 à n - 1) de chaque valeur et valeurs distinctes : par comptage si compactes, par hachage sinon"""
+    if len(valeurs):
+        minimum = valeurs.min()
+        if valeurs.max() - minimum < 4 * len(valeurs) + 1024:
+            presentes = np.bincount(valeurs - minimum) > 0
+            return (np.cumsum(presentes) - 1)[valeurs - minimum], np.flatnonzero(presentes) + minimum
+    return pd.factorize(valeurs)
+
+
+def encoder(paniers: np.ndarray, produits: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Représentation horizontale compacte : les articles distincts de chaque
+    panier, triés, à la suite (articles[debuts[p]:debuts[p + 1]] pour le
+    panier p). Les articles sont numérotés de 0 à n - 1.
+
+    Returns:
+        (debuts, articles, id du produit de chaque numéro d'article)
+    """
+    articles, ids = _numeroter(produits)
+    numeros, uniques = _numeroter(paniers)
+    n = max(len(ids), 1)
+    # Un seul tri sur (panier, article) : ordre horizontal, puis doublons retirés
+    # (tri explicite : np.unique sans autre sortie passe par un hachage bien plus lent ici)
+    cles = np.sort(numeros.astype(np.int64) * n + articles)
+    cles = cles[np.concatenate(([True], cles[1:] != cles[:-1]))] if len(cles) else cles
+    tailles = np.bincount(cles // n, minlength=len(uniques))
+    debuts = np.concatenate(([0], np.cumsum(tailles)))
+    return debuts, (cles % n).astype(np.int32), ids
+
+
+def _tableau(source: Source, nom: str) -> np.ndarray:
+    """Tableau du calcul : tel quel dans le processus, projeté depuis le dossier partagé dans un worker"""
+    if isinstance(source, dict):
+        return source[nom]
+    cle = (source, nom)
+    if cle not in _PROJECTIONS:
+        _PROJECTIONS[cle] = np.load(Path(source) / f"{nom}.npy", mmap_mode='r')
+    return _PROJECTIONS[cle]
+
+
+def _compter_paires(source: Source, premier: int, dernier: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Tâche : occurrences des paires d'articles des paniers [premier, dernier[,
+    générées toutes à la fois (code a * n + b, a < b) puis comptées
+    """
+    n = int(_tableau(source, 'nb_articles'))
+    debuts = np.asarray(_tableau(source, 'debuts')[premier:dernier + 1])
+    articles = np.asarray(_tableau(source, 'articles')[debuts[0]:debuts[-1]]).astype(np.int64)
+    tailles = np.diff(debuts)
+    rangs = np.arange(len(articles)) - np.repeat(debuts[:-1] - debuts[0], tailles)
+    suivants = np.repeat(tailles, tailles) - rangs - 1  # Articles après chacun dans son panier
+    gauche = np.repeat(np.arange(len(articles)), suivants)
+    droite = gauche + 1 + np.arange(len(gauche)) - np.repeat(np.cumsum(suivants) - suivants, suivants)
+    codes = articles[gauche] * n + articles[droite]
+    if n * n <= COMPTAGE_DENSE:
+        comptes = np.bincount(codes, minlength=n * n)
+        codes = np.flatnonzero(comptes)
+        return codes, comptes[codes]
+    return np.unique(codes, return_counts=True)
+
+
+def _eclat(prefixe: Tuple[int, ...], membres: List[Tuple[int, np.ndarray]], seuil: int, longueur_max: int,
+           paires: set, n: int, masque: np.ndarray, resultats: List[Tuple[Tuple[int, ...], int]]) -> None:
+    """
+    Étend en profondeur les itemsets `prefixe` + b de `membres` (article b,
+    paniers qui les contiennent) : paniers communs à deux membres par
+    marquage des paniers de l'un et lecture pour ceux de l'autre
+    """
+    for k, (b, paniers_b) in enumerate(membres[:-1]):
+        masque[paniers_b] = True
+        suivants = []
+        for c, paniers_c in membres[k + 1:]:
+            if b * n + c not in paires:
+                continue  # Un sous-ensemble {b, c} non fréquent : l'extension ne peut pas l'être
+            communs = paniers_c[masque[paniers_c]]
+            if len(communs) >= seuil:
+                suivants.append((c, communs))
+                resultats.append((prefixe + (b, c), len(communs)))
+        masque[paniers_b] = False
+        if len(suivants) > 1 and len(prefixe) + 3 <= longueur_max:
+            _eclat(prefixe + (b,), suivants, seuil, longueur_max, paires, n, masque, resultats)
+
+
+def _explorer(source: Source, prefixes: List[int], seuil: int,
+              longueur_max: int) -> List[Tuple[Tuple[int, ...], int]]:
+    """
+    Tâche : itemsets fréquents de 3 articles et plus dont le plus petit
+    article est l'un de `prefixes`, sur les listes verticales de paniers
+    (Eclat) restreintes aux paires fréquentes
+    """
+    n = int(_tableau(source, 'nb_articles'))
+    debuts, paniers = _tableau(source, 'debuts_verticaux'), _tableau(source, 'paniers')
+    codes = np.asarray(_tableau(source, 'paires'))
+    paires = set(codes.tolist())
+    masque = np.zeros(int(_tableau(source, 'nb_paniers')), dtype=bool)
+    resultats = []
+    for a in prefixes:
+        partenaires = codes[np.searchsorted(codes, a * n):np.searchsorted(codes, (a + 1) * n)] % n
+        paniers_a = np.asarray(paniers[debuts[a]:debuts[a + 1]])
+        masque[paniers_a] = True
+        membres = []
+        for b in partenaires.tolist():
+            paniers_b = np.asarray(paniers[debuts[b]:debuts[b + 1]])
+            membres.append((b, paniers_b[masque[paniers_b]]))
+        masque[paniers_a] = False
+        _eclat((a,), membres, seuil, longueur_max, paires, n, masque, resultats)
+    return resultats
+
+
+def _lots(couts: np.ndarray, taille: int) -> List[Tuple[int, int]]:
+    """Découpe des paniers en plages consécutives d'environ `taille` unités de coût"""
+    cumul = np.cumsum(couts)
+    if not len(cumul):
+        return []
+    bornes = np.searchsorted(cumul, np.arange(1, cumul[-1] // taille + 1) * taille, side='right')
+    bornes = np.unique(np.concatenate(([0], bornes, [len(couts)])))
+    return list(zip(bornes[:-1].tolist(), bornes[1:].tolist()))
+
+
+def _executer(executeur: Optional[ProcessPoolExecutor], tache: Callable, source: Source, arguments: list) -> list:
+    """Résultats de `tache` pour chaque jeu d'arguments : répartis sur les workers, ou dans le processus"""
+    if executeur is None:
+        return [tache(source, *a) for a in arguments]
+    futurs = [executeur.submit(tache, source, *a) for a in arguments]
+    return [f.result() for f in futurs]
+
+
+def _miner(tableaux: Dict[str, np.ndarray], source: Source, executeur: Optional[ProcessPoolExecutor],
+           seuil: int, longueur_max: int, workers: int) -> Itemsets:
+    """Paires comptées sur les paniers, puis extensions explorées sur les listes verticales"""
+    n = int(tableaux['nb_articles'])
+    tailles = np.diff(tableaux['debuts'])
+    lots = _lots(tailles * (tailles - 1) // 2, PAIRES_PAR_LOT)
+    if not lots:
+        return {}
+    comptages = _executer(executeur, _compter_paires, source, lots)
+    codes = np.concatenate([c for c, _ in comptages])
+    comptes = np.concatenate([c for _, c in comptages])
+    if len(comptages) > 1:
+        codes, inverse = np.unique(codes, return_inverse=True)
+        comptes = np.bincount(inverse, weights=comptes).astype(np.int64)
+    frequentes = comptes >= seuil
+    codes, comptes = codes[frequentes], comptes[frequentes]
+    itemsets = {(a, b): c for a, b, c in zip((codes // n).tolist(), (codes % n).tolist(), comptes.tolist())}
+    if longueur_max < 3 or not len(codes):
+        return itemsets
+
+    # Listes verticales : paniers de chaque article, triés (tri stable de l'ordre horizontal)
+    ordre = np.argsort(tableaux['articles'], kind='stable')
+    paniers = np.repeat(np.arange(len(tailles), dtype=np.int32), tailles)[ordre]
+    debuts_verticaux = np.concatenate(([0], np.cumsum(np.bincount(tableaux['articles'], minlength=n))))
+    etendus = {'paires': codes, 'paniers': paniers, 'debuts_verticaux': debuts_verticaux}
+    if isinstance(source, dict):
+        source.update(etendus)
+    else:
+        for nom, valeurs in etendus.items():
+            np.save(Path(source) / f"{nom}.npy", valeurs)
+
+    # Préfixes ayant au moins deux partenaires, répartis du plus chargé au moins chargé entre les tâches
+    partenaires = np.bincount(codes // n, minlength=n)
+    prefixes = np.flatnonzero(partenaires > 1)
+    prefixes = prefixes[np.argsort(-partenaires[prefixes], kind='stable')].tolist()
+    nb_taches = min(len(prefixes), workers * 4) if executeur is not None else min(len(prefixes), 1)
+    groupes = [(prefixes[i::nb_taches], seuil, longueur_max) for i in range(nb_taches)]
+    for resultats in _executer(executeur, _explorer, source, groupes):
+        itemsets.update(resultats)
+    return itemsets
+
+
+def extraire(debuts: np.ndarray, articles: np.ndarray, support_min: float = SUPPORT_MIN,
+             longueur_max: int = LONGUEUR_MAX, workers: Optional[int] = None) -> Itemsets:
+    """
+    Itemsets fréquents des paniers (représentation de `encoder`) : ceux
+    présents dans au moins `support_min` des paniers, jusqu'à `longueur_max`
+    articles, en codes d'articles triés -> nombre de paniers.
+
+    Les articles isolés sont comptés d'un bincount ; les paires sur les
+    paniers, toutes générées et comptées d'un coup par lot ; les itemsets
+    plus longs en profondeur sur les listes verticales de paniers, par
+    intersection des listes de deux itemsets de même préfixe (Eclat). Les
+    articles non fréquents et les paniers devenus trop petits sont écartés
+    avant chaque étape. Au-delà de SEUIL_PARALLELE paniers, les lots et les
+    préfixes sont répartis sur `workers` processus (par défaut : nombre de
+    CPU), qui projettent les mêmes tableaux depuis un dossier temporaire.
+    """
+    nb_paniers = len(debuts) - 1
+    seuil = max(1, math.ceil(support_min * nb_paniers))
+    comptes = np.bincount(articles) if len(articles) else np.zeros(0, dtype=np.int64)
+    frequents = np.flatnonzero(comptes >= seuil)
+    itemsets = {(int(a),): int(comptes[a]) for a in frequents}
+    if longueur_max < 2 or len(frequents) < 2:
+        return itemsets
+
+    # Articles fréquents seulement (renumérotés), paniers d'au moins deux d'entre eux
+    rangs = np.full(len(comptes), -1, dtype=np.int32)
+    rangs[frequents] = np.arange(len(frequents), dtype=np.int32)
+    paniers = np.repeat(np.arange(nb_paniers), np.diff(debuts))
+    gardes = rangs[articles] >= 0
+    paniers, reduits = paniers[gardes], rangs[articles[gardes]]
+    tailles = np.bincount(paniers, minlength=nb_paniers)
+    gardes = tailles[paniers] > 1
+    tailles = tailles[tailles > 1]
+    tableaux = {'debuts': np.concatenate(([0], np.cumsum(tailles))), 'articles': reduits[gardes],
+                'nb_articles': np.array(len(frequents)), 'nb_paniers': np.array(len(tailles))}
+    del paniers, gardes
+    if tableaux['nb_paniers'] == 0:
+        # Aucun panier ne réunit deux articles fréquents : pas de paire à compter
+        return itemsets
+
+    workers = workers or os.cpu_count() or 1
+    if workers < 2 or len(tailles) < SEUIL_PARALLELE:
+        multiples = _miner(tableaux, dict(tableaux), None, seuil, longueur_max, workers)
+    else:
+        with tempfile.TemporaryDirectory(prefix="associations-") as dossier, \
+                ProcessPoolExecutor(max_workers=workers) as executeur:
+            for nom, valeurs in tableaux.items():
+                np.save(Path(dossier) / f"{nom}.npy", valeurs)
+            multiples = _miner(tableaux, dossier, executeur, seuil, longueur_max, workers)
+    itemsets.update({tuple(int(frequents[a]) for a in codes): n for codes, n in multiples.items()})
+    return itemsets
+
+
+def regles(itemsets: Itemsets, nb_paniers: int, confiance_min: float = CONFIANCE_MIN) -> pd.DataFrame:
+    """
+    Règles X -> y à un seul conséquent, tirées des itemsets fréquents :
+    support de X + y, confiance P(y | X) et lift, la confiance rapportée à
+    la fréquence de y (au-dessus de 1 : achetés ensemble plus souvent que
+    par hasard). Tous les sous-ensembles d'un itemset fréquent le sont aussi.
+    """
+    lignes = []
+    for articles, n in itemsets.items():
+        if len(articles) < 2:
+            continue
+        for k, consequent in enumerate(articles):
+            antecedent = articles[:k] + articles[k + 1:]
+            confiance = n / itemsets[antecedent]
+            if confiance >= confiance_min:
+                lignes.append((antecedent, consequent, n, confiance, confiance * nb_paniers / itemsets[(consequent,)]))
+    resultat = pd.DataFrame(lignes, columns=['antecedent', 'consequent', 'paniers', 'confiance', 'lift'])
+    resultat.insert(3, 'support', resultat['paniers'] / nb_paniers if nb_paniers else 0.0)
+    return resultat.sort_values(['lift', 'paniers'], ascending=False, ignore_index=True)
+
+
+def analyser(conn: sqlite3.Connection, debut: Optional[str] = None, fin: Optional[str] = None,
+             support_min: float = SUPPORT_MIN, confiance_min: float = CONFIANCE_MIN,
+             longueur_max: int = LONGUEUR_MAX, workers: Optional[int] = None) -> Tuple[pd.DataFrame, pd.DataFrame, int]:
+    """
+    Itemsets fréquents et règles d'association des paniers de [debut, fin]
+    (connexion en lecture seule possible), avec les noms des produits
+
+    Returns:
+        (itemsets, regles, nombre de paniers)
+    """
+    debuts, articles, ids = encoder(*lire_lignes(conn, debut, fin))
+    nb_paniers = len(debuts) - 1
+    itemsets = extraire(debuts, articles, support_min, longueur_max, workers)
+    noms = dict(conn.execute("SELECT id, nom FROM produits"))
+
+    def libeller(codes: Tuple[int, ...]) -> str:
+        return " + ".join(noms.get(int(ids[c]), f"#{ids[c]}") for c in codes)
+
+    frequents = pd.DataFrame({
+        'articles': [libeller(codes) for codes in itemsets],
+        'taille': [len(codes) for codes in itemsets],
+        'paniers': list(itemsets.values()),
+    })
+    frequents['support'] = frequents['paniers'] / nb_paniers if nb_paniers else 0.0
+    frequents = frequents.sort_values(['paniers', 'taille'], ascending=[False, True], ignore_index=True)
+
+    associations = regles(itemsets, nb_paniers, confiance_min)
+    associations['antecedent'] = associations['antecedent'].map(libeller)
+    associations['consequent'] = associations['consequent'].map(lambda c: libeller((c,)))
+    return frequents, associations, nb_paniers
+
+
+def _banc(nb_paniers: int, nb_articles: int, support_min: float, workers: Optional[int]) -> List[str]:
+    """
+    Paniers synthétiques (popularité des articles en loi de puissance, et
+    quelques lots d'articles achetés ensemble), face au comptage panier par
+    panier des seules paires (extrapolé d'un échantillon)
+    """
+    generateur = np.random.default_rng(0)
+    tailles = 1 + generateur.poisson(2.0, nb_paniers)
+    popularite = 1 / np.arange(1, nb_articles + 1) ** 0.8
+    produits = [generateur.choice(nb_articles, size=int(tailles.sum()), p=popularite / popularite.sum())]
+    paniers = [np.repeat(np.arange(nb_paniers), tailles)]
+    for _ in range(20):  # Lots de 2 à 4 articles présents ensemble dans 0,5 % des paniers
+        lot = generateur.choice(nb_articles, size=generateur.integers(2, 5), replace=False)
+        elus = generateur.choice(nb_paniers, size=nb_paniers // 200, replace=False)
+        paniers.append(np.repeat(elus, len(lot)))
+        produits.append(np.tile(lot, len(elus)))
+    paniers, produits = np.concatenate(paniers), np.concatenate(produits) + 1
+
+    debut = time.perf_counter()
+    debuts, articles, _ = encoder(paniers, produits)
+    encodage = time.perf_counter() - debut
+    debut = time.perf_counter()
+    itemsets = extraire(debuts, articles, support_min, LONGUEUR_MAX, workers)
+    extraction = time.perf_counter() - debut
+    associations = regles(itemsets, nb_paniers)
+
+    echantillon = min(nb_paniers, 100_000)
+    debut = time.perf_counter()
+    comptes = Counter()
+    for p in range(echantillon):
+        comptes.update(itertools.combinations(articles[debuts[p]:debuts[p + 1]].tolist(), 2))
+    boucle = (time.perf_counter() - debut) * nb_paniers / echantillon
+
+    par_taille = Counter(len(codes) for codes in itemsets)
+    return [f"{nb_paniers:,} paniers, {len(produits):,} lignes, {nb_articles:,} articles, support {support_min:.2%} "
+            f"({workers or os.cpu_count()} processus)",
+            f"encodage {encodage:.1f} s, extraction {extraction:.1f} s: "
+            + ", ".join(f"{n:,} itemsets de {t}" for t, n in sorted(par_taille.items())),
+            f"{len(associations):,} règles, lift max {associations['lift'].max() if len(associations) else 0:.1f}",
+            f"paires comptées panier par panier: ~{boucle:.0f} s (extrapolé de {echantillon:,} paniers)"]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Produits achetés ensemble : itemsets fréquents et règles")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    for nom, aide in (("regles", "Règles d'association, par lift décroissant"),
+                      ("itemsets", "Itemsets fréquents, par nombre de paniers décroissant")):
+        p = sous.add_parser(nom, help=aide)
+        p.add_argument("--debut", default=None, help="Premier jour (AAAA-MM-JJ)")
+        p.add_argument("--fin", default=None, help="Dernier jour (AAAA-MM-JJ)")
+        p.add_argument("--support", type=float, default=SUPPORT_MIN, help="Part minimale des paniers")
+        p.add_argument("--confiance", type=float, default=CONFIANCE_MIN)
+        p.add_argument("--longueur", type=int, default=LONGUEUR_MAX, help="Articles au plus par itemset")
+        p.add_argument("--workers", type=int, default=None, help="Processus de comptage (défaut: nombre de CPU)")
+        p.add_argument("--limite", type=int, default=30)
+
+    p = sous.add_parser("banc", help="Extraction sur des paniers synthétiques")
+    p.add_argument("--paniers", type=int, default=10_000_000)
+    p.add_argument("--articles", type=int, default=10_000)
+    p.add_argument("--support", type=float, default=0.001)
+    p.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args()
+    try:
+        if args.commande == "banc":
+            print("\n".join(_banc(args.paniers, args.articles, args.support, args.workers)))
+            sys.exit(0)
+        conn = connecter(DB_PATH)
+        try:
+            migrer_schema(conn)
+            debut = time.perf_counter()
+            frequents, associations, nb_paniers = analyser(conn, args.debut, args.fin, args.support,
+                                                           args.confiance, args.longueur, args.workers)
+            tableau = associations if args.commande == "regles" else frequents
+            with pd.option_context('display.width', 250, 'display.max_colwidth', 80):
+                print(tableau.head(args.limite).to_string(index=False))
+            logger.info(f"{nb_paniers:,} paniers, {len(frequents):,} itemsets, {len(associations):,} règles "
+                        f"en {time.perf_counter() - debut:.2f} s")
+        finally:
+            conn.close()
+    except (sqlite3.Error, ValueError) as e:
+        logger.error(f"Erreur d'analyse des paniers: {e}")
+        sys.exit(1)
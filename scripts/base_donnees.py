@@ -0,0 +1,657 @@
+# scripts/base_donnees.py
+"""Accès partagé à la base des ventes et évolutions de schéma"""
+import hashlib
+import logging
+import sqlite3
+import unicodedata
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Union
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "../data/vente.db"
+
+# Index plein texte des noms : mots (préfixes, sans accents) et trigrammes (fragments)
+INDEX_RECHERCHE = {
+    'mots': "tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'",
+    'trigrammes': "tokenize = 'trigram'",
+}
+
+# Échantillon stratifié des ventes (strate = mois x produit) : chaque vente y
+# entre avec la probabilité max(TAUX, MINIMUM / population de la strate)
+ECHANTILLON_TAUX = 0.01
+ECHANTILLON_MINIMUM = 30
+SEUIL_ECHANTILLON = f"max({ECHANTILLON_TAUX}, {ECHANTILLON_MINIMUM} * 1.0 / s.population)"
+
+
+def connecter(db_path: Union[str, Path] = DB_PATH, lecture_seule: bool = False,
+              timeout: float = 30.0) -> sqlite3.Connection:
+    """
+    Ouvre une connexion configurée pour l'accès concurrent.
+
+    En écriture la base passe en mode WAL : les lecteurs (dashboard, analyses)
+    ne sont jamais bloqués par un écrivain. En lecture seule la connexion est
+    ouverte via une URI `mode=ro`.
+    """
+    if lecture_seule:
+        uri = f"file:{Path(db_path).resolve().as_posix()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=timeout, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(str(db_path), timeout=timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-65536")  # 64 Mo
+    return conn
+
+
+def colonnes(conn: sqlite3.Connection, table: str) -> set:
+    """Retourne les noms de colonnes d'une table"""
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def table_existe(conn: sqlite3.Connection, table: str) -> bool:
+    """Indique si une table existe dans la base"""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)
+    ).fetchone() is not None
+
+
+def dossier_base(conn: sqlite3.Connection) -> Path:
+    """Dossier du fichier de la base principale (dossier courant pour une base en mémoire)"""
+    fichier = conn.execute("PRAGMA database_list").fetchone()[2]
+    return Path(fichier).resolve().parent if fichier else Path.cwd()
+
+
+def ajouter_colonne(conn: sqlite3.Connection, table: str, colonne: str, definition: str) -> None:
+    """Ajoute une colonne si elle n'existe pas encore"""
+    if colonne not in colonnes(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {colonne} {definition}")
+
+
+def migrer_schema(conn: sqlite3.Connection) -> None:
+    """Met à niveau une base créée par 01_creation_db (opération idempotente)"""
+    # Prix effectivement facturé et clé d'idempotence des imports
+    ajouter_colonne(conn, 'ventes', 'prix_unitaire', 'REAL')
+    ajouter_colonne(conn, 'ventes', 'cle_import', 'INTEGER')
+    ajouter_colonne(conn, 'produits', 'categorie_id', 'INTEGER REFERENCES categories(id)')
+    # Ticket de caisse (ou facture) de la vente : NULL pour les ventes enregistrées avant son introduction
+    ajouter_colonne(conn, 'ventes', 'ticket_id', 'INTEGER REFERENCES tickets(id)')
+
+    nouveau_journal = not table_existe(conn, 'mouvements_stock')
+    nouvel_historique = not table_existe(conn, 'prix_produits')
+    nouvel_echantillon = not table_existe(conn, 'strates_echantillon')
+    nouvelles_esquisses = not table_existe(conn, 'esquisses_jour')
+    nouveau_palmares = not table_existe(conn, 'palmares') or not table_existe(conn, 'totaux_produits')
+    nouvelle_segmentation = not table_existe(conn, 'rfm_clients')
+    nouvelles_cohortes = not table_existe(conn, 'clients_actifs_mois')
+
+    # Le type 'inventaire' élargit la contrainte du journal de stock : SQLite ne modifiant pas
+    # un CHECK, la table est reconstruite (recopiée après création de la nouvelle, plus bas)
+    journal = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'mouvements_stock'").fetchone()
+    if journal and "'inventaire'" not in journal[0]:
+        for nom in ('trg_ventes_stock_insert', 'trg_ventes_stock_update', 'trg_ventes_stock_delete',
+                    'trg_mouvements_snapshots', 'trg_mouvements_catalogue'):
+            conn.execute(f"DROP TRIGGER IF EXISTS {nom}")
+        conn.execute("DROP INDEX IF EXISTS idx_mouvements_produit_date")
+        conn.execute("DROP INDEX IF EXISTS idx_mouvements_suivi")
+        conn.execute("ALTER TABLE mouvements_stock RENAME TO mouvements_stock_ancien")
+    # Anciennes versions de triggers, recréées plus bas (nom, marque de la version courante) :
+    # - mouvements de stock sans condition, un upsert identique journalisait deux mouvements ;
+    # - prix daté en UTC, et réinscrit même quand l'historique le portait déjà
+    for nom, marque in (('trg_ventes_stock_update', 'WHEN'), ('trg_prix_update', 'localtime')):
+        declencheur = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (nom,)).fetchone()
+        if declencheur and marque not in declencheur[0]:
+            conn.execute(f"DROP TRIGGER {nom}")
+
+    conn.executescript("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_ventes_cle_import ON ventes(cle_import);
+    CREATE INDEX IF NOT EXISTS idx_ventes_date ON ventes(date);
+    CREATE INDEX IF NOT EXISTS idx_ventes_produit ON ventes(produit_id);
+    CREATE INDEX IF NOT EXISTS idx_ventes_client ON ventes(client_id);
+    CREATE INDEX IF NOT EXISTS idx_ventes_ticket ON ventes(ticket_id);
+
+    -- Tickets : un par encaissement ; ceux des imports retrouvés par la clé de leur
+    -- numéro d'origine (date et numéro de ticket d'un export, empreinte d'une facture)
+    CREATE TABLE IF NOT EXISTS tickets (
+        id INTEGER PRIMARY KEY,
+        cle_import INTEGER UNIQUE
+    );
+
+    -- Version du catalogue, incrémentée à chaque modification des produits ou du stock
+    CREATE TABLE IF NOT EXISTS version_catalogue (version INTEGER NOT NULL);
+    INSERT INTO version_catalogue SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM version_catalogue);
+    CREATE TRIGGER IF NOT EXISTS trg_catalogue_insert AFTER INSERT ON produits
+        BEGIN UPDATE version_catalogue SET version = version + 1; END;
+    CREATE TRIGGER IF NOT EXISTS trg_catalogue_update AFTER UPDATE OF nom, prix ON produits
+        BEGIN UPDATE version_catalogue SET version = version + 1; END;
+    CREATE TRIGGER IF NOT EXISTS trg_catalogue_delete AFTER DELETE ON produits
+        BEGIN UPDATE version_catalogue SET version = version + 1; END;
+
+    -- Journal des mouvements de stock (append-only) : quantités signées, sauf les
+    -- inventaires qui donnent le stock compté en fin de journée
+    CREATE TABLE IF NOT EXISTS mouvements_stock (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        produit_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        quantite INTEGER NOT NULL,
+        type TEXT NOT NULL CHECK (type IN ('vente', 'reception', 'ajustement', 'inventaire')),
+        vente_id INTEGER,
+        commentaire TEXT,
+        FOREIGN KEY (produit_id) REFERENCES produits(id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_mouvements_produit_date ON mouvements_stock(produit_id, date);
+    -- Un produit est suivi en stock dès qu'il a reçu une réception ou un inventaire
+    CREATE INDEX IF NOT EXISTS idx_mouvements_suivi ON mouvements_stock(produit_id) WHERE type != 'vente';
+    CREATE INDEX IF NOT EXISTS idx_mouvements_inventaire ON mouvements_stock(produit_id, date)
+        WHERE type = 'inventaire';
+    -- Demande récente par produit (points de commande) : type figure dans l'index
+    -- pour que la requête ne lise que lui
+    CREATE INDEX IF NOT EXISTS idx_mouvements_ventes ON mouvements_stock(date, produit_id, quantite, type)
+        WHERE type = 'vente';
+
+    -- Stock de fin de journée par produit, point de départ des calculs
+    CREATE TABLE IF NOT EXISTS snapshots_stock (
+        produit_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        stock INTEGER NOT NULL,
+        PRIMARY KEY (produit_id, date)
+    ) WITHOUT ROWID;
+
+    -- Un mouvement antidaté invalide les snapshots postérieurs du produit
+    CREATE TRIGGER IF NOT EXISTS trg_mouvements_snapshots AFTER INSERT ON mouvements_stock
+        BEGIN DELETE FROM snapshots_stock WHERE produit_id = NEW.produit_id AND date >= NEW.date; END;
+    CREATE TRIGGER IF NOT EXISTS trg_mouvements_catalogue AFTER INSERT ON mouvements_stock
+        WHEN NEW.type != 'vente'
+        BEGIN UPDATE version_catalogue SET version = version + 1; END;
+
+    -- Toute vente, quel que soit son canal d'entrée, est une sortie de stock
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_stock_insert AFTER INSERT ON ventes
+        BEGIN
+            INSERT INTO mouvements_stock (produit_id, date, quantite, type, vente_id)
+            VALUES (NEW.produit_id, NEW.date, -NEW.quantite, 'vente', NEW.id);
+        END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_stock_update AFTER UPDATE OF produit_id, date, quantite ON ventes
+        WHEN OLD.produit_id IS NOT NEW.produit_id OR OLD.date IS NOT NEW.date OR OLD.quantite IS NOT NEW.quantite
+        BEGIN
+            INSERT INTO mouvements_stock (produit_id, date, quantite, type, vente_id)
+            VALUES (OLD.produit_id, OLD.date, OLD.quantite, 'vente', OLD.id),
+                   (NEW.produit_id, NEW.date, -NEW.quantite, 'vente', NEW.id);
+        END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_stock_delete AFTER DELETE ON ventes
+        BEGIN
+            INSERT INTO mouvements_stock (produit_id, date, quantite, type, vente_id)
+            VALUES (OLD.produit_id, OLD.date, OLD.quantite, 'vente', OLD.id);
+        END;
+
+    -- Historique des prix : le prix en vigueur à une date est la dernière
+    -- entrée dont valide_depuis <= date
+    CREATE TABLE IF NOT EXISTS prix_produits (
+        produit_id INTEGER NOT NULL,
+        valide_depuis TEXT NOT NULL,
+        prix REAL NOT NULL,
+        PRIMARY KEY (produit_id, valide_depuis)
+    ) WITHOUT ROWID;
+    CREATE TRIGGER IF NOT EXISTS trg_prix_insert AFTER INSERT ON produits
+        BEGIN INSERT OR REPLACE INTO prix_produits VALUES (NEW.id, '0001-01-01', NEW.prix); END;
+    -- Un prix modifié directement prend effet le jour même (date locale) ; un prix
+    -- déjà en vigueur dans l'historique (prix_historique.definir_prix) n'est pas réinscrit
+    CREATE TRIGGER IF NOT EXISTS trg_prix_update AFTER UPDATE OF prix ON produits
+        WHEN NEW.prix != OLD.prix AND NEW.prix IS NOT (
+            SELECT prix FROM prix_produits WHERE produit_id = NEW.id AND valide_depuis <= date('now', 'localtime')
+            ORDER BY valide_depuis DESC LIMIT 1)
+        BEGIN INSERT OR REPLACE INTO prix_produits VALUES (NEW.id, date('now', 'localtime'), NEW.prix); END;
+
+    -- Une vente enregistrée sans prix reçoit le prix en vigueur à sa date
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_prix AFTER INSERT ON ventes
+        WHEN NEW.prix_unitaire IS NULL
+        BEGIN
+            UPDATE ventes SET prix_unitaire = (
+                SELECT prix FROM prix_produits
+                WHERE produit_id = NEW.produit_id AND valide_depuis <= NEW.date
+                ORDER BY valide_depuis DESC LIMIT 1
+            ) WHERE id = NEW.id;
+        END;
+
+    -- Taux de change datés : 1 devise_source = taux devise_cible
+    CREATE TABLE IF NOT EXISTS taux_change (
+        devise_source TEXT NOT NULL,
+        devise_cible TEXT NOT NULL,
+        date TEXT NOT NULL,
+        taux REAL NOT NULL CHECK (taux > 0),
+        PRIMARY KEY (devise_source, devise_cible, date)
+    ) WITHOUT ROWID;
+    -- Parité fixe BCEAO depuis l'introduction de l'euro
+    INSERT OR IGNORE INTO taux_change VALUES ('EUR', 'XOF', '1999-01-01', 655.96);
+
+    -- Arborescence des catégories en ensembles imbriqués : le sous-arbre d'un
+    -- nœud est l'intervalle [bg, bd] (bornes recalculées par categories.py)
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nom TEXT NOT NULL,
+        parent_id INTEGER REFERENCES categories(id),
+        bg INTEGER,
+        bd INTEGER,
+        profondeur INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_categories_bornes ON categories(bg, bd);
+    CREATE INDEX IF NOT EXISTS idx_categories_parent ON categories(parent_id, nom);
+    CREATE INDEX IF NOT EXISTS idx_produits_categorie ON produits(categorie_id);
+
+    -- Esquisses journalières fusionnables (clients distincts, quantiles des paniers)
+    -- par magasin ; les jours touchés par une écriture sont recalculés par esquisses.py
+    -- (ON CONFLICT DO NOTHING plutôt que OR IGNORE, que la résolution d'un upsert englobant écraserait)
+    CREATE TABLE IF NOT EXISTS esquisses_jour (
+        magasin TEXT NOT NULL,
+        jour TEXT NOT NULL,
+        nb_ventes INTEGER NOT NULL,
+        clients BLOB NOT NULL,
+        quantites BLOB NOT NULL,
+        montants BLOB NOT NULL,
+        PRIMARY KEY (magasin, jour)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS esquisses_a_recalculer (jour TEXT PRIMARY KEY) WITHOUT ROWID;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_esquisses_insert AFTER INSERT ON ventes
+        BEGIN INSERT INTO esquisses_a_recalculer VALUES (substr(NEW.date, 1, 10)) ON CONFLICT DO NOTHING; END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_esquisses_update AFTER UPDATE ON ventes
+        BEGIN
+            INSERT INTO esquisses_a_recalculer
+            VALUES (substr(OLD.date, 1, 10)), (substr(NEW.date, 1, 10)) ON CONFLICT DO NOTHING;
+        END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_esquisses_delete AFTER DELETE ON ventes
+        BEGIN INSERT INTO esquisses_a_recalculer VALUES (substr(OLD.date, 1, 10)) ON CONFLICT DO NOTHING; END;
+
+    -- Palmarès (meilleurs produits et clients) par jour et par mois, recalculés
+    -- par palmares.py pour les jours touchés ; plancher = majorant des absents
+    CREATE TABLE IF NOT EXISTS palmares (
+        dimension TEXT NOT NULL CHECK (dimension IN ('produit', 'client')),
+        periode TEXT NOT NULL,
+        cle INTEGER NOT NULL,
+        ca_eur REAL NOT NULL,
+        erreur REAL NOT NULL,
+        quantite INTEGER NOT NULL,
+        PRIMARY KEY (dimension, periode, cle)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS planchers_palmares (
+        dimension TEXT NOT NULL,
+        periode TEXT NOT NULL,
+        plancher REAL NOT NULL,
+        PRIMARY KEY (dimension, periode)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS palmares_a_recalculer (jour TEXT PRIMARY KEY) WITHOUT ROWID;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_palmares_insert AFTER INSERT ON ventes
+        BEGIN INSERT INTO palmares_a_recalculer VALUES (substr(NEW.date, 1, 10)) ON CONFLICT DO NOTHING; END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_palmares_update AFTER UPDATE ON ventes
+        BEGIN
+            INSERT INTO palmares_a_recalculer
+            VALUES (substr(OLD.date, 1, 10)), (substr(NEW.date, 1, 10)) ON CONFLICT DO NOTHING;
+        END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_palmares_delete AFTER DELETE ON ventes
+        BEGIN INSERT INTO palmares_a_recalculer VALUES (substr(OLD.date, 1, 10)) ON CONFLICT DO NOTHING; END;
+
+    -- Totaux complets par produit, par jour (AAAA-MM-JJ) et par mois (AAAA-MM),
+    -- recalculés avec le palmarès : comparaisons de périodes sans relire les ventes
+    CREATE TABLE IF NOT EXISTS totaux_produits (
+        periode TEXT NOT NULL,
+        produit_id INTEGER NOT NULL,
+        nb_ventes INTEGER NOT NULL,
+        quantite INTEGER NOT NULL,
+        ca_eur REAL NOT NULL,
+        PRIMARY KEY (periode, produit_id)
+    ) WITHOUT ROWID;
+
+    -- Segmentation RFM : agrégats de chaque client (tout l'historique, archives
+    -- comprises) et derniers scores, recalculés par segmentation.py pour les clients touchés
+    CREATE TABLE IF NOT EXISTS rfm_clients (
+        client_id INTEGER PRIMARY KEY,
+        premier_achat TEXT NOT NULL,
+        dernier_achat TEXT NOT NULL,
+        frequence INTEGER NOT NULL,
+        montant REAL NOT NULL,
+        r INTEGER,
+        f INTEGER,
+        m INTEGER,
+        segment TEXT
+    );
+    CREATE TABLE IF NOT EXISTS rfm_a_recalculer (client_id INTEGER PRIMARY KEY) WITHOUT ROWID;
+    -- Version des segments enregistrés : nomme leur copie colonnaire (data/colonnes/rfm)
+    CREATE TABLE IF NOT EXISTS rfm_version (jeton TEXT NOT NULL);
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_rfm_insert AFTER INSERT ON ventes WHEN NEW.client_id IS NOT NULL
+        BEGIN INSERT INTO rfm_a_recalculer VALUES (NEW.client_id) ON CONFLICT DO NOTHING; END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_rfm_update
+        AFTER UPDATE OF client_id, date, quantite, prix_unitaire ON ventes
+        BEGIN
+            INSERT INTO rfm_a_recalculer SELECT OLD.client_id WHERE OLD.client_id IS NOT NULL
+                ON CONFLICT DO NOTHING;
+            INSERT INTO rfm_a_recalculer SELECT NEW.client_id WHERE NEW.client_id IS NOT NULL
+                ON CONFLICT DO NOTHING;
+        END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_rfm_delete AFTER DELETE ON ventes WHEN OLD.client_id IS NOT NULL
+        BEGIN INSERT INTO rfm_a_recalculer VALUES (OLD.client_id) ON CONFLICT DO NOTHING; END;
+
+    -- Cohortes : clients distincts actifs de chaque mois (identifiants triés,
+    -- entiers little-endian de `octets` octets), recalculés par cohortes.py pour les mois touchés
+    CREATE TABLE IF NOT EXISTS clients_actifs_mois (
+        mois TEXT PRIMARY KEY,
+        nb_clients INTEGER NOT NULL,
+        octets INTEGER NOT NULL,
+        clients BLOB NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS cohortes_a_recalculer (mois TEXT PRIMARY KEY) WITHOUT ROWID;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_cohortes_insert AFTER INSERT ON ventes WHEN NEW.client_id IS NOT NULL
+        BEGIN INSERT INTO cohortes_a_recalculer VALUES (substr(NEW.date, 1, 7)) ON CONFLICT DO NOTHING; END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_cohortes_update AFTER UPDATE OF client_id, date ON ventes
+        BEGIN
+            INSERT INTO cohortes_a_recalculer SELECT substr(OLD.date, 1, 7) WHERE OLD.client_id IS NOT NULL
+                ON CONFLICT DO NOTHING;
+            INSERT INTO cohortes_a_recalculer SELECT substr(NEW.date, 1, 7) WHERE NEW.client_id IS NOT NULL
+                ON CONFLICT DO NOTHING;
+        END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_cohortes_delete AFTER DELETE ON ventes WHEN OLD.client_id IS NOT NULL
+        BEGIN INSERT INTO cohortes_a_recalculer VALUES (substr(OLD.date, 1, 7)) ON CONFLICT DO NOTHING; END;
+
+    -- Bases des autres magasins du réseau, lues en lecture seule par federation.py
+    CREATE TABLE IF NOT EXISTS magasins (nom TEXT PRIMARY KEY, chemin TEXT NOT NULL);
+
+    -- Périodes archivées par archives.py (une base en lecture seule chacune) ;
+    -- fermées à l'écriture : esquisses et palmarès de ces jours sont définitifs
+    CREATE TABLE IF NOT EXISTS archives_ventes (
+        periode TEXT PRIMARY KEY,
+        chemin TEXT NOT NULL,
+        debut TEXT NOT NULL,
+        fin TEXT NOT NULL,
+        nb_ventes INTEGER NOT NULL
+    );
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_archivees_insert BEFORE INSERT ON ventes
+        WHEN NEW.date < (SELECT MAX(fin) FROM archives_ventes)
+        BEGIN SELECT RAISE(ABORT, 'Vente dans une période archivée'); END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_archivees_update BEFORE UPDATE OF date ON ventes
+        WHEN NEW.date < (SELECT MAX(fin) FROM archives_ventes)
+        BEGIN SELECT RAISE(ABORT, 'Vente dans une période archivée'); END;
+    """)
+
+    if table_existe(conn, 'mouvements_stock_ancien'):
+        # Snapshots calculés par l'ancienne règle (ventes antérieures au suivi comprises) abandonnés
+        conn.execute("DELETE FROM snapshots_stock")
+        conn.execute("INSERT INTO mouvements_stock SELECT * FROM mouvements_stock_ancien")
+        conn.execute("DROP TABLE mouvements_stock_ancien")
+    if nouveau_journal:
+        # Reprise de l'historique des ventes existantes dans le journal
+        conn.execute("""
+        INSERT INTO mouvements_stock (produit_id, date, quantite, type, vente_id)
+        SELECT produit_id, date, -quantite, 'vente', id FROM ventes ORDER BY id
+        """)
+    if nouvel_historique:
+        # Seul le prix actuel est connu : il vaut pour tout l'historique
+        conn.execute("INSERT INTO prix_produits SELECT id, '0001-01-01', prix FROM produits")
+        conn.execute("""
+        UPDATE ventes SET prix_unitaire = (SELECT prix FROM produits WHERE id = ventes.produit_id)
+        WHERE prix_unitaire IS NULL
+        """)
+    if nouvelles_esquisses:
+        conn.execute("INSERT OR IGNORE INTO esquisses_a_recalculer SELECT DISTINCT substr(date, 1, 10) FROM ventes")
+    if nouveau_palmares:
+        conn.execute("INSERT OR IGNORE INTO palmares_a_recalculer SELECT DISTINCT substr(date, 1, 10) FROM ventes")
+    if nouvelle_segmentation:
+        # Tous les clients connus, y compris ceux dont les ventes sont toutes archivées
+        conn.execute("INSERT OR IGNORE INTO rfm_a_recalculer SELECT id FROM clients")
+        conn.execute("INSERT OR IGNORE INTO rfm_a_recalculer SELECT DISTINCT client_id FROM ventes "
+                     "WHERE client_id IS NOT NULL")
+    if nouvelles_cohortes:
+        # Mois des ventes courantes et de chaque période archivée
+        conn.execute("INSERT OR IGNORE INTO cohortes_a_recalculer SELECT DISTINCT substr(date, 1, 7) FROM ventes")
+        conn.execute("""
+        WITH RECURSIVE mois(jour, fin) AS (
+            SELECT debut, fin FROM archives_ventes
+            UNION ALL SELECT date(jour, '+1 month'), fin FROM mois WHERE date(jour, '+1 month') < fin
+        )
+        INSERT OR IGNORE INTO cohortes_a_recalculer SELECT DISTINCT substr(jour, 1, 7) FROM mois
+        """)
+    # Chemins d'archive enregistrés en absolu : relatifs au dossier de la base, qui se
+    # déplace (ou se restaure ailleurs) avec ses archives
+    for (chemin,) in conn.execute("SELECT DISTINCT chemin FROM archives_ventes").fetchall():
+        if Path(chemin).is_absolute() and Path(chemin).is_relative_to(dossier_base(conn)):
+            conn.execute("UPDATE archives_ventes SET chemin = ? WHERE chemin = ?",
+                         (Path(chemin).relative_to(dossier_base(conn)).as_posix(), chemin))
+    _creer_echantillon(conn, nouvel_echantillon)
+    _creer_index_recherche(conn)
+    conn.commit()
+
+
+def _creer_echantillon(conn: sqlite3.Connection, nouveau: bool) -> None:
+    """
+    Crée l'échantillon stratifié des ventes, tenu à jour par trigger.
+
+    Chaque vente échantillonnée garde sa clé aléatoire : quand la strate
+    grossit, son seuil baisse et les lectures écartent les ventes dont la
+    clé le dépasse désormais, sans réécrire l'échantillon. Le LIMIT des
+    sous-requêtes empêche SQLite de les aplatir dans la jointure, ce qui
+    ferait tirer random() deux fois (clé stockée et clé comparée).
+    Les colonnes utiles sont recopiées pour lire l'échantillon sans
+    accéder à la table des ventes.
+    """
+    conn.executescript(f"""
+    CREATE TABLE IF NOT EXISTS strates_echantillon (
+        mois TEXT NOT NULL,
+        produit_id INTEGER NOT NULL,
+        population INTEGER NOT NULL,
+        PRIMARY KEY (mois, produit_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS echantillon_ventes (
+        vente_id INTEGER PRIMARY KEY,
+        mois TEXT NOT NULL,
+        produit_id INTEGER NOT NULL,
+        client_id INTEGER,
+        date TEXT,
+        quantite INTEGER,
+        montant_eur REAL,
+        cle REAL NOT NULL
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_echantillon_insert AFTER INSERT ON ventes
+        BEGIN
+            INSERT INTO strates_echantillon VALUES (substr(NEW.date, 1, 7), NEW.produit_id, 1)
+                ON CONFLICT (mois, produit_id) DO UPDATE SET population = population + 1;
+            -- Montant relu dans la table : le prix peut être complété par trg_ventes_prix
+            INSERT INTO echantillon_ventes
+            SELECT NEW.id, s.mois, s.produit_id, NEW.client_id, NEW.date, NEW.quantite,
+                   (SELECT prix_unitaire * quantite FROM ventes WHERE id = NEW.id), t.cle
+            FROM (SELECT random() / 18446744073709551616.0 + 0.5 AS cle LIMIT 1) t
+            JOIN strates_echantillon s ON s.mois = substr(NEW.date, 1, 7) AND s.produit_id = NEW.produit_id
+            WHERE t.cle < {SEUIL_ECHANTILLON};
+        END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_echantillon_strate AFTER UPDATE OF produit_id, date ON ventes
+        WHEN NEW.produit_id != OLD.produit_id OR substr(NEW.date, 1, 7) != substr(OLD.date, 1, 7)
+        BEGIN
+            UPDATE strates_echantillon SET population = population - 1
+                WHERE mois = substr(OLD.date, 1, 7) AND produit_id = OLD.produit_id;
+            INSERT INTO strates_echantillon VALUES (substr(NEW.date, 1, 7), NEW.produit_id, 1)
+                ON CONFLICT (mois, produit_id) DO UPDATE SET population = population + 1;
+        END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_echantillon_update AFTER UPDATE ON ventes
+        BEGIN
+            UPDATE echantillon_ventes
+            SET mois = substr(NEW.date, 1, 7), produit_id = NEW.produit_id, client_id = NEW.client_id,
+                date = NEW.date, quantite = NEW.quantite, montant_eur = NEW.prix_unitaire * NEW.quantite
+            WHERE vente_id = NEW.id;
+        END;
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_echantillon_delete AFTER DELETE ON ventes
+        BEGIN
+            UPDATE strates_echantillon SET population = population - 1
+                WHERE mois = substr(OLD.date, 1, 7) AND produit_id = OLD.produit_id;
+            DELETE FROM echantillon_ventes WHERE vente_id = OLD.id;
+        END;
+    """)
+    if nouveau:
+        # Tirage initial sur l'historique existant
+        conn.execute("""
+        INSERT INTO strates_echantillon
+        SELECT substr(date, 1, 7), produit_id, COUNT(*) FROM ventes GROUP BY 1, 2
+        """)
+        conn.execute(f"""
+        INSERT INTO echantillon_ventes
+        SELECT t.id, s.mois, s.produit_id, t.client_id, t.date, t.quantite, t.montant_eur, t.cle
+        FROM (SELECT id, substr(date, 1, 7) AS mois, produit_id, client_id, date, quantite,
+                     prix_unitaire * quantite AS montant_eur,
+                     random() / 18446744073709551616.0 + 0.5 AS cle
+              FROM ventes LIMIT -1) t
+        JOIN strates_echantillon s ON s.mois = t.mois AND s.produit_id = t.produit_id
+        WHERE t.cle < {SEUIL_ECHANTILLON}
+        """)
+
+
+def _creer_index_recherche(conn: sqlite3.Connection) -> None:
+    """
+    Crée les index FTS5 des noms de produits et clients, tenus à jour par trigger.
+
+    Les index sont à contenu externe : seuls les termes sont stockés, les
+    noms restent dans leur table d'origine.
+    """
+    for table in ('produits', 'clients'):
+        for suffixe, options in INDEX_RECHERCHE.items():
+            index = f"recherche_{table}_{suffixe}"
+            nouveau = not table_existe(conn, index)
+            try:
+                conn.executescript(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5(
+                    nom, content = '{table}', content_rowid = 'id', {options}
+                );
+                CREATE TRIGGER IF NOT EXISTS trg_{index}_insert AFTER INSERT ON {table}
+                    BEGIN INSERT INTO {index} (rowid, nom) VALUES (NEW.id, NEW.nom); END;
+                CREATE TRIGGER IF NOT EXISTS trg_{index}_delete AFTER DELETE ON {table}
+                    BEGIN INSERT INTO {index} ({index}, rowid, nom) VALUES ('delete', OLD.id, OLD.nom); END;
+                CREATE TRIGGER IF NOT EXISTS trg_{index}_update AFTER UPDATE OF nom ON {table}
+                    BEGIN
+                        INSERT INTO {index} ({index}, rowid, nom) VALUES ('delete', OLD.id, OLD.nom);
+                        INSERT INTO {index} (rowid, nom) VALUES (NEW.id, NEW.nom);
+                    END;
+                """)
+            except sqlite3.OperationalError as e:
+                # SQLite compilé sans FTS5 (ou sans trigram) : recherche par LIKE
+                logger.warning(f"Index de recherche {index} indisponible: {e}")
+                continue
+            if nouveau:
+                conn.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+
+
+# Triggers d'insertion de ventes et leurs équivalents ensemblistes, appliqués aux
+# ventes d'id > :depuis (dans cet ordre : le prix complété sert à l'échantillon)
+_INSERTIONS_EN_MASSE = {
+    'trg_ventes_archivees_insert': (),  # Contrôle des périodes archivées, fait avant les autres
+    'trg_ventes_prix': ("""
+        UPDATE ventes SET prix_unitaire = (
+            SELECT prix FROM prix_produits
+            WHERE produit_id = ventes.produit_id AND valide_depuis <= ventes.date
+            ORDER BY valide_depuis DESC LIMIT 1
+        ) WHERE id > :depuis AND prix_unitaire IS NULL""",),
+    'trg_ventes_stock_insert': ("""
+        INSERT INTO mouvements_stock (produit_id, date, quantite, type, vente_id)
+        SELECT produit_id, date, -quantite, 'vente', id FROM ventes WHERE id > :depuis ORDER BY id""",),
+    'trg_ventes_echantillon_insert': ("""
+        INSERT INTO strates_echantillon
+        SELECT substr(date, 1, 7), produit_id, COUNT(*) FROM ventes WHERE id > :depuis GROUP BY 1, 2
+        ON CONFLICT (mois, produit_id) DO UPDATE SET population = population + excluded.population""", f"""
+        INSERT INTO echantillon_ventes
+        SELECT t.id, s.mois, s.produit_id, t.client_id, t.date, t.quantite, t.montant_eur, t.cle
+        FROM (SELECT id, substr(date, 1, 7) AS mois, produit_id, client_id, date, quantite,
+                     prix_unitaire * quantite AS montant_eur,
+                     random() / 18446744073709551616.0 + 0.5 AS cle
+              FROM ventes WHERE id > :depuis LIMIT -1) t
+        JOIN strates_echantillon s ON s.mois = t.mois AND s.produit_id = t.produit_id
+        WHERE t.cle < {SEUIL_ECHANTILLON}"""),
+    'trg_ventes_esquisses_insert': ("""
+        INSERT INTO esquisses_a_recalculer SELECT DISTINCT substr(date, 1, 10) FROM ventes
+        WHERE id > :depuis ON CONFLICT DO NOTHING""",),
+    'trg_ventes_palmares_insert': ("""
+        INSERT INTO palmares_a_recalculer SELECT DISTINCT substr(date, 1, 10) FROM ventes
+        WHERE id > :depuis ON CONFLICT DO NOTHING""",),
+    'trg_ventes_rfm_insert': ("""
+        INSERT INTO rfm_a_recalculer SELECT DISTINCT client_id FROM ventes
+        WHERE id > :depuis AND client_id IS NOT NULL ON CONFLICT DO NOTHING""",),
+    'trg_ventes_cohortes_insert': ("""
+        INSERT INTO cohortes_a_recalculer SELECT DISTINCT substr(date, 1, 7) FROM ventes
+        WHERE id > :depuis AND client_id IS NOT NULL ON CONFLICT DO NOTHING""",),
+}
+
+
+@contextmanager
+def transaction_immediate(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """
+    Transaction qui prend le verrou d'écriture dès son ouverture (BEGIN
+    IMMEDIATE), validée en sortie du bloc et annulée sur erreur.
+
+    Aucun autre écrivain ne modifie la base entre les lectures du bloc et
+    la validation : des marqueurs de recalcul lus puis effacés dans le bloc
+    ne peuvent pas emporter ceux qu'une vente concurrente y aurait ajoutés.
+    Dans une transaction déjà ouverte, le bloc s'y joint.
+    """
+    with conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        yield conn
+
+
+@contextmanager
+def insertions_en_masse(conn: sqlite3.Connection) -> Iterator[None]:
+    """
+    Le temps du bloc, les ventes insérées ne déclenchent pas les triggers
+    d'insertion ligne à ligne : en sortie, leurs effets (prix en vigueur,
+    sorties de stock, échantillon, jours, clients et mois à recalculer)
+    sont appliqués en une requête chacun, puis les triggers sont recréés.
+
+    Tout se passe dans la transaction en cours (ouverte au besoin), sous
+    un point de sauvegarde : aucun autre écrivain n'insère de vente
+    entre-temps et, sur erreur, les ventes du bloc sont annulées et les
+    triggers rétablis avant que l'erreur ne remonte ; l'appelant peut
+    valider le reste de sa transaction. Une vente d'une période archivée
+    lève la même erreur que son trigger. Les triggers sans équivalent ici
+    continuent de s'appliquer ligne à ligne.
+
+    Chaque équivalent de _INSERTIONS_EN_MASSE doit suivre son trigger :
+    tests/test_insertions_en_masse.py compare les deux chemins.
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    conn.execute("SAVEPOINT insertions_en_masse")
+    depuis = conn.execute("SELECT COALESCE(MAX(id), 0) FROM ventes").fetchone()[0]
+    sql_triggers = dict(conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'ventes'"
+    ).fetchall())
+    remplaces = [nom for nom in _INSERTIONS_EN_MASSE if nom in sql_triggers]
+    try:
+        for nom in remplaces:
+            conn.execute(f"DROP TRIGGER {nom}")
+        yield
+        if 'trg_ventes_archivees_insert' in remplaces and conn.execute(
+            "SELECT 1 FROM ventes WHERE id > ? AND date < (SELECT MAX(fin) FROM archives_ventes) LIMIT 1",
+            (depuis,)
+        ).fetchone():
+            raise sqlite3.IntegrityError("Vente dans une période archivée")
+        for nom in remplaces:
+            for requete in _INSERTIONS_EN_MASSE[nom]:
+                conn.execute(requete, {'depuis': depuis})
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK TO insertions_en_masse")  # Ventes du bloc annulées, triggers supprimés rétablis
+        raise
+    finally:
+        if conn.in_transaction:
+            presents = {n for (n,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+            for nom in remplaces:
+                if nom not in presents:
+                    conn.execute(sql_triggers[nom])
+            conn.execute("RELEASE insertions_en_masse")
+
+
+def normaliser_nom(nom: str) -> str:
+    """Forme canonique d'un nom : sans accents, casse ni espaces superflus"""
+    decompose = unicodedata.normalize('NFKD', str(nom))
+    sans_accents = "".join(c for c in decompose if not unicodedata.combining(c))
+    return " ".join(sans_accents.casefold().split())
+
+
+def cle_hash(*parties) -> int:
+    """Clé d'idempotence entière (64 bits signés) dérivée des parties fournies"""
+    empreinte = hashlib.sha1("\x1f".join(map(str, parties)).encode('utf-8')).digest()
+    return int.from_bytes(empreinte[:8], 'big', signed=True)
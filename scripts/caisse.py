@@ -0,0 +1,337 @@
+# scripts/caisse.py
+"""Encaissement en caisse : catalogue en mémoire et écriture durable des ventes"""
+import argparse
+import http.client
+import json
+import logging
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import TimeoutError as DelaiDepasse
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from base_donnees import DB_PATH, connecter, migrer_schema, normaliser_nom
+from service_ecriture import EcrivainGroupe
+from stock import stocks_courants
+
+logger = logging.getLogger(__name__)
+
+
+class ErreurCaisse(Exception):
+    """Encaissement refusé (produit inconnu, stock insuffisant, ligne invalide)"""
+    pass
+
+
+class CatalogueCache:
+    """
+    Copie en mémoire du catalogue (nom, prix) et du stock des produits suivis.
+
+    La synchronisation repose sur la table version_catalogue, incrémentée par
+    trigger à chaque modification de produits et à chaque réception,
+    ajustement ou inventaire de stock : la version est relue au plus une fois
+    par `intervalle_sync` secondes et le catalogue n'est rechargé que si elle
+    a changé. Le stock est décrémenté en mémoire à la réservation ;
+    les réservations non encore validées sont déduites lors d'un rechargement.
+    """
+
+    def __init__(self, db_path=DB_PATH, intervalle_sync: float = 1.0):
+        self._conn = connecter(db_path, lecture_seule=True)
+        self.intervalle_sync = intervalle_sync
+        self._verrou = threading.Lock()
+        self._version = None
+        self._derniere_verif = 0.0
+        self._produits: Dict[int, dict] = {}
+        self._par_nom: Dict[str, int] = {}
+        self._reserve = defaultdict(int)
+        self.synchroniser(force=True)
+
+    def synchroniser(self, force: bool = False) -> None:
+        """Recharge le catalogue si la base a changé depuis le dernier chargement"""
+        maintenant = time.monotonic()
+        if not force and maintenant - self._derniere_verif < self.intervalle_sync:
+            return
+        with self._verrou:
+            self._derniere_verif = maintenant
+            version = self._conn.execute("SELECT version FROM version_catalogue").fetchone()[0]
+            if not force and version == self._version:
+                return
+            stocks = stocks_courants(self._conn)
+            produits = {
+                id_: {'id': id_, 'nom': nom, 'prix': prix,
+                      'stock': stocks[id_] - self._reserve[id_] if id_ in stocks else None}
+                for id_, nom, prix in self._conn.execute("SELECT id, nom, prix FROM produits")
+            }
+            self._produits = produits
+            self._par_nom = {normaliser_nom(p['nom']): id_ for id_, p in produits.items()}
+            self._version = version
+        logger.info(f"Catalogue chargé: {len(produits)} produits (version {version})")
+
+    def produit(self, reference) -> dict:
+        """Retourne un produit par id ou par nom"""
+        if isinstance(reference, int):
+            produit = self._produits.get(reference)
+        else:
+            produit = self._produits.get(self._par_nom.get(normaliser_nom(reference)))
+        if produit is None:
+            raise ErreurCaisse(f"Produit inconnu: {reference}")
+        return produit
+
+    def lister(self) -> List[dict]:
+        return list(self._produits.values())
+
+    def reserver(self, quantites: Dict[int, int]) -> None:
+        """Vérifie et réserve le stock de toutes les lignes d'un ticket, ou d'aucune"""
+        with self._verrou:
+            for id_, quantite in quantites.items():
+                stock = self._produits[id_]['stock']
+                if stock is not None and stock < quantite:
+                    raise ErreurCaisse(
+                        f"Stock insuffisant pour {self._produits[id_]['nom']}: {stock} disponible(s), {quantite} demandé(s)"
+                    )
+            for id_, quantite in quantites.items():
+                if self._produits[id_]['stock'] is not None:
+                    self._produits[id_]['stock'] -= quantite
+                    self._reserve[id_] += quantite
+
+    def liberer(self, quantites: Dict[int, int], vendu: bool) -> None:
+        """Termine une réservation : validée en base, ou annulée et restituée"""
+        with self._verrou:
+            for id_, quantite in quantites.items():
+                if self._reserve[id_]:
+                    self._reserve[id_] -= quantite
+                    if not vendu and id_ in self._produits:
+                        self._produits[id_]['stock'] += quantite
+
+
+class Caisse:
+    """Point d'encaissement : valide un ticket et l'écrit via l'écrivain groupé"""
+
+    def __init__(self, db_path=DB_PATH, delai_max_ms: float = 2.0):
+        conn = connecter(db_path)
+        migrer_schema(conn)
+        conn.close()
+        self.catalogue = CatalogueCache(db_path)
+        self.ecrivain = EcrivainGroupe(db_path, delai_max_ms=delai_max_ms)
+        self.ecrivain.demarrer()
+
+    def fermer(self) -> None:
+        self.ecrivain.arreter()
+
+    def encaisser(self, client_id: int, lignes: List[dict], timeout: Optional[float] = 10.0) -> dict:
+        """
+        Enregistre un ticket de caisse.
+
+        Args:
+            client_id: Client du ticket
+            lignes: [{'produit': id ou nom, 'quantite': n}, ...]
+
+        Returns:
+            {'ids': [...], 'total': montant, 'date': 'YYYY-MM-DD'}, après COMMIT
+
+        Raises:
+            TimeoutError: écriture commencée mais non terminée après `timeout` (issue inconnue)
+        """
+        if not lignes:
+            raise ErreurCaisse("Ticket vide")
+        self.catalogue.synchroniser()
+
+        jour = date.today().isoformat()
+        ventes, quantites = [], defaultdict(int)
+        for ligne in lignes:
+            produit = self.catalogue.produit(ligne.get('produit', ligne.get('produit_id')))
+            quantite = int(ligne.get('quantite', 1))
+            if quantite <= 0:
+                raise ErreurCaisse(f"Quantité invalide pour {produit['nom']}: {quantite}")
+            quantites[produit['id']] += quantite
+            ventes.append({
+                'produit_id': produit['id'], 'client_id': client_id, 'date': jour,
+                'quantite': quantite, 'prix_unitaire': produit['prix']
+            })
+
+        self.catalogue.reserver(quantites)
+        futur = self.ecrivain.enregistrer_ticket(ventes)
+        # La réservation se termine sur l'issue réelle de l'écriture, même après l'expiration du délai
+        futur.add_done_callback(lambda f: self.catalogue.liberer(
+            quantites, vendu=not f.cancelled() and f.exception() is None
+        ))
+        try:
+            ids = futur.result(timeout=timeout)
+        except DelaiDepasse:
+            if futur.cancel():
+                raise ErreurCaisse(f"Ticket non enregistré : écriture non commencée après {timeout} s")
+            raise TimeoutError(f"Ticket en cours d'écriture depuis {timeout} s : il peut encore être validé")
+
+        total = sum(v['quantite'] * v['prix_unitaire'] for v in ventes)
+        return {'ids': ids, 'total': round(total, 2), 'date': jour}
+
+
+# ---- API HTTP LOCALE ----
+def creer_serveur(caisse: Caisse, hote: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """
+    Expose la caisse en HTTP local.
+
+    GET  /produits  -> catalogue en cache
+    POST /ventes    -> {"client_id": 1, "lignes": [{"produit": "Souris sans fil", "quantite": 2}]}
+    """
+
+    class Gestionnaire(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Connexions persistantes
+
+        def _repondre(self, code: int, corps) -> None:
+            donnees = json.dumps(corps, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(donnees)))
+            self.end_headers()
+            self.wfile.write(donnees)
+
+        def do_GET(self):
+            if self.path == "/produits":
+                self._repondre(200, caisse.catalogue.lister())
+            else:
+                self._repondre(404, {'erreur': "Ressource inconnue"})
+
+        def do_POST(self):
+            if self.path != "/ventes":
+                self._repondre(404, {'erreur': "Ressource inconnue"})
+                return
+            try:
+                longueur = int(self.headers.get("Content-Length", 0))
+                demande = json.loads(self.rfile.read(longueur) or b"{}")
+                self._repondre(201, caisse.encaisser(int(demande['client_id']), demande['lignes']))
+            except (ErreurCaisse, KeyError, ValueError, TypeError) as e:
+                self._repondre(400, {'erreur': str(e)})
+            except TimeoutError as e:
+                # Issue inconnue : la caisse doit vérifier le ticket avant de le renvoyer
+                self._repondre(504, {'erreur': str(e)})
+            except Exception as e:
+                logger.error(f"Erreur d'encaissement: {e}", exc_info=True)
+                self._repondre(500, {'erreur': "Erreur interne"})
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return ThreadingHTTPServer((hote, port), Gestionnaire)
+
+
+# ---- TEST DE CHARGE ----
+def test_charge(caisse: Caisse, debit: float, duree: float, concurrence: int = 64,
+                url: Optional[str] = None) -> dict:
+    """
+    Envoie `debit` encaissements par seconde pendant `duree` secondes.
+
+    La charge est en boucle ouverte : chaque encaissement a une heure d'envoi
+    planifiée et sa latence est mesurée depuis cette heure, ce qui inclut
+    l'attente si le système prend du retard.
+    """
+    produits = [p for p in caisse.catalogue.lister() if p['stock'] is None]
+    if not produits:
+        raise ErreurCaisse("Aucun produit sans suivi de stock pour le test de charge")
+
+    total = int(debit * duree)
+    latences, erreurs = [], []
+    verrou = threading.Lock()
+    suivant = iter(range(total))
+    depart = time.perf_counter() + 0.1
+
+    def client_http():
+        hote, port = url.split(":")
+        return http.client.HTTPConnection(hote, int(port), timeout=10)
+
+    def travailleur():
+        conn = client_http() if url else None
+        while True:
+            with verrou:
+                i = next(suivant, None)
+            if i is None:
+                break
+            prevu = depart + i / debit
+            attente = prevu - time.perf_counter()
+            if attente > 0:
+                time.sleep(attente)
+            lignes = [{'produit': produits[i % len(produits)]['id'], 'quantite': 1}]
+            try:
+                if conn:
+                    conn.request("POST", "/ventes", json.dumps({'client_id': 1, 'lignes': lignes}),
+                                 {"Content-Type": "application/json"})
+                    reponse = conn.getresponse()
+                    reponse.read()
+                    if reponse.status != 201:
+                        raise ErreurCaisse(f"HTTP {reponse.status}")
+                else:
+                    caisse.encaisser(1, lignes)
+                with verrou:
+                    latences.append(time.perf_counter() - prevu)
+            except Exception as e:
+                with verrou:
+                    erreurs.append(e)
+        if conn:
+            conn.close()
+
+    threads = [threading.Thread(target=travailleur) for _ in range(concurrence)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ecoule = time.perf_counter() - depart
+
+    centiles = statistics.quantiles(latences, n=100, method='inclusive') if len(latences) > 1 else [0] * 99
+    return {
+        'encaissements': len(latences),
+        'erreurs': len(erreurs),
+        'debit_obtenu': len(latences) / ecoule,
+        'p50_ms': centiles[49] * 1000,
+        'p99_ms': centiles[98] * 1000,
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Caisse : API HTTP locale ou test de charge")
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--test-charge", action="store_true", help="Lance le test de charge sur une copie jetable")
+    parser.add_argument("--debit", type=float, default=1000, help="Encaissements par seconde")
+    parser.add_argument("--duree", type=float, default=10, help="Durée du test en secondes")
+    parser.add_argument("--http", action="store_true", help="Test de charge via l'API HTTP")
+    args = parser.parse_args()
+
+    if not args.test_charge:
+        caisse = Caisse(args.db)
+        serveur = creer_serveur(caisse, port=args.port)
+        logger.info(f"Caisse en écoute sur http://127.0.0.1:{args.port}")
+        try:
+            serveur.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            serveur.server_close()
+            caisse.fermer()
+    else:
+        from service_ecriture import _creer_base_test
+
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp) / 'charge.db'
+            _creer_base_test(base)
+            caisse = Caisse(base)
+            serveur = None
+            if args.http:
+                serveur = creer_serveur(caisse, port=args.port)
+                threading.Thread(target=serveur.serve_forever, daemon=True).start()
+            try:
+                r = test_charge(caisse, args.debit, args.duree,
+                                url=f"127.0.0.1:{args.port}" if args.http else None)
+            finally:
+                if serveur:
+                    serveur.shutdown()
+                    serveur.server_close()
+                caisse.fermer()
+        print(
+            f"{r['encaissements']:,} encaissements ({r['erreurs']} erreurs) à {r['debit_obtenu']:,.0f}/s - "
+            f"latence p50 {r['p50_ms']:.2f} ms, p99 {r['p99_ms']:.2f} ms"
+        )
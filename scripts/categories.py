@@ -0,0 +1,246 @@
+# scripts/categories.py
+"""Arborescence des catégories de produits (ensembles imbriqués) et agrégats par sous-arbre"""
+import argparse
+import logging
+import sqlite3
+import sys
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from base_donnees import DB_PATH, connecter, migrer_schema
+from devises import DEVISE_BASE, Convertisseur
+
+logger = logging.getLogger(__name__)
+
+SEPARATEUR = ' > '
+NON_CLASSE = 'Non classé'  # Pseudo-catégorie (id 0) des produits sans catégorie
+MONTANTS = ['quantite', 'ca_eur', 'ca_devise']
+
+
+def renumeroter(conn: sqlite3.Connection) -> None:
+    """
+    Recalcule les bornes (bg, bd) et la profondeur de toutes les catégories.
+
+    Un parcours en profondeur numérote chaque nœud à l'entrée (bg) et à la
+    sortie (bd) : le sous-arbre d'une catégorie est exactement l'ensemble des
+    catégories dont bg est compris entre ses bornes. Les modifications de
+    l'arbre sont rares, la renumérotation complète (linéaire) suffit.
+    """
+    lignes = conn.execute("SELECT id, parent_id FROM categories ORDER BY nom").fetchall()
+    enfants: Dict[Optional[int], List[int]] = {}
+    for id_, parent in lignes:
+        enfants.setdefault(parent, []).append(id_)
+
+    bornes = []
+    compteur = 0
+    pile = [(id_, 0, False) for id_ in reversed(enfants.get(None, []))]
+    entrees = {}
+    while pile:
+        id_, profondeur, sortie = pile.pop()
+        compteur += 1
+        if sortie:
+            bornes.append((entrees[id_], compteur, profondeur, id_))
+            continue
+        entrees[id_] = compteur
+        pile.append((id_, profondeur, True))
+        pile.extend((enfant, profondeur + 1, False) for enfant in reversed(enfants.get(id_, [])))
+
+    if len(bornes) != len(lignes):
+        raise ValueError("L'arborescence des catégories contient un cycle")
+    with conn:
+        conn.executemany("UPDATE categories SET bg = ?, bd = ?, profondeur = ? WHERE id = ?", bornes)
+
+
+def creer_chemins(conn: sqlite3.Connection, chemins: Iterable[str]) -> Dict[str, int]:
+    """
+    Retourne l'id de chaque catégorie désignée par "Racine > ... > Feuille",
+    en créant les niveaux manquants (une seule renumérotation à la fin).
+    """
+    ids: Dict[str, int] = {}
+    cree = False
+    with conn:
+        for chemin in chemins:
+            parent = None
+            for nom in (n.strip() for n in chemin.split(SEPARATEUR.strip())):
+                if not nom:
+                    raise ValueError(f"Chemin de catégorie invalide: {chemin!r}")
+                ligne = conn.execute(
+                    "SELECT id FROM categories WHERE nom = ? AND parent_id IS ?", (nom, parent)
+                ).fetchone()
+                if ligne:
+                    parent = ligne[0]
+                else:
+                    parent = conn.execute(
+                        "INSERT INTO categories (nom, parent_id) VALUES (?, ?)", (nom, parent)
+                    ).lastrowid
+                    cree = True
+            ids[chemin] = parent
+    if cree:
+        renumeroter(conn)
+    return ids
+
+
+def creer_chemin(conn: sqlite3.Connection, chemin: str) -> int:
+    """Id de la catégorie désignée par un chemin, créée si besoin"""
+    return creer_chemins(conn, [chemin])[chemin]
+
+
+def classer_produits(conn: sqlite3.Connection, affectations: Dict[int, int]) -> None:
+    """Affecte une catégorie à des produits {produit_id: categorie_id}"""
+    with conn:
+        conn.executemany(
+            "UPDATE produits SET categorie_id = ? WHERE id = ?",
+            [(categorie, produit) for produit, categorie in affectations.items()]
+        )
+
+
+def _agreger_ventes(conn: sqlite3.Connection, cle: str, filtres: List[str], params: list,
+                    debut: Optional[str], fin: Optional[str], devise: str,
+                    convertisseur: Optional[Convertisseur]) -> pd.DataFrame:
+    """
+    Quantités et CA des ventes groupés par `cle`, convertis dans `devise`.
+
+    Les ventes ne sont groupées par jour en plus que si le taux a varié sur
+    la période, chaque sous-total journalier étant converti au taux du jour.
+    """
+    filtres, params = list(filtres), list(params)
+    if debut:
+        filtres.append("v.date >= ?")
+        params.append(debut)
+    if fin:
+        filtres.append("v.date <= ?")
+        params.append(fin)
+    where = ("WHERE " + " AND ".join(filtres)) if filtres else ""
+
+    # Taux constant sur la période : conversion des totaux, sans grouper par jour
+    facteur = 1.0
+    if devise != DEVISE_BASE:
+        convertisseur = convertisseur or Convertisseur(conn)
+        periode = conn.execute("SELECT MIN(date), MAX(date) FROM ventes").fetchone()
+        facteur = convertisseur.facteur_constant(
+            DEVISE_BASE, devise, debut or periode[0], fin or periode[1]
+        ) if periode[0] else 1.0
+    par_date = facteur is None
+
+    ventes = pd.read_sql(
+        f"""SELECT {cle} AS cle, {'v.date,' if par_date else ''}
+            SUM(v.quantite) AS quantite, SUM(v.prix_unitaire * v.quantite) AS ca_eur
+        FROM ventes v JOIN produits p ON v.produit_id = p.id
+        {where}
+        GROUP BY 1{', 2' if par_date else ''}""",
+        conn, params=params
+    )
+    if par_date:
+        ventes['ca_devise'] = convertisseur.convertir(ventes['ca_eur'], ventes['date'], DEVISE_BASE, devise)
+    else:
+        ventes['ca_devise'] = ventes['ca_eur'] * facteur
+    return ventes.groupby('cle')[MONTANTS].sum()
+
+
+def ca_par_categorie(conn: sqlite3.Connection, debut: Optional[str] = None, fin: Optional[str] = None,
+                     devise: str = DEVISE_BASE,
+                     convertisseur: Optional[Convertisseur] = None) -> pd.DataFrame:
+    """
+    CA et quantités cumulés sur le sous-arbre de chaque catégorie.
+
+    Une seule agrégation des ventes par catégorie de produit, puis cumul
+    par sommes préfixes dans l'ordre des bornes gauches : le total d'un
+    sous-arbre vaut cumul[bd] - cumul[bg - 1], sans requête récursive.
+
+    Returns:
+        DataFrame id, nom, parent_id, profondeur, bg, bd, quantite, ca_eur,
+        ca_devise (et une ligne id 0 pour les produits non classés)
+    """
+    feuilles = _agreger_ventes(conn, "COALESCE(p.categorie_id, 0)", [], [], debut, fin, devise, convertisseur)
+
+    arbre = pd.read_sql("SELECT id, nom, parent_id, profondeur, bg, bd FROM categories ORDER BY bg", conn)
+    if not arbre.empty:
+        # Valeur propre de chaque nœud placée à sa borne gauche, puis cumul
+        positions = np.zeros((2 * len(arbre) + 1, len(MONTANTS)))
+        propres = feuilles.reindex(arbre['id'], fill_value=0)[MONTANTS].to_numpy(dtype=float)
+        positions[arbre['bg'].to_numpy()] = propres
+        cumul = positions.cumsum(axis=0)
+        arbre[MONTANTS] = cumul[arbre['bd'].to_numpy()] - cumul[arbre['bg'].to_numpy() - 1]
+    else:
+        arbre = arbre.reindex(columns=[*arbre.columns, *MONTANTS])
+
+    if 0 in feuilles.index:
+        non_classe = pd.DataFrame([{
+            'id': 0, 'nom': NON_CLASSE, 'parent_id': None, 'profondeur': 0, 'bg': 0, 'bd': 0,
+            **feuilles.loc[0, MONTANTS].to_dict()
+        }])
+        arbre = pd.concat([arbre, non_classe], ignore_index=True) if not arbre.empty else non_classe
+    arbre['parent_id'] = arbre['parent_id'].astype('Int64')
+    return arbre
+
+
+def ca_produits_categorie(conn: sqlite3.Connection, categorie_id: int, debut: Optional[str] = None,
+                          fin: Optional[str] = None, devise: str = DEVISE_BASE,
+                          convertisseur: Optional[Convertisseur] = None, limite: int = 20) -> pd.DataFrame:
+    """Meilleurs produits d'un sous-arbre (une requête sur l'intervalle de bornes indexé)"""
+    if categorie_id == 0:
+        filtres, params = ["p.categorie_id IS NULL"], []
+    else:
+        bornes = conn.execute("SELECT bg, bd FROM categories WHERE id = ?", (categorie_id,)).fetchone()
+        if not bornes:
+            raise ValueError(f"Catégorie inconnue: {categorie_id}")
+        filtres = ["p.categorie_id IN (SELECT id FROM categories WHERE bg BETWEEN ? AND ?)"]
+        params = list(bornes)
+    produits = _agreger_ventes(conn, "p.nom", filtres, params, debut, fin, devise, convertisseur)
+    return produits.nlargest(limite, 'ca_devise').rename_axis('produit').reset_index()
+
+
+def chemin_categorie(arbre: pd.DataFrame, categorie_id: Optional[int]) -> List[int]:
+    """Ids des ancêtres d'une catégorie, de la racine à la catégorie elle-même"""
+    if categorie_id is None:
+        return []
+    if categorie_id == 0:
+        return [0]
+    ligne = arbre.loc[arbre['id'] == categorie_id].iloc[0]
+    ancetres = arbre[(arbre['bg'] <= ligne['bg']) & (arbre['bd'] >= ligne['bd']) & (arbre['id'] != 0)]
+    return ancetres.sort_values('bg')['id'].tolist()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Catégories de produits")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    p = sous.add_parser("ajouter", help='Crée une catégorie, ex: "Informatique > Périphériques"')
+    p.add_argument("chemin")
+
+    p = sous.add_parser("classer", help="Range un produit dans une catégorie (créée si besoin)")
+    p.add_argument("produit_id", type=int)
+    p.add_argument("chemin")
+
+    p = sous.add_parser("importer", help="Range les produits d'un CSV produit_id,categorie (chemin)")
+    p.add_argument("fichier")
+
+    p = sous.add_parser("arbre", help="Affiche le CA cumulé par catégorie")
+    p.add_argument("--debut", default=None)
+    p.add_argument("--fin", default=None)
+
+    args = parser.parse_args()
+    conn = connecter(DB_PATH)
+    try:
+        migrer_schema(conn)
+        if args.commande == "ajouter":
+            logger.info(f"Catégorie {creer_chemin(conn, args.chemin)} : {args.chemin}")
+        elif args.commande == "classer":
+            classer_produits(conn, {args.produit_id: creer_chemin(conn, args.chemin)})
+        elif args.commande == "importer":
+            affectations = pd.read_csv(args.fichier, dtype={'categorie': str})
+            ids = creer_chemins(conn, affectations['categorie'].unique())
+            classer_produits(conn, dict(zip(affectations['produit_id'], affectations['categorie'].map(ids))))
+            logger.info(f"{len(affectations)} produits classés dans {len(ids)} catégories")
+        else:
+            arbre = ca_par_categorie(conn, args.debut, args.fin)
+            arbre['categorie'] = ['  ' * int(p) + n for p, n in zip(arbre['profondeur'], arbre['nom'])]
+            print(arbre[['categorie', 'quantite', 'ca_eur']].to_string(index=False))
+    except (sqlite3.Error, ValueError) as e:
+        logger.error(f"Erreur de catégorie: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
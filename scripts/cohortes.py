@@ -0,0 +1,233 @@
+# scripts/cohortes.py
+"""Rétention par cohorte : clients actifs selon leur mois de premier achat et l'ancienneté"""
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from archives import historique_complet
+from base_donnees import DB_PATH, connecter, migrer_schema, transaction_immediate
+
+logger = logging.getLogger(__name__)
+
+JALONS = (1, 3, 6, 12)  # Mois d'ancienneté résumés dans le rapport
+
+
+def _numero(mois: Iterable[str]) -> np.ndarray:
+    """Numéro de mois (AAAA-MM) depuis l'an 0, pour compter des écarts en mois"""
+    mois = np.asarray(list(mois), dtype='datetime64[M]')
+    return mois.astype(np.int64)
+
+
+def _en_octets(clients: np.ndarray) -> Tuple[int, bytes]:
+    """Identifiants triés sur 4 octets s'ils y tiennent, sinon 8"""
+    octets = 4 if not len(clients) or (clients.min() >= 0 and clients.max() < 2**31) else 8
+    return octets, clients.astype(f'<i{octets}').tobytes()
+
+
+def _clients_mois(conn: sqlite3.Connection, mois: Iterable[str]) -> Dict[str, np.ndarray]:
+    """Clients distincts actifs de chaque mois, lus sur l'index des dates (tout l'historique, archives comprises)"""
+    actifs = {}
+    with historique_complet(conn):
+        for m in sorted(mois):
+            clients = np.array([c for (c,) in conn.execute(
+                """SELECT DISTINCT client_id FROM ventes
+                WHERE date >= ? AND date < date(?, '+1 month') AND client_id IS NOT NULL""",
+                (f"{m}-01", f"{m}-01")
+            )], dtype=np.int64)
+            if len(clients):
+                actifs[m] = np.sort(clients)
+    return actifs
+
+
+def actualiser(conn: sqlite3.Connection) -> int:
+    """
+    Recalcule et enregistre les clients actifs des mois modifiés ; retourne le nombre de mois.
+
+    Mois en attente et ventes sont lus sous le verrou d'écriture (archives
+    attachées avant, hors transaction) : une vente validée entre la lecture
+    et l'effacement des marqueurs serait perdue.
+    """
+    if not conn.execute("SELECT 1 FROM cohortes_a_recalculer LIMIT 1").fetchone():
+        return 0
+    with historique_complet(conn), transaction_immediate(conn):
+        mois = [m for (m,) in conn.execute("SELECT mois FROM cohortes_a_recalculer")]
+        if not mois:
+            return 0
+        actifs = _clients_mois(conn, mois)
+        conn.executemany("DELETE FROM clients_actifs_mois WHERE mois = ?", [(m,) for m in mois])
+        conn.executemany("INSERT INTO clients_actifs_mois VALUES (?, ?, ?, ?)",
+                         [(m, len(clients), *_en_octets(clients)) for m, clients in actifs.items()])
+        conn.executemany("DELETE FROM cohortes_a_recalculer WHERE mois = ?", [(m,) for m in mois])
+    return len(mois)
+
+
+def _actifs(conn: sqlite3.Connection) -> Dict[str, np.ndarray]:
+    """
+    Clients actifs de chaque mois : enregistrés, et recalculés à la volée
+    pour les mois en attente (résultat à jour en lecture seule)
+    """
+    en_attente = {m for (m,) in conn.execute("SELECT mois FROM cohortes_a_recalculer")}
+    actifs = {m: np.frombuffer(clients, dtype=f'<i{octets}')
+              for m, octets, clients in conn.execute("SELECT mois, octets, clients FROM clients_actifs_mois")
+              if m not in en_attente}
+    actifs.update(_clients_mois(conn, en_attente))
+    return dict(sorted(actifs.items()))
+
+
+def matrice(actifs: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """
+    Clients actifs par cohorte (mois du premier achat, en lignes) et par
+    ancienneté en mois (colonnes, 0 = mois d'acquisition = taille de la
+    cohorte), à partir des clients actifs de chaque mois.
+
+    Une opération vectorisée par mois, aucune par client : la cohorte de
+    chaque client est fixée au premier mois où il apparaît, puis les
+    clients de chaque mois sont comptés par cohorte d'un seul bincount.
+    """
+    if not actifs:
+        return pd.DataFrame(dtype=np.int64).rename_axis(index='cohorte', columns='anciennete')
+    mois = list(actifs)
+    numeros = _numero(mois)
+    premier = numeros[0]
+    nb_mois = int(numeros[-1] - premier) + 1
+
+    # Identifiants denses : tableau direct si les numéros de clients sont compacts, rangs sinon
+    total = sum(len(c) for c in actifs.values())
+    plus_grand = max(int(c.max()) for c in actifs.values())
+    if 0 <= min(int(c.min()) for c in actifs.values()) and plus_grand < 4 * total + 1024:
+        indices = actifs
+        taille = plus_grand + 1
+    else:
+        tous = np.unique(np.concatenate(list(actifs.values())))
+        indices = {m: np.searchsorted(tous, c) for m, c in actifs.items()}
+        taille = len(tous)
+
+    cohorte = np.full(taille, -1, dtype=np.int32)  # Rang du mois d'acquisition de chaque client
+    effectifs = np.zeros(nb_mois * nb_mois, dtype=np.int64)
+    for m, numero in zip(mois, numeros):
+        rang = int(numero - premier)
+        clients = indices[m]
+        leurs_cohortes = cohorte[clients]
+        nouveaux = leurs_cohortes < 0
+        cohorte[clients[nouveaux]] = rang
+        leurs_cohortes[nouveaux] = rang
+        effectifs += np.bincount(leurs_cohortes * nb_mois + (rang - leurs_cohortes), minlength=nb_mois * nb_mois)
+
+    etiquettes = pd.period_range(mois[0], periods=nb_mois, freq='M').strftime('%Y-%m')
+    resultat = pd.DataFrame(effectifs.reshape(nb_mois, nb_mois), index=etiquettes, columns=range(nb_mois))
+    resultat = resultat[resultat[0] > 0]
+    return resultat.rename_axis(index='cohorte', columns='anciennete')
+
+
+def retention(effectifs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Part des clients de chaque cohorte actifs après n mois ; NaN au-delà
+    du dernier mois observé (ancienneté pas encore atteinte)
+    """
+    if effectifs.empty:
+        return effectifs.astype(float)
+    parts = effectifs.div(effectifs[0], axis=0)
+    # Les colonnes couvrent du premier mois observé (première cohorte) au dernier
+    derniere = _numero(effectifs.index[:1])[0] + len(effectifs.columns) - 1
+    observables = derniere - _numero(effectifs.index)
+    return parts.where(np.arange(len(effectifs.columns)) <= observables[:, None])
+
+
+def retention_moyenne(effectifs: pd.DataFrame, jalons: Iterable[int] = JALONS) -> pd.Series:
+    """
+    Part des clients actifs après chacune des anciennetés `jalons`, sur
+    toutes les cohortes qui l'ont atteinte (pondérée par leur taille)
+    """
+    parts = retention(effectifs)
+    moyennes = {}
+    for n in jalons:
+        if n in parts.columns and parts[n].notna().any():
+            atteinte = parts[n].notna()
+            moyennes[n] = effectifs.loc[atteinte, n].sum() / effectifs.loc[atteinte, 0].sum()
+    return pd.Series(moyennes, dtype=float).rename_axis('anciennete')
+
+
+def cohortes(conn: sqlite3.Connection) -> pd.DataFrame:
+    """Matrice des clients actifs par cohorte et ancienneté, à jour (connexion en lecture seule possible)"""
+    return matrice(_actifs(conn))
+
+
+def _banc(clients: int, mois: int = 36) -> List[str]:
+    """Matrice de `clients` clients synthétiques, face au calcul par client (extrapolé)"""
+    generateur = np.random.default_rng(0)
+    acquisition = generateur.integers(0, mois, clients)
+    fidelite = generateur.uniform(0.05, 0.6, clients)  # Probabilité d'achat de chaque client chaque mois
+    actifs = {}
+    for m in range(mois):
+        candidats = np.flatnonzero(acquisition <= m)
+        tirage = generateur.random(len(candidats)) < fidelite[candidats]
+        actifs[str(np.datetime64('2021-01') + m)] = candidats[tirage | (acquisition[candidats] == m)]
+    paires = sum(len(c) for c in actifs.values())
+
+    debut = time.perf_counter()
+    effectifs = matrice(actifs)
+    vectorise = time.perf_counter() - debut
+
+    # Par client : mois de premier achat puis ancienneté de chacun de ses mois d'activité
+    echantillon = min(clients, 20_000)
+    historiques = {}
+    for m, clients_mois in actifs.items():
+        for client in clients_mois[clients_mois < echantillon].tolist():
+            historiques.setdefault(client, []).append(m)
+    debut = time.perf_counter()
+    comptes = {}
+    for client, mois_actifs in historiques.items():
+        depart = pd.Period(min(mois_actifs), 'M')
+        for m in mois_actifs:
+            cle = (str(depart), (pd.Period(m, 'M') - depart).n)
+            comptes[cle] = comptes.get(cle, 0) + 1
+    boucle = (time.perf_counter() - debut) * clients / echantillon
+
+    return [f"{clients:,} clients, {paires:,} paires client-mois: matrice {vectorise:.2f} s, "
+            f"boucle par client ~{boucle:.0f} s (extrapolée de {echantillon:,} clients)",
+            f"rétention moyenne à 1 mois: {retention(effectifs)[1].mean():.1%}"]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Rétention par cohorte de premier achat")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    sous.add_parser("actualiser", help="Recalcule les clients actifs des mois modifiés")
+
+    p = sous.add_parser("matrice", help="Rétention de chaque cohorte")
+    p.add_argument("--effectifs", action="store_true", help="Nombres de clients plutôt que parts")
+
+    p = sous.add_parser("banc", help="Matrice de clients synthétiques, face à un calcul par client")
+    p.add_argument("--clients", type=int, default=10_000_000)
+
+    args = parser.parse_args()
+    try:
+        if args.commande == "banc":
+            print("\n".join(_banc(args.clients)))
+            sys.exit(0)
+        conn = connecter(DB_PATH)
+        try:
+            migrer_schema(conn)
+            debut = time.perf_counter()
+            if args.commande == "actualiser":
+                logger.info(f"{actualiser(conn)} mois recalculés")
+            else:
+                actualiser(conn)
+                effectifs = cohortes(conn)
+                tableau = effectifs if args.effectifs else retention(effectifs)
+                with pd.option_context('display.float_format', '{:.0%}'.format, 'display.width', 250,
+                                       'display.max_columns', 20):
+                    print(tableau.to_string())
+            logger.info(f"Terminé en {time.perf_counter() - debut:.2f} s")
+        finally:
+            conn.close()
+    except (sqlite3.Error, ValueError) as e:
+        logger.error(f"Erreur de cohortes: {e}")
+        sys.exit(1)
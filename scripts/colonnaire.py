@@ -0,0 +1,244 @@
+# scripts/colonnaire.py
+"""Instantanés colonnaires des ventes, projetés en mémoire et partagés entre sessions et processus"""
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+
+from base_donnees import DB_PATH, connecter
+
+logger = logging.getLogger(__name__)
+
+DOSSIER_COLONNES = Path(DB_PATH).parent / "colonnes"
+GARDER = 2  # Instantanés conservés : le courant et le précédent, encore ouvert par les sessions en retard
+META = "meta.json"
+
+
+def nom_instantane(*cle) -> str:
+    """Nom de dossier d'un instantané, stable d'un processus à l'autre pour une même clé"""
+    return hashlib.sha1(repr(cle).encode()).hexdigest()[:16]
+
+
+def _encoder(colonne: pd.Series) -> tuple:
+    """Tableau à largeur fixe d'une colonne, et son dictionnaire pour les colonnes de texte"""
+    if isinstance(colonne.dtype, pd.CategoricalDtype):
+        codes, valeurs = colonne.cat.codes.to_numpy(), colonne.cat.categories
+    elif isinstance(colonne.dtype, np.dtype) and colonne.dtype.kind in 'biufmM':
+        return colonne.to_numpy(), None
+    else:
+        codes, valeurs = pd.factorize(colonne, sort=True)
+    if not all(isinstance(v, str) for v in valeurs):
+        raise ValueError(f"Colonne {colonne.name} non prise en charge ({colonne.dtype})")
+    # Codes au type que pandas retient pour ce nombre de valeurs (le plus petit entier signé
+    # strictement supérieur) : ils seront projetés sans conversion
+    type_codes = next(t for t in (np.int8, np.int16, np.int32, np.int64) if len(valeurs) < np.iinfo(t).max)
+    return codes.astype(type_codes, copy=False), list(valeurs)
+
+
+def ecrire(df: pd.DataFrame, dossier: Path) -> Path:
+    """
+    Écrit `df` colonne par colonne : un fichier .npy par colonne (nombres et
+    dates tels quels, textes codés par dictionnaire) et un meta.json.
+
+    Le dossier est écrit sous un nom temporaire puis renommé : un lecteur
+    ne voit jamais d'instantané partiel. Si un autre processus a écrit le
+    même instantané entre-temps, le sien est conservé.
+    """
+    temporaire = dossier.with_name(f".{dossier.name}.{os.getpid()}")
+    temporaire.mkdir(parents=True, exist_ok=True)
+    try:
+        colonnes = []
+        for i, nom in enumerate(df.columns):
+            valeurs, dictionnaire = _encoder(df[nom])
+            fichier = f"{i:03d}.npy"
+            np.save(temporaire / fichier, np.ascontiguousarray(valeurs))
+            colonnes.append({'nom': nom, 'fichier': fichier, 'dictionnaire': dictionnaire})
+        (temporaire / META).write_text(json.dumps({'lignes': len(df), 'colonnes': colonnes}, ensure_ascii=False))
+        try:
+            os.rename(temporaire, dossier)
+        except OSError:
+            if not (dossier / META).exists():
+                raise
+    finally:
+        shutil.rmtree(temporaire, ignore_errors=True)
+    return dossier
+
+
+def ouvrir(dossier: Path) -> pd.DataFrame:
+    """
+    DataFrame dont les colonnes sont des projections en lecture seule des
+    fichiers de l'instantané : les pages viennent du cache du système, une
+    seule fois pour tous les processus qui l'ouvrent. Les colonnes de texte
+    sont des catégories. Toute tentative de modification échoue.
+    """
+    meta = json.loads((dossier / META).read_text())
+    mode = 'r' if meta['lignes'] else None  # Un fichier vide ne peut pas être projeté
+    colonnes = {}
+    for colonne in meta['colonnes']:
+        valeurs = np.load(dossier / colonne['fichier'], mmap_mode=mode)
+        if colonne['dictionnaire'] is not None:
+            valeurs = pd.Categorical.from_codes(valeurs, categories=pd.Index(colonne['dictionnaire']),
+                                                validate=False)
+        colonnes[colonne['nom']] = valeurs
+    return pd.DataFrame(colonnes, copy=False)
+
+
+def partager(cle: tuple, construire: Callable[[], pd.DataFrame],
+             dossier: Path = DOSSIER_COLONNES) -> pd.DataFrame:
+    """
+    Ouvre l'instantané de `cle` (par exemple version de la base et devise),
+    en le construisant avec `construire` s'il n'existe pas encore. Un
+    DataFrame vide est retourné tel quel, sans instantané.
+    """
+    chemin = dossier / nom_instantane(*cle)
+    if not (chemin / META).exists():
+        df = construire()
+        if df.empty:
+            return df
+        debut = time.perf_counter()
+        ecrire(df, chemin)
+        logger.info(f"Instantané colonnaire {chemin.name} écrit en {time.perf_counter() - debut:.2f} s")
+        elaguer(GARDER, dossier)
+    return ouvrir(chemin)
+
+
+def instantanes(dossier: Path = DOSSIER_COLONNES) -> List[Path]:
+    """Instantanés complets du dossier, du plus ancien au plus récent"""
+    if not dossier.exists():
+        return []
+    return sorted((d for d in dossier.iterdir() if (d / META).exists()), key=lambda d: (d / META).stat().st_mtime)
+
+
+def elaguer(garder: int, dossier: Path = DOSSIER_COLONNES) -> List[Path]:
+    """
+    Supprime les instantanés au-delà des `garder` plus récents. Un processus
+    qui projette encore un instantané supprimé garde ses données jusqu'à
+    ce qu'il le referme ; les fichiers encore ouverts sous Windows sont
+    laissés en place et supprimés à un élagage suivant.
+    """
+    supprimes = []
+    for chemin in instantanes(dossier)[:-garder] if garder > 0 else []:
+        try:
+            shutil.rmtree(chemin)
+            supprimes.append(chemin)
+        except OSError as e:
+            logger.warning(f"Instantané {chemin.name} non supprimé: {e}")
+    return supprimes
+
+
+def _memoire() -> dict:
+    """Mémoire résidente et part proportionnelle (pages partagées divisées par leurs utilisateurs), en Mo"""
+    valeurs = {}
+    for ligne in Path("/proc/self/smaps_rollup").read_text().splitlines():
+        champ, _, reste = ligne.partition(':')
+        if champ in ('Rss', 'Pss'):
+            valeurs[champ] = int(reste.split()[0]) / 1024
+    return valeurs
+
+
+def _session(chemin: str, mode: str, barriere, resultats) -> None:
+    """
+    Session du banc : sans données (interpréteur et bibliothèques seuls),
+    instantané projeté, ou copie privée au format de load_data (textes en str)
+    """
+    if mode != 'vide':
+        df = ouvrir(Path(chemin))
+        if mode == 'privee':
+            df = df.astype({nom: 'str' for nom in df.columns if isinstance(df[nom].dtype, pd.CategoricalDtype)})
+        for nom in df.columns:
+            colonne = df[nom]
+            if isinstance(colonne.dtype, pd.CategoricalDtype):
+                colonne.array.codes.view(np.uint8).sum()
+            elif colonne.dtype.kind in 'biufmM':
+                colonne.to_numpy().view(np.uint8).sum()
+            else:
+                colonne.str.len().sum()
+    barriere.wait()  # Toutes les sessions vivantes au moment de la mesure
+    resultats.put(_memoire())
+    barriere.wait()
+
+
+def banc(conn: sqlite3.Connection, sessions: int = 8) -> List[str]:
+    """Mémoire de `sessions` processus ouvrant le même instantané, projeté puis en copie privée"""
+    df = pd.read_sql(
+        """SELECT v.produit_id, v.client_id, v.date, v.quantite, v.prix_unitaire,
+                  p.nom AS produit, c.nom AS client
+        FROM ventes v JOIN produits p ON p.id = v.produit_id JOIN clients c ON c.id = v.client_id""", conn
+    )
+    df['date'] = pd.to_datetime(df['date'])
+    df['mois'] = df['date'].dt.strftime('%Y-%m')
+    df['chiffre_affaires'] = df['quantite'] * df['prix_unitaire']
+    lignes = [f"{len(df):,} lignes, {df.memory_usage(deep=True).sum() / 2**20:.0f} Mo en DataFrame"]
+
+    dossier = DOSSIER_COLONNES / f".banc.{os.getpid()}"
+    try:
+        debut = time.perf_counter()
+        ecrire(df, dossier)
+        taille = sum(f.stat().st_size for f in dossier.iterdir()) / 2**20
+        lignes.append(f"écriture {time.perf_counter() - debut:.2f} s, {taille:.0f} Mo sur disque")
+        del df
+        debut = time.perf_counter()
+        ouvrir(dossier)
+        lignes.append(f"ouverture {(time.perf_counter() - debut) * 1000:.1f} ms")
+
+        contexte = multiprocessing.get_context('spawn')  # Processus indépendants, comme des serveurs distincts
+        for libelle, mode in (("sans données", 'vide'), ("instantané projeté", 'projection'),
+                              ("copies privées", 'privee')):
+            barriere, resultats = contexte.Barrier(sessions), contexte.Queue()
+            processus = [contexte.Process(target=_session, args=(str(dossier), mode, barriere, resultats))
+                         for _ in range(sessions)]
+            for p in processus:
+                p.start()
+            mesures = [resultats.get(timeout=600) for _ in processus]
+            for p in processus:
+                p.join()
+            lignes.append(f"{libelle:>20}: {sessions} sessions, PSS total {sum(m['Pss'] for m in mesures):.0f} Mo, "
+                          f"RSS par session {np.mean([m['Rss'] for m in mesures]):.0f} Mo")
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+    return lignes
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Instantanés colonnaires partagés des ventes")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    sous.add_parser("liste", help="Instantanés disponibles")
+
+    p = sous.add_parser("elaguer", help="Supprime les instantanés les plus anciens")
+    p.add_argument("--garder", type=int, default=GARDER)
+
+    p = sous.add_parser("banc", help="Mémoire de plusieurs sessions, instantané partagé ou copies privées")
+    p.add_argument("--sessions", type=int, default=8)
+
+    args = parser.parse_args()
+    try:
+        if args.commande == "liste":
+            for chemin in instantanes():
+                meta = json.loads((chemin / META).read_text())
+                taille = sum(f.stat().st_size for f in chemin.iterdir()) / 2**20
+                print(f"{chemin.name}  {meta['lignes']:,} lignes  {len(meta['colonnes'])} colonnes  {taille:.0f} Mo")
+        elif args.commande == "elaguer":
+            for chemin in elaguer(args.garder):
+                logger.info(f"Instantané supprimé: {chemin.name}")
+        else:
+            conn = connecter(DB_PATH, lecture_seule=True)
+            try:
+                print("\n".join(banc(conn, args.sessions)))
+            finally:
+                conn.close()
+    except (sqlite3.Error, ValueError, OSError) as e:
+        logger.error(f"Erreur d'instantané colonnaire: {e}")
+        sys.exit(1)
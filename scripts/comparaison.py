@@ -0,0 +1,266 @@
+# scripts/comparaison.py
+"""Comparaison d'une période courante à une période de référence, par produit, client ou magasin"""
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import pandas as pd
+
+from archives import attacher as attacher_archives
+from base_donnees import DB_PATH, connecter, migrer_schema
+from devises import DEVISE_BASE, DEVISE_RAPPORT, Convertisseur
+from federation import RESEAU, SOURCES, THREADS_MAX, magasins, schema
+from palmares import actualiser as actualiser_palmares, decouper, facteur_periode, jours_des_mois, totaux_jours
+
+logger = logging.getLogger(__name__)
+
+MODES = {
+    'mois': "Mois en cours / mêmes jours du mois précédent",
+    'cumul_annuel': "Cumul annuel / même période l'an dernier",
+    'semaine': "Semaine en cours / même semaine l'an dernier",
+}
+DIMENSIONS = {'produit': 'produits', 'client': 'clients', 'magasin': None}
+MESURES = ['nb_ventes', 'quantite', 'ca_eur']
+AGREGATS = "COUNT(*) AS nb_ventes, SUM(quantite) AS quantite, SUM(montant) AS ca_eur"
+LOT_NOMS = 10_000  # Identifiants par requête de noms (sous la limite de variables de SQLite)
+
+Periode = Tuple[str, str]  # Premier et dernier jour inclus (AAAA-MM-JJ)
+
+
+def periodes(mode: str, jour: str) -> Tuple[Periode, Periode]:
+    """
+    Période courante (jusqu'à `jour` inclus) et période de référence
+    d'un mode de MODES. La semaine de l'an dernier est décalée de 364
+    jours : mêmes jours de la semaine.
+    """
+    jour = pd.Timestamp(jour).normalize()
+    if mode == 'mois':
+        debut = jour.replace(day=1)
+        debut_ref = debut - pd.DateOffset(months=1)
+        fin_ref = min(debut_ref + pd.Timedelta(days=jour.day - 1), debut - pd.Timedelta(days=1))
+    elif mode == 'cumul_annuel':
+        debut = jour.replace(month=1, day=1)
+        debut_ref, fin_ref = debut - pd.DateOffset(years=1), jour - pd.DateOffset(years=1)
+    elif mode == 'semaine':
+        debut = jour - pd.Timedelta(days=jour.weekday())
+        debut_ref, fin_ref = debut - pd.Timedelta(days=364), jour - pd.Timedelta(days=364)
+    else:
+        raise ValueError(f"Mode inconnu: {mode}")
+    return (str(debut.date()), str(jour.date())), (str(debut_ref.date()), str(fin_ref.date()))
+
+
+def _totaux_produits(conn: sqlite3.Connection, periode: Periode) -> pd.DataFrame:
+    """
+    Totaux par produit d'une période, lus dans les totaux enregistrés :
+    mois entiers, puis jours des mois entamés. Les jours en attente de
+    recalcul et ceux sans totaux (jours sans vente, ventes archivées avant
+    l'enregistrement des totaux) sont agrégés à la volée depuis `ventes`.
+    """
+    mois_entiers, jours_isoles, en_attente = decouper(conn, *periode)
+    perimes = set(en_attente)
+    periodes_lues = sorted(mois_entiers) + [j for j in jours_isoles if j not in perimes]
+    lus = pd.read_sql(
+        f"""SELECT periode, produit_id AS cle, nb_ventes, quantite, ca_eur FROM totaux_produits
+        WHERE periode IN ({','.join('?' * len(periodes_lues))})""",
+        conn, params=periodes_lues
+    ) if periodes_lues else pd.DataFrame(columns=['periode', 'cle', *MESURES])
+    presentes = set(lus['periode'])
+    a_calculer = sorted(perimes | {j for p in periodes_lues if p not in presentes
+                                   for j in ([p] if len(p) == 10 else jours_des_mois([p]))})
+    morceaux = [lus, totaux_jours(conn, 'produit', a_calculer)] if a_calculer else [lus]
+    return pd.concat(morceaux, ignore_index=True).groupby('cle')[MESURES].sum().astype(float)
+
+
+def _deux_periodes(ventes: str, agregats: str, courante: Periode, reference: Periode,
+                   cle: Optional[str] = None) -> Tuple[str, list]:
+    """
+    Agrégats des deux périodes en une seule requête, marqués periode = 1
+    (courante) ou 0 (référence). Chaque branche lit sa plage sur l'index
+    des dates et agrège ses lignes au passage (par `cle` si fournie) :
+    les ventes ne sont lues qu'une fois, sans tri de leur réunion.
+    """
+    groupe = f" AND {cle} IS NOT NULL GROUP BY {cle}" if cle else ""
+    selection = f"{cle} AS cle, {agregats}" if cle else agregats
+    branche = (f"SELECT {{}} AS periode, {selection} FROM ({ventes}) "
+               f"WHERE date >= ? AND date < date(?, '+1 day'){groupe}")
+    return f"{branche.format(1)} UNION ALL {branche.format(0)}", [*courante, *reference]
+
+
+def _totaux_clients(conn: sqlite3.Connection, courante: Periode,
+                    reference: Periode) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Totaux par client des deux périodes, en une requête"""
+    requete, params = _deux_periodes(SOURCES['ventes']['ventes'], AGREGATS, courante, reference, 'client_id')
+    totaux = pd.read_sql(requete, conn, params=params)
+    return tuple(totaux[totaux['periode'] == p].set_index('cle')[MESURES] for p in (1, 0))
+
+
+def _comparer_magasin(chemin: Union[str, Path], courante: Periode, reference: Periode) -> pd.DataFrame:
+    """Totaux et clients distincts d'un magasin pour les deux périodes, sur sa propre connexion"""
+    conn = connecter(chemin, lecture_seule=True)
+    try:
+        source = SOURCES[schema(conn)]
+        attacher_archives(conn, min(courante[0], reference[0]), max(courante[1], reference[1]))
+        requete, params = _deux_periodes(source['ventes'], f"{AGREGATS}, COUNT(DISTINCT client_id) AS clients",
+                                         courante, reference)
+        totaux = pd.read_sql(requete, conn, params=params)
+    finally:
+        conn.close()
+    return totaux.set_index('periode').reindex([1, 0]).fillna(0)
+
+
+def _par_magasin(conn: sqlite3.Connection, courante: Periode, reference: Periode,
+                 threads: Optional[int] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Totaux de chaque magasin du réseau (interrogés en parallèle) et du réseau, pour les deux périodes"""
+    chemins = magasins(conn)
+    totaux = {}
+    with ThreadPoolExecutor(max_workers=threads or min(len(chemins), THREADS_MAX),
+                            thread_name_prefix="magasin") as executeur:
+        calculs = {nom: executeur.submit(_comparer_magasin, chemin, courante, reference)
+                   for nom, chemin in chemins.items()}
+        for nom, calcul in calculs.items():
+            try:
+                totaux[nom] = calcul.result()
+            except (sqlite3.Error, pd.errors.DatabaseError, ValueError) as e:
+                # pd.read_sql signale une table ou colonne manquante, une base verrouillée, par DatabaseError
+                logger.warning(f"Magasin {nom} écarté: {e}")
+    # Réseau : somme des magasins (clients distincts propres à chaque base, comme dans federation)
+    colonnes = [*MESURES, 'clients']
+    periodes_magasins = []
+    for p in (1, 0):
+        par_nom = pd.DataFrame({nom: t.loc[p, colonnes] for nom, t in totaux.items()}, index=colonnes).T
+        par_nom.loc[RESEAU] = par_nom.sum()
+        periodes_magasins.append(par_nom.rename_axis('cle'))
+    return tuple(periodes_magasins)
+
+
+def _nommer(conn: sqlite3.Connection, table: str, cles: pd.Index) -> pd.Series:
+    """Noms des identifiants, lus par lots ; 'Produit 12' ou 'Client 7' à défaut"""
+    cles = [int(c) for c in cles]
+    noms = {}
+    for i in range(0, len(cles), LOT_NOMS):
+        lot = cles[i:i + LOT_NOMS]
+        noms.update(conn.execute(f"SELECT id, nom FROM {table} WHERE id IN ({','.join('?' * len(lot))})", lot))
+    libelle = table[:-1].capitalize()
+    return pd.Series([noms.get(c, f"{libelle} {c}") for c in cles], index=cles)
+
+
+def confronter(courant: pd.DataFrame, reference: pd.DataFrame, facteur_courant: float = 1.0,
+               facteur_reference: float = 1.0) -> pd.DataFrame:
+    """
+    Rapproche les totaux des deux périodes (index commun, colonnes de
+    MESURES) : montants convertis, écart et évolution relative (NaN sans
+    CA de référence). Trié par CA courant décroissant.
+    """
+    courant, reference = courant.astype(float), reference.astype(float)
+    cles = courant.index.union(reference.index)
+    courant, reference = courant.reindex(cles, fill_value=0.0), reference.reindex(cles, fill_value=0.0)
+    resultat = pd.DataFrame({
+        'nb_ventes_courant': courant['nb_ventes'].astype(int),
+        'nb_ventes_reference': reference['nb_ventes'].astype(int),
+        'quantite_courante': courant['quantite'].astype(int),
+        'quantite_reference': reference['quantite'].astype(int),
+        'ca_courant': courant['ca_eur'] * facteur_courant,
+        'ca_reference': reference['ca_eur'] * facteur_reference,
+    }, index=cles)
+    resultat['ecart'] = resultat['ca_courant'] - resultat['ca_reference']
+    resultat['evolution'] = resultat['ecart'] / resultat['ca_reference'].where(resultat['ca_reference'] > 0)
+    return resultat.sort_values(['ca_courant', 'ca_reference'], ascending=False)
+
+
+def comparer(conn: sqlite3.Connection, dimension: str, courante: Periode, reference: Periode,
+             devise: str = DEVISE_BASE, convertisseur: Optional[Convertisseur] = None,
+             threads: Optional[int] = None) -> pd.DataFrame:
+    """
+    Compare deux périodes par produit, client ou magasin.
+
+    Produits : totaux enregistrés par palmares.py (mois entiers et jours),
+    sans relire les ventes. Clients : une seule requête pour les deux
+    périodes, chacune lue sur l'index des dates. Magasins : une requête
+    par base du réseau, en parallèle, plus la ligne RESEAU.
+
+    Les montants sont convertis au taux de chaque période (taux moyen
+    journalier s'il a varié), comme dans palmares.meilleurs.
+
+    Returns:
+        DataFrame <dimension>, nb_ventes_courant, nb_ventes_reference,
+        quantite_courante, quantite_reference, ca_courant, ca_reference,
+        ecart, evolution (et clients_courant, clients_reference par magasin)
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Dimension inconnue: {dimension}")
+    if dimension == 'produit':
+        courant, ref = _totaux_produits(conn, courante), _totaux_produits(conn, reference)
+    elif dimension == 'client':
+        courant, ref = _totaux_clients(conn, courante, reference)
+    else:
+        courant, ref = _par_magasin(conn, courante, reference, threads)
+
+    convertisseur = convertisseur or (Convertisseur(conn) if devise != DEVISE_BASE else None)
+    resultat = confronter(courant[MESURES], ref[MESURES], facteur_periode(convertisseur, devise, *courante),
+                          facteur_periode(convertisseur, devise, *reference))
+    if dimension == 'magasin':
+        resultat['clients_courant'] = courant['clients'].reindex(resultat.index).astype(int)
+        resultat['clients_reference'] = ref['clients'].reindex(resultat.index).astype(int)
+        return resultat.rename_axis(dimension).reset_index()
+    resultat.insert(0, dimension, _nommer(conn, DIMENSIONS[dimension], resultat.index).to_numpy())
+    return resultat.rename_axis('cle').reset_index()
+
+
+def _banc(conn: sqlite3.Connection, courante: Periode, reference: Periode) -> List[str]:
+    """Durée de la comparaison par produit et par client, face à deux agrégations séparées des ventes"""
+    lignes = []
+    for dimension, colonne in (('produit', 'produit_id'), ('client', 'client_id')):
+        debut = time.perf_counter()
+        for periode in (courante, reference):
+            conn.execute(
+                f"""SELECT {colonne}, COUNT(*), SUM(quantite), SUM(prix_unitaire * quantite) FROM ventes
+                WHERE date >= ? AND date < date(?, '+1 day') GROUP BY 1""", periode
+            ).fetchall()
+        deux_requetes = time.perf_counter() - debut
+        debut = time.perf_counter()
+        resultat = comparer(conn, dimension, courante, reference)
+        lignes.append(f"{dimension:>8}: {len(resultat):,} lignes en {time.perf_counter() - debut:.2f} s "
+                      f"(deux agrégations des ventes : {deux_requetes:.2f} s)")
+    return lignes
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Comparaison de périodes")
+    parser.add_argument("commande", choices=("comparer", "banc"))
+    parser.add_argument("--dimension", choices=list(DIMENSIONS), default='produit')
+    parser.add_argument("--mode", choices=list(MODES), default='mois')
+    parser.add_argument("--jour", default=None, help="Dernier jour de la période courante (dernière vente par défaut)")
+    parser.add_argument("--courante", nargs=2, metavar=("DEBUT", "FIN"), help="Période courante libre")
+    parser.add_argument("--reference", nargs=2, metavar=("DEBUT", "FIN"), help="Période de référence libre")
+    parser.add_argument("--devise", default=DEVISE_RAPPORT)
+    parser.add_argument("-n", type=int, default=20, help="Lignes affichées")
+    args = parser.parse_args()
+
+    conn = connecter(DB_PATH)
+    try:
+        migrer_schema(conn)
+        actualiser_palmares(conn)
+        attacher_archives(conn)
+        if args.courante and args.reference:
+            courante, reference = tuple(args.courante), tuple(args.reference)
+        else:
+            jour = args.jour or conn.execute("SELECT MAX(date) FROM ventes").fetchone()[0][:10]
+            courante, reference = periodes(args.mode, jour)
+        logger.info(f"Période courante {courante[0]} - {courante[1]}, référence {reference[0]} - {reference[1]}")
+        if args.commande == "banc":
+            print("\n".join(_banc(conn, courante, reference)))
+        else:
+            resultat = comparer(conn, args.dimension, courante, reference, args.devise)
+            with pd.option_context('display.float_format', '{:,.2f}'.format, 'display.width', 200):
+                print(resultat.head(args.n).to_string(index=False))
+    except (sqlite3.Error, pd.errors.DatabaseError, ValueError, KeyError) as e:
+        logger.error(f"Erreur de comparaison: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
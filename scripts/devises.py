@@ -0,0 +1,159 @@
+# scripts/devises.py
+"""Conversion de devises à partir d'une table locale de taux datés"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from base_donnees import DB_PATH, connecter, migrer_schema
+
+logger = logging.getLogger(__name__)
+
+DEVISE_BASE = 'EUR'  # Devise des prix enregistrés en base
+DEVISE_RAPPORT = os.environ.get('DEVISE_RAPPORT', 'XOF')  # Devise d'affichage par défaut
+SYMBOLES = {'EUR': '€', 'XOF': 'FCFA', 'XAF': 'FCFA (CEMAC)', 'USD': '$', 'GBP': '£'}
+
+
+def symbole(devise: str) -> str:
+    """Libellé court d'une devise pour les graphiques et rapports"""
+    return SYMBOLES.get(devise, devise)
+
+
+class Convertisseur:
+    """
+    Taux de change datés chargés en mémoire, par paire de devises.
+
+    Le taux applicable à une date est le dernier taux publié à cette date ou
+    avant. Les paires absentes sont déduites de la paire inverse ou d'un
+    passage par DEVISE_BASE.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        taux = pd.read_sql(
+            "SELECT devise_source, devise_cible, date, taux FROM taux_change ORDER BY date", conn
+        )
+        self._paires: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+        for (source, cible), groupe in taux.groupby(['devise_source', 'devise_cible']):
+            dates = groupe['date'].to_numpy(dtype=object).astype('datetime64[D]')
+            self._paires[(source, cible)] = (dates, groupe['taux'].to_numpy(dtype=float))
+
+    def devises(self) -> list:
+        """Devises vers lesquelles DEVISE_BASE peut être convertie"""
+        connues = {d for paire in self._paires for d in paire}
+        return sorted(connues | {DEVISE_BASE})
+
+    def _serie(self, de: str, vers: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Dates et taux de la paire (de, vers), éventuellement reconstruits"""
+        if (de, vers) in self._paires:
+            return self._paires[(de, vers)]
+        if (vers, de) in self._paires:
+            dates, taux = self._paires[(vers, de)]
+            return dates, 1.0 / taux
+        if DEVISE_BASE not in (de, vers):
+            dates_a, taux_a = self._serie(de, DEVISE_BASE)
+            dates_b, taux_b = self._serie(DEVISE_BASE, vers)
+            dates = np.union1d(dates_a, dates_b)
+            dates = dates[dates >= max(dates_a[0], dates_b[0])]
+            return dates, self._chercher(dates_a, taux_a, dates) * self._chercher(dates_b, taux_b, dates)
+        raise KeyError(f"Aucun taux de change pour {de} -> {vers}")
+
+    @staticmethod
+    def _chercher(dates_taux: np.ndarray, taux: np.ndarray, dates: np.ndarray) -> np.ndarray:
+        """Taux en vigueur à chaque date (recherche dichotomique vectorisée)"""
+        positions = np.searchsorted(dates_taux, dates, side='right') - 1
+        if (positions < 0).any():
+            raise KeyError(f"Aucun taux de change avant le {dates_taux[0]}")
+        return taux[positions]
+
+    def taux(self, de: str, vers: str, dates) -> np.ndarray:
+        """Taux applicables à un tableau de dates"""
+        dates = np.asarray(pd.to_datetime(dates).values.astype('datetime64[D]'))
+        if de == vers:
+            return np.ones(len(dates))
+        return self._chercher(*self._serie(de, vers), dates)
+
+    def facteur_constant(self, de: str, vers: str, debut, fin) -> Optional[float]:
+        """Taux unique si la paire n'a pas varié sur [debut, fin], sinon None"""
+        if de == vers:
+            return 1.0
+        dates_taux, taux = self._serie(de, vers)
+        bornes = self._chercher(dates_taux, np.arange(len(taux)),
+                                pd.to_datetime([debut, fin]).values.astype('datetime64[D]'))
+        periode = taux[bornes[0]:bornes[1] + 1]
+        return float(periode[0]) if np.all(periode == periode[0]) else None
+
+    def convertir(self, montants, dates, de: str = DEVISE_BASE, vers: str = DEVISE_RAPPORT) -> np.ndarray:
+        """Convertit une colonne de montants, ligne à ligne mais sans boucle Python"""
+        montants = np.asarray(montants, dtype=float)
+        if de == vers:
+            return montants
+        dates = pd.to_datetime(dates)
+        facteur = self.facteur_constant(de, vers, dates.min(), dates.max()) if len(dates) else 1.0
+        if facteur is not None:
+            return montants * facteur
+        return montants * self.taux(de, vers, dates)
+
+    def convertir_total(self, montants_par_jour: pd.Series, de: str = DEVISE_BASE,
+                        vers: str = DEVISE_RAPPORT) -> float:
+        """
+        Convertit une somme à partir de ses sous-totaux journaliers.
+
+        Le taux étant unique pour une journée, sommer chaque jour puis
+        convertir donne le même résultat que convertir chaque vente : la
+        conversion porte sur un point par jour au lieu d'un par vente.
+        """
+        if montants_par_jour.empty:
+            return 0.0
+        return float(self.convertir(montants_par_jour.values, montants_par_jour.index, de, vers).sum())
+
+
+def ajouter_taux(conn: sqlite3.Connection, source: str, cible: str, date: str, taux: float) -> None:
+    """Enregistre (ou corrige) le taux d'une paire à une date"""
+    if taux <= 0:
+        raise ValueError(f"Taux invalide: {taux}")
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO taux_change VALUES (?, ?, ?, ?)",
+                     (source.upper(), cible.upper(), date, taux))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Table des taux de change")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    p = sous.add_parser("ajouter", help="Ajoute un taux (1 source = taux cible)")
+    p.add_argument("source")
+    p.add_argument("cible")
+    p.add_argument("date", help="Date d'effet AAAA-MM-JJ")
+    p.add_argument("taux", type=float)
+
+    p = sous.add_parser("importer", help="Importe un CSV devise_source,devise_cible,date,taux")
+    p.add_argument("fichier")
+
+    sous.add_parser("lister", help="Affiche la table des taux")
+
+    args = parser.parse_args()
+    conn = connecter(DB_PATH)
+    try:
+        migrer_schema(conn)
+        if args.commande == "ajouter":
+            ajouter_taux(conn, args.source, args.cible, args.date, args.taux)
+        elif args.commande == "importer":
+            taux = pd.read_csv(args.fichier)
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO taux_change VALUES (?, ?, ?, ?)",
+                                 taux[['devise_source', 'devise_cible', 'date', 'taux']].itertuples(index=False))
+            logger.info(f"{len(taux)} taux importés")
+        else:
+            print(pd.read_sql("SELECT * FROM taux_change ORDER BY devise_source, devise_cible, date", conn)
+                  .to_string(index=False))
+    except (sqlite3.Error, ValueError, KeyError) as e:
+        logger.error(f"Erreur de taux de change: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
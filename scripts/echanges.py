@@ -0,0 +1,111 @@
+# scripts/echanges.py
+"""Tables transmises entre les étapes du pipeline (analyse -> visualisation -> rapport), au format colonnaire"""
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+import pandas as pd
+from pandas.api.types import is_string_dtype
+
+from colonnaire import ecrire, ouvrir
+
+logger = logging.getLogger(__name__)
+
+DOSSIER_ECHANGES = Path(__file__).parent.parent / "output" / "echanges"
+
+# Colonnes garanties par table : les étapes suivantes les lisent sans les revérifier
+SCHEMAS = {
+    'top_produits': {'produit': 'texte', 'quantite': 'entier', 'ca_eur': 'reel', 'ca_devise': 'reel',
+                     'devise': 'texte'},
+    'ca_total': {'ca_eur': 'reel', 'ca_devise': 'reel', 'nb_ventes': 'entier', 'clients_uniques': 'entier',
+                 'devise': 'texte'},
+    'ca_categories': {'categorie': 'texte', 'quantite': 'entier', 'ca_eur': 'reel', 'ca_devise': 'reel',
+                      'devise': 'texte'},
+    'distribution_paniers': {'nb_ventes': 'entier', 'clients_uniques': 'reel', 'devise': 'texte'},
+    'evolution_produits': {'mode': 'texte', 'debut': 'texte', 'fin': 'texte', 'debut_reference': 'texte',
+                           'fin_reference': 'texte', 'produit': 'texte', 'ca_courant': 'reel',
+                           'ca_reference': 'reel', 'ecart': 'reel', 'evolution': 'reel', 'devise': 'texte'},
+}
+TYPES = {'entier': 'int64', 'reel': 'float64'}
+
+
+def _conformer(df: pd.DataFrame, nom: str) -> pd.DataFrame:
+    """Vérifie les colonnes du schéma de `nom` et fixe leurs types ; ValueError sinon"""
+    schema = SCHEMAS[nom]
+    manquantes = [c for c in schema if c not in df.columns]
+    if manquantes:
+        raise ValueError(f"{nom}: colonnes manquantes {manquantes}. Colonnes disponibles: {list(df.columns)}")
+    types = {}
+    for colonne, genre in schema.items():
+        if genre == 'texte':
+            if not (is_string_dtype(df[colonne]) or df[colonne].isna().all()):
+                raise ValueError(f"{nom}: colonne {colonne} de type {df[colonne].dtype}, texte attendu")
+        else:
+            if genre == 'entier' and df[colonne].dtype.kind == 'f' and not (df[colonne] % 1 == 0).all():
+                raise ValueError(f"{nom}: colonne {colonne} non entière (valeurs décimales ou manquantes)")
+            types[colonne] = TYPES[genre]
+    try:
+        return df.astype(types)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"{nom}: types non conformes au schéma ({e})")
+
+
+def publier(df: pd.DataFrame, nom: str, dossier: Path = DOSSIER_ECHANGES) -> Path:
+    """
+    Écrit la table `nom` pour les étapes suivantes, après contrôle de son
+    schéma : une table publiée a toujours les colonnes et les types de
+    SCHEMAS. Remplace la publication précédente.
+
+    `dossier/nom` est un lien symbolique vers la version courante : la
+    nouvelle version est écrite à côté, puis le lien est remplacé par
+    renommage (atomique), et l'ancienne version supprimée ensuite. Un
+    lecteur trouve toujours une table complète. Sans lien symbolique
+    (Windows sans privilège), l'ancienne version est écartée par renommage
+    juste avant la mise en place de la nouvelle.
+    """
+    df = _conformer(df, nom)
+    chemin = dossier / nom
+    nouveau = ecrire(df, dossier / f".{nom}.{time.time_ns()}")
+    lien = dossier / f".{nom}.lien.{os.getpid()}"
+    if chemin.is_symlink():
+        ancien = chemin.resolve()
+    elif chemin.exists():
+        ancien = dossier / f".{nom}.ancien.{os.getpid()}"  # Publication antérieure aux liens
+    else:
+        ancien = None
+    try:
+        try:
+            lien.unlink(missing_ok=True)
+            os.symlink(nouveau.name, lien, target_is_directory=True)
+        except OSError:
+            lien = nouveau
+        if ancien is not None and not chemin.is_symlink():
+            os.rename(chemin, ancien)
+        os.replace(lien, chemin)
+    except BaseException:
+        if ancien is not None and ancien.exists() and not chemin.exists():
+            os.rename(ancien, chemin)
+        shutil.rmtree(nouveau, ignore_errors=True)
+        if lien != nouveau:
+            lien.unlink(missing_ok=True)
+        raise
+    if ancien is not None:
+        shutil.rmtree(ancien, ignore_errors=True)
+    logger.info(f"Table {nom} publiée: {len(df):,} lignes")
+    return chemin
+
+
+def lire(nom: str, dossier: Path = DOSSIER_ECHANGES) -> pd.DataFrame:
+    """
+    Table publiée par une étape précédente, sans analyse de texte : les
+    nombres sont projetés depuis le fichier, les textes décodés de leur
+    dictionnaire. FileNotFoundError si elle n'a pas été publiée.
+    """
+    chemin = dossier / nom
+    if not chemin.exists():
+        raise FileNotFoundError(f"Table {nom} introuvable dans {dossier}. Exécutez d'abord 02_analyse.py")
+    df = ouvrir(chemin)
+    textes = {c: 'str' for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)}
+    return df.astype(textes) if textes else df
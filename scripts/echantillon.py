@@ -0,0 +1,190 @@
+# scripts/echantillon.py
+"""Estimations rapides (CA, panier moyen, parts produits) sur l'échantillon stratifié des ventes"""
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from base_donnees import DB_PATH, SEUIL_ECHANTILLON, connecter, migrer_schema
+from devises import DEVISE_BASE, DEVISE_RAPPORT, Convertisseur
+
+logger = logging.getLogger(__name__)
+
+Z_95 = 1.96  # Quantile de la loi normale pour un intervalle de confiance à 95 %
+
+
+class Echantillon:
+    """
+    Ventes échantillonnées chargées en mémoire, avec les estimateurs stratifiés.
+
+    Dans chaque strate (mois x produit), les ventes tirées représentent les
+    autres : un total est estimé par population x moyenne de l'échantillon,
+    strate par strate, et sa variance par la formule du sondage aléatoire
+    simple avec correction de population finie. Les intervalles retournés
+    sont des demi-largeurs à 95 % (approximation normale).
+    """
+
+    def __init__(self, conn: sqlite3.Connection, devise: str = DEVISE_RAPPORT,
+                 convertisseur: Optional[Convertisseur] = None):
+        debut = time.perf_counter()
+        strates = pd.read_sql(
+            """SELECT s.mois, s.produit_id, COALESCE(p.nom, s.produit_id) AS produit, s.population
+            FROM strates_echantillon s LEFT JOIN produits p ON p.id = s.produit_id
+            WHERE s.population > 0""",
+            conn
+        )
+        # Seuil actuel de chaque strate : les ventes tirées quand elle était plus petite le dépassent
+        ventes = pd.read_sql(
+            f"""SELECT e.mois, e.produit_id, e.client_id, e.date, e.quantite, e.montant_eur AS ca_eur
+            FROM strates_echantillon s
+            JOIN echantillon_ventes e ON e.mois = s.mois AND e.produit_id = s.produit_id
+            WHERE s.population > 0 AND e.cle < {SEUIL_ECHANTILLON}""",
+            conn
+        )
+        clients = pd.read_sql("SELECT id, nom FROM clients", conn).set_index('id')['nom']
+        population = strates['population'].to_numpy(dtype=float)
+        index_strates = pd.MultiIndex.from_frame(strates[['mois', 'produit_id']])
+        codes = index_strates.get_indexer(pd.MultiIndex.from_frame(ventes[['mois', 'produit_id']]))
+        ventes['produit'] = strates['produit'].astype(str).to_numpy()[codes]
+        ventes['client'] = ventes['client_id'].map(clients)
+
+        self.population = population
+        self.strate = codes
+        self.taille = np.bincount(self.strate, minlength=len(strates)).astype(float)
+        # Produit de chaque strate, pour les parts par produit
+        self.produit_strate, self.produits = pd.factorize(strates['produit'].astype(str))
+        vides = int(((self.taille == 0) & (population > 0)).sum())
+        if vides:
+            logger.warning(f"{vides} strates sans vente échantillonnée : estimations sous-évaluées")
+
+        convertisseur = convertisseur or Convertisseur(conn)
+        ventes['ca_devise'] = convertisseur.convertir(ventes['ca_eur'], ventes['date'], DEVISE_BASE, devise)
+        ventes['date'] = pd.to_datetime(ventes['date'])
+        self.ventes = ventes
+        self.devise = devise
+        logger.info(f"Échantillon de {len(ventes):,} ventes sur {int(population.sum()):,} "
+                    f"chargé en {time.perf_counter() - debut:.2f} s")
+
+    @property
+    def nb_ventes(self) -> int:
+        """Taille de la population représentée"""
+        return int(self.population.sum())
+
+    def _strates(self, valeurs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Total estimé et variance de chaque strate pour une variable de l'échantillon"""
+        n, population = self.taille, self.population
+        sommes = np.bincount(self.strate, valeurs, minlength=len(n))
+        carres = np.bincount(self.strate, valeurs * valeurs, minlength=len(n))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            moyennes = np.where(n > 0, sommes / n, 0.0)
+            dispersion = np.where(n > 1, (carres - n * moyennes ** 2) / (n - 1), 0.0)
+            variances = np.where(n > 0, population ** 2 * (1 - n / population) * dispersion / n, 0.0)
+        return population * moyennes, np.maximum(variances, 0.0)
+
+    def _masque(self, lignes: Optional[np.ndarray]) -> np.ndarray:
+        if lignes is None:
+            return np.ones(len(self.ventes))
+        masque = np.zeros(len(self.ventes))
+        masque[lignes] = 1.0
+        return masque
+
+    def estimer(self, lignes: Optional[np.ndarray] = None) -> Dict[str, Tuple[float, float]]:
+        """
+        CA total, nombre de ventes et panier moyen des lignes retenues de
+        l'échantillon (toutes par défaut), chacun en (estimation, marge à 95 %).
+        """
+        masque = self._masque(lignes)
+        ca = self.ventes['ca_devise'].to_numpy(dtype=float) * masque
+        total, var_total = self._strates(ca)
+        nombre, var_nombre = self._strates(masque)
+        ca_total, nb_ventes = float(total.sum()), float(nombre.sum())
+        panier = ca_total / nb_ventes if nb_ventes else 0.0
+        # Panier moyen (ratio) : variance linéarisée sur les résidus ca - panier x indicatrice
+        _, var_residus = self._strates(ca - panier * masque)
+        marge_panier = Z_95 * np.sqrt(var_residus.sum()) / nb_ventes if nb_ventes else 0.0
+        return {
+            'ca': (ca_total, Z_95 * float(np.sqrt(var_total.sum()))),
+            'nb_ventes': (nb_ventes, Z_95 * float(np.sqrt(var_nombre.sum()))),
+            'panier_moyen': (panier, float(marge_panier)),
+        }
+
+    def parts(self, lignes: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """
+        CA et part de chaque produit, avec leurs marges à 95 %.
+
+        Chaque strate appartient à un seul produit : le CA d'un produit est la
+        somme de ses strates, et la variance de sa part (ratio au CA total)
+        s'obtient par linéarisation à partir des variances des strates.
+        """
+        masque = self._masque(lignes)
+        total, variances = self._strates(self.ventes['ca_devise'].to_numpy(dtype=float) * masque)
+        nb = len(self.produits)
+        ca = np.bincount(self.produit_strate, total, minlength=nb)
+        var_ca = np.bincount(self.produit_strate, variances, minlength=nb)
+        ca_total, var_totale = ca.sum(), var_ca.sum()
+        parts = ca / ca_total if ca_total else np.zeros(nb)
+        var_parts = ((1 - parts) ** 2 * var_ca + parts ** 2 * (var_totale - var_ca)) / ca_total ** 2 \
+            if ca_total else np.zeros(nb)
+        resultat = pd.DataFrame({
+            'produit': self.produits,
+            'ca_devise': ca,
+            'marge_ca': Z_95 * np.sqrt(var_ca),
+            'part': parts,
+            'marge_part': Z_95 * np.sqrt(np.maximum(var_parts, 0.0)),
+        })
+        return resultat[resultat['ca_devise'] > 0].sort_values('ca_devise', ascending=False, ignore_index=True)
+
+
+def reconstruire(conn: sqlite3.Connection) -> None:
+    """Supprime l'échantillon et le tire à nouveau sur tout l'historique (après des suppressions massives)"""
+    with conn:
+        conn.execute("DROP TABLE IF EXISTS strates_echantillon")
+        conn.execute("DROP TABLE IF EXISTS echantillon_ventes")
+        for suffixe in ('insert', 'strate', 'update', 'delete'):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_ventes_echantillon_{suffixe}")
+    migrer_schema(conn)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Estimations sur l'échantillon stratifié des ventes")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    p = sous.add_parser("estimer", help="Compare les estimations aux valeurs exactes")
+    p.add_argument("--devise", default=DEVISE_RAPPORT)
+
+    sous.add_parser("reconstruire", help="Tire un nouvel échantillon sur tout l'historique")
+
+    args = parser.parse_args()
+    conn = connecter(DB_PATH)
+    try:
+        migrer_schema(conn)
+        if args.commande == "reconstruire":
+            reconstruire(conn)
+            logger.info("Échantillon reconstruit")
+        else:
+            echantillon = Echantillon(conn, args.devise)
+            debut = time.perf_counter()
+            estimations = echantillon.estimer()
+            parts = echantillon.parts()
+            duree = (time.perf_counter() - debut) * 1000
+            par_jour = pd.read_sql(
+                "SELECT date, SUM(prix_unitaire * quantite) AS ca, COUNT(*) AS nb FROM ventes GROUP BY date", conn
+            ).set_index('date')
+            ca_exact = Convertisseur(conn).convertir_total(par_jour['ca'], DEVISE_BASE, args.devise)
+            print(f"Échantillon: {len(echantillon.ventes):,} ventes sur {echantillon.nb_ventes:,} "
+                  f"(estimations en {duree:.1f} ms)")
+            for nom, (valeur, marge) in estimations.items():
+                print(f"  {nom:<13} {valeur:>18,.2f} ± {marge:,.2f}")
+            print(f"  exact: ca {ca_exact:,.2f}, nb_ventes {int(par_jour['nb'].sum()):,}")
+            print(parts.head(10).to_string(index=False))
+    except (sqlite3.Error, ValueError, KeyError) as e:
+        logger.error(f"Erreur d'échantillonnage: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,349 @@
+# scripts/esquisses.py
+"""Esquisses fusionnables : clients distincts (HyperLogLog) et quantiles des paniers (DDSketch)"""
+import argparse
+import logging
+import os
+import sqlite3
+import struct
+import sys
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from base_donnees import DB_PATH, connecter, migrer_schema, transaction_immediate
+from devises import DEVISE_BASE, DEVISE_RAPPORT, Convertisseur
+
+logger = logging.getLogger(__name__)
+
+MAGASIN = os.environ.get('MAGASIN', 'principal')  # Magasin de la base locale
+PRECISION_HLL = 12  # 4096 registres : erreur type de 1,6 %
+ERREUR_QUANTILES = 0.01  # Erreur relative garantie des quantiles
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _melanger(valeurs: np.ndarray) -> np.ndarray:
+    """Hachage 64 bits (splitmix64) d'entiers, vectorisé"""
+    x = valeurs.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class HyperLogLog:
+    """
+    Nombre approximatif d'éléments distincts, en 2^precision octets.
+
+    Deux esquisses se fusionnent par maximum registre à registre : l'union
+    de jours ou de magasins s'estime sans revoir les ventes, avec la même
+    erreur type 1,04 / sqrt(2^precision).
+    """
+
+    def __init__(self, precision: int = PRECISION_HLL, registres: Optional[np.ndarray] = None):
+        self.precision = precision
+        self.registres = registres if registres is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def erreur_relative(self) -> float:
+        return 1.04 / np.sqrt(len(self.registres))
+
+    def ajouter(self, valeurs: Iterable[int]) -> 'HyperLogLog':
+        hachages = _melanger(np.asarray(valeurs, dtype=np.int64))
+        bits_restants = 64 - self.precision
+        registre = (hachages >> np.uint64(bits_restants)).astype(np.intp)
+        reste = hachages & np.uint64((1 << bits_restants) - 1)
+        # Rang = position du premier bit à 1 dans les bits restants (longueur binaire par étalement)
+        etale = reste.copy()
+        for decalage in (1, 2, 4, 8, 16, 32):
+            etale |= etale >> np.uint64(decalage)
+        rangs = (bits_restants + 1 - np.bitwise_count(etale)).astype(np.uint8)
+        np.maximum.at(self.registres, registre, rangs)
+        return self
+
+    def fusionner(self, autre: 'HyperLogLog') -> 'HyperLogLog':
+        np.maximum(self.registres, autre.registres, out=self.registres)
+        return self
+
+    def estimer(self) -> float:
+        m = len(self.registres)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        brute = alpha * m * m / np.sum(np.ldexp(1.0, -self.registres.astype(np.int32)))
+        vides = int(np.count_nonzero(self.registres == 0))
+        if brute <= 2.5 * m and vides:
+            return m * np.log(m / vides)  # Petits effectifs : comptage linéaire
+        return float(brute)
+
+    def en_octets(self) -> bytes:
+        return bytes([self.precision]) + self.registres.tobytes()
+
+    @classmethod
+    def depuis_octets(cls, donnees: bytes) -> 'HyperLogLog':
+        return cls(donnees[0], np.frombuffer(donnees, dtype=np.uint8, offset=1).copy())
+
+
+class EsquisseQuantiles:
+    """
+    Quantiles à erreur relative bornée (DDSketch) de valeurs positives.
+
+    Chaque valeur tombe dans l'intervalle [g^(i-1), g^i[ avec g = (1+e)/(1-e) :
+    tout quantile est restitué à e près en relatif, quel que soit le nombre
+    de valeurs. Les compteurs s'additionnent, les esquisses se fusionnent
+    donc exactement.
+    """
+
+    def __init__(self, erreur: float = ERREUR_QUANTILES):
+        self.erreur = erreur
+        self.gamma = (1 + erreur) / (1 - erreur)
+        self.decalage = 0
+        self.compteurs = np.zeros(0, dtype=np.int64)
+        self.zeros = 0
+
+    @property
+    def n(self) -> int:
+        return int(self.compteurs.sum()) + self.zeros
+
+    def _etendre(self, debut: int, fin: int) -> None:
+        """Élargit le tableau des compteurs pour couvrir les indices [debut, fin["""
+        if not len(self.compteurs):
+            self.decalage, self.compteurs = debut, np.zeros(fin - debut, dtype=np.int64)
+            return
+        nouveau_debut = min(debut, self.decalage)
+        nouvelle_fin = max(fin, self.decalage + len(self.compteurs))
+        if (nouveau_debut, nouvelle_fin) != (self.decalage, self.decalage + len(self.compteurs)):
+            compteurs = np.zeros(nouvelle_fin - nouveau_debut, dtype=np.int64)
+            compteurs[self.decalage - nouveau_debut:self.decalage - nouveau_debut + len(self.compteurs)] = self.compteurs
+            self.decalage, self.compteurs = nouveau_debut, compteurs
+
+    def ajouter(self, valeurs: Iterable[float]) -> 'EsquisseQuantiles':
+        valeurs = np.asarray(valeurs, dtype=float)
+        valeurs = valeurs[~np.isnan(valeurs)]
+        positives = valeurs[valeurs > 0]
+        self.zeros += len(valeurs) - len(positives)
+        if len(positives):
+            indices = np.ceil(np.log(positives) / np.log(self.gamma)).astype(np.int64)
+            debut = int(indices.min())
+            self._etendre(debut, int(indices.max()) + 1)
+            self.compteurs += np.bincount(indices - self.decalage, minlength=len(self.compteurs))
+        return self
+
+    def fusionner(self, autre: 'EsquisseQuantiles') -> 'EsquisseQuantiles':
+        if autre.gamma != self.gamma:
+            raise ValueError("Esquisses de précisions différentes")
+        self.zeros += autre.zeros
+        if len(autre.compteurs):
+            self._etendre(autre.decalage, autre.decalage + len(autre.compteurs))
+            debut = autre.decalage - self.decalage
+            self.compteurs[debut:debut + len(autre.compteurs)] += autre.compteurs
+        return self
+
+    def multiplier(self, facteur: float) -> 'EsquisseQuantiles':
+        """
+        Copie à l'échelle `facteur` (conversion de devise) : décalage des
+        intervalles, arrondi au plus proche, soit au plus une erreur e de plus.
+        """
+        copie = EsquisseQuantiles(self.erreur)
+        copie.zeros, copie.compteurs = self.zeros, self.compteurs.copy()
+        copie.decalage = self.decalage + int(round(np.log(facteur) / np.log(self.gamma)))
+        return copie
+
+    def quantile(self, q: float) -> float:
+        if self.n == 0:
+            return float('nan')
+        rang = q * (self.n - 1)
+        if rang < self.zeros:
+            return 0.0
+        i = int(np.searchsorted(np.cumsum(self.compteurs), rang - self.zeros, side='right'))
+        return float(2 * self.gamma ** (self.decalage + i) / (self.gamma + 1))
+
+    def en_octets(self) -> bytes:
+        return struct.pack('<dqq', self.erreur, self.decalage, self.zeros) + self.compteurs.astype('<i8').tobytes()
+
+    @classmethod
+    def depuis_octets(cls, donnees: bytes) -> 'EsquisseQuantiles':
+        erreur, decalage, zeros = struct.unpack_from('<dqq', donnees)
+        esquisse = cls(erreur)
+        esquisse.decalage, esquisse.zeros = decalage, zeros
+        esquisse.compteurs = np.frombuffer(donnees, dtype='<i8', offset=struct.calcsize('<dqq')).astype(np.int64)
+        return esquisse
+
+
+def plages_consecutives(jours: Iterable[str]) -> List[tuple]:
+    """Regroupe des jours en plages [premier, dernier] de jours consécutifs"""
+    dates = np.sort(np.array(list(jours), dtype='datetime64[D]'))
+    coupures = np.flatnonzero(np.diff(dates) > np.timedelta64(1, 'D')) + 1
+    return [(str(plage[0]), str(plage[-1])) for plage in np.split(dates, coupures)]
+
+
+def _esquisser_jours(conn: sqlite3.Connection, jours: List[str]) -> Dict[str, tuple]:
+    """
+    Esquisses (nb_ventes, clients, quantités, montants) calculées depuis les
+    ventes de chaque jour, lues par plages de jours consécutifs sur l'index des dates.
+    """
+    resultats = {}
+    for premier, dernier in plages_consecutives(jours):
+        ventes = pd.read_sql(
+            """SELECT substr(date, 1, 10) AS jour, client_id, quantite, prix_unitaire * quantite AS montant
+            FROM ventes WHERE date >= ? AND date < date(?, '+1 day')""",
+            conn, params=(premier, dernier)
+        )
+        for jour, groupe in ventes.groupby('jour', sort=False):
+            resultats[jour] = (
+                len(groupe),
+                HyperLogLog().ajouter(groupe['client_id'].dropna().to_numpy()),
+                EsquisseQuantiles().ajouter(groupe['quantite'].to_numpy()),
+                EsquisseQuantiles().ajouter(groupe['montant'].to_numpy()),
+            )
+    return resultats
+
+
+def actualiser(conn: sqlite3.Connection, magasin: str = MAGASIN) -> int:
+    """
+    Recalcule et enregistre les esquisses des jours modifiés ; retourne le nombre de jours.
+
+    Jours en attente et ventes sont lus sous le verrou d'écriture : une vente
+    validée entre la lecture et l'effacement des marqueurs serait perdue.
+    """
+    with transaction_immediate(conn):
+        jours = [j for (j,) in conn.execute("SELECT jour FROM esquisses_a_recalculer")]
+        if not jours:
+            return 0
+        esquisses = _esquisser_jours(conn, jours)
+        conn.executemany("DELETE FROM esquisses_jour WHERE magasin = ? AND jour = ?", [(magasin, j) for j in jours])
+        conn.executemany(
+            "INSERT INTO esquisses_jour VALUES (?, ?, ?, ?, ?, ?)",
+            [(magasin, jour, nb, hll.en_octets(), quantites.en_octets(), montants.en_octets())
+             for jour, (nb, hll, quantites, montants) in esquisses.items()]
+        )
+        conn.executemany("DELETE FROM esquisses_a_recalculer WHERE jour = ?", [(j,) for j in jours])
+    return len(jours)
+
+
+def resume(conn: sqlite3.Connection, debut: Optional[str] = None, fin: Optional[str] = None,
+           magasins: Optional[List[str]] = None, devise: str = DEVISE_BASE,
+           convertisseur: Optional[Convertisseur] = None) -> dict:
+    """
+    Clients distincts et distribution des paniers sur [debut, fin], par
+    fusion des esquisses journalières des magasins demandés (tous par défaut).
+
+    Les jours en attente de recalcul pour la base locale sont esquissés à la
+    volée : le résultat est à jour même sur une connexion en lecture seule.
+    Un panier est une ligne de vente, comme pour le panier moyen de l'analyse.
+    """
+    periode = "jour >= ? AND jour <= ?"
+    params = [debut or '0000-00-00', fin or '9999-12-31']
+    selection = periode
+    if magasins:
+        selection += f" AND magasin IN ({','.join('?' * len(magasins))})"
+    lignes = conn.execute(
+        f"SELECT magasin, jour, nb_ventes, clients, quantites, montants FROM esquisses_jour WHERE {selection}",
+        params + list(magasins or [])
+    ).fetchall()
+
+    frais = {}
+    if not magasins or MAGASIN in magasins:
+        en_attente = [j for (j,) in conn.execute(f"SELECT jour FROM esquisses_a_recalculer WHERE {periode}", params)]
+        if en_attente:
+            perimes = set(en_attente)
+            lignes = [l for l in lignes if not (l[0] == MAGASIN and l[1] in perimes)]
+            frais = _esquisser_jours(conn, en_attente)
+
+    facteur = 1.0
+    if devise != DEVISE_BASE:
+        convertisseur = convertisseur or Convertisseur(conn)
+        jours = [l[1] for l in lignes] + list(frais)
+        facteur = convertisseur.facteur_constant(DEVISE_BASE, devise, min(jours), max(jours)) if jours else 1.0
+
+    clients = HyperLogLog()
+    quantites, montants = EsquisseQuantiles(), EsquisseQuantiles()
+    nb_ventes = 0
+    # Registres HLL fusionnés d'un bloc, compteurs de quantiles un par un
+    registres = [np.frombuffer(l[3], dtype=np.uint8, offset=1) for l in lignes]
+    registres += [hll.registres for _, hll, _, _ in frais.values()]
+    if registres:
+        clients.registres = np.maximum.reduce(np.stack(registres))
+    journalieres = [(l[1], l[2], EsquisseQuantiles.depuis_octets(l[4]), EsquisseQuantiles.depuis_octets(l[5]))
+                    for l in lignes]
+    journalieres += [(jour, nb, q, m) for jour, (nb, _, q, m) in frais.items()]
+    for jour, nb, esquisse_quantites, esquisse_montants in journalieres:
+        nb_ventes += nb
+        quantites.fusionner(esquisse_quantites)
+        if facteur is None:
+            # Taux variable : chaque jour est converti à son taux
+            esquisse_montants = esquisse_montants.multiplier(
+                float(convertisseur.taux(DEVISE_BASE, devise, [jour])[0]))
+        montants.fusionner(esquisse_montants)
+    echelle = facteur if facteur is not None else 1.0
+
+    return {
+        'nb_ventes': nb_ventes,
+        'clients_uniques': clients.estimer() if nb_ventes else 0.0,
+        'erreur_clients': clients.erreur_relative,
+        'erreur_quantiles': montants.erreur,
+        **{f'panier_p{int(q * 100)}': montants.quantile(q) * echelle for q in QUANTILES},
+        **{f'quantite_p{int(q * 100)}': quantites.quantile(q) for q in QUANTILES},
+        'devise': devise,
+    }
+
+
+def importer(conn: sqlite3.Connection, autre_base: str, magasin: str) -> int:
+    """Recopie les esquisses d'une autre base sous le nom de magasin donné"""
+    source = connecter(autre_base, lecture_seule=True)
+    try:
+        lignes = source.execute(
+            "SELECT ?, jour, nb_ventes, clients, quantites, montants FROM esquisses_jour WHERE magasin = ?",
+            (magasin, MAGASIN)
+        ).fetchall()
+    finally:
+        source.close()
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO esquisses_jour VALUES (?, ?, ?, ?, ?, ?)", lignes)
+    return len(lignes)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Esquisses journalières des clients et paniers")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    sous.add_parser("actualiser", help="Recalcule les esquisses des jours modifiés")
+
+    p = sous.add_parser("resume", help="Clients distincts et quantiles des paniers sur une période")
+    p.add_argument("--debut", default=None)
+    p.add_argument("--fin", default=None)
+    p.add_argument("--magasin", action="append", dest="magasins", help="Répétable ; tous par défaut")
+    p.add_argument("--devise", default=DEVISE_RAPPORT)
+    p.add_argument("--exact", action="store_true", help="Compare au comptage exact")
+
+    p = sous.add_parser("importer", help="Ajoute les esquisses de la base d'un autre magasin")
+    p.add_argument("base")
+    p.add_argument("magasin")
+
+    args = parser.parse_args()
+    conn = connecter(DB_PATH)
+    try:
+        migrer_schema(conn)
+        if args.commande == "actualiser":
+            debut = time.perf_counter()
+            nb = actualiser(conn)
+            logger.info(f"{nb} jours esquissés en {time.perf_counter() - debut:.2f} s")
+        elif args.commande == "importer":
+            logger.info(f"{importer(conn, args.base, args.magasin)} jours importés pour {args.magasin}")
+        else:
+            debut = time.perf_counter()
+            resultat = resume(conn, args.debut, args.fin, args.magasins, args.devise)
+            duree = (time.perf_counter() - debut) * 1000
+            for cle, valeur in resultat.items():
+                print(f"  {cle:<16} {valeur:,.2f}" if isinstance(valeur, float) else f"  {cle:<16} {valeur}")
+            print(f"  (fusion en {duree:.1f} ms)")
+            if args.exact:
+                exact = conn.execute(
+                    "SELECT COUNT(DISTINCT client_id) FROM ventes WHERE date >= ? AND date < date(?, '+1 day')",
+                    (args.debut or '0000-01-01', args.fin or '9999-12-30')
+                ).fetchone()[0]
+                print(f"  clients exacts  {exact:,}")
+    except (sqlite3.Error, ValueError, KeyError) as e:
+        logger.error(f"Erreur d'esquisses: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
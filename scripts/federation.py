@@ -0,0 +1,318 @@
+# scripts/federation.py
+"""Indicateurs du réseau de magasins : requêtes parallèles sur la base de chaque magasin, puis fusion"""
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from archives import attacher as attacher_archives
+from base_donnees import DB_PATH, colonnes, connecter, migrer_schema, table_existe
+from devises import DEVISE_BASE, DEVISE_RAPPORT, Convertisseur
+from esquisses import MAGASIN
+
+logger = logging.getLogger(__name__)
+
+RESEAU = 'Réseau'  # Ligne des totaux du réseau dans les résultats par magasin
+THREADS_MAX = 64
+
+# Ventes de chaque schéma connu, ramenées aux colonnes date, client_id,
+# produit_id, quantite et montant (euros), et catalogue (id, nom) : les
+# produits sont rapprochés entre magasins par leur nom, leurs identifiants
+# étant propres à chaque base. Les conditions sur la date passent à travers
+# la sous-requête et utilisent l'index.
+SOURCES = {
+    # Base des scripts, migrée : prix facturé à la vente
+    'ventes': {
+        'ventes': "SELECT date, client_id, produit_id, quantite, prix_unitaire * quantite AS montant FROM ventes",
+        'produits': "SELECT id, nom FROM produits",
+    },
+    # Base des scripts non migrée (lecture seule) : prix du catalogue
+    'ventes_catalogue': {
+        'ventes': """SELECT v.date, v.client_id, v.produit_id, v.quantite, p.prix * v.quantite AS montant
+            FROM ventes v LEFT JOIN produits p ON p.id = v.produit_id""",
+        'produits': "SELECT id, nom FROM produits",
+    },
+    # Ancien logiciel de caisse (data/ventes_magasin.db) : montant enregistré à la vente
+    'historique': {
+        'ventes': """SELECT v.date, v.id_client AS client_id, v.id_produit AS produit_id, v.quantite,
+            COALESCE(v.montant, p.prix * v.quantite) AS montant
+            FROM Ventes v LEFT JOIN Produits p ON p.id_produit = v.id_produit""",
+        'produits': "SELECT id_produit AS id, nom FROM Produits",
+    },
+}
+
+
+def schema(conn: sqlite3.Connection) -> str:
+    """Schéma des ventes d'une base (clé de SOURCES)"""
+    ventes = colonnes(conn, 'ventes')  # PRAGMA insensible à la casse : couvre aussi "Ventes"
+    if not ventes:
+        raise ValueError("Aucune table des ventes")
+    if 'id_produit' in ventes:
+        return 'historique'
+    return 'ventes' if 'prix_unitaire' in ventes else 'ventes_catalogue'
+
+
+def enregistrer(conn: sqlite3.Connection, nom: str, chemin: Union[str, Path]) -> str:
+    """Ajoute (ou déplace) la base d'un magasin au réseau ; retourne son schéma"""
+    chemin = Path(chemin).resolve()
+    if nom in (MAGASIN, RESEAU):
+        raise ValueError(f"Nom de magasin réservé: {nom}")
+    if not chemin.is_file():
+        raise ValueError(f"Base introuvable: {chemin}")
+    try:
+        autre = connecter(chemin, lecture_seule=True)
+        try:
+            schema_magasin = schema(autre)
+        finally:
+            autre.close()
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f"{chemin} n'est pas une base SQLite: {e}")
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO magasins VALUES (?, ?)", (nom, str(chemin)))
+    return schema_magasin
+
+
+def retirer(conn: sqlite3.Connection, nom: str) -> None:
+    """Retire un magasin du réseau (sa base n'est pas touchée)"""
+    with conn:
+        if conn.execute("DELETE FROM magasins WHERE nom = ?", (nom,)).rowcount == 0:
+            raise ValueError(f"Magasin inconnu: {nom}")
+
+
+def magasins(conn: sqlite3.Connection) -> Dict[str, Path]:
+    """Bases du réseau : celle de la connexion (magasin MAGASIN) puis les magasins enregistrés"""
+    principale = conn.execute("PRAGMA database_list").fetchone()[2]
+    chemins = {MAGASIN: Path(principale)}
+    if table_existe(conn, 'magasins'):
+        chemins.update({nom: Path(chemin)
+                        for nom, chemin in conn.execute("SELECT nom, chemin FROM magasins ORDER BY nom")})
+    return chemins
+
+
+def _periode(debut: Optional[str], fin: Optional[str]) -> Tuple[str, list]:
+    conditions, params = [], []
+    if debut:
+        conditions.append("date >= ?")
+        params.append(debut)
+    if fin:
+        conditions.append("date < date(?, '+1 day')")
+        params.append(fin)
+    return " AND ".join(conditions) or "1", params
+
+
+def agregats_magasin(chemin: Union[str, Path], debut: Optional[str] = None,
+                     fin: Optional[str] = None) -> Dict[str, object]:
+    """
+    Agrégats partiels d'un magasin, sur sa propre connexion en lecture seule :
+    totaux journaliers (pour les KPI, les mois et la conversion au taux du
+    jour), totaux par produit et nombre de clients distincts.
+    """
+    debut_mesure = time.perf_counter()
+    conn = connecter(chemin, lecture_seule=True)
+    try:
+        source = SOURCES[schema(conn)]
+        attacher_archives(conn, debut, fin)  # Archives du magasin recoupant la période
+        ventes = source['ventes']
+        condition, params = _periode(debut, fin)
+        par_jour = pd.read_sql(
+            f"""SELECT substr(date, 1, 10) AS jour, COUNT(*) AS nb_ventes, SUM(quantite) AS quantite,
+                SUM(montant) AS ca_eur
+            FROM ({ventes}) WHERE {condition} GROUP BY 1""",
+            conn, params=params
+        )
+        # Noms joints après agrégation : quelques lignes au lieu d'une par vente
+        produits = pd.read_sql(
+            f"""SELECT COALESCE(c.nom, 'Produit ' || t.produit_id) AS produit, t.quantite, t.ca_eur
+            FROM (
+                SELECT produit_id, SUM(quantite) AS quantite, SUM(montant) AS ca_eur
+                FROM ({ventes}) WHERE {condition} AND produit_id IS NOT NULL GROUP BY 1
+            ) t LEFT JOIN ({source['produits']}) c ON c.id = t.produit_id""",
+            conn, params=params
+        )
+        clients = conn.execute(f"SELECT COUNT(DISTINCT client_id) FROM ({ventes}) WHERE {condition}",
+                               params).fetchone()[0]
+    finally:
+        conn.close()
+    return {'par_jour': par_jour, 'produits': produits, 'clients': clients,
+            'duree': time.perf_counter() - debut_mesure}
+
+
+class Reseau:
+    """
+    Résultats fusionnés du réseau, avec le détail par magasin.
+
+    Les agrégats partiels sont additifs (sommes et comptages), sauf les
+    clients distincts : les identifiants clients étant propres à chaque
+    base, le total du réseau est la somme des magasins (un client venu dans
+    deux magasins y compte deux fois).
+
+    Attributes:
+        par_magasin: une ligne par magasin plus la ligne RESEAU (ca_eur,
+            ca_devise, nb_ventes, quantite, clients, panier_moyen_devise,
+            debut, fin, duree_s)
+        mensuel: mois, magasin, nb_ventes, ca_eur, ca_devise
+        produits: produit, magasin, quantite, ca_eur, ca_devise
+        echecs: message d'erreur des magasins non interrogés
+    """
+
+    def __init__(self, partiels: Dict[str, dict], echecs: Dict[str, str], devise: str = DEVISE_BASE,
+                 convertisseur: Optional[Convertisseur] = None):
+        self.devise = devise
+        self.echecs = echecs
+        lignes, mensuels, produits = [], [], []
+        for nom, partiel in partiels.items():
+            par_jour = partiel['par_jour']
+            par_jour['ca_devise'] = convertisseur.convertir(par_jour['ca_eur'], par_jour['jour'], DEVISE_BASE, devise) \
+                if devise != DEVISE_BASE and not par_jour.empty else par_jour['ca_eur']
+            ca_eur, ca_devise = float(par_jour['ca_eur'].sum()), float(par_jour['ca_devise'].sum())
+            lignes.append({
+                'magasin': nom, 'ca_eur': ca_eur, 'ca_devise': ca_devise,
+                'nb_ventes': int(par_jour['nb_ventes'].sum()), 'quantite': int(par_jour['quantite'].sum()),
+                'clients': int(partiel['clients']), 'debut': par_jour['jour'].min(), 'fin': par_jour['jour'].max(),
+                'duree_s': partiel['duree'],
+            })
+            mensuel = par_jour.groupby(par_jour['jour'].str[:7])[['nb_ventes', 'ca_eur', 'ca_devise']].sum()
+            mensuels.append(mensuel.rename_axis('mois').reset_index().assign(magasin=nom))
+            # Produits : taux effectif moyen du magasin sur la période
+            facteur = ca_devise / ca_eur if ca_eur else 1.0
+            produits.append(partiel['produits'].assign(magasin=nom, ca_devise=partiel['produits']['ca_eur'] * facteur))
+
+        colonnes_magasin = ['magasin', 'ca_eur', 'ca_devise', 'nb_ventes', 'quantite', 'clients', 'debut', 'fin',
+                            'duree_s']
+        par_magasin = pd.DataFrame(lignes, columns=colonnes_magasin)
+        total = par_magasin[['ca_eur', 'ca_devise', 'nb_ventes', 'quantite', 'clients']].sum()
+        reseau = {**total.to_dict(), 'magasin': RESEAU, 'debut': par_magasin['debut'].min(),
+                  'fin': par_magasin['fin'].max(), 'duree_s': par_magasin['duree_s'].max()}
+        self.par_magasin = pd.concat([par_magasin, pd.DataFrame([reseau])], ignore_index=True).set_index('magasin')
+        self.par_magasin = self.par_magasin.astype({'nb_ventes': int, 'quantite': int, 'clients': int})
+        self.par_magasin['panier_moyen_devise'] = \
+            self.par_magasin['ca_devise'] / self.par_magasin['nb_ventes'].where(self.par_magasin['nb_ventes'] > 0)
+        self.mensuel = pd.concat(mensuels, ignore_index=True) if mensuels else \
+            pd.DataFrame(columns=['mois', 'nb_ventes', 'ca_eur', 'ca_devise', 'magasin'])
+        self.produits = pd.concat(produits, ignore_index=True) if produits else \
+            pd.DataFrame(columns=['produit', 'quantite', 'ca_eur', 'magasin', 'ca_devise'])
+
+    def top_produits(self, k: int = 5) -> pd.DataFrame:
+        """
+        Top k du réseau (produits rapprochés par nom), avec la part de marché
+        et le CA de chaque magasin dans une colonne à son nom.
+        """
+        reseau = self.produits.groupby('produit')[['quantite', 'ca_eur', 'ca_devise']].sum()
+        top = reseau.nlargest(k, 'ca_devise')
+        ca_total = self.par_magasin.loc[RESEAU, 'ca_devise']
+        top['part_marche'] = (top['ca_devise'] * 100.0 / ca_total).round(2) if ca_total else 0.0
+        detail = self.produits[self.produits['produit'].isin(top.index)].pivot_table(
+            index='produit', columns='magasin', values='ca_devise', aggfunc='sum', fill_value=0.0
+        ).reindex(columns=self.par_magasin.index.drop(RESEAU), fill_value=0.0)
+        return top.join(detail).rename_axis('produit').reset_index()
+
+    def mensuel_par_magasin(self) -> pd.DataFrame:
+        """CA de chaque mois (lignes) par magasin (colonnes), plus la colonne RESEAU"""
+        tableau = self.mensuel.pivot_table(index='mois', columns='magasin', values='ca_devise',
+                                           aggfunc='sum', fill_value=0.0)
+        tableau[RESEAU] = tableau.sum(axis=1)
+        return tableau
+
+
+def interroger(chemins: Dict[str, Union[str, Path]], debut: Optional[str] = None, fin: Optional[str] = None,
+               devise: str = DEVISE_BASE, convertisseur: Optional[Convertisseur] = None,
+               threads: Optional[int] = None) -> Reseau:
+    """
+    Interroge tous les magasins en parallèle (un thread et une connexion en
+    lecture seule par base ; SQLite relâche le GIL pendant les requêtes) et
+    fusionne leurs agrégats. Un magasin illisible est écarté et signalé dans
+    `Reseau.echecs` sans bloquer les autres.
+    """
+    if devise != DEVISE_BASE and convertisseur is None:
+        raise ValueError("Un convertisseur est nécessaire pour une devise autre que la devise de base")
+    threads = threads or min(max(len(chemins), 1), THREADS_MAX)
+    partiels, echecs = {}, {}
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="magasin") as executeur:
+        calculs = {nom: executeur.submit(agregats_magasin, chemin, debut, fin) for nom, chemin in chemins.items()}
+        for nom, calcul in calculs.items():
+            try:
+                partiels[nom] = calcul.result()
+            except (sqlite3.Error, pd.errors.DatabaseError, ValueError) as e:
+                # pd.read_sql signale une table ou colonne manquante, une base verrouillée, par DatabaseError
+                logger.warning(f"Magasin {nom} écarté: {e}")
+                echecs[nom] = str(e)
+    return Reseau(partiels, echecs, devise, convertisseur)
+
+
+def _banc(chemins: Dict[str, Path], copies: int) -> List[str]:
+    """Temps séquentiel et parallèle sur `copies` interrogations réparties entre les bases données"""
+    noms = list(chemins)
+    repartis = {f"{noms[i % len(noms)]}#{i}": chemins[noms[i % len(noms)]] for i in range(copies)}
+    lignes = []
+    for libelle, threads in (("séquentiel", 1), ("parallèle", None)):
+        debut = time.perf_counter()
+        reseau = interroger(repartis, threads=threads)
+        duree = time.perf_counter() - debut
+        plus_lent = reseau.par_magasin.drop(index=RESEAU)['duree_s'].max()
+        lignes.append(f"{libelle:>11}: {copies} magasins en {duree:.2f} s "
+                      f"(magasin le plus lent : {plus_lent:.2f} s)")
+    return lignes
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Indicateurs consolidés du réseau de magasins")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    sous.add_parser("liste", help="Magasins du réseau et chemin de leur base")
+
+    p = sous.add_parser("enregistrer", help="Ajoute la base d'un magasin au réseau")
+    p.add_argument("nom")
+    p.add_argument("chemin")
+
+    p = sous.add_parser("retirer", help="Retire un magasin du réseau")
+    p.add_argument("nom")
+
+    for commande, aide in (("kpis", "Indicateurs par magasin et du réseau"),
+                           ("top", "Meilleurs produits du réseau, détaillés par magasin"),
+                           ("mensuel", "CA mensuel par magasin")):
+        p = sous.add_parser(commande, help=aide)
+        p.add_argument("--debut", default=None)
+        p.add_argument("--fin", default=None)
+        p.add_argument("--devise", default=DEVISE_RAPPORT)
+        if commande == "top":
+            p.add_argument("-k", type=int, default=5)
+
+    p = sous.add_parser("banc", help="Compare interrogation séquentielle et parallèle")
+    p.add_argument("--copies", type=int, default=50, help="Interrogations simulées, réparties entre les bases")
+
+    args = parser.parse_args()
+    conn = connecter(DB_PATH)
+    try:
+        migrer_schema(conn)
+        if args.commande == "enregistrer":
+            logger.info(f"Magasin {args.nom} enregistré (schéma {enregistrer(conn, args.nom, args.chemin)})")
+        elif args.commande == "retirer":
+            retirer(conn, args.nom)
+            logger.info(f"Magasin {args.nom} retiré")
+        elif args.commande == "liste":
+            for nom, chemin in magasins(conn).items():
+                print(f"{nom:<20} {chemin}")
+        elif args.commande == "banc":
+            print("\n".join(_banc(magasins(conn), args.copies)))
+        else:
+            reseau = interroger(magasins(conn), args.debut, args.fin, args.devise, Convertisseur(conn))
+            if args.commande == "kpis":
+                print(reseau.par_magasin.to_string())
+            elif args.commande == "top":
+                print(reseau.top_produits(args.k).to_string(index=False))
+            else:
+                print(reseau.mensuel_par_magasin().to_string())
+            for nom, erreur in reseau.echecs.items():
+                print(f"Magasin {nom} écarté: {erreur}")
+    except (sqlite3.Error, pd.errors.DatabaseError, ValueError, KeyError) as e:
+        logger.error(f"Erreur de fédération: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
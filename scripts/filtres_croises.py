@@ -0,0 +1,318 @@
+# scripts/filtres_croises.py
+"""Moteur de filtres croisés du dashboard : index bitmap par dimension"""
+import argparse
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SEUIL_DENSE = 64  # Au-delà, les valeurs d'une dimension sont stockées en listes de lignes
+NB_TRANCHES = 32  # Tranches de CA (quantiles) pour le filtre de montant minimal
+TAILLE_CACHE = 32  # Bitmaps de filtres mémorisés
+SEUIL_TABLE = 256  # Valeurs sélectionnées au-delà desquelles le bitmap est calculé par table de correspondance
+
+
+class IndexBitmap:
+    """
+    Index d'une colonne : pour chaque valeur, l'ensemble des lignes qui la portent.
+
+    Les dimensions de faible cardinalité (mois, tranches de CA) gardent un
+    bitmap compacté par valeur (n/8 octets) ; les autres (produits, clients)
+    une liste triée de lignes par valeur, stockée d'un seul tenant (une
+    permutation des lignes + des bornes), soit 4 octets par ligne quel que
+    soit le nombre de valeurs.
+    """
+
+    def __init__(self, colonne: pd.Series, valeurs: Optional[pd.Index] = None):
+        if valeurs is None:
+            codes, valeurs = pd.factorize(colonne, sort=True)
+        else:
+            codes = valeurs.get_indexer(colonne)
+        self.valeurs = pd.Index(valeurs)
+        # Les valeurs manquantes reçoivent le code len(valeurs), jamais sélectionnable
+        self.codes = np.where(codes < 0, len(self.valeurs), codes).astype(np.int32)
+        self.n = len(self.codes)
+        self.ordre = np.argsort(self.codes, kind='stable').astype(np.int32)
+        effectifs = np.bincount(self.codes, minlength=len(self.valeurs) + 1)
+        self.bornes = np.concatenate([[0], np.cumsum(effectifs)])
+        self.denses = None
+        if len(self.valeurs) <= SEUIL_DENSE:
+            self.denses = np.stack([self._compacter(self.lignes(c)) for c in range(len(self.valeurs))])
+
+    def lignes(self, code: int) -> np.ndarray:
+        """Lignes portant la valeur de code `code` (triées)"""
+        return self.ordre[self.bornes[code]:self.bornes[code + 1]]
+
+    def _compacter(self, lignes: np.ndarray) -> np.ndarray:
+        masque = np.zeros(self.n, dtype=bool)
+        masque[lignes] = True
+        return np.packbits(masque)
+
+    def codes_de(self, valeurs: Iterable) -> np.ndarray:
+        """Codes des valeurs connues parmi `valeurs`"""
+        codes = self.valeurs.get_indexer(list(valeurs))
+        return np.unique(codes[codes >= 0]).astype(np.int64)
+
+    def bitmap(self, codes: np.ndarray) -> np.ndarray:
+        """Union des lignes des valeurs sélectionnées, en bitmap compacté"""
+        if self.denses is not None:
+            if len(codes) == 0:
+                return np.zeros_like(self.denses[0])
+            return np.bitwise_or.reduce(self.denses[codes], axis=0)
+        if len(codes) == 0:
+            return self._compacter(np.empty(0, dtype=np.int32))
+        if len(codes) > SEUIL_TABLE:
+            # Nombreuses valeurs : une table de correspondance évite de concaténer les listes
+            retenus = np.zeros(len(self.valeurs) + 1, dtype=bool)
+            retenus[codes] = True
+            return np.packbits(retenus[self.codes])
+        return self._compacter(np.concatenate([self.lignes(c) for c in codes]))
+
+
+class MoteurFiltres:
+    """
+    Filtres croisés sur un DataFrame de ventes.
+
+    Chaque filtre est traduit en bitmap à partir des index précalculés, puis
+    les bitmaps sont intersectés (ET bit à bit sur n/8 octets). Les
+    agrégats d'une dimension sont calculés sous tous les filtres sauf le
+    sien : le graphique des produits montre toujours les autres produits
+    disponibles dans la sélection courante des autres dimensions.
+
+    Filtres acceptés : {dimension: [valeurs], 'ca_min': montant}, une liste
+    vide ou absente signifiant "pas de filtre".
+
+    Le moteur est partagé entre les sessions du dashboard : ses caches sont
+    protégés par un verrou (réentrant, `selectionner` appelant `_bitmap`).
+    """
+
+    def __init__(self, df: pd.DataFrame, dimensions: Iterable[str] = ('produit', 'client', 'mois'),
+                 mesure: str = 'ca_devise', nb_tranches: int = NB_TRANCHES):
+        debut = time.perf_counter()
+        self.n = len(df)
+        self.mesure = df[mesure].to_numpy(dtype=float)
+        self.index: Dict[str, IndexBitmap] = {dim: IndexBitmap(df[dim]) for dim in dimensions if dim in df}
+
+        # Tranches de montant : bornes aux quantiles, valeur de tranche = borne basse
+        bornes = np.unique(np.quantile(self.mesure, np.linspace(0, 1, nb_tranches + 1))) if self.n else np.array([0.0])
+        self.bornes_tranches = bornes[:-1] if len(bornes) > 1 else bornes
+        tranches = np.searchsorted(self.bornes_tranches, self.mesure, side='right') - 1
+        self.tranches = IndexBitmap(pd.Series(tranches.clip(min=0)), pd.RangeIndex(len(self.bornes_tranches)))
+        self._total = float(self.mesure.sum())
+        self._complets: Dict[str, np.ndarray] = {}
+        self._bitmaps: Dict[tuple, np.ndarray] = {}
+        self._selections: Dict[tuple, 'Selection'] = {}
+        self._verrou = threading.RLock()
+        logger.info(f"Index de filtres construits sur {self.n:,} lignes en {time.perf_counter() - debut:.2f} s")
+
+    def _bitmap_ca_min(self, ca_min: float) -> np.ndarray:
+        """Lignes dont le montant atteint `ca_min` : tranches entières + tri de la tranche frontière"""
+        frontiere = int(np.searchsorted(self.bornes_tranches, ca_min, side='right')) - 1
+        if frontiere < 0:
+            return self.tranches.bitmap(np.arange(len(self.bornes_tranches)))
+        resultat = self.tranches.bitmap(np.arange(frontiere + 1, len(self.bornes_tranches)))
+        lignes = self.tranches.lignes(frontiere)
+        retenues = lignes[self.mesure[lignes] >= ca_min]
+        return resultat | self.tranches._compacter(retenues)
+
+    def _cle(self, dim: str, valeurs) -> Optional[tuple]:
+        """Clé canonique d'un filtre actif, None si le filtre ne retient pas de lignes en moins"""
+        if dim == 'ca_min':
+            return (dim, float(valeurs)) if valeurs and valeurs > 0 else None
+        if dim in self.index and valeurs is not None and len(valeurs) > 0:
+            return (dim, self.index[dim].codes_de(valeurs).tobytes())
+        return None
+
+    def _bitmap(self, cle: tuple) -> np.ndarray:
+        """Bitmap d'un filtre, mémorisé : d'un rafraîchissement à l'autre un seul filtre change"""
+        with self._verrou:
+            if cle not in self._bitmaps:
+                if len(self._bitmaps) >= TAILLE_CACHE:
+                    self._bitmaps.pop(next(iter(self._bitmaps)))
+                dim, valeur = cle
+                if dim == 'ca_min':
+                    self._bitmaps[cle] = self._bitmap_ca_min(valeur)
+                else:
+                    self._bitmaps[cle] = self.index[dim].bitmap(np.frombuffer(valeur, dtype=np.int64))
+            return self._bitmaps[cle]
+
+    def selectionner(self, filtres: dict) -> 'Selection':
+        """
+        Traduit un jeu de filtres en sélection (un bitmap par filtre actif).
+
+        Les sélections récentes sont mémorisées avec leurs agrégats : réafficher
+        un panneau sans changer de filtre ne recalcule rien.
+        """
+        cles = tuple(sorted(c for c in (self._cle(dim, v) for dim, v in filtres.items()) if c is not None))
+        with self._verrou:
+            if cles not in self._selections:
+                if len(self._selections) >= TAILLE_CACHE:
+                    self._selections.pop(next(iter(self._selections)))
+                self._selections[cles] = Selection(self, {cle[0]: self._bitmap(cle) for cle in cles})
+            return self._selections[cles]
+
+    def agregat_complet(self, dimension: str) -> np.ndarray:
+        """Somme de la mesure par valeur de la dimension, sans filtre (calculée une fois)"""
+        with self._verrou:
+            if dimension not in self._complets:
+                index = self.index[dimension]
+                self._complets[dimension] = np.bincount(
+                    index.codes, weights=self.mesure, minlength=len(index.valeurs) + 1
+                )
+            return self._complets[dimension]
+
+
+class Selection:
+    """
+    Lignes retenues par un jeu de filtres, avec les agrégats qui en découlent.
+
+    Les intersections sont faites sur les bitmaps compactés ; les agrégats
+    ne parcourent que la plus petite des deux parties (lignes retenues ou
+    lignes exclues, le résultat étant alors obtenu par différence avec
+    l'agrégat complet), jamais les n lignes.
+
+    Une même sélection pouvant servir plusieurs sessions à la fois, ses
+    mémos sont remplis sous un verrou propre (pris avant celui du moteur).
+    """
+
+    def __init__(self, moteur: MoteurFiltres, bitmaps: Dict[str, np.ndarray]):
+        self.moteur = moteur
+        self.bitmaps = bitmaps
+        self._parties: Dict[frozenset, tuple] = {}
+        self._agregats: Dict[tuple, pd.Series] = {}
+        self._lignes: Optional[np.ndarray] = None
+        self.memo: dict = {}  # Résultats dérivés mémorisés par les appelants, via memoriser()
+        self._verrou = threading.RLock()
+
+    def memoriser(self, cle, calcul: Callable[[], object]):
+        """Résultat dérivé de la sélection (tableau croisé...), calculé une fois par `calcul()`"""
+        with self._verrou:
+            if cle not in self.memo:
+                self.memo[cle] = calcul()
+            return self.memo[cle]
+
+    def bitmap(self, sauf: Optional[str] = None) -> Optional[np.ndarray]:
+        """Intersection des filtres actifs (hors `sauf`), None si aucun"""
+        resultat = None
+        for dim, bitmap in self.bitmaps.items():
+            if dim == sauf:
+                continue
+            resultat = bitmap.copy() if resultat is None else np.bitwise_and(resultat, bitmap, out=resultat)
+        return resultat
+
+    def _partie_minoritaire(self, sauf: Optional[str] = None) -> Optional[tuple]:
+        """
+        (positions, poids, complément ?) des lignes à parcourir : les lignes
+        retenues ou les lignes exclues, la plus petite des deux. Mémorisé par
+        combinaison de filtres, plusieurs agrégats partageant souvent la même.
+        """
+        cle = frozenset(dim for dim in self.bitmaps if dim != sauf)
+        if not cle:
+            return None
+        with self._verrou:
+            if cle not in self._parties:
+                n = self.moteur.n
+                bitmap = self.bitmap(sauf)
+                complement = int(np.bitwise_count(bitmap).sum()) > n // 2
+                if complement:
+                    np.bitwise_not(bitmap, out=bitmap)
+                positions = np.flatnonzero(np.unpackbits(bitmap, count=n).view(bool))
+                self._parties[cle] = (positions, self.moteur.mesure[positions], complement)
+            return self._parties[cle]
+
+    def lignes(self) -> np.ndarray:
+        """Positions des lignes retenues"""
+        with self._verrou:
+            if self._lignes is None:
+                bitmap = self.bitmap()
+                if bitmap is None:
+                    self._lignes = np.arange(self.moteur.n)
+                else:
+                    self._lignes = np.flatnonzero(np.unpackbits(bitmap, count=self.moteur.n).view(bool))
+            return self._lignes
+
+    def total(self) -> tuple:
+        """(somme de la mesure, nombre de lignes) de la sélection"""
+        moteur = self.moteur
+        partie = self._partie_minoritaire()
+        if partie is None:
+            return moteur._total, moteur.n
+        positions, poids, complement = partie
+        somme = float(poids.sum())
+        if complement:
+            return moteur._total - somme, moteur.n - len(positions)
+        return somme, len(positions)
+
+    def agreger(self, dimension: str, croise: bool = True) -> pd.Series:
+        """
+        Somme de la mesure par valeur de `dimension` dans la sélection.
+
+        Args:
+            croise: Si True, le filtre propre à la dimension est ignoré
+        """
+        cle = (dimension, croise)
+        with self._verrou:
+            if cle in self._agregats:
+                return self._agregats[cle]
+            moteur = self.moteur
+            index = moteur.index[dimension]
+            complet = moteur.agregat_complet(dimension)
+            partie = self._partie_minoritaire(sauf=dimension if croise else None)
+            if partie is None:
+                sommes = complet
+            else:
+                positions, poids, complement = partie
+                partielles = np.bincount(index.codes[positions], weights=poids, minlength=len(complet))
+                sommes = complet - partielles if complement else partielles
+            self._agregats[cle] = pd.Series(sommes[:len(index.valeurs)], index=index.valeurs, name=dimension)
+            return self._agregats[cle]
+
+
+# ---- BANC D'ESSAI ----
+def _ventes_synthetiques(n: int, nb_produits: int, nb_clients: int, graine: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(graine)
+    mois = pd.period_range('2022-01', periods=36, freq='M').astype(str)
+    return pd.DataFrame({
+        'produit': pd.Categorical.from_codes(rng.zipf(1.3, n) % nb_produits, [f"P{i}" for i in range(nb_produits)]),
+        'client': pd.Categorical.from_codes(rng.integers(0, nb_clients, n), [f"C{i}" for i in range(nb_clients)]),
+        'mois': pd.Categorical.from_codes(rng.integers(0, len(mois), n), mois),
+        'ca_devise': rng.lognormal(10, 1, n),
+    })
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Banc d'essai du moteur de filtres croisés")
+    parser.add_argument("--lignes", type=int, default=10_000_000)
+    parser.add_argument("--produits", type=int, default=50_000)
+    parser.add_argument("--clients", type=int, default=200_000)
+    args = parser.parse_args()
+
+    df = _ventes_synthetiques(args.lignes, args.produits, args.clients)
+    moteur = MoteurFiltres(df)
+    scenarios = {
+        'aucun filtre': {},
+        '1 produit': {'produit': ['P1']},
+        '200 produits + 12 mois': {'produit': [f"P{i}" for i in range(200)], 'mois': list(df['mois'].cat.categories[:12])},
+        '1000 clients + CA min': {'client': [f"C{i}" for i in range(1000)], 'ca_min': 30_000},
+        'tous filtres': {'produit': [f"P{i}" for i in range(50)], 'client': [f"C{i}" for i in range(50_000)],
+                         'mois': list(df['mois'].cat.categories[-6:]), 'ca_min': 10_000},
+    }
+    for dim in moteur.index:
+        moteur.agregat_complet(dim)
+    for nom, filtres in scenarios.items():
+        durees = []
+        for _ in range(2):  # 1er passage : bitmaps des filtres à construire ; 2e : déjà mémorisés
+            debut = time.perf_counter()
+            selection = moteur.selectionner(filtres)
+            total, lignes = selection.total()
+            for dim in moteur.index:
+                selection.agreger(dim)
+            durees.append((time.perf_counter() - debut) * 1000)
+        print(f"{nom:>24}: {lignes:>10,} lignes | total + 3 agrégats croisés en "
+              f"{durees[0]:6.1f} ms (filtres mémorisés: {durees[1]:5.1f} ms)")
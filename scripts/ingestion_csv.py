@@ -0,0 +1,289 @@
+# scripts/ingestion_csv.py
+"""Import incrémental des exports de caisse (POS/CSV) dans la base des ventes"""
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from archives import limite_archives
+from base_donnees import DB_PATH, connecter, insertions_en_masse, migrer_schema, normaliser_nom
+from referentiel import IndexNoms, resoudre_tickets, transaction_referentiel
+
+logger = logging.getLogger(__name__)
+
+TAILLE_CHUNK = 500_000  # Lignes lues et validées par passe (une transaction par passe)
+
+# Noms de colonnes acceptés dans les exports (après normalisation)
+ALIAS_COLONNES = {
+    'date': ('date', 'date vente', 'jour'),
+    'produit': ('produit', 'article', 'designation', 'libelle'),
+    'client': ('client', 'nom client'),
+    'quantite': ('quantite', 'qte', 'qty'),
+    'prix': ('prix', 'prix unitaire', 'pu'),
+    'ticket': ('ticket', 'transaction', 'no ticket', 'numero ticket'),
+    'ligne': ('ligne', 'no ligne', 'numero ligne'),
+}
+OBLIGATOIRES = ('date', 'produit', 'client', 'quantite')
+
+_INSERT = """INSERT INTO ventes
+    (produit_id, client_id, date, quantite, prix_unitaire, cle_import, ticket_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?)"""
+REQUETES = {
+    'ignorer': _INSERT.replace("INSERT INTO", "INSERT OR IGNORE INTO"),
+    'upsert': _INSERT + """
+    ON CONFLICT(cle_import) DO UPDATE SET
+        produit_id = excluded.produit_id,
+        client_id = excluded.client_id,
+        date = excluded.date,
+        quantite = excluded.quantite,
+        prix_unitaire = excluded.prix_unitaire,
+        ticket_id = excluded.ticket_id""",
+}
+
+
+def renommer_colonnes(colonnes_source: List[str]) -> dict:
+    """Associe les en-têtes de l'export aux noms de colonnes internes"""
+    renommage = {}
+    for col in colonnes_source:
+        nom = normaliser_nom(col)
+        for interne, alias in ALIAS_COLONNES.items():
+            if nom in alias and interne not in renommage.values():
+                renommage[col] = interne
+                break
+    return renommage
+
+
+def valider_chunk(df: pd.DataFrame, format_date: Optional[str], limite: Optional[str] = None) -> pd.DataFrame:
+    """
+    Convertit les types en bloc et écarte les lignes invalides.
+
+    Les conversions sont vectorisées (to_datetime, to_numeric) ; aucune ligne
+    n'est traitée individuellement. Les ventes datées avant `limite` (fin des
+    périodes archivées) sont écartées : leur insertion ferait échouer le lot.
+    """
+    dates = pd.to_datetime(df['date'], format=format_date or 'ISO8601', errors='coerce')
+    quantites = pd.to_numeric(df['quantite'], errors='coerce')
+    prix = (
+        pd.to_numeric(df['prix'].astype(str).str.replace(",", ".", regex=False), errors='coerce')
+        if 'prix' in df.columns else pd.Series(np.nan, index=df.index)
+    )
+    produits = df['produit']
+    clients = df['client']
+
+    valides = (
+        dates.notna() & quantites.notna() & (quantites > 0) & (quantites % 1 == 0)
+        & produits.notna() & clients.notna()
+        & ~(prix < 0)
+    )
+    if limite is not None:
+        valides &= dates >= pd.Timestamp(limite)
+
+    propre = pd.DataFrame({
+        'date': dates[valides].values.astype('datetime64[D]').astype(str),
+        'produit': produits[valides].values,
+        'client': clients[valides].values,
+        'quantite': quantites[valides].astype('int64').values,
+        'prix': prix[valides].values,
+    })
+    for col in ('ticket', 'ligne'):
+        if col in df.columns:
+            propre[col] = df.loc[valides, col].astype('string').values
+    return propre
+
+
+def resoudre_ids(df: pd.DataFrame, index: IndexNoms, colonne: str, prix: Optional[pd.Series] = None) -> np.ndarray:
+    """Traduit une colonne de noms en ids via le cache, en créant les manquants en bloc
+
+    Les noms sont factorisés d'abord : la normalisation et la recherche dans le
+    cache ne portent que sur les valeurs distinctes du chunk.
+    """
+    codes, uniques = pd.factorize(df[colonne])
+    prix_par_nom = None
+    if prix is not None:
+        premiers = pd.Series(prix.values).groupby(codes).first()
+        prix_par_nom = dict(zip(uniques, premiers.reindex(range(len(uniques))).values))
+    ids = index.resoudre_ou_creer(uniques, prix=prix_par_nom)
+    return np.fromiter((ids[nom] for nom in uniques), dtype=np.int64, count=len(uniques))[codes]
+
+
+class Occurrences:
+    """
+    Rang de chaque ligne parmi les lignes de même contenu déjà lues dans le
+    fichier, d'un chunk à l'autre.
+
+    Les comptes par contenu (empreinte 64 bits) sont tenus dans deux
+    tableaux triés, 16 octets par contenu distinct.
+    """
+
+    def __init__(self):
+        self.contenus = np.empty(0, dtype=np.int64)
+        self.comptes = np.empty(0, dtype=np.int64)
+
+    def rangs(self, contenus: np.ndarray) -> np.ndarray:
+        """Rang (0 pour la première) de chaque ligne parmi les lignes de même contenu"""
+        locaux = pd.Series(contenus).groupby(contenus, sort=False).cumcount().to_numpy()
+        uniques, inverse, effectifs = np.unique(contenus, return_inverse=True, return_counts=True)
+        positions = np.searchsorted(self.contenus, uniques)
+        connus = positions < len(self.contenus)
+        connus[connus] = self.contenus[positions[connus]] == uniques[connus]
+        precedents = np.zeros(len(uniques), dtype=np.int64)
+        precedents[connus] = self.comptes[positions[connus]]
+        self.comptes[positions[connus]] += effectifs[connus]
+        self.contenus = np.insert(self.contenus, positions[~connus], uniques[~connus])
+        self.comptes = np.insert(self.comptes, positions[~connus], effectifs[~connus])
+        return precedents[inverse] + locaux
+
+
+def calculer_cles(df: pd.DataFrame, occurrences: Optional[Occurrences] = None) -> np.ndarray:
+    """
+    Clé naturelle de chaque ligne, hachée en entier 64 bits.
+
+    Si l'export fournit un numéro de ticket (et de ligne), ils identifient la
+    vente : une ligne corrigée dans un export ultérieur met alors à jour la
+    vente existante en mode upsert. Sinon la clé est le contenu de la ligne
+    et son rang parmi les lignes identiques du fichier (`occurrences`) : deux
+    ventes identiques du même jour restent deux ventes, et un export qui en
+    recoupe un autre redonne les mêmes clés. La première occurrence garde la
+    clé du seul contenu, celle des imports antérieurs.
+    """
+    if 'ticket' in df.columns:
+        colonnes_cle = ['date', 'ticket'] + (['ligne'] if 'ligne' in df.columns else ['produit_id'])
+    else:
+        colonnes_cle = ['date', 'produit_id', 'client_id', 'quantite', 'prix']
+    cles = pd.util.hash_pandas_object(df[colonnes_cle], index=False).values.view(np.int64)
+    if 'ticket' in df.columns or occurrences is None:
+        return cles
+    rangs = occurrences.rangs(cles)
+    repetees = rangs > 0
+    if repetees.any():
+        cles = cles.copy()
+        cles[repetees] = pd.util.hash_pandas_object(
+            pd.DataFrame({'contenu': cles[repetees], 'rang': rangs[repetees]}), index=False
+        ).values.view(np.int64)
+    return cles
+
+
+def calculer_tickets(conn: sqlite3.Connection, df: pd.DataFrame) -> list:
+    """
+    Ticket de chaque ligne : un par numéro de ticket de l'export et par jour
+    (les caisses renumérotent souvent chaque jour). None sans numéro de ticket.
+    """
+    if 'ticket' not in df.columns:
+        return [None] * len(df)
+    cles = pd.util.hash_pandas_object(df[['date', 'ticket']], index=False).values.view(np.int64)
+    codes, uniques = pd.factorize(cles)
+    ids = resoudre_tickets(conn, uniques.tolist())
+    tickets = np.array([ids[c] for c in uniques.tolist()], dtype=np.int64)[codes]
+    return pd.Series(tickets).astype(object).where(df['ticket'].notna().to_numpy(), None).tolist()
+
+
+def cles_existantes(conn: sqlite3.Connection, cles: np.ndarray) -> np.ndarray:
+    """Masque des clés déjà importées, lues en une requête sur l'index unique"""
+    existantes = [c for (c,) in conn.execute(
+        "SELECT cle_import FROM ventes WHERE cle_import IN (SELECT value FROM json_each(?))",
+        (json.dumps(cles.tolist()),)
+    )]
+    return np.isin(cles, np.array(existantes, dtype=np.int64))
+
+
+def importer_fichier(chemin: Path, db_path: Path = DB_PATH, mode: str = 'ignorer',
+                     taille_chunk: int = TAILLE_CHUNK, format_date: Optional[str] = None,
+                     separateur: str = ',') -> dict:
+    """Importe un export de caisse de taille quelconque et retourne les statistiques"""
+    if mode not in REQUETES:
+        raise ValueError(f"Mode inconnu: {mode} (attendu: {', '.join(REQUETES)})")
+
+    debut = time.perf_counter()
+    stats = {'lues': 0, 'rejetees': 0, 'doublons': 0, 'ecrites': 0}
+
+    conn = connecter(db_path)
+    try:
+        migrer_schema(conn)
+        produits = IndexNoms(conn, 'produits')
+        clients = IndexNoms(conn, 'clients')
+
+        entete = pd.read_csv(chemin, sep=separateur, nrows=0).columns.tolist()
+        renommage = renommer_colonnes(entete)
+        manquantes = set(OBLIGATOIRES) - set(renommage.values())
+        if manquantes:
+            raise KeyError(f"Colonnes manquantes: {manquantes}. Colonnes disponibles: {entete}")
+        limite = limite_archives(conn)
+        occurrences = Occurrences() if 'ticket' not in renommage.values() else None
+
+        lecteur = pd.read_csv(
+            chemin, sep=separateur, usecols=list(renommage), dtype=str,
+            chunksize=taille_chunk, engine='c'
+        )
+        for brut in lecteur:
+            brut = brut.rename(columns=renommage)
+            df = valider_chunk(brut, format_date, limite)
+            stats['lues'] += len(brut)
+            stats['rejetees'] += len(brut) - len(df)
+
+            with transaction_referentiel(conn, produits, clients):
+                df['produit_id'] = resoudre_ids(df, produits, 'produit', prix=df['prix'])
+                df['client_id'] = resoudre_ids(df, clients, 'client')
+                df['cle'] = calculer_cles(df, occurrences)
+
+                avant = len(df)
+                # Insertion dans l'ordre des clés : accès séquentiels à l'index unique
+                df = df.drop_duplicates('cle', keep='last').sort_values('cle')
+                stats['doublons'] += avant - len(df)
+
+                prix = df['prix'].astype(object).where(df['prix'].notna(), None)
+                lignes = list(zip(
+                    df['produit_id'].tolist(), df['client_id'].tolist(), df['date'].tolist(),
+                    df['quantite'].tolist(), prix.tolist(), df['cle'].tolist(), calculer_tickets(conn, df)
+                ))
+                # Ventes déjà importées : mises à jour ligne à ligne (triggers de modification) ;
+                # nouvelles ventes : insertion en masse, effets des triggers appliqués en bloc
+                existantes = (cles_existantes(conn, df['cle'].values) if mode == 'upsert'
+                              else np.zeros(len(lignes), dtype=bool))
+                if existantes.any():
+                    stats['ecrites'] += conn.executemany(
+                        REQUETES[mode], (l for l, e in zip(lignes, existantes) if e)
+                    ).rowcount
+                with insertions_en_masse(conn):
+                    stats['ecrites'] += conn.executemany(
+                        REQUETES[mode], (l for l, e in zip(lignes, existantes) if not e)
+                    ).rowcount
+
+            logger.info(f"{stats['lues']:,} lignes traitées ({stats['lues'] / (time.perf_counter() - debut):,.0f} lignes/s)")
+    finally:
+        conn.close()
+
+    stats['duree_s'] = time.perf_counter() - debut
+    stats['lignes_par_s'] = stats['lues'] / stats['duree_s'] if stats['duree_s'] else float('inf')
+    logger.info(
+        f"Import terminé: {stats['lues']:,} lues, {stats['ecrites']:,} écrites, "
+        f"{stats['doublons']:,} doublons, {stats['rejetees']:,} rejetées "
+        f"en {stats['duree_s']:.2f}s ({stats['lignes_par_s']:,.0f} lignes/s)"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Ajoute des exports de caisse CSV à la base des ventes")
+    parser.add_argument("fichiers", type=Path, nargs='+', help="Exports CSV à importer")
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="Base de données cible")
+    parser.add_argument("--mode", choices=list(REQUETES), default='ignorer',
+                        help="'ignorer' conserve la vente existante, 'upsert' la remplace")
+    parser.add_argument("--chunk", type=int, default=TAILLE_CHUNK, help="Lignes par transaction")
+    parser.add_argument("--format-date", default=None, help="Format strptime des dates (défaut: ISO 8601)")
+    parser.add_argument("--sep", default=',', help="Séparateur de colonnes")
+    args = parser.parse_args()
+
+    try:
+        for fichier in args.fichiers:
+            importer_fichier(fichier, args.db, args.mode, args.chunk, args.format_date, args.sep)
+    except Exception as e:
+        logger.error(f"Erreur lors de l'import: {e}", exc_info=True)
+        sys.exit(1)
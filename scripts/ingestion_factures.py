@@ -0,0 +1,250 @@
+# scripts/ingestion_factures.py
+"""Import en masse de factures PDF dans la table ventes"""
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from archives import limite_archives
+from base_donnees import DB_PATH, cle_hash, connecter, migrer_schema, normaliser_nom
+from pdf_utils import iter_pdf_pages
+from referentiel import IndexNoms, resoudre_tickets, transaction_referentiel
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = 50_000  # Lignes insérées par transaction
+
+# En-têtes de colonnes reconnus (après normalisation)
+COLONNES = {
+    'produit': ('produit', 'designation', 'article', 'description', 'libelle'),
+    'quantite': ('quantite', 'qte', 'qty', 'qt'),
+    'prix': ('prix unitaire', 'prix', 'p.u.', 'pu', 'prix u.'),
+    'date': ('date',),
+    'client': ('client',),
+}
+
+_CLIENT_RE = re.compile(r"client\s*:?\s*(.+)", re.IGNORECASE)
+_DATE_RE = re.compile(r"(\d{1,2}[/.-]\d{1,2}[/.-]\d{4}|\d{4}-\d{2}-\d{2})")
+
+
+def _convertir_date(texte: str) -> Optional[str]:
+    """Convertit une date de facture au format ISO utilisé par la table ventes"""
+    for fmt in ("%d/%m/%Y", "%d.%m.%Y", "%d-%m-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(texte.strip(), fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def _convertir_nombre(texte: str) -> Optional[float]:
+    """Convertit un montant au format français ('1 234,50 €') en float"""
+    nettoye = re.sub(r"[^\d,.-]", "", texte or "")
+    if "," in nettoye:
+        nettoye = nettoye.replace(".", "").replace(",", ".")
+    try:
+        return float(nettoye)
+    except ValueError:
+        return None
+
+
+def _reperer_colonnes(entete: List[str]) -> dict:
+    """Associe chaque champ attendu à l'indice de sa colonne dans le tableau"""
+    positions = {}
+    for i, cellule in enumerate(entete):
+        nom = normaliser_nom(cellule or "")
+        for champ, alias in COLONNES.items():
+            if champ not in positions and any(nom.startswith(a) for a in alias):
+                positions[champ] = i
+                break
+    return positions
+
+
+def _cellule(cellules: list, positions: dict, champ: str) -> str:
+    """Contenu nettoyé de la cellule correspondant à un champ ('' si absente)"""
+    i = positions.get(champ)
+    if i is None or i >= len(cellules):
+        return ""
+    return (cellules[i] or "").strip()
+
+
+def extraire_facture(chemin: str) -> dict:
+    """
+    Extrait les lignes d'une facture PDF (exécuté dans un worker).
+
+    La date et le client de l'en-tête de la facture s'appliquent aux lignes
+    dont le tableau ne fournit pas ces colonnes. Seuls les PDF disposant d'une
+    couche texte sont exploitables ; un scan sans OCR ne produit aucune ligne.
+    """
+    with open(chemin, 'rb') as f:
+        empreinte = hashlib.sha256(f.read()).hexdigest()
+
+    date_facture, client_facture = None, None
+    lignes = []
+    for page in iter_pdf_pages(chemin, avec_tables=True, workers=1):
+        for ligne_texte in page['texte'].splitlines():
+            if client_facture is None and (m := _CLIENT_RE.search(ligne_texte)):
+                client_facture = m.group(1).strip()
+            if date_facture is None and "date" in ligne_texte.lower() and (m := _DATE_RE.search(ligne_texte)):
+                date_facture = _convertir_date(m.group(1))
+
+        for table in page['tables']:
+            if not table:
+                continue
+            positions = _reperer_colonnes(table[0])
+            if not {'produit', 'quantite', 'prix'}.issubset(positions):
+                continue
+            for cellules in table[1:]:
+                produit = _cellule(cellules, positions, 'produit')
+                quantite = _convertir_nombre(_cellule(cellules, positions, 'quantite'))
+                prix = _convertir_nombre(_cellule(cellules, positions, 'prix'))
+                date = _cellule(cellules, positions, 'date')
+                if not produit or not quantite or prix is None:
+                    continue  # Lignes de total, de remise, etc.
+                lignes.append({
+                    'produit': produit,
+                    'quantite': int(quantite),
+                    'prix': prix,
+                    'date': _convertir_date(date) if date else None,
+                    'client': _cellule(cellules, positions, 'client') or None,
+                })
+
+    for rang, ligne in enumerate(lignes):
+        ligne['date'] = ligne['date'] or date_facture
+        ligne['client'] = ligne['client'] or client_facture
+        # Même contenu de fichier, même rang : même clé, quel que soit le nom du fichier
+        ligne['cle'] = cle_hash(empreinte, rang)
+        ligne['ticket'] = cle_hash(empreinte)  # Une facture, un ticket
+
+    return {'fichier': chemin, 'lignes': lignes}
+
+
+def extraire_facture_isolee(chemin: str) -> dict:
+    """
+    extraire_facture dont l'échec reste propre au fichier : l'erreur est
+    retournée (clé 'erreur') au lieu d'interrompre le lot, et les autres
+    factures sont importées.
+    """
+    try:
+        return extraire_facture(chemin)
+    except Exception as e:
+        return {'fichier': chemin, 'lignes': [], 'erreur': f"{type(e).__name__}: {e}"}
+
+
+class ChargeurVentes:
+    """Accumule des lignes de vente et les insère par lots idempotents"""
+
+    def __init__(self, conn, taille_lot: int = TAILLE_LOT):
+        self.conn = conn
+        self.taille_lot = taille_lot
+        self.produits = IndexNoms(conn, 'produits')
+        self.clients = IndexNoms(conn, 'clients')
+        self._tampon = []
+        self.inserees = 0
+        self.ignorees = 0
+
+    def ajouter(self, lignes: List[dict]) -> None:
+        self._tampon.extend(lignes)
+        if len(self._tampon) >= self.taille_lot:
+            self.vider()
+
+    def vider(self) -> None:
+        """Résout les noms du lot puis l'insère dans une seule transaction"""
+        if not self._tampon:
+            return
+        lot, self._tampon = self._tampon, []
+
+        with transaction_referentiel(self.conn, self.produits, self.clients):
+            ids_produits = self.produits.resoudre_ou_creer(
+                (l['produit'] for l in lot), prix={l['produit']: l['prix'] for l in lot}
+            )
+            ids_clients = self.clients.resoudre_ou_creer(l['client'] for l in lot)
+            ids_tickets = resoudre_tickets(self.conn, (l['ticket'] for l in lot))
+            avant = self.conn.total_changes
+            self.conn.executemany(
+                """INSERT OR IGNORE INTO ventes
+                (produit_id, client_id, date, quantite, prix_unitaire, cle_import, ticket_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    (ids_produits[l['produit']], ids_clients[l['client']], l['date'],
+                     l['quantite'], l['prix'], l['cle'], ids_tickets[l['ticket']])
+                    for l in lot
+                )
+            )
+            inserees = self.conn.total_changes - avant
+
+        self.inserees += inserees
+        self.ignorees += len(lot) - inserees
+
+
+def importer_dossier(dossier: Path, db_path: Path = DB_PATH, workers: Optional[int] = None) -> dict:
+    """Importe toutes les factures PDF d'un dossier et retourne les statistiques"""
+    fichiers = sorted(str(p) for p in Path(dossier).glob("**/*.pdf"))
+    if not fichiers:
+        raise FileNotFoundError(f"Aucune facture PDF dans {dossier}")
+
+    debut = time.perf_counter()
+    conn = connecter(db_path)
+    try:
+        migrer_schema(conn)
+        chargeur = ChargeurVentes(conn)
+        rejetees = 0
+        echecs = []
+        limite = limite_archives(conn) or ''
+
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for facture in executor.map(extraire_facture_isolee, fichiers, chunksize=8):
+                if 'erreur' in facture:
+                    logger.warning(f"Facture illisible, ignorée: {facture['fichier']} ({facture['erreur']})")
+                    echecs.append(facture['fichier'])
+                    continue
+                valides = [l for l in facture['lignes'] if l['date'] and l['date'] >= limite and l['client']]
+                rejetees += len(facture['lignes']) - len(valides)
+                if not facture['lignes']:
+                    logger.warning(f"Aucune ligne reconnue dans {facture['fichier']}")
+                chargeur.ajouter(valides)
+        chargeur.vider()
+    finally:
+        conn.close()
+
+    duree = time.perf_counter() - debut
+    stats = {
+        'factures': len(fichiers),
+        'lignes_inserees': chargeur.inserees,
+        'lignes_deja_importees': chargeur.ignorees,
+        'lignes_rejetees': rejetees,
+        'factures_en_echec': echecs,
+        'duree_s': duree,
+        'factures_par_s': len(fichiers) / duree if duree else float('inf'),
+    }
+    logger.info(
+        f"{stats['factures']} factures en {duree:.2f}s ({stats['factures_par_s']:,.1f} factures/s) - "
+        f"{stats['lignes_inserees']} lignes insérées, {stats['lignes_deja_importees']} déjà importées, "
+        f"{rejetees} rejetées (date ou client introuvable, ou période archivée)"
+    )
+    if echecs:
+        logger.warning(f"{len(echecs)} facture(s) en échec, à reprendre: {', '.join(echecs)}")
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Importe un dossier de factures PDF dans la base des ventes")
+    parser.add_argument("dossier", type=Path, help="Dossier contenant les factures PDF")
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="Base de données cible")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de processus d'extraction")
+    args = parser.parse_args()
+
+    try:
+        importer_dossier(args.dossier, args.db, args.workers)
+    except Exception as e:
+        logger.error(f"Erreur lors de l'import: {e}", exc_info=True)
+        sys.exit(1)
@@ -0,0 +1,368 @@
+# scripts/palmares.py
+"""Meilleurs produits et clients par période : résumés top-K fusionnables par jour et par mois"""
+import argparse
+import itertools
+import logging
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from base_donnees import DB_PATH, connecter, migrer_schema, transaction_immediate
+from devises import DEVISE_BASE, Convertisseur
+from esquisses import plages_consecutives
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = {'produit': ('produit_id', 'produits'), 'client': ('client_id', 'clients')}
+CAPACITE = 100  # Éléments conservés par résumé, bien au-delà des classements affichés
+
+
+class Resume:
+    """
+    Résumé top-K d'une période : les CAPACITE meilleurs éléments avec leur CA
+    majoré (ca_eur) et l'écart à son minorant (erreur), plus un plancher qui
+    majore le CA de tout élément absent du résumé.
+
+    Les résumés d'un jour ou d'un mois sont exacts (erreur nulle). Fusionner
+    des résumés additionne les CA, un élément absent d'un résumé y comptant
+    pour son plancher : les bornes restent garanties, quel que soit le
+    nombre de périodes fusionnées.
+    """
+
+    def __init__(self, elements: pd.DataFrame, plancher: float = 0.0):
+        self.elements = elements  # Index cle ; colonnes ca_eur, erreur, quantite (triées par CA)
+        self.plancher = plancher
+
+    @classmethod
+    def vide(cls, plancher: float = 0.0) -> 'Resume':
+        return cls(pd.DataFrame(columns=['ca_eur', 'erreur', 'quantite']).rename_axis('cle'), plancher)
+
+    @classmethod
+    def fusionner(cls, resumes: List['Resume'], capacite: int = CAPACITE) -> 'Resume':
+        """Résumé de l'union des périodes, en une seule agrégation"""
+        resumes = [r for r in resumes if len(r.elements) or r.plancher]
+        if not resumes:
+            return cls.vide()
+        planchers = sum(r.plancher for r in resumes)
+        tous = pd.concat([r.elements.assign(plancher=r.plancher) for r in resumes])
+        # Présent : valeur du résumé ; absent : plancher du résumé (déjà compté dans `planchers`)
+        tous['ca_eur'] -= tous['plancher']
+        tous['erreur'] -= tous['plancher']
+        fusion = tous.groupby(level=0)[['ca_eur', 'erreur', 'quantite']].sum()
+        fusion[['ca_eur', 'erreur']] += planchers
+        fusion['erreur'] = fusion['erreur'].clip(lower=0.0)  # Résidus d'arrondi des soustractions
+        fusion = fusion.sort_values('ca_eur', ascending=False)
+        plancher = max(planchers, float(fusion['ca_eur'].iloc[capacite]) if len(fusion) > capacite else 0.0)
+        return cls(fusion.head(capacite), plancher)
+
+    def meilleurs(self, k: int = 10) -> pd.DataFrame:
+        """
+        Les k premiers, avec `garanti` vrai si l'élément est certainement dans
+        le vrai top k (son minorant dépasse tout autre majorant).
+        """
+        premiers = self.elements.head(k).copy()
+        suivant = float(self.elements['ca_eur'].iloc[k]) if len(self.elements) > k else 0.0
+        premiers['garanti'] = premiers['ca_eur'] - premiers['erreur'] >= max(self.plancher, suivant)
+        return premiers
+
+
+def totaux_jours(conn: sqlite3.Connection, dimension: str, jours: Iterable[str]) -> pd.DataFrame:
+    """Totaux exacts par jour et par élément, lus par plages de jours consécutifs sur l'index des dates"""
+    colonne, _ = DIMENSIONS[dimension]
+    totaux = [pd.read_sql(
+        f"""SELECT substr(date, 1, 10) AS periode, {colonne} AS cle,
+            SUM(prix_unitaire * quantite) AS ca_eur, SUM(quantite) AS quantite, COUNT(*) AS nb_ventes
+        FROM ventes WHERE date >= ? AND date < date(?, '+1 day') AND {colonne} IS NOT NULL
+        GROUP BY 1, 2""",
+        conn, params=(premier, dernier)
+    ) for premier, dernier in plages_consecutives(jours)]
+    return pd.concat(totaux, ignore_index=True) if totaux else \
+        pd.DataFrame(columns=['periode', 'cle', 'ca_eur', 'quantite', 'nb_ventes'])
+
+
+def _resumer(totaux: pd.DataFrame, capacite: int = CAPACITE) -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    Résumés exacts de chaque période à partir de ses totaux complets
+    (colonnes periode, cle, ca_eur, quantite), à plat : les éléments
+    retenus de toutes les périodes et le plancher de chacune.
+    """
+    tries = totaux.sort_values(['periode', 'ca_eur'], ascending=[True, False], ignore_index=True)
+    rangs = tries.groupby('periode', sort=False).cumcount().to_numpy()
+    planchers = tries[rangs == capacite].set_index('periode')['ca_eur'].rename('plancher')
+    elements = tries[rangs < capacite].assign(erreur=0.0)[['periode', 'cle', 'ca_eur', 'erreur', 'quantite']]
+    return elements, planchers
+
+
+def _en_resumes(elements: pd.DataFrame, planchers: pd.Series) -> Dict[str, Resume]:
+    """Résumés par période à partir de leur forme à plat (éléments triés par CA dans chaque période)"""
+    resumes = {p: Resume(g.set_index('cle')[['ca_eur', 'erreur', 'quantite']], float(planchers.get(p, 0.0)))
+               for p, g in elements.groupby('periode', sort=False)}
+    for periode in planchers.index.difference(list(resumes)):
+        resumes[periode] = Resume.vide(float(planchers[periode]))
+    return resumes
+
+
+def _resumes_jours(conn: sqlite3.Connection, dimension: str, jours: Iterable[str]) -> Dict[str, Resume]:
+    """Résumés exacts de chaque jour, calculés depuis les ventes"""
+    return _en_resumes(*_resumer(totaux_jours(conn, dimension, jours)))
+
+
+def _totaux_mois(totaux: pd.DataFrame) -> pd.DataFrame:
+    """Totaux exacts de chaque mois à partir des totaux complets de tous ses jours"""
+    par_mois = totaux.assign(periode=totaux['periode'].str[:7])
+    return par_mois.groupby(['periode', 'cle'], as_index=False)[['ca_eur', 'quantite', 'nb_ventes']].sum()
+
+
+def jours_des_mois(mois: Iterable[str]) -> List[str]:
+    return [j for m in sorted(mois)
+            for j in pd.date_range(f"{m}-01", pd.Period(m).end_time.normalize()).strftime('%Y-%m-%d')]
+
+
+def _lire(conn: sqlite3.Connection, dimension: str, condition: str, params: list) -> Dict[str, Resume]:
+    """Résumés enregistrés des périodes répondant à `condition`"""
+    elements = pd.read_sql(
+        f"""SELECT periode, cle, ca_eur, erreur, quantite FROM palmares
+        WHERE dimension = ? AND {condition} ORDER BY periode, ca_eur DESC""",
+        conn, params=[dimension, *params]
+    )
+    planchers = pd.read_sql(
+        f"SELECT periode, plancher FROM planchers_palmares WHERE dimension = ? AND {condition}",
+        conn, params=[dimension, *params]
+    ).set_index('periode')['plancher']
+    return _en_resumes(elements, planchers)
+
+
+def _ecrire(conn: sqlite3.Connection, dimension: str, periodes: Iterable[str],
+            elements: pd.DataFrame, planchers: pd.Series) -> None:
+    """Remplace les résumés enregistrés des périodes données (dans la transaction en cours)"""
+    periodes = [(dimension, p) for p in periodes]
+    conn.executemany("DELETE FROM palmares WHERE dimension = ? AND periode = ?", periodes)
+    conn.executemany("DELETE FROM planchers_palmares WHERE dimension = ? AND periode = ?", periodes)
+    conn.executemany("INSERT INTO palmares VALUES (?, ?, ?, ?, ?, ?)", zip(
+        itertools.repeat(dimension), elements['periode'], elements['cle'].astype(int).tolist(),
+        elements['ca_eur'].tolist(), elements['erreur'].tolist(), elements['quantite'].astype(int).tolist()
+    ))
+    planchers = planchers[planchers > 0]
+    conn.executemany("INSERT INTO planchers_palmares VALUES (?, ?, ?)",
+                     zip(itertools.repeat(dimension), planchers.index, planchers.tolist()))
+
+
+def _ecrire_totaux(conn: sqlite3.Connection, periodes: Iterable[str], totaux: pd.DataFrame) -> None:
+    """Remplace les totaux complets par produit des périodes données (dans la transaction en cours)"""
+    conn.executemany("DELETE FROM totaux_produits WHERE periode = ?", [(p,) for p in periodes])
+    conn.executemany("INSERT INTO totaux_produits VALUES (?, ?, ?, ?, ?)", zip(
+        totaux['periode'], totaux['cle'].astype(int).tolist(), totaux['nb_ventes'].astype(int).tolist(),
+        totaux['quantite'].astype(int).tolist(), totaux['ca_eur'].tolist()
+    ))
+
+
+def actualiser(conn: sqlite3.Connection) -> int:
+    """
+    Recalcule les résumés des mois touchés par des ventes modifiées et de
+    tous leurs jours, en une lecture par plage de mois consécutifs ;
+    retourne le nombre de jours en attente traités.
+
+    Les totaux journaliers étant complets, le résumé d'un mois en est
+    déduit exactement : seule la fusion de plusieurs mois (fenêtres
+    quelconques) introduit une erreur bornée. Les totaux complets des
+    produits sont aussi enregistrés (totaux_produits), pour les
+    comparaisons de périodes.
+
+    Jours en attente et ventes sont lus sous le verrou d'écriture : une vente
+    validée entre la lecture et l'effacement des marqueurs serait perdue.
+    """
+    with transaction_immediate(conn):
+        en_attente = [j for (j,) in conn.execute("SELECT jour FROM palmares_a_recalculer")]
+        if not en_attente:
+            return 0
+        mois = {j[:7] for j in en_attente}
+        jours = jours_des_mois(mois)
+        for dimension in DIMENSIONS:
+            totaux = totaux_jours(conn, dimension, jours)
+            totaux_mois = _totaux_mois(totaux)
+            # Jours et mois vidés par des suppressions : plus aucune ligne
+            _ecrire(conn, dimension, jours, *_resumer(totaux))
+            _ecrire(conn, dimension, mois, *_resumer(totaux_mois))
+            if dimension == 'produit':
+                _ecrire_totaux(conn, jours, totaux)
+                _ecrire_totaux(conn, mois, totaux_mois)
+        conn.executemany("DELETE FROM palmares_a_recalculer WHERE jour = ?", [(j,) for j in en_attente])
+    return len(en_attente)
+
+
+def _en_attente(conn: sqlite3.Connection, debut: str, fin: str) -> List[str]:
+    return [j for (j,) in conn.execute(
+        "SELECT jour FROM palmares_a_recalculer WHERE jour >= ? AND jour <= ?", (debut, fin))]
+
+
+def facteur_periode(convertisseur: Optional[Convertisseur], devise: str, debut: str, fin: str) -> float:
+    """Taux de la période, ou taux moyen journalier s'il a varié"""
+    if devise == DEVISE_BASE:
+        return 1.0
+    facteur = convertisseur.facteur_constant(DEVISE_BASE, devise, debut, fin)
+    if facteur is None:
+        facteur = float(convertisseur.taux(DEVISE_BASE, devise, pd.date_range(debut, fin)).mean())
+    return facteur
+
+
+def decouper(conn: sqlite3.Connection, debut: str, fin: str) -> Tuple[set, List[str], List[str]]:
+    """
+    Découpe [debut, fin] en mois entiers, lisibles dans les agrégats
+    mensuels, et jours isolés (mois entamés ou en attente de recalcul),
+    lisibles dans les journaliers sauf ceux en attente (retournés à part).
+    """
+    en_attente = _en_attente(conn, debut, fin)
+    mois_perimes = {j[:7] for j in en_attente}
+    jours = pd.date_range(debut, fin).strftime('%Y-%m-%d')
+    mois_entiers = {m for m, g in pd.Series(jours).groupby(jours.str[:7])
+                    if len(g) == pd.Period(m).days_in_month and m not in mois_perimes}
+    jours_isoles = [j for j in jours if j[:7] not in mois_entiers]
+    return mois_entiers, jours_isoles, en_attente
+
+
+def _nommer(conn: sqlite3.Connection, dimension: str, classement: pd.DataFrame) -> pd.DataFrame:
+    _, table = DIMENSIONS[dimension]
+    cles = [int(c) for c in classement['cle'].unique()]
+    noms = dict(conn.execute(
+        f"SELECT id, nom FROM {table} WHERE id IN ({','.join('?' * len(cles))})", cles
+    ).fetchall()) if cles else {}
+    classement.insert(classement.columns.get_loc('cle') + 1, dimension, classement['cle'].map(noms))
+    return classement
+
+
+def _meilleurs_exacts(conn: sqlite3.Connection, dimension: str, debut: str, fin: str, k: int) -> pd.DataFrame:
+    colonne, _ = DIMENSIONS[dimension]
+    classement = pd.read_sql(
+        f"""SELECT {colonne} AS cle, SUM(prix_unitaire * quantite) AS ca_eur, SUM(quantite) AS quantite
+        FROM ventes WHERE date >= ? AND date < date(?, '+1 day') AND {colonne} IS NOT NULL
+        GROUP BY 1 ORDER BY 2 DESC LIMIT ?""",
+        conn, params=(debut, fin, k)
+    )
+    return classement.assign(erreur=0.0, garanti=True)[['cle', 'ca_eur', 'erreur', 'quantite', 'garanti']]
+
+
+def meilleurs(conn: sqlite3.Connection, dimension: str, debut: Optional[str] = None, fin: Optional[str] = None,
+              k: int = 10, devise: str = DEVISE_BASE, convertisseur: Optional[Convertisseur] = None,
+              exact_si_incertain: bool = True) -> pd.DataFrame:
+    """
+    Top k d'une fenêtre quelconque [debut, fin] : résumés mensuels pour les
+    mois entiers, journaliers pour les mois entamés ou en attente de recalcul.
+
+    Quand les bornes ne suffisent pas à garantir le classement (CA très
+    dispersé entre les éléments, typiquement les clients sur une longue
+    fenêtre), il est recalculé exactement sur les ventes de la fenêtre,
+    sauf si `exact_si_incertain` est faux.
+
+    Returns:
+        DataFrame rang, cle, <dimension>, ca_eur, erreur, quantite, garanti, ca_devise
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Dimension inconnue: {dimension}")
+    bornes = conn.execute("SELECT MIN(date), MAX(date) FROM ventes").fetchone()
+    if bornes[0] is None:
+        return pd.DataFrame(columns=['rang', 'cle', dimension, 'ca_eur', 'erreur', 'quantite', 'garanti', 'ca_devise'])
+    debut, fin = max(debut or bornes[0][:10], bornes[0][:10]), min(fin or bornes[1][:10], bornes[1][:10])
+
+    mois_entiers, jours_isoles, en_attente = decouper(conn, debut, fin)
+
+    resumes = list(_lire(conn, dimension, "length(periode) = 7 AND periode >= ? AND periode <= ?",
+                         [debut[:7], fin[:7]]).items())
+    resumes = [r for p, r in resumes if p in mois_entiers]
+    if jours_isoles:
+        stockes = _lire(conn, dimension, "length(periode) = 10 AND periode >= ? AND periode <= ?",
+                        [jours_isoles[0], jours_isoles[-1]])
+        perimes = set(en_attente)
+        resumes += [r for p, r in stockes.items() if p in set(jours_isoles) and p not in perimes]
+        resumes += list(_resumes_jours(conn, dimension, en_attente).values()) if en_attente else []
+
+    classement = Resume.fusionner(resumes).meilleurs(k).rename_axis('cle').reset_index()
+    if exact_si_incertain and not classement['garanti'].all():
+        logger.info(f"Top {k} {dimension} non garanti par les résumés du {debut} au {fin} : calcul exact")
+        classement = _meilleurs_exacts(conn, dimension, debut, fin, k)
+    classement.insert(0, 'rang', np.arange(1, len(classement) + 1))
+    convertisseur = convertisseur or (Convertisseur(conn) if devise != DEVISE_BASE else None)
+    classement['ca_devise'] = classement['ca_eur'] * facteur_periode(convertisseur, devise, debut, fin)
+    return _nommer(conn, dimension, classement)
+
+
+def par_mois(conn: sqlite3.Connection, dimension: str, k: int = 10, debut: Optional[str] = None,
+             fin: Optional[str] = None, devise: str = DEVISE_BASE,
+             convertisseur: Optional[Convertisseur] = None) -> pd.DataFrame:
+    """
+    Top k exact de chaque mois (AAAA-MM) entre debut et fin, lu en une
+    requête sur les résumés mensuels ; les mois en attente de recalcul sont
+    résumés à la volée depuis leurs ventes.
+
+    Returns:
+        DataFrame mois, rang, cle, <dimension>, ca_eur, erreur, quantite, ca_devise
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Dimension inconnue: {dimension}")
+    debut, fin = debut or '0000-00', fin or '9999-12'
+    classement = pd.read_sql(
+        """SELECT periode AS mois, rang, cle, ca_eur, erreur, quantite FROM (
+            SELECT periode, cle, ca_eur, erreur, quantite,
+                   ROW_NUMBER() OVER (PARTITION BY periode ORDER BY ca_eur DESC) AS rang
+            FROM palmares WHERE dimension = ? AND length(periode) = 7 AND periode >= ? AND periode <= ?
+        ) WHERE rang <= ? ORDER BY mois, rang""",
+        conn, params=(dimension, debut, fin, k)
+    )
+
+    perimes = sorted({j[:7] for j in _en_attente(conn, f"{debut}-01", f"{fin}-31")})
+    if perimes:
+        totaux = _totaux_mois(totaux_jours(conn, dimension, jours_des_mois(perimes)))
+        recalcules, _ = _resumer(totaux, k)
+        recalcules = recalcules.rename(columns={'periode': 'mois'})
+        recalcules['rang'] = recalcules.groupby('mois').cumcount() + 1
+        classement = pd.concat(
+            [classement[~classement['mois'].isin(perimes)], recalcules], ignore_index=True
+        ).sort_values(['mois', 'rang'], ignore_index=True)[classement.columns]
+
+    if devise != DEVISE_BASE and not classement.empty:
+        convertisseur = convertisseur or Convertisseur(conn)
+        facteurs = {m: facteur_periode(convertisseur, devise, f"{m}-01", str(pd.Period(m).end_time.date()))
+                    for m in classement['mois'].unique()}
+        classement['ca_devise'] = classement['ca_eur'] * classement['mois'].map(facteurs)
+    else:
+        classement['ca_devise'] = classement['ca_eur']
+    return _nommer(conn, dimension, classement)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Palmarès des produits et clients")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    sous.add_parser("actualiser", help="Recalcule les résumés des jours modifiés et de leurs mois")
+
+    p = sous.add_parser("top", help="Top k d'une période quelconque")
+    p.add_argument("dimension", choices=list(DIMENSIONS))
+    p.add_argument("--debut", default=None)
+    p.add_argument("--fin", default=None)
+    p.add_argument("-k", type=int, default=10)
+
+    p = sous.add_parser("mois", help="Top k de chaque mois")
+    p.add_argument("dimension", choices=list(DIMENSIONS))
+    p.add_argument("-k", type=int, default=10)
+
+    args = parser.parse_args()
+    conn = connecter(DB_PATH)
+    try:
+        migrer_schema(conn)
+        debut = time.perf_counter()
+        if args.commande == "actualiser":
+            logger.info(f"{actualiser(conn)} jours recalculés")
+        elif args.commande == "top":
+            print(meilleurs(conn, args.dimension, args.debut, args.fin, args.k).to_string(index=False))
+        else:
+            print(par_mois(conn, args.dimension, args.k).to_string(index=False))
+        logger.info(f"Terminé en {(time.perf_counter() - debut) * 1000:.1f} ms")
+    except (sqlite3.Error, ValueError, KeyError) as e:
+        logger.error(f"Erreur de palmarès: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
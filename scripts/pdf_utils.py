@@ -1,32 +1,195 @@
 # scripts/pdf_utils.py
 import base64
 import io
+import os
+import re
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Optional
+
 import PyPDF2
 import pdfplumber
 import streamlit as st
 import pandas as pd
-from datetime import datetime
-import tempfile
+
+# Paramètres de l'extraction parallèle
+PAGES_PAR_LOT = 16  # Pages traitées par tâche d'un worker
+SEUIL_PARALLELE = 32  # En dessous, l'extraction reste séquentielle
+
+_NOMBRE_RE = re.compile(r"^[+-]?\d+(?:[.,]\d+)?$")
+
+
+def _extraire_page(page, avec_tables: bool) -> dict:
+    """Extrait le texte (une seule fois) et les tableaux d'une page"""
+    resultat = {
+        'page': page.page_number,
+        'texte': page.extract_text() or "",
+        'tables': page.extract_tables() if avec_tables else []
+    }
+    # Libère les objets mis en cache par pdfplumber pour borner la mémoire
+    page.close()
+    return resultat
+
+
+def _extraire_lot(chemin: str, debut: int, fin: int, avec_tables: bool) -> List[dict]:
+    """Tâche d'un worker : extrait les pages [debut, fin[ du fichier"""
+    with pdfplumber.open(chemin) as pdf:
+        return [_extraire_page(pdf.pages[i], avec_tables) for i in range(debut, fin)]
+
+
+def _nombre_pages(chemin: str) -> int:
+    """Compte les pages sans analyser leur contenu"""
+    with open(chemin, 'rb') as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def iter_pdf_pages(file, avec_tables: bool = True, workers: Optional[int] = None) -> Iterator[dict]:
+    """
+    Parcourt un PDF page par page et produit {'page', 'texte', 'tables'}.
+
+    Les gros documents sont découpés en lots de PAGES_PAR_LOT pages répartis
+    sur un pool de processus. Le nombre de lots en cours est limité à deux par
+    worker : la mémoire reste bornée quelle que soit la taille du document et
+    les pages sont restituées dans l'ordre.
+
+    Args:
+        file: Chemin du fichier ou objet fichier (ex: upload Streamlit)
+        avec_tables: Si True, extrait aussi les tableaux détectés
+        workers: Nombre de processus (par défaut: nombre de CPU)
+    """
+    temp_path = None
+    if isinstance(file, (str, os.PathLike)):
+        chemin = str(file)
+    else:
+        # Les workers ont besoin d'un chemin : on recopie le flux sur disque
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
+            file.seek(0)
+            shutil.copyfileobj(file, tmp)
+            temp_path = chemin = tmp.name
+
+    try:
+        nb_pages = _nombre_pages(chemin)
+        workers = workers or os.cpu_count() or 1
+
+        if nb_pages < SEUIL_PARALLELE or workers < 2:
+            with pdfplumber.open(chemin) as pdf:
+                for page in pdf.pages:
+                    yield _extraire_page(page, avec_tables)
+            return
+
+        lots = ((d, min(d + PAGES_PAR_LOT, nb_pages)) for d in range(0, nb_pages, PAGES_PAR_LOT))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            en_cours = deque()
+            for debut, fin in lots:
+                en_cours.append(executor.submit(_extraire_lot, chemin, debut, fin, avec_tables))
+                if len(en_cours) >= workers * 2:
+                    yield from en_cours.popleft().result()
+            while en_cours:
+                yield from en_cours.popleft().result()
+    finally:
+        if temp_path:
+            os.unlink(temp_path)
+
 
 def read_pdf(file):
     """Lit un PDF et retourne son texte"""
     try:
-        with pdfplumber.open(file) as pdf:
-            text = "\n".join([page.extract_text() for page in pdf.pages if page.extract_text()])
-        return text
+        return "\n".join(
+            page['texte'] for page in iter_pdf_pages(file, avec_tables=False) if page['texte']
+        )
     except Exception as e:
         st.error(f"Erreur de lecture du PDF : {str(e)}")
         return ""
 
+
 def display_pdf(file):
     """Affiche un PDF dans Streamlit"""
-    # Votre implémentation ici...
-    pass
+    try:
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, 'rb') as f:
+                contenu = f.read()
+        else:
+            file.seek(0)
+            contenu = file.read()
+        b64 = base64.b64encode(contenu).decode('utf-8')
+        st.markdown(
+            f'<iframe src="data:application/pdf;base64,{b64}" width="100%" height="800" '
+            f'type="application/pdf"></iframe>',
+            unsafe_allow_html=True
+        )
+    except Exception as e:
+        st.error(f"Erreur d'affichage du PDF : {str(e)}")
+
+
+def _typer_colonne(serie: pd.Series) -> pd.Series:
+    """Convertit une colonne texte en nombre ou en date lorsque c'est possible"""
+    valeurs = serie.dropna()
+    if valeurs.empty:
+        return serie
+
+    # Nombres au format français : "1 234,56 €" -> 1234.56
+    nettoyee = (
+        serie.str.replace(r"\s", "", regex=True)
+        .str.replace(r"(€|FCFA|EUR|XOF|%)$", "", regex=True)
+        .str.replace(r"\.(?=.*,)", "", regex=True)
+    )
+    if nettoyee.dropna().str.match(_NOMBRE_RE).all():
+        nombres = pd.to_numeric(nettoyee.str.replace(",", ".", regex=False))
+        if (nombres.dropna() % 1 == 0).all():
+            return nombres.astype('Int64')
+        return nombres.astype('float64')
+
+    dates = pd.to_datetime(serie, errors='coerce', dayfirst=True, format='mixed')
+    if dates.notna().sum() == len(valeurs):
+        return dates
+
+    return serie.astype('string')
+
+
+def _table_vers_dataframe(table: List[list]) -> Optional[pd.DataFrame]:
+    """Construit un DataFrame typé à partir d'un tableau brut pdfplumber"""
+    lignes = [[(c or "").strip() or None for c in ligne] for ligne in table if any(ligne)]
+    if len(lignes) < 2:
+        return None
+
+    entete = lignes[0]
+    if all(entete):
+        colonnes = [str(c).replace("\n", " ") for c in entete]
+        donnees = lignes[1:]
+    else:
+        colonnes = [f"col_{i}" for i in range(len(entete))]
+        donnees = lignes
+
+    df = pd.DataFrame(donnees, columns=colonnes, dtype='string')
+    for col in df.columns:
+        df[col] = _typer_colonne(df[col])
+    return df
+
+
+def pdf_to_dataframe(file, workers: Optional[int] = None) -> List[pd.DataFrame]:
+    """Convertit les tableaux PDF en DataFrames typés
+
+    Les tableaux consécutifs partageant les mêmes en-têtes (tableau qui se
+    poursuit sur plusieurs pages) sont fusionnés avant le typage.
+    """
+    tables_brutes = []
+    try:
+        for page in iter_pdf_pages(file, avec_tables=True, workers=workers):
+            for table in page['tables']:
+                if not table:
+                    continue
+                if tables_brutes and tables_brutes[-1][0] == table[0]:
+                    tables_brutes[-1].extend(table[1:])
+                else:
+                    tables_brutes.append(table)
+    except Exception as e:
+        st.error(f"Erreur d'extraction des tableaux : {str(e)}")
+        return []
 
-def pdf_to_dataframe(file):
-    """Convertit les tableaux PDF en DataFrame"""
-    # Votre implémentation ici...
-    pass
+    return [df for df in map(_table_vers_dataframe, tables_brutes) if df is not None]
 
 
 def generate_sales_report(
@@ -0,0 +1,157 @@
+# scripts/prix_historique.py
+"""Historique des prix et affectation du prix en vigueur aux ventes"""
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+import pandas as pd
+
+from base_donnees import DB_PATH, connecter, migrer_schema
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = 2_000_000  # Ventes traitées par passe lors du recalcul
+
+
+def definir_prix(conn: sqlite3.Connection, produit_id: int, prix: float,
+                 valide_depuis: Optional[str] = None, revaloriser: bool = False) -> int:
+    """
+    Enregistre un prix applicable à partir d'une date (passée ou future).
+
+    Le prix courant de la table produits est mis à jour si ce changement est
+    le plus récent déjà en vigueur. Les ventes passées gardent le prix
+    effectivement facturé : seules les ventes de la période sans prix et
+    les ventes datées après aujourd'hui (commandes à venir) sont valorisées.
+
+    Args:
+        revaloriser: Réévalue aussi les ventes passées déjà valorisées de la
+            période (correction d'un prix saisi par erreur)
+
+    Returns:
+        Nombre de ventes dont le prix a été recalculé
+    """
+    aujourdhui = date.today()
+    jour = valide_depuis or aujourdhui.isoformat()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO prix_produits VALUES (?, ?, ?)", (produit_id, jour, prix))
+        en_vigueur = conn.execute(
+            """SELECT prix FROM prix_produits WHERE produit_id = ? AND valide_depuis <= ?
+            ORDER BY valide_depuis DESC LIMIT 1""",
+            (produit_id, aujourdhui.isoformat())
+        ).fetchone()
+        if en_vigueur:
+            # Déjà en vigueur dans l'historique : trg_prix_update n'inscrit pas de nouvelle date
+            conn.execute("UPDATE produits SET prix = ? WHERE id = ?", (en_vigueur[0], produit_id))
+    if revaloriser:
+        return appliquer_prix(conn, produit_id=produit_id, depuis=jour, tout_recalculer=True)
+    a_venir = max(jour, (aujourdhui + timedelta(days=1)).isoformat())
+    return (appliquer_prix(conn, produit_id=produit_id, depuis=a_venir, tout_recalculer=True)
+            + appliquer_prix(conn, produit_id=produit_id, depuis=jour))
+
+
+def appliquer_prix(conn: sqlite3.Connection, produit_id: Optional[int] = None, depuis: Optional[str] = None,
+                   tout_recalculer: bool = False, taille_lot: int = TAILLE_LOT) -> int:
+    """
+    Affecte à chaque vente le prix en vigueur à sa date (jointure "as-of").
+
+    L'historique des prix est chargé une fois ; les ventes sont lues par lots
+    d'ids, associées au dernier prix valide_depuis <= date par merge_asof, puis
+    écrites en une seule instruction UPDATE ... FROM par lot.
+
+    Args:
+        produit_id: Limite le calcul à un produit
+        depuis: Limite le calcul aux ventes à partir de cette date
+        tout_recalculer: Si False, seules les ventes sans prix sont traitées
+
+    Returns:
+        Nombre de ventes mises à jour
+    """
+    filtres, params = [], []
+    if not tout_recalculer:
+        filtres.append("prix_unitaire IS NULL")
+    if produit_id is not None:
+        filtres.append("produit_id = ?")
+        params.append(produit_id)
+    if depuis is not None:
+        filtres.append("date >= ?")
+        params.append(depuis)
+    where = " AND ".join(filtres) or "1"
+
+    prix = pd.read_sql(
+        "SELECT produit_id, valide_depuis, prix FROM prix_produits"
+        + (" WHERE produit_id = ?" if produit_id is not None else ""),
+        conn, params=[produit_id] if produit_id is not None else None
+    )
+    prix['valide_depuis'] = pd.to_datetime(prix['valide_depuis'].replace('0001-01-01', '1900-01-01'))
+    prix = prix.sort_values('valide_depuis')
+
+    bornes = conn.execute(f"SELECT MIN(id), MAX(id) FROM ventes WHERE {where}", params).fetchone()
+    if bornes[0] is None:
+        return 0
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS prix_calcules (id INTEGER PRIMARY KEY, prix REAL)")
+    total = 0
+    debut = time.perf_counter()
+    for borne in range(bornes[0], bornes[1] + 1, taille_lot):
+        ventes = pd.read_sql(
+            f"SELECT id, produit_id, date FROM ventes WHERE id >= ? AND id < ? AND {where}",
+            conn, params=[borne, borne + taille_lot, *params]
+        )
+        if ventes.empty:
+            continue
+        ventes['date'] = pd.to_datetime(ventes['date'], errors='coerce')
+        ventes = ventes.dropna(subset=['date']).sort_values('date')
+
+        associees = pd.merge_asof(
+            ventes, prix, left_on='date', right_on='valide_depuis', by='produit_id', direction='backward'
+        ).dropna(subset=['prix'])
+
+        with conn:
+            conn.execute("DELETE FROM prix_calcules")
+            conn.executemany(
+                "INSERT INTO prix_calcules VALUES (?, ?)",
+                zip(associees['id'].tolist(), associees['prix'].tolist())
+            )
+            conn.execute(
+                "UPDATE ventes SET prix_unitaire = c.prix FROM prix_calcules c WHERE ventes.id = c.id"
+            )
+        total += len(associees)
+        logger.info(f"{total:,} ventes valorisées ({total / (time.perf_counter() - debut):,.0f} ventes/s)")
+
+    conn.execute("DROP TABLE IF EXISTS temp.prix_calcules")
+    return total
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Historique des prix des produits")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    p = sous.add_parser("definir", help="Enregistre un nouveau prix")
+    p.add_argument("produit_id", type=int)
+    p.add_argument("prix", type=float)
+    p.add_argument("--depuis", default=None, help="Date d'effet (défaut: aujourd'hui)")
+    p.add_argument("--revaloriser", action="store_true",
+                   help="Réévalue aussi les ventes passées déjà valorisées depuis la date d'effet")
+
+    p = sous.add_parser("appliquer", help="Valorise les ventes au prix en vigueur à leur date")
+    p.add_argument("--tout", action="store_true", help="Recalcule aussi les ventes déjà valorisées")
+
+    args = parser.parse_args()
+    conn = connecter(DB_PATH)
+    try:
+        migrer_schema(conn)
+        if args.commande == "definir":
+            n = definir_prix(conn, args.produit_id, args.prix, args.depuis, args.revaloriser)
+        else:
+            n = appliquer_prix(conn, tout_recalculer=args.tout)
+        logger.info(f"{n:,} ventes valorisées")
+    except (sqlite3.Error, ValueError) as e:
+        logger.error(f"Erreur de tarification: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,120 @@
+# scripts/recherche.py
+"""Recherche instantanée des produits et clients par nom (index FTS5)"""
+import argparse
+import logging
+import re
+import sqlite3
+import sys
+import time
+from typing import List, Tuple
+
+from base_donnees import DB_PATH, connecter, migrer_schema, normaliser_nom, table_existe
+
+logger = logging.getLogger(__name__)
+
+TABLES = ('produits', 'clients')
+LIMITE = 20
+CANDIDATS = 10  # Correspondances lues par résultat affiché, avant tri par pertinence
+
+
+def requete_prefixe(texte: str) -> str:
+    """Expression MATCH où chaque mot saisi est un préfixe : "sou fil" -> "sou"* "fil"*"""
+    mots = re.findall(r"\w+", normaliser_nom(texte))
+    return " ".join(f'"{mot}"*' for mot in mots)
+
+
+def _meilleurs(candidats: List[Tuple[int, str]], texte: str, limite: int) -> List[Tuple[int, str]]:
+    """
+    Trie un lot borné de correspondances : nom commençant par la saisie,
+    puis noms les plus courts. Le classement bm25 de FTS5 imposerait de
+    noter toutes les correspondances, des dizaines de milliers pour une
+    saisie d'une ou deux lettres.
+    """
+    saisie = normaliser_nom(texte)
+    candidats.sort(key=lambda r: (not normaliser_nom(r[1]).startswith(saisie), len(r[1]), r[1]))
+    return candidats[:limite]
+
+
+def rechercher(conn: sqlite3.Connection, table: str, texte: str, limite: int = LIMITE) -> List[Tuple[int, str]]:
+    """
+    Meilleures correspondances (id, nom) pour une saisie partielle.
+
+    Les mots saisis sont d'abord cherchés comme débuts de mots, sans tenir
+    compte des accents ni de la casse ("tele" trouve "Téléphone"). Si cela
+    ne suffit pas à remplir la liste, les fragments d'au moins trois
+    caractères sont cherchés n'importe où dans le nom ("phone").
+    """
+    if table not in TABLES:
+        raise ValueError(f"Table non indexée: {table}")
+    expression = requete_prefixe(texte)
+    if not expression:
+        return []
+
+    index_mots = f"recherche_{table}_mots"
+    if not table_existe(conn, index_mots):
+        # Base sans FTS5 : parcours complet, acceptable sur de petits volumes
+        return conn.execute(
+            f"SELECT id, nom FROM {table} WHERE nom LIKE ? ORDER BY length(nom) LIMIT ?",
+            (f"%{texte.strip()}%", limite)
+        ).fetchall()
+
+    resultats = _meilleurs(conn.execute(
+        f"""SELECT i.rowid, t.nom FROM {index_mots} i JOIN {table} t ON t.id = i.rowid
+        WHERE {index_mots} MATCH ? LIMIT ?""",
+        (expression, limite * CANDIDATS)
+    ).fetchall(), texte, limite)
+
+    index_trigrammes = f"recherche_{table}_trigrammes"
+    fragment = texte.strip()
+    if len(resultats) < limite and len(fragment) >= 3 and table_existe(conn, index_trigrammes):
+        trouves = {id_ for id_, _ in resultats}
+        complement = _meilleurs(conn.execute(
+            f"""SELECT i.rowid, t.nom FROM {index_trigrammes} i JOIN {table} t ON t.id = i.rowid
+            WHERE {index_trigrammes} MATCH ? LIMIT ?""",
+            ('"' + fragment.replace('"', '""') + '"', limite * CANDIDATS)
+        ).fetchall(), texte, limite)
+        resultats += [r for r in complement if r[0] not in trouves][:limite - len(resultats)]
+    return resultats
+
+
+def reconstruire(conn: sqlite3.Connection) -> None:
+    """Reconstruit tous les index à partir des tables (après un import hors triggers)"""
+    with conn:
+        for table in TABLES:
+            for suffixe in ('mots', 'trigrammes'):
+                index = f"recherche_{table}_{suffixe}"
+                if table_existe(conn, index):
+                    conn.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+                    conn.execute(f"INSERT INTO {index} ({index}) VALUES ('optimize')")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Recherche de produits et clients")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    p = sous.add_parser("chercher", help="Affiche les meilleures correspondances")
+    p.add_argument("table", choices=TABLES)
+    p.add_argument("texte")
+    p.add_argument("--limite", type=int, default=LIMITE)
+
+    sous.add_parser("reconstruire", help="Reconstruit et compacte les index")
+
+    args = parser.parse_args()
+    conn = connecter(DB_PATH)
+    try:
+        migrer_schema(conn)
+        if args.commande == "chercher":
+            debut = time.perf_counter()
+            resultats = rechercher(conn, args.table, args.texte, args.limite)
+            for id_, nom in resultats:
+                print(f"{id_:>8}  {nom}")
+            logger.info(f"{len(resultats)} résultats en {(time.perf_counter() - debut) * 1000:.1f} ms")
+        else:
+            reconstruire(conn)
+            logger.info("Index de recherche reconstruits")
+    except (sqlite3.Error, ValueError) as e:
+        logger.error(f"Erreur de recherche: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,113 @@
+# scripts/referentiel.py
+"""Index mémoire des produits et clients pour la résolution des noms, et tickets des imports"""
+import json
+import logging
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+from base_donnees import normaliser_nom
+
+logger = logging.getLogger(__name__)
+
+
+class IndexNoms:
+    """Correspondance nom normalisé -> id, chargée une fois depuis la base"""
+
+    TABLES = {'produits', 'clients'}
+
+    def __init__(self, conn: sqlite3.Connection, table: str):
+        if table not in self.TABLES:
+            raise ValueError(f"Table non indexable: {table}")
+        self.conn = conn
+        self.table = table
+        self._ids: Dict[str, int] = {}
+        self.recharger()
+
+    def recharger(self) -> None:
+        """Relit la table complète (une seule requête)"""
+        self._ids = {
+            normaliser_nom(nom): id_
+            for id_, nom in self.conn.execute(f"SELECT id, nom FROM {self.table} ORDER BY id")
+        }
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def resoudre(self, nom: str) -> Optional[int]:
+        """Retourne l'id correspondant au nom, ou None"""
+        return self._ids.get(normaliser_nom(nom))
+
+    def resoudre_ou_creer(self, noms: Iterable[str],
+                          prix: Optional[Dict[str, float]] = None) -> Dict[str, int]:
+        """
+        Résout un lot de noms et crée en une seule requête ceux qui manquent.
+
+        Args:
+            noms: Noms tels qu'ils apparaissent dans la source
+            prix: Prix par nom source, requis pour créer des produits
+
+        Returns:
+            Dictionnaire nom source -> id
+        """
+        cles = {nom: normaliser_nom(nom) for nom in noms}
+        manquants = {}
+        for nom, cle in cles.items():
+            if cle not in self._ids:
+                manquants.setdefault(cle, nom)
+
+        if manquants:
+            if self.table == 'produits':
+                prix = {normaliser_nom(nom): p for nom, p in (prix or {}).items()}
+                lignes = [(nom.strip(), float(prix.get(cle) or 0.0)) for cle, nom in manquants.items()]
+                self.conn.executemany("INSERT INTO produits (nom, prix) VALUES (?, ?)", lignes)
+            else:
+                lignes = [(nom.strip(),) for nom in manquants.values()]
+                self.conn.executemany("INSERT INTO clients (nom) VALUES (?)", lignes)
+
+            # Les nouveaux ids sont les plus grands : une seule relecture suffit
+            nouveaux = self.conn.execute(
+                f"SELECT id, nom FROM {self.table} ORDER BY id DESC LIMIT ?", (len(lignes),)
+            )
+            for id_, nom in nouveaux:
+                self._ids[normaliser_nom(nom)] = id_
+            logger.info(f"{len(lignes)} {self.table} créé(s)")
+
+        return {nom: self._ids[cle] for nom, cle in cles.items()}
+
+
+@contextmanager
+def transaction_referentiel(conn: sqlite3.Connection, *index: IndexNoms) -> Iterator[sqlite3.Connection]:
+    """
+    Transaction (`with conn`) dont l'annulation s'étend aux index fournis.
+
+    Les noms créés par resoudre_ou_creer entrent dans le cache avant la
+    validation : si la transaction est annulée, le cache désignerait des ids
+    qui n'existent plus (ou qu'une autre ligne reprendra). Sur erreur, les
+    index sont relus depuis la base une fois l'annulation faite.
+    """
+    try:
+        with conn:
+            yield conn
+    except BaseException:
+        for idx in index:
+            idx.recharger()
+        raise
+
+
+def resoudre_tickets(conn: sqlite3.Connection, cles: Iterable[int]) -> Dict[int, int]:
+    """
+    Id du ticket de chaque clé d'import (numéro de ticket d'un export,
+    empreinte d'une facture), en créant les tickets manquants : réimporter
+    la même source retrouve les mêmes tickets.
+
+    Returns:
+        Dictionnaire clé -> id de ticket
+    """
+    cles = list(dict.fromkeys(int(c) for c in cles))
+    if not cles:
+        return {}
+    conn.executemany("INSERT OR IGNORE INTO tickets (cle_import) VALUES (?)", ((c,) for c in cles))
+    return dict(conn.execute(
+        "SELECT cle_import, id FROM tickets WHERE cle_import IN (SELECT value FROM json_each(?))", (json.dumps(cles),)
+    ))
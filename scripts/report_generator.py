@@ -15,6 +15,8 @@ from reportlab.platypus import (
 from reportlab.lib.units import inch
 from reportlab.lib.enums import TA_CENTER
 
+from devises import DEVISE_RAPPORT, symbole
+
 @classmethod
 def generate_sales_report(
     cls,
@@ -56,8 +58,9 @@ class ReportGenerator:
         }
     }
 
-    def __init__(self):
+    def __init__(self, devise: str = DEVISE_RAPPORT):
         self._styles = self._initialize_styles()
+        self._libelle = symbole(devise)
 
     @staticmethod
     def _initialize_styles() -> dict:
@@ -103,7 +106,7 @@ class ReportGenerator:
 
     def _validate_data(self, df: pd.DataFrame) -> None:
         """Valide la structure des données"""
-        required_columns = {'produit', 'quantite', 'ca_cfa'}
+        required_columns = {'produit', 'quantite', 'ca_devise'}
         if not required_columns.issubset(df.columns):
             missing = required_columns - set(df.columns)
             raise ValueError(f"Colonnes requises manquantes: {missing}")
@@ -148,13 +151,13 @@ class ReportGenerator:
 
     def _create_summary_table(self, df: pd.DataFrame) -> List[Table]:
         """Crée le tableau de synthèse"""
-        total_ca = df['ca_cfa'].sum()
+        total_ca = df['ca_devise'].sum()
         avg_basket = total_ca / df['quantite'].sum()
 
         data = [
             ["Indicateur", "Valeur"],
-            ["CA Total", f"{total_ca:,.2f} FCFA"],
-            ["Panier Moyen", f"{avg_basket:,.2f} FCFA"],
+            ["CA Total", f"{total_ca:,.2f} {self._libelle}"],
+            ["Panier Moyen", f"{avg_basket:,.2f} {self._libelle}"],
             ["Produit le Plus Vendu", df['produit'].mode()[0]]
         ]
 
@@ -175,7 +178,7 @@ class ReportGenerator:
         """Crée le tableau détaillé"""
         summary = df.groupby('produit').agg({
             'quantite': ['sum', 'mean'],
-            'ca_cfa': 'sum'
+            'ca_devise': 'sum'
         }).reset_index()
 
         summary.columns = ['Produit', 'Quantité Totale', 'Moyenne', 'CA Total']
@@ -202,12 +205,12 @@ class ReportGenerator:
             plt.style.use('ggplot')
             fig, ax = plt.subplots(figsize=(10, 6))
 
-            sales = df.groupby('produit')['ca_cfa'].sum().sort_values()
+            sales = df.groupby('produit')['ca_devise'].sum().sort_values()
             bars = ax.barh(sales.index.astype(str), sales.values, color='#4e79a7')
 
-            ax.bar_label(bars, fmt='%.0f FCFA', padding=5)
+            ax.bar_label(bars, fmt=f'%.0f {self._libelle}', padding=5)
             ax.set_title("Répartition du CA par Produit", pad=20)
-            ax.set_xlabel("Chiffre d'Affaires (FCFA)")
+            ax.set_xlabel(f"Chiffre d'Affaires ({self._libelle})")
 
             plt.tight_layout()
 
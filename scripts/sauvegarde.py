@@ -0,0 +1,365 @@
+# scripts/sauvegarde.py
+"""Sauvegardes à chaud de la base des ventes : copie par étapes, instantanés compressés et vérifiés"""
+import argparse
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import stat
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Union
+
+from archives import DOSSIER_ARCHIVES, chemin_archive
+from base_donnees import DB_PATH, connecter, dossier_base, migrer_schema, table_existe
+
+logger = logging.getLogger(__name__)
+
+DOSSIER_SAUVEGARDES = Path(DB_PATH).parent / "sauvegardes"
+PAGES_PAR_ETAPE = 1024  # 4 Mo par étape avec des pages de 4 Ko : verrou de lecture bref
+PAUSE_ETAPE = 0.005  # Secondes laissées aux autres connexions entre deux étapes
+REDEMARRAGES_MAX = 3  # Au-delà, copie en une étape (instantané de lecture, n'arrête pas les écrivains en WAL)
+NIVEAU_GZIP = 3  # Compression rapide : l'essentiel du gain est acquis dès les premiers niveaux
+TAILLE_BLOC = 1 << 20
+
+
+class _CopieInstable(Exception):
+    """La base source change plus vite que la copie par étapes n'avance"""
+
+
+def sauvegarder(conn: sqlite3.Connection, destination: Union[str, Path], pages_par_etape: int = PAGES_PAR_ETAPE,
+                pause: float = PAUSE_ETAPE) -> Dict[str, float]:
+    """
+    Copie la base de `conn` dans `destination` avec l'API de sauvegarde en
+    ligne de SQLite, `pages_par_etape` pages à la fois : chaque étape ne
+    tient qu'un verrou de lecture bref, et le dashboard comme les caisses
+    continuent de lire et d'écrire pendant la copie.
+
+    Une écriture par une autre connexion fait recommencer la copie depuis
+    le début ; après REDEMARRAGES_MAX reprises, elle se termine en une
+    seule étape (une transaction de lecture, qui ne bloque pas les
+    écrivains en mode WAL).
+
+    Returns:
+        Statistiques : octets, duree_s, etapes, redemarrages
+    """
+    debut = time.perf_counter()
+    etat = {'etapes': 0, 'redemarrages': 0, 'restant': None}
+
+    def progression(statut, restant, total):
+        if etat['restant'] is not None and restant > etat['restant']:
+            etat['redemarrages'] += 1
+            if etat['redemarrages'] > REDEMARRAGES_MAX:
+                raise _CopieInstable()
+        etat['restant'] = restant
+        etat['etapes'] += 1
+        if pause and restant:
+            time.sleep(pause)
+
+    copie = sqlite3.connect(destination)
+    try:
+        try:
+            conn.backup(copie, pages=pages_par_etape, progress=progression)
+        except _CopieInstable:
+            logger.warning(f"Base modifiée pendant la copie ({etat['redemarrages']} reprises) : copie en une étape")
+            conn.backup(copie)
+        copie.execute("PRAGMA journal_mode=DELETE")  # Copie autonome, sans fichiers -wal/-shm
+    finally:
+        copie.close()
+    return {'octets': Path(destination).stat().st_size, 'duree_s': time.perf_counter() - debut,
+            'etapes': etat['etapes'], 'redemarrages': etat['redemarrages']}
+
+
+def _empreinte(chemin: Path) -> str:
+    sha = hashlib.sha256()
+    with open(chemin, 'rb') as f:
+        for bloc in iter(lambda: f.read(TAILLE_BLOC), b''):
+            sha.update(bloc)
+    return sha.hexdigest()
+
+
+def _controler(chemin: Path) -> None:
+    """Contrôle d'intégrité rapide d'une copie (structure des pages et des index)"""
+    copie = sqlite3.connect(chemin)
+    try:
+        resultat = copie.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        copie.close()
+    if resultat != 'ok':
+        raise ValueError(f"Copie corrompue ({chemin.name}): {resultat}")
+
+
+def _compresser(source: Path, cible: Path, niveau: int) -> None:
+    with open(source, 'rb') as entree, gzip.open(cible, 'wb', compresslevel=niveau) as sortie:
+        shutil.copyfileobj(entree, sortie, TAILLE_BLOC)
+
+
+def _decompresser(source: Path, cible: Path) -> None:
+    with gzip.open(source, 'rb') as entree, open(cible, 'wb') as sortie:
+        shutil.copyfileobj(entree, sortie, TAILLE_BLOC)
+
+
+def _archives_enregistrees(chemin: Path) -> List[str]:
+    """Chemins d'archive (tels qu'enregistrés) référencés par une copie de la base"""
+    copie = sqlite3.connect(chemin)
+    try:
+        if not table_existe(copie, 'archives_ventes'):
+            return []
+        return [c for (c,) in copie.execute("SELECT DISTINCT chemin FROM archives_ventes ORDER BY 1")]
+    finally:
+        copie.close()
+
+
+def instantane(conn: sqlite3.Connection, dossier: Path = DOSSIER_SAUVEGARDES,
+               niveau: int = NIVEAU_GZIP) -> Path:
+    """
+    Instantané compressé de la base : copie par étapes, contrôle
+    d'intégrité, compression gzip et empreinte SHA-256 dans un fichier
+    voisin au format de `sha256sum` (vérifiable aussi hors de ce script).
+
+    Les bases d'archive que référence la copie (voir archives.py) sont
+    compressées dans le dossier `<instantané>.archives` et leurs empreintes
+    ajoutées au même fichier. Le nom porte la date à la microseconde.
+    """
+    dossier.mkdir(parents=True, exist_ok=True)
+    nom = f"{Path(DB_PATH).stem}_{datetime.now():%Y%m%d-%H%M%S-%f}"
+    copie = dossier / f".{nom}.db"
+    archive = dossier / f"{nom}.db.gz"
+    dossier_archives = dossier / f"{nom}.archives"
+    fichiers = [archive]
+    try:
+        stats = sauvegarder(conn, copie)
+        _controler(copie)
+        debut = time.perf_counter()
+        _compresser(copie, archive, niveau)
+        duree_compression = time.perf_counter() - debut
+        # Bases d'archive figées (jamais modifiées) : copiées telles quelles
+        sources = [chemin_archive(conn, c) for c in _archives_enregistrees(copie)]
+        if len({s.name for s in sources}) != len(sources):
+            raise ValueError("Bases d'archive homonymes dans des dossiers différents : "
+                             "instantané impossible")
+        if sources:
+            dossier_archives.mkdir()
+        for source in sources:
+            fichiers.append(dossier_archives / f"{source.name}.gz")
+            _compresser(source, fichiers[-1], niveau)
+    except BaseException:
+        archive.unlink(missing_ok=True)
+        shutil.rmtree(dossier_archives, ignore_errors=True)
+        raise
+    finally:
+        copie.unlink(missing_ok=True)
+    archive.with_name(archive.name + '.sha256').write_text("".join(
+        f"{_empreinte(f)}  {f.relative_to(dossier).as_posix()}\n" for f in fichiers
+    ))
+    logger.info(f"Instantané {archive.name}: {stats['octets'] / 1e6:.1f} Mo copiés en {stats['duree_s']:.2f} s "
+                f"({stats['etapes']} étapes), compressés en {duree_compression:.2f} s "
+                f"à {archive.stat().st_size / 1e6:.1f} Mo, {len(fichiers) - 1} base(s) d'archive")
+    return archive
+
+
+def _empreintes(archive: Path) -> Dict[Path, str]:
+    """Fichiers d'un instantané (base puis archives) et leur empreinte enregistrée"""
+    empreinte_fichier = archive.with_name(archive.name + '.sha256')
+    if not empreinte_fichier.exists():
+        raise ValueError(f"Empreinte introuvable: {empreinte_fichier.name}")
+    empreintes = {}
+    for ligne in empreinte_fichier.read_text().splitlines():
+        if ligne.strip():
+            empreinte, nom = ligne.split(maxsplit=1)
+            empreintes[archive.parent / nom.strip()] = empreinte
+    return empreintes
+
+
+def verifier(archive: Union[str, Path]) -> None:
+    """
+    Compare l'empreinte d'un instantané et de ses bases d'archive à celles
+    enregistrées ; ValueError si l'une diffère ou manque
+    """
+    archive = Path(archive)
+    for fichier, attendue in _empreintes(archive).items():
+        if not fichier.exists():
+            raise ValueError(f"Fichier de l'instantané introuvable: {fichier.name}")
+        if _empreinte(fichier) != attendue:
+            raise ValueError(f"Empreinte invalide pour {fichier.name} : fichier altéré ou incomplet")
+
+
+def restaurer(archive: Union[str, Path], conn: sqlite3.Connection) -> float:
+    """
+    Remplace le contenu de la base de `conn` par un instantané vérifié.
+
+    L'instantané est décompressé à côté puis recopié par l'API de
+    sauvegarde en une seule étape : les autres connexions ouvertes voient
+    directement la base restaurée, sans fichier remplacé sous leurs pieds.
+
+    Ses bases d'archive sont d'abord remises dans le dossier `archives`
+    voisin de la base (un fichier identique déjà en place est gardé, un
+    fichier différent remplacé par renommage), et la copie est
+    réenregistrée à ces emplacements avant d'être recopiée : la base
+    restaurée ne référence jamais une archive absente.
+    Retourne la durée en secondes.
+    """
+    debut = time.perf_counter()
+    archive = Path(archive)
+    verifier(archive)
+    cible_archives = dossier_base(conn) / DOSSIER_ARCHIVES.name
+    with tempfile.TemporaryDirectory(dir=archive.parent) as dossier:
+        copie = Path(dossier) / archive.stem
+        _decompresser(archive, copie)
+        _controler(copie)
+
+        emplacements = {}
+        for fichier in list(_empreintes(archive))[1:]:
+            cible = cible_archives / fichier.stem
+            temporaire = Path(dossier) / fichier.stem
+            _decompresser(fichier, temporaire)
+            _controler(temporaire)
+            if not cible.exists() or _empreinte(cible) != _empreinte(temporaire):
+                cible_archives.mkdir(parents=True, exist_ok=True)
+                os.chmod(temporaire, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                provisoire = cible.with_name(f".{cible.name}")
+                provisoire.unlink(missing_ok=True)
+                shutil.move(temporaire, provisoire)
+                os.replace(provisoire, cible)
+            emplacements[fichier.stem] = f"{DOSSIER_ARCHIVES.name}/{fichier.stem}"
+
+        source = sqlite3.connect(copie)
+        try:
+            if emplacements:
+                with source:
+                    source.executemany("UPDATE archives_ventes SET chemin = ? WHERE chemin = ?", [
+                        (emplacements[Path(c).name], c) for c in _archives_enregistrees(copie)
+                    ])
+            source.backup(conn)
+        finally:
+            source.close()
+    return time.perf_counter() - debut
+
+
+def instantanes(dossier: Path = DOSSIER_SAUVEGARDES) -> List[Path]:
+    """Instantanés du dossier, du plus ancien au plus récent"""
+    return sorted(dossier.glob("*.db.gz"))
+
+
+def elaguer(garder: int, dossier: Path = DOSSIER_SAUVEGARDES) -> List[Path]:
+    """Supprime les instantanés au-delà des `garder` plus récents ; retourne les fichiers supprimés"""
+    supprimes = instantanes(dossier)[:-garder] if garder > 0 else []
+    for archive in supprimes:
+        archive.unlink()
+        archive.with_name(archive.name + '.sha256').unlink(missing_ok=True)
+        shutil.rmtree(archive.with_name(archive.name[:-len('.db.gz')] + '.archives'), ignore_errors=True)
+    return supprimes
+
+
+def _latences(chemin: Path, arret: threading.Event, mesures: list) -> None:
+    """Totaux des 20 000 dernières ventes en boucle sur sa propre connexion, durées en millisecondes"""
+    lecteur = connecter(chemin, lecture_seule=True)
+    try:
+        while not arret.is_set():
+            debut = time.perf_counter()
+            lecteur.execute(
+                """SELECT COUNT(*), SUM(prix_unitaire * quantite)
+                FROM (SELECT prix_unitaire, quantite FROM ventes ORDER BY date DESC LIMIT 20000)"""
+            ).fetchall()
+            mesures.append((time.perf_counter() - debut) * 1000)
+    finally:
+        lecteur.close()
+
+
+def banc(conn: sqlite3.Connection, pages_par_etape: int = PAGES_PAR_ETAPE, pause: float = PAUSE_ETAPE,
+         duree_reference: float = 3.0) -> List[str]:
+    """Débit de la copie, effet sur la latence d'un lecteur concurrent, compression et restauration"""
+    chemin = Path(conn.execute("PRAGMA database_list").fetchone()[2])
+    lignes = []
+    with tempfile.TemporaryDirectory() as dossier:
+        dossier = Path(dossier)
+        for libelle, copier in (
+            ("sans sauvegarde", lambda: time.sleep(duree_reference)),
+            (f"copie par {pages_par_etape} pages",
+             lambda: sauvegarder(conn, dossier / "etapes.db", pages_par_etape, pause)),
+            ("copie en une étape", lambda: sauvegarder(conn, dossier / "bloc.db", -1, 0)),
+        ):
+            mesures, arret = [], threading.Event()
+            lecteur = threading.Thread(target=_latences, args=(chemin, arret, mesures))
+            lecteur.start()
+            time.sleep(0.2)
+            mesures.clear()  # Sans l'ouverture de la connexion ni le premier remplissage du cache
+            stats = copier()
+            arret.set()
+            lecteur.join()
+            centiles = statistics.quantiles(mesures, n=100, method='inclusive') if len(mesures) > 1 else [float('nan')] * 99
+            debit = f", {stats['octets'] / 1e6 / stats['duree_s']:.0f} Mo/s en {stats['duree_s']:.2f} s" \
+                if stats else ""
+            lignes.append(f"{libelle:>22}: lecteur p50 {centiles[49]:.1f} ms, p95 {centiles[94]:.1f} ms, "
+                          f"max {max(mesures, default=float('nan')):.1f} ms ({len(mesures)} requêtes){debit}")
+
+        archive = instantane(conn, dossier)
+        taille = (dossier / "bloc.db").stat().st_size
+        lignes.append(f"{'instantané':>22}: {taille / 1e6:.1f} Mo -> {archive.stat().st_size / 1e6:.1f} Mo")
+        cible = connecter(dossier / "restauree.db")
+        try:
+            lignes.append(f"{'restauration':>22}: {restaurer(archive, cible):.2f} s")
+        finally:
+            cible.close()
+    return lignes
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Sauvegardes à chaud de la base des ventes")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    p = sous.add_parser("sauvegarder", help="Copie la base vers un fichier SQLite, sans l'arrêter")
+    p.add_argument("destination")
+    p.add_argument("--pages", type=int, default=PAGES_PAR_ETAPE, help="Pages par étape (-1 : une seule étape)")
+    p.add_argument("--pause", type=float, default=PAUSE_ETAPE)
+
+    p = sous.add_parser("instantane", help="Instantané compressé et vérifié dans le dossier des sauvegardes")
+    p.add_argument("--garder", type=int, default=0, help="Ne conserver que les N plus récents (0 : tous)")
+
+    sous.add_parser("liste", help="Instantanés disponibles")
+
+    p = sous.add_parser("verifier", help="Vérifie l'empreinte d'un instantané")
+    p.add_argument("archive")
+
+    p = sous.add_parser("restaurer", help="Remplace la base par un instantané vérifié")
+    p.add_argument("archive")
+
+    p = sous.add_parser("banc", help="Mesure débit et effet sur un lecteur concurrent")
+    p.add_argument("--pages", type=int, default=PAGES_PAR_ETAPE)
+    p.add_argument("--pause", type=float, default=PAUSE_ETAPE)
+
+    args = parser.parse_args()
+    conn = connecter(DB_PATH)
+    try:
+        migrer_schema(conn)
+        if args.commande == "sauvegarder":
+            stats = sauvegarder(conn, args.destination, args.pages, args.pause)
+            logger.info(f"{stats['octets'] / 1e6:.1f} Mo copiés en {stats['duree_s']:.2f} s "
+                        f"({stats['etapes']} étapes, {stats['redemarrages']} reprises)")
+        elif args.commande == "instantane":
+            instantane(conn)
+            for archive in elaguer(args.garder):
+                logger.info(f"Instantané supprimé: {archive.name}")
+        elif args.commande == "liste":
+            for archive in instantanes():
+                print(f"{archive.name}  {archive.stat().st_size / 1e6:.1f} Mo")
+        elif args.commande == "verifier":
+            verifier(args.archive)
+            logger.info(f"{Path(args.archive).name}: empreinte valide")
+        elif args.commande == "restaurer":
+            logger.info(f"Base restaurée en {restaurer(args.archive, conn):.2f} s")
+        else:
+            print("\n".join(banc(conn, args.pages, args.pause)))
+    except (sqlite3.Error, ValueError, OSError) as e:
+        logger.error(f"Erreur de sauvegarde: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
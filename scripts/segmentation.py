@@ -0,0 +1,293 @@
+# scripts/segmentation.py
+"""Segmentation RFM des clients (récence, fréquence, montant), actualisée pour les seuls clients touchés"""
+import argparse
+import logging
+import secrets
+import sqlite3
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from archives import historique_complet
+from base_donnees import DB_PATH, connecter, migrer_schema, transaction_immediate
+from colonnaire import DOSSIER_COLONNES, GARDER, ecrire, elaguer, nom_instantane, partager
+from devises import DEVISE_BASE, DEVISE_RAPPORT, Convertisseur
+from palmares import facteur_periode
+
+logger = logging.getLogger(__name__)
+
+DOSSIER_RFM = DOSSIER_COLONNES / "rfm"  # Copies colonnaires de rfm_clients, une par version
+CLASSES = 5  # Scores de 1 à 5 : quintiles de la population
+SEGMENTS = ['Champions', 'Fidèles', 'Fidèles potentiels', 'Nouveaux', 'Prometteurs', 'À surveiller',
+            'À réveiller', 'À risque', 'À ne pas perdre', 'En sommeil']
+# Segment (indice dans SEGMENTS) selon les scores de récence (lignes, R = 1 à 5) et de fréquence (colonnes)
+GRILLE = np.array([
+    [9, 9, 7, 7, 8],  # R = 1 : en sommeil, à risque, à ne pas perdre
+    [9, 9, 7, 7, 8],
+    [6, 6, 5, 1, 1],  # R = 3 : à réveiller, à surveiller, fidèles
+    [4, 2, 2, 1, 1],  # R = 4 : prometteurs, fidèles potentiels, fidèles
+    [3, 2, 2, 0, 0],  # R = 5 : nouveaux, fidèles potentiels, champions
+], dtype=np.int8)
+AGREGATS = ['premier_achat', 'dernier_achat', 'frequence', 'montant']
+SCORES = ['r', 'f', 'm', 'segment']
+
+
+def _en_jours(agregats: pd.DataFrame) -> pd.DataFrame:
+    """Dates d'achat (texte AAAA-MM-JJ) en dates numpy : comparaisons et écarts vectorisés"""
+    return agregats.astype({c: 'datetime64[s]' for c in ('premier_achat', 'dernier_achat')})
+
+
+def _agreger(conn: sqlite3.Connection, tous: bool) -> pd.DataFrame:
+    """
+    Agrégats par client en un passage groupé sur les ventes : tous les
+    clients, ou ceux de rfm_a_recalculer (lus sur l'index des clients)
+    """
+    condition = "" if tous else "AND client_id IN (SELECT client_id FROM rfm_a_recalculer)"
+    return _en_jours(pd.read_sql(
+        f"""SELECT client_id, substr(MIN(date), 1, 10) AS premier_achat, substr(MAX(date), 1, 10) AS dernier_achat,
+            COUNT(*) AS frequence, SUM(prix_unitaire * quantite) AS montant
+        FROM ventes WHERE client_id IS NOT NULL {condition} GROUP BY client_id""",
+        conn
+    )).set_index('client_id')
+
+
+def _lire_enregistres(conn: sqlite3.Connection) -> pd.DataFrame:
+    """Table rfm_clients complète, au format des copies colonnaires (une ligne par client)"""
+    enregistres = _en_jours(pd.read_sql(f"SELECT client_id, {', '.join(AGREGATS + SCORES)} FROM rfm_clients", conn))
+    return enregistres.assign(segment=pd.Categorical(enregistres['segment'], categories=SEGMENTS))
+
+
+def _enregistres(conn: sqlite3.Connection) -> pd.DataFrame:
+    """
+    Agrégats et scores enregistrés, projetés depuis la copie colonnaire de
+    la version courante : relire des millions de lignes depuis SQLite prend
+    plus de temps que tout le reste du calcul. La copie est reconstruite
+    depuis la table si elle manque.
+    """
+    version = conn.execute("SELECT jeton FROM rfm_version").fetchone()
+    if version is None:
+        return _lire_enregistres(conn).set_index('client_id')
+    return partager(('rfm', version[0]), lambda: _lire_enregistres(conn), DOSSIER_RFM).set_index('client_id')
+
+
+def _agregats_a_jour(conn: sqlite3.Connection) -> Tuple[pd.DataFrame, List[int]]:
+    """
+    Agrégats enregistrés (avec leurs derniers scores), ceux des clients
+    touchés depuis remplacés par un recalcul ; et la liste de ces clients.
+
+    Les ventes archivées font partie de l'historique d'un client : elles
+    sont lues aussi (archives.historique_complet).
+    """
+    touches = [c for (c,) in conn.execute("SELECT client_id FROM rfm_a_recalculer")]
+    enregistres = _enregistres(conn)
+    if not touches:
+        return enregistres, touches
+
+    # Plus de la moitié des clients touchés (première segmentation) : un seul passage sur toutes les ventes
+    tous = len(touches) * 2 >= len(enregistres)
+    with historique_complet(conn):
+        recalcules = _agreger(conn, tous=tous)
+    if tous:
+        # Le passage complet couvre déjà les clients non touchés : les ajouter les dupliquerait
+        return recalcules, touches
+    conserves = enregistres[~enregistres.index.isin(touches)]
+    if conserves.empty:
+        return recalcules, touches
+    if recalcules.empty:
+        # Clients touchés sans plus aucune vente : leur cadre vide, non typé, convertirait les autres
+        return conserves, touches
+    return pd.concat([conserves, recalcules]).sort_index(), touches
+
+
+def _quantiles(valeurs: pd.Series) -> np.ndarray:
+    """Score de 1 à CLASSES selon le rang centile moyen, vectorisé ; des valeurs égales ont le même score"""
+    brutes = valeurs.to_numpy()
+    if brutes.dtype.kind in 'iu' and len(brutes) and np.ptp(brutes) <= 4 * len(brutes):
+        # Entiers peu dispersés (jours, nombres d'achats) : rangs par comptage, sans tri
+        decalees = brutes - brutes.min()
+        effectifs = np.bincount(decalees)
+        rangs = (np.cumsum(effectifs) - (effectifs - 1) / 2)[decalees] / len(brutes)
+    else:
+        rangs = valeurs.rank(method='average', pct=True).to_numpy()
+    return np.ceil(rangs * CLASSES).clip(1, CLASSES).astype(np.int8)
+
+
+def scorer(agregats: pd.DataFrame, reference: Optional[str] = None) -> pd.DataFrame:
+    """
+    Scores R, F et M (1 à CLASSES, CLASSES = meilleur) et segment de chaque
+    client, par classement de toute la population en une opération par
+    mesure. La récence est comptée en jours jusqu'à `reference` (dernier
+    achat de la population par défaut) : les scores, relatifs, ne changent
+    pas quand elle avance pour tous.
+
+    Returns:
+        `agregats` avec recence, r, f, m et segment (catégorie de SEGMENTS)
+    """
+    scores = agregats[AGREGATS].copy()
+    dernier = scores['dernier_achat'].to_numpy().astype('datetime64[D]')
+    reference = np.datetime64(reference, 'D') if reference else dernier.max(initial=np.datetime64(0, 'D'))
+    scores['recence'] = (reference - dernier).astype(np.int64)
+    if scores.empty:
+        return scores.assign(r=np.int8(0), f=np.int8(0), m=np.int8(0),
+                             segment=pd.Categorical([], categories=SEGMENTS))
+    scores['r'] = _quantiles(-scores['recence'])
+    scores['f'] = _quantiles(scores['frequence'])
+    scores['m'] = _quantiles(scores['montant'])
+    scores['segment'] = pd.Categorical.from_codes(
+        GRILLE[scores['r'].to_numpy() - 1, scores['f'].to_numpy() - 1], categories=SEGMENTS)
+    return scores
+
+
+def calculer(conn: sqlite3.Connection, reference: Optional[str] = None) -> pd.DataFrame:
+    """
+    Segmentation à jour sans rien écrire dans la base (connexion en lecture
+    seule possible) : agrégats enregistrés, clients touchés recalculés à la volée
+    """
+    agregats, _ = _agregats_a_jour(conn)
+    return scorer(agregats, reference)
+
+
+def actualiser(conn: sqlite3.Connection) -> int:
+    """
+    Recalcule les agrégats des clients touchés depuis la dernière
+    exécution, reclasse toute la population et enregistre les lignes qui
+    ont changé (clients touchés, scores déplacés par le reclassement) ;
+    retourne le nombre de clients touchés traités.
+
+    Une nouvelle version de rfm_version est enregistrée avec les lignes,
+    et la copie colonnaire correspondante écrite pour les lectures suivantes.
+
+    Clients touchés et ventes sont lus sous le verrou d'écriture (archives
+    attachées avant, hors transaction) : une vente validée entre la lecture
+    et l'effacement des marqueurs laisserait son client à un score périmé.
+    """
+    if not conn.execute("SELECT 1 FROM rfm_a_recalculer LIMIT 1").fetchone():
+        return 0
+    with historique_complet(conn), transaction_immediate(conn):
+        enregistres, touches = _agregats_a_jour(conn)
+        scores = scorer(enregistres)
+        anciens = enregistres.reindex(index=scores.index, columns=SCORES)
+        modifies = scores.index.isin(touches)
+        for colonne in SCORES:
+            modifies |= (scores[colonne] != anciens[colonne]).to_numpy()
+
+        a_ecrire = scores[modifies]
+        version = secrets.token_hex(8)
+        conn.executemany("DELETE FROM rfm_clients WHERE client_id = ?", [(c,) for c in touches])
+        conn.executemany(
+            """INSERT OR REPLACE INTO rfm_clients (client_id, premier_achat, dernier_achat, frequence, montant,
+                r, f, m, segment) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            zip(a_ecrire.index.astype(int).tolist(), a_ecrire['premier_achat'].dt.strftime('%Y-%m-%d'),
+                a_ecrire['dernier_achat'].dt.strftime('%Y-%m-%d'), a_ecrire['frequence'].astype(int).tolist(),
+                a_ecrire['montant'].tolist(), a_ecrire['r'].tolist(), a_ecrire['f'].tolist(), a_ecrire['m'].tolist(),
+                a_ecrire['segment'].astype(str))
+        )
+        conn.executemany("DELETE FROM rfm_a_recalculer WHERE client_id = ?", [(c,) for c in touches])
+        conn.execute("DELETE FROM rfm_version")
+        conn.execute("INSERT INTO rfm_version VALUES (?)", (version,))
+    logger.info(f"Segmentation: {len(touches):,} clients touchés, {len(a_ecrire):,} lignes écrites")
+
+    try:
+        copie = scores[AGREGATS + SCORES].rename_axis('client_id').reset_index()
+        if not copie.empty:
+            ecrire(copie, DOSSIER_RFM / nom_instantane('rfm', version))
+            elaguer(GARDER, DOSSIER_RFM)
+    except OSError as e:
+        logger.warning(f"Copie colonnaire de la segmentation non écrite (relue depuis la base): {e}")
+    return len(touches)
+
+
+def resumer(scores: pd.DataFrame, conn: Optional[sqlite3.Connection] = None, devise: str = DEVISE_BASE,
+            convertisseur: Optional[Convertisseur] = None) -> pd.DataFrame:
+    """
+    Taille et profil moyen de chaque segment (ordre de SEGMENTS). Les
+    montants sont convertis au taux moyen de la période des achats.
+
+    Returns:
+        DataFrame segment, clients, part, recence, frequence, montant_moyen, montant
+    """
+    resume = scores.groupby('segment').agg(
+        clients=('r', 'size'), recence=('recence', 'mean'), frequence=('frequence', 'mean'),
+        montant_moyen=('montant', 'mean'), montant=('montant', 'sum')
+    ).reindex(SEGMENTS).dropna(subset=['clients'])
+    resume['clients'] = resume['clients'].astype(int)
+    resume['part'] = resume['clients'] / resume['clients'].sum()
+    if devise != DEVISE_BASE and not scores.empty:
+        convertisseur = convertisseur or Convertisseur(conn)
+        facteur = facteur_periode(convertisseur, devise, scores['premier_achat'].min(), scores['dernier_achat'].max())
+        resume[['montant_moyen', 'montant']] *= facteur
+    return resume.rename_axis('segment').reset_index()[
+        ['segment', 'clients', 'part', 'recence', 'frequence', 'montant_moyen', 'montant']]
+
+
+def _banc(clients: int) -> List[str]:
+    """Segmentation vectorisée de `clients` clients synthétiques, face à une boucle par client (extrapolée)"""
+    generateur = np.random.default_rng(0)
+    derniers = pd.Timestamp('2021-01-01') + pd.to_timedelta(generateur.integers(0, 1095, clients), unit='D')
+    agregats = pd.DataFrame({
+        'premier_achat': '2021-01-01',
+        'dernier_achat': derniers.strftime('%Y-%m-%d'),
+        'frequence': generateur.geometric(0.2, clients),
+        'montant': generateur.lognormal(7, 1.5, clients),
+    }, index=pd.RangeIndex(clients, name='client_id'))
+
+    debut = time.perf_counter()
+    scores = scorer(agregats)
+    vectorise = time.perf_counter() - debut
+
+    # Boucle par client : rang de chacune de ses mesures dans les valeurs triées de la population
+    tries = [np.sort(-scores['recence'].to_numpy()), np.sort(scores['frequence'].to_numpy()),
+             np.sort(scores['montant'].to_numpy())]
+    echantillon = min(clients, 20_000)
+    debut = time.perf_counter()
+    for ligne in scores.head(echantillon).itertuples():
+        notes = []
+        for valeurs, valeur in zip(tries, (-ligne.recence, ligne.frequence, ligne.montant)):
+            rang = (np.searchsorted(valeurs, valeur, 'left') + np.searchsorted(valeurs, valeur, 'right') + 1) / 2
+            notes.append(min(max(int(np.ceil(rang / clients * CLASSES)), 1), CLASSES))
+        GRILLE[notes[0] - 1, notes[1] - 1]
+    boucle = (time.perf_counter() - debut) * clients / echantillon
+
+    return [f"{clients:,} clients: vectorisé {vectorise:.2f} s, boucle par client ~{boucle:.0f} s "
+            f"(extrapolée de {echantillon:,} clients)",
+            scores['segment'].value_counts().to_string()]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Segmentation RFM des clients")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    sous.add_parser("actualiser", help="Recalcule les clients touchés et enregistre les segments")
+
+    p = sous.add_parser("resume", help="Taille et profil des segments")
+    p.add_argument("--devise", default=DEVISE_RAPPORT)
+
+    p = sous.add_parser("banc", help="Scoring vectorisé de clients synthétiques, face à une boucle par client")
+    p.add_argument("--clients", type=int, default=5_000_000)
+
+    args = parser.parse_args()
+    try:
+        if args.commande == "banc":
+            print("\n".join(_banc(args.clients)))
+            sys.exit(0)
+        conn = connecter(DB_PATH)
+        try:
+            migrer_schema(conn)
+            debut = time.perf_counter()
+            if args.commande == "actualiser":
+                logger.info(f"{actualiser(conn):,} clients recalculés")
+            else:
+                actualiser(conn)
+                scores = calculer(conn)
+                with pd.option_context('display.float_format', '{:,.2f}'.format, 'display.width', 200):
+                    print(resumer(scores, conn, args.devise).to_string(index=False))
+            logger.info(f"Terminé en {time.perf_counter() - debut:.2f} s")
+        finally:
+            conn.close()
+    except (sqlite3.Error, ValueError, KeyError) as e:
+        logger.error(f"Erreur de segmentation: {e}")
+        sys.exit(1)
@@ -0,0 +1,319 @@
+# scripts/service_ecriture.py
+"""Service d'écriture des ventes par validation groupée (group commit)"""
+import argparse
+import logging
+import queue
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date
+from pathlib import Path
+from typing import List, Optional
+
+from base_donnees import DB_PATH, connecter, migrer_schema
+from stock import snapshots_quotidiens
+
+logger = logging.getLogger(__name__)
+
+_ARRET = object()
+
+
+class EcrivainGroupe:
+    """
+    Écrivain unique de la table ventes, alimenté par une file en mémoire.
+
+    Les producteurs (caisses, imports, dashboard) déposent leurs ventes sans
+    jamais ouvrir de transaction. Un thread dédié regroupe les demandes
+    arrivées pendant au plus `delai_max_ms` (ou `taille_lot_max` demandes) et
+    les valide en une seule transaction : un seul fsync par lot, aucun
+    conflit de verrou entre écrivains, et les lecteurs en mode WAL ne sont
+    jamais bloqués. Chaque demande est acquittée après le COMMIT.
+
+    Au premier lot de chaque journée, le thread fige aussi le stock de la
+    veille (snapshots quotidiens du journal de stock).
+    """
+
+    def __init__(self, db_path=DB_PATH, delai_max_ms: float = 5.0, taille_lot_max: int = 1000,
+                 synchrone: str = 'FULL'):
+        self.db_path = db_path
+        self.delai_max = delai_max_ms / 1000
+        self.taille_lot_max = taille_lot_max
+        self.synchrone = synchrone
+        self._file = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self.lots_valides = 0
+        self.ventes_ecrites = 0
+
+    def __enter__(self):
+        self.demarrer()
+        return self
+
+    def __exit__(self, *exc):
+        self.arreter()
+
+    def demarrer(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._boucle, name="ecrivain-ventes", daemon=True)
+        self._thread.start()
+
+    def arreter(self) -> None:
+        """Vide la file puis arrête le thread d'écriture"""
+        if self._thread:
+            self._file.put(_ARRET)
+            self._thread.join()
+            self._thread = None
+
+    def enregistrer(self, vente: dict) -> Future:
+        """
+        Dépose une vente et retourne un Future résolu avec son id après COMMIT.
+
+        Args:
+            vente: produit_id, client_id, quantite, et optionnellement date
+                (défaut: aujourd'hui) et prix_unitaire
+        """
+        futur = Future()
+        self._file.put(([vente], True, futur))
+        return futur
+
+    def enregistrer_ticket(self, ventes: List[dict]) -> Future:
+        """Dépose les lignes d'un même ticket, écrites ensemble ou pas du tout
+
+        Le Future est résolu avec la liste des ids des ventes.
+        """
+        futur = Future()
+        self._file.put((list(ventes), False, futur))
+        return futur
+
+    def enregistrer_sync(self, vente: dict, timeout: Optional[float] = 10.0) -> int:
+        """Dépose une vente et attend son acquittement"""
+        return self.enregistrer(vente).result(timeout=timeout)
+
+    def _collecter_lot(self, premier) -> tuple:
+        """Complète le lot jusqu'à l'échéance ou la taille maximale"""
+        lot = [premier]
+        echeance = time.perf_counter() + self.delai_max
+        while len(lot) < self.taille_lot_max:
+            restant = echeance - time.perf_counter()
+            try:
+                demande = self._file.get(timeout=restant) if restant > 0 else self._file.get_nowait()
+            except queue.Empty:
+                break
+            if demande is _ARRET:
+                return lot, True
+            lot.append(demande)
+        return lot, False
+
+    def _ecrire_vente(self, cursor: sqlite3.Cursor, vente: dict, ticket_id: int) -> int:
+        cursor.execute(
+            """INSERT INTO ventes (produit_id, client_id, date, quantite, prix_unitaire, ticket_id)
+            VALUES (?, ?, ?, ?, ?, ?)""",
+            (vente['produit_id'], vente['client_id'], vente.get('date') or date.today().isoformat(),
+             vente['quantite'], vente.get('prix_unitaire'), ticket_id)
+        )
+        # La sortie de stock est journalisée par trigger dans la même transaction
+        return cursor.lastrowid
+
+    def _valider_lot(self, conn: sqlite3.Connection, lot: List[tuple]) -> None:
+        """Écrit un lot dans une transaction ; une demande invalide n'annule pas les autres"""
+        resultats = []
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for ventes, unique, futur in lot:
+                if not futur.set_running_or_notify_cancel():
+                    continue  # Demande annulée avant son écriture
+                cursor.execute("SAVEPOINT vente")
+                try:
+                    # Un ticket par demande : les lignes d'un encaissement partagent le leur
+                    ticket_id = cursor.execute("INSERT INTO tickets DEFAULT VALUES").lastrowid
+                    ids = [self._ecrire_vente(cursor, vente, ticket_id) for vente in ventes]
+                    resultats.append((futur, ids[0] if unique else ids, None))
+                    cursor.execute("RELEASE vente")
+                except Exception as e:
+                    # Demande invalide (contrainte, champ manquant, type de paramètre...)
+                    cursor.execute("ROLLBACK TO vente")
+                    cursor.execute("RELEASE vente")
+                    resultats.append((futur, None, e))
+            cursor.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            logger.error(f"Échec du lot de {len(lot)} ventes: {e}")
+            for *_, futur in lot:
+                if not futur.done():
+                    futur.set_exception(e)
+            return
+        finally:
+            cursor.close()
+
+        self.lots_valides += 1
+        for futur, ids, erreur in resultats:
+            if erreur is None:
+                self.ventes_ecrites += 1 if isinstance(ids, int) else len(ids)
+                futur.set_result(ids)
+            else:
+                futur.set_exception(erreur)
+
+    def _boucle(self) -> None:
+        conn = connecter(self.db_path)
+        conn.isolation_level = None  # Transactions gérées explicitement
+        conn.execute(f"PRAGMA synchronous={self.synchrone}")
+        try:
+            arret = False
+            jour_snapshots = None
+            while not arret:
+                premier = self._file.get()
+                if premier is _ARRET:
+                    break
+                if jour_snapshots != date.today():
+                    jour_snapshots = date.today()
+                    try:
+                        snapshots_quotidiens(conn)
+                    except sqlite3.Error as e:
+                        logger.warning(f"Snapshots de stock non pris: {e}")
+                lot, arret = self._collecter_lot(premier)
+                try:
+                    self._valider_lot(conn, lot)
+                except Exception as e:
+                    # Erreur imprévue : le lot échoue mais le thread continue de servir la file
+                    logger.exception(f"Échec imprévu du lot de {len(lot)} ventes")
+                    if conn.in_transaction:
+                        conn.rollback()
+                    for *_, futur in lot:
+                        if not futur.done():
+                            futur.set_exception(e)
+        finally:
+            conn.close()
+
+
+# ---- BANC D'ESSAI ----
+def _creer_base_test(db_path: Path) -> None:
+    """Crée une base jetable au schéma de 01_creation_db"""
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+    CREATE TABLE produits (id INTEGER PRIMARY KEY AUTOINCREMENT, nom TEXT NOT NULL, prix REAL NOT NULL);
+    CREATE TABLE clients (id INTEGER PRIMARY KEY AUTOINCREMENT, nom TEXT NOT NULL);
+    CREATE TABLE ventes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        produit_id INTEGER, client_id INTEGER,
+        date TEXT NOT NULL, quantite INTEGER NOT NULL,
+        FOREIGN KEY (produit_id) REFERENCES produits(id),
+        FOREIGN KEY (client_id) REFERENCES clients(id)
+    );
+    INSERT INTO produits (nom, prix) VALUES ('Souris sans fil', 25.99), ('Clavier mécanique', 89.99);
+    INSERT INTO clients (nom) VALUES ('Jean Dupont'), ('Marie Martin');
+    """)
+    migrer_schema(conn)
+    conn.close()
+
+
+def _centile(valeurs: List[float], p: float) -> float:
+    return statistics.quantiles(valeurs, n=100, method='inclusive')[p - 1] if len(valeurs) > 1 else valeurs[0]
+
+
+def banc_essai(db_path: Path, producteurs: int, ventes_par_producteur: int, mode: str,
+               delai_max_ms: float) -> dict:
+    """Mesure débit et latence d'acquittement avec N producteurs concurrents"""
+    latences, erreurs = [], []
+    verrou = threading.Lock()
+    vente = {'produit_id': 1, 'client_id': 1, 'quantite': 1, 'prix_unitaire': 25.99}
+    lectures = []
+    fin_ecritures = threading.Event()
+
+    def lecteur():
+        # Requête type dashboard exécutée en continu pendant les écritures
+        conn = connecter(db_path, lecture_seule=True)
+        while not fin_ecritures.is_set():
+            t = time.perf_counter()
+            conn.execute("SELECT COUNT(*), SUM(quantite) FROM ventes").fetchone()
+            lectures.append(time.perf_counter() - t)
+        conn.close()
+
+    def producteur_groupe(ecrivain):
+        for _ in range(ventes_par_producteur):
+            t = time.perf_counter()
+            try:
+                ecrivain.enregistrer_sync(vente)
+                with verrou:
+                    latences.append(time.perf_counter() - t)
+            except Exception as e:
+                with verrou:
+                    erreurs.append(e)
+
+    def producteur_direct():
+        conn = sqlite3.connect(str(db_path), timeout=5.0)
+        conn.execute("PRAGMA synchronous=FULL")
+        for _ in range(ventes_par_producteur):
+            t = time.perf_counter()
+            try:
+                conn.execute(
+                    "INSERT INTO ventes (produit_id, client_id, date, quantite, prix_unitaire) VALUES (?, ?, ?, ?, ?)",
+                    (1, 1, date.today().isoformat(), 1, 25.99)
+                )
+                conn.commit()
+                with verrou:
+                    latences.append(time.perf_counter() - t)
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                with verrou:
+                    erreurs.append(e)
+        conn.close()
+
+    thread_lecteur = threading.Thread(target=lecteur)
+    thread_lecteur.start()
+    debut = time.perf_counter()
+    if mode == 'groupe':
+        with EcrivainGroupe(db_path, delai_max_ms=delai_max_ms) as ecrivain:
+            threads = [threading.Thread(target=producteur_groupe, args=(ecrivain,)) for _ in range(producteurs)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            lots = ecrivain.lots_valides
+    else:
+        threads = [threading.Thread(target=producteur_direct) for _ in range(producteurs)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        lots = len(latences)
+    duree = time.perf_counter() - debut
+    fin_ecritures.set()
+    thread_lecteur.join()
+
+    return {
+        'mode': mode,
+        'ecritures_par_s': len(latences) / duree,
+        'p50_ms': _centile(latences, 50) * 1000 if latences else float('nan'),
+        'p99_ms': _centile(latences, 99) * 1000 if latences else float('nan'),
+        'transactions': lots,
+        'erreurs': len(erreurs),
+        'lecture_p99_ms': _centile(lectures, 99) * 1000 if lectures else float('nan'),
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Banc d'essai de l'écriture groupée des ventes")
+    parser.add_argument("--producteurs", type=int, default=16)
+    parser.add_argument("--ventes", type=int, default=500, help="Ventes par producteur")
+    parser.add_argument("--delai-ms", type=float, default=5.0, help="Latence maximale de regroupement")
+    args = parser.parse_args()
+
+    print(f"=== {args.producteurs} producteurs x {args.ventes} ventes ===")
+    for mode in ('direct', 'groupe'):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp) / 'bench.db'
+            _creer_base_test(base)
+            r = banc_essai(base, args.producteurs, args.ventes, mode, args.delai_ms)
+        print(
+            f"{r['mode']:>7}: {r['ecritures_par_s']:>9,.0f} écritures/s | "
+            f"acquittement p50 {r['p50_ms']:.2f} ms, p99 {r['p99_ms']:.2f} ms | "
+            f"{r['transactions']} transactions | {r['erreurs']} erreurs | "
+            f"lecture p99 {r['lecture_p99_ms']:.2f} ms"
+        )
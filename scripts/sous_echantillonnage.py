@@ -0,0 +1,115 @@
+# scripts/sous_echantillonnage.py
+"""Réduction des séries temporelles avant affichage (LTTB, min/max par intervalle)"""
+import argparse
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+LARGEUR_GRAPHIQUE = 1200  # Largeur de tracé en pixels : au-delà d'un point par pixel, rien n'est visible
+POINTS_PAR_PIXEL = 50  # Au-delà, la courbe n'est plus qu'une bande verticale par pixel : min/max
+
+
+def lttb(x: np.ndarray, y: np.ndarray, nb_points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets : indices de `nb_points` points conservant
+    l'allure visuelle de la série (pics et creux compris).
+
+    Le premier et le dernier point sont gardés ; entre les deux, chaque
+    intervalle retient le point formant le plus grand triangle avec le point
+    retenu précédent et la moyenne de l'intervalle suivant.
+    """
+    n = len(x)
+    if nb_points >= n or nb_points < 3:
+        return np.arange(n)
+    bornes = np.linspace(1, n - 1, nb_points - 1).astype(np.int64)
+    indices = np.empty(nb_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    precedent = 0
+    for i in range(nb_points - 2):
+        debut, fin = bornes[i], bornes[i + 1]
+        suivant_debut, suivant_fin = fin, bornes[i + 2] if i + 2 < len(bornes) else n
+        x_moy = x[suivant_debut:suivant_fin].mean()
+        y_moy = y[suivant_debut:suivant_fin].mean()
+        aires = np.abs(
+            (x[precedent] - x_moy) * (y[debut:fin] - y[precedent])
+            - (x[precedent] - x[debut:fin]) * (y_moy - y[precedent])
+        )
+        precedent = debut + int(np.argmax(aires))
+        indices[i + 1] = precedent
+    return indices
+
+
+def min_max(y: np.ndarray, nb_points: int) -> np.ndarray:
+    """Indices du minimum et du maximum de chaque intervalle (nb_points / 2 intervalles)"""
+    n = len(y)
+    if nb_points >= n:
+        return np.arange(n)
+    nb_intervalles = max(nb_points // 2, 1)
+    taille = n // nb_intervalles
+    # Intervalles de taille égale vus comme une matrice ; le reste rejoint le dernier
+    blocs = y[:taille * nb_intervalles].reshape(nb_intervalles, taille)
+    decalages = np.arange(nb_intervalles) * taille
+    mins = decalages + blocs.argmin(axis=1)
+    maxs = decalages + blocs.argmax(axis=1)
+    reste = y[taille * nb_intervalles:]
+    if len(reste):
+        base = taille * (nb_intervalles - 1)
+        dernier = y[base:]
+        mins[-1], maxs[-1] = base + dernier.argmin(), base + dernier.argmax()
+    return np.unique(np.concatenate([mins, maxs]))
+
+
+def sous_echantillonner(serie: pd.Series, largeur: int = LARGEUR_GRAPHIQUE, methode: str = 'auto') -> pd.Series:
+    """
+    Réduit une série indexée par date à au plus `largeur` points.
+
+    Args:
+        methode: 'lttb', 'minmax' ou 'auto' (LTTB tant qu'il y a au plus
+            POINTS_PAR_PIXEL points par pixel, pour garder l'allure de la
+            courbe ; min/max au-delà, pour en tracer l'enveloppe exacte)
+    """
+    if len(serie) <= largeur:
+        return serie
+    serie = serie.sort_index()
+    if methode == 'auto':
+        methode = 'lttb' if len(serie) <= POINTS_PAR_PIXEL * largeur else 'minmax'
+    y = serie.to_numpy(dtype=float)
+    if methode == 'lttb':
+        index = serie.index
+        x = index.asi8.astype(float) if isinstance(index, pd.DatetimeIndex) else np.arange(len(serie), dtype=float)
+        indices = lttb(x, y, largeur)
+    elif methode == 'minmax':
+        indices = min_max(y, largeur)
+    else:
+        raise ValueError(f"Méthode inconnue: {methode}")
+    return serie.iloc[indices]
+
+
+def fenetre(serie: pd.Series, debut, fin) -> pd.Series:
+    """Partie de la série comprise dans la fenêtre de zoom [debut, fin]"""
+    return serie.loc[pd.Timestamp(debut):pd.Timestamp(fin)]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Banc d'essai du sous-échantillonnage")
+    parser.add_argument("--points", type=int, default=5_000_000)
+    parser.add_argument("--largeur", type=int, default=LARGEUR_GRAPHIQUE)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    serie = pd.Series(
+        np.cumsum(rng.normal(0, 1, args.points)),
+        index=pd.date_range('2015-01-01', periods=args.points, freq='min')
+    )
+    for methode in ('lttb', 'minmax'):
+        debut = time.perf_counter()
+        reduite = sous_echantillonner(serie, args.largeur, methode)
+        duree = (time.perf_counter() - debut) * 1000
+        print(f"{methode:>6}: {len(serie):,} -> {len(reduite):,} points en {duree:.0f} ms | "
+              f"min {reduite.min():.1f} / {serie.min():.1f}, max {reduite.max():.1f} / {serie.max():.1f} | "
+              f"JSON {len(reduite.to_json()) / 1024:.0f} Ko au lieu de {len(serie.to_json()) / 1024 / 1024:.0f} Mo")
@@ -0,0 +1,224 @@
+# scripts/stock.py
+"""Gestion du stock : journal des mouvements et snapshots périodiques"""
+import argparse
+import logging
+import sqlite3
+import sys
+from datetime import date, timedelta
+from statistics import NormalDist
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from base_donnees import DB_PATH, connecter, migrer_schema, transaction_immediate
+
+logger = logging.getLogger(__name__)
+
+JOUR_MAX = '9999-12-31'
+
+# Stock de chaque produit suivi à une date. Le point de départ est le plus récent
+# du dernier snapshot et du dernier inventaire <= date, complété des mouvements
+# postérieurs (parcours d'index sur (produit_id, date)). Sans l'un ni l'autre, le
+# stock part de 0 au premier mouvement de suivi (réception, ajustement ou
+# inventaire) : les ventes antérieures, enregistrées avant le suivi, sont ignorées.
+_STOCKS_A_DATE = """
+WITH suivis AS (
+    SELECT produit_id, MIN(date) AS debut FROM mouvements_stock
+    WHERE type != 'vente' AND (:produit IS NULL OR produit_id = :produit)
+    GROUP BY produit_id HAVING MIN(date) <= :jour
+),
+reperes AS (
+    SELECT s.produit_id, s.debut,
+        COALESCE((SELECT MAX(date) FROM snapshots_stock
+                  WHERE produit_id = s.produit_id AND date <= :jour), '') AS snapshot,
+        COALESCE((SELECT MAX(date) FROM mouvements_stock
+                  WHERE produit_id = s.produit_id AND type = 'inventaire' AND date <= :jour), '') AS inventaire
+    FROM suivis s
+)
+SELECT
+    r.produit_id,
+    CASE
+        WHEN r.inventaire != '' AND r.inventaire >= r.snapshot THEN (
+            SELECT quantite FROM mouvements_stock
+            WHERE produit_id = r.produit_id AND type = 'inventaire' AND date = r.inventaire
+            ORDER BY id DESC LIMIT 1)
+        WHEN r.snapshot != '' THEN (
+            SELECT stock FROM snapshots_stock WHERE produit_id = r.produit_id AND date = r.snapshot)
+        ELSE 0
+    END + COALESCE((
+        SELECT SUM(m.quantite) FROM mouvements_stock m
+        WHERE m.produit_id = r.produit_id AND m.type != 'inventaire'
+          AND m.date > max(r.snapshot, r.inventaire) AND m.date >= r.debut AND m.date <= :jour
+    ), 0) AS stock
+FROM reperes r
+"""
+
+
+def enregistrer_mouvement(conn: sqlite3.Connection, produit_id: int, quantite: int, type_: str,
+                          jour: Optional[str] = None, commentaire: Optional[str] = None) -> int:
+    """
+    Ajoute une réception (quantité positive), un ajustement (écart signé) ou
+    un inventaire (stock compté en fin de journée, qui remplace le calcul).
+
+    Les sorties liées aux ventes sont journalisées automatiquement par trigger.
+    """
+    if type_ not in ('reception', 'ajustement', 'inventaire'):
+        raise ValueError(f"Type de mouvement manuel invalide: {type_}")
+    if type_ == 'inventaire' and quantite < 0:
+        raise ValueError(f"Stock inventorié négatif: {quantite}")
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO mouvements_stock (produit_id, date, quantite, type, commentaire) VALUES (?, ?, ?, ?, ?)",
+            (produit_id, jour or date.today().isoformat(), quantite, type_, commentaire)
+        )
+    return cursor.lastrowid
+
+
+def stock_a_date(conn: sqlite3.Connection, produit_id: int, jour: str = JOUR_MAX) -> Optional[int]:
+    """Stock d'un produit en fin de journée `jour` (None si le produit n'est pas encore suivi)"""
+    ligne = conn.execute(_STOCKS_A_DATE, {'jour': jour, 'produit': produit_id}).fetchone()
+    return ligne[1] if ligne else None
+
+
+def stocks_a_date(conn: sqlite3.Connection, jour: str = JOUR_MAX) -> Dict[int, int]:
+    """Stock de tous les produits suivis en fin de journée `jour`"""
+    return dict(conn.execute(_STOCKS_A_DATE, {'jour': jour, 'produit': None}).fetchall())
+
+
+def stocks_courants(conn: sqlite3.Connection) -> Dict[int, int]:
+    """Stock actuel de tous les produits suivis"""
+    return stocks_a_date(conn, JOUR_MAX)
+
+
+def prendre_snapshots(conn: sqlite3.Connection, jour: Optional[str] = None) -> int:
+    """
+    Fige le stock de fin de journée de chaque produit suivi.
+
+    Par défaut le snapshot porte sur la veille : les ventes du jour, encore
+    en cours, invalideraient immédiatement un snapshot daté d'aujourd'hui.
+    """
+    jour = jour or (date.today() - timedelta(days=1)).isoformat()
+    with conn:
+        cursor = conn.execute(
+            f"INSERT OR REPLACE INTO snapshots_stock (produit_id, date, stock) "
+            f"SELECT produit_id, :jour, stock FROM ({_STOCKS_A_DATE})",
+            {'jour': jour, 'produit': None}
+        )
+    logger.info(f"{cursor.rowcount} snapshots de stock au {jour}")
+    return cursor.rowcount
+
+
+def snapshots_quotidiens(conn: sqlite3.Connection) -> int:
+    """
+    Fige le stock de la veille des produits qui n'en ont pas encore : appelé
+    au premier lot de chaque journée par l'écrivain des ventes (ou par une
+    tâche planifiée via `stock.py snapshot`), il borne la queue lue à un jour.
+
+    Le contrôle porte sur chaque produit : un mouvement antidaté efface le
+    snapshot de son seul produit, les autres restent en place. Contrôle et
+    insertion forment une transaction (BEGIN IMMEDIATE).
+    """
+    veille = (date.today() - timedelta(days=1)).isoformat()
+    with transaction_immediate(conn):
+        manquant = conn.execute(
+            """SELECT 1 FROM mouvements_stock m WHERE type != 'vente' AND date <= :jour
+            AND NOT EXISTS (SELECT 1 FROM snapshots_stock WHERE produit_id = m.produit_id AND date = :jour)
+            LIMIT 1""",
+            {'jour': veille}
+        ).fetchone()
+        if not manquant:
+            return 0
+        cursor = conn.execute(
+            f"INSERT OR IGNORE INTO snapshots_stock (produit_id, date, stock) "
+            f"SELECT produit_id, :jour, stock FROM ({_STOCKS_A_DATE})",
+            {'jour': veille, 'produit': None}
+        )
+    logger.info(f"{cursor.rowcount} snapshots de stock au {veille}")
+    return cursor.rowcount
+
+
+def points_de_commande(conn: sqlite3.Connection, fenetre_jours: int = 90, delai_jours: int = 7,
+                       niveau_service: float = 0.95) -> pd.DataFrame:
+    """
+    Calcule le point de commande de tous les produits en une passe vectorisée.
+
+    point = demande moyenne x délai + z x écart-type journalier x sqrt(délai),
+    les jours sans vente comptant pour une demande nulle.
+    """
+    debut = (date.today() - timedelta(days=fenetre_jours)).isoformat()
+    ventes = pd.read_sql(
+        """SELECT produit_id, date, -SUM(quantite) AS demande
+        FROM mouvements_stock WHERE type = 'vente' AND date > ?
+        GROUP BY produit_id, date""",
+        conn, params=(debut,)
+    )
+    produits = pd.read_sql("SELECT id AS produit_id, nom FROM produits", conn).set_index('produit_id')
+
+    agregats = ventes.assign(carre=ventes['demande'] ** 2).groupby('produit_id')[['demande', 'carre']].sum()
+    agregats = agregats.reindex(produits.index, fill_value=0)
+    n = fenetre_jours
+    moyenne = agregats['demande'] / n
+    variance = ((agregats['carre'] - n * moyenne ** 2) / (n - 1)).clip(lower=0)
+
+    z = NormalDist().inv_cdf(niveau_service)
+    resultat = produits.assign(
+        demande_jour=moyenne,
+        ecart_type_jour=np.sqrt(variance),
+    )
+    resultat['stock_securite'] = np.ceil(z * resultat['ecart_type_jour'] * np.sqrt(delai_jours))
+    resultat['point_commande'] = np.ceil(resultat['demande_jour'] * delai_jours) + resultat['stock_securite']
+    resultat['stock'] = pd.Series(stocks_courants(conn), dtype='Int64').reindex(resultat.index)
+    resultat['a_commander'] = (resultat['stock'] <= resultat['point_commande']).fillna(False).astype(bool)
+    return resultat.reset_index()
+
+
+def etat_stock(conn: sqlite3.Connection, jour: str = JOUR_MAX) -> pd.DataFrame:
+    """Tableau nom / stock des produits suivis, pour l'affichage"""
+    stocks = stocks_a_date(conn, jour)
+    produits = pd.read_sql("SELECT id AS produit_id, nom FROM produits", conn)
+    produits['stock'] = produits['produit_id'].map(stocks).astype('Int64')
+    return produits.dropna(subset=['stock']).sort_values('stock')
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Gestion du stock")
+    sous = parser.add_subparsers(dest="commande", required=True)
+
+    p = sous.add_parser("mouvement", help="Enregistre une réception, un ajustement ou un inventaire")
+    p.add_argument("produit_id", type=int)
+    p.add_argument("quantite", type=int, help="Quantité reçue, écart, ou stock compté pour un inventaire")
+    p.add_argument("--type", choices=['reception', 'ajustement', 'inventaire'], default='reception')
+    p.add_argument("--date", default=None)
+    p.add_argument("--commentaire", default=None)
+
+    p = sous.add_parser("snapshot", help="Fige le stock de fin de journée (défaut: veille)")
+    p.add_argument("--date", default=None)
+
+    p = sous.add_parser("etat", help="Affiche le stock (défaut: actuel)")
+    p.add_argument("--date", default=JOUR_MAX)
+
+    p = sous.add_parser("reappro", help="Liste les produits sous leur point de commande")
+    p.add_argument("--fenetre", type=int, default=90)
+    p.add_argument("--delai", type=int, default=7)
+    p.add_argument("--service", type=float, default=0.95)
+
+    args = parser.parse_args()
+    conn = connecter(DB_PATH)
+    try:
+        migrer_schema(conn)
+        if args.commande == "mouvement":
+            enregistrer_mouvement(conn, args.produit_id, args.quantite, args.type, args.date, args.commentaire)
+        elif args.commande == "snapshot":
+            prendre_snapshots(conn, args.date)
+        elif args.commande == "etat":
+            print(etat_stock(conn, args.date).to_string(index=False))
+        else:
+            reappro = points_de_commande(conn, args.fenetre, args.delai, args.service)
+            print(reappro[reappro['a_commander']].to_string(index=False))
+    except (sqlite3.Error, ValueError) as e:
+        logger.error(f"Erreur de stock: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,80 @@
+"""Configuration commune des tests : modules de scripts/ et base jetable"""
+
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+
+from base_donnees import connecter, migrer_schema  # noqa: E402
+
+
+def creer_base(db_path: Path) -> sqlite3.Connection:
+    """Base jetable au schéma de 01_creation_db, migrée, avec deux produits et deux clients"""
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = connecter(db_path)
+    conn.executescript("""
+    CREATE TABLE produits (id INTEGER PRIMARY KEY AUTOINCREMENT, nom TEXT NOT NULL, prix REAL NOT NULL);
+    CREATE TABLE clients (id INTEGER PRIMARY KEY AUTOINCREMENT, nom TEXT NOT NULL);
+    CREATE TABLE ventes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        produit_id INTEGER, client_id INTEGER,
+        date TEXT NOT NULL, quantite INTEGER NOT NULL,
+        FOREIGN KEY (produit_id) REFERENCES produits(id),
+        FOREIGN KEY (client_id) REFERENCES clients(id)
+    );
+    """)
+    migrer_schema(conn)
+    with conn:
+        conn.executemany("INSERT INTO produits (nom, prix) VALUES (?, ?)",
+                         [('Souris sans fil', 25.99), ('Clavier mécanique', 89.99)])
+        conn.executemany("INSERT INTO clients (nom) VALUES (?)", [('Jean Dupont',), ('Marie Martin',)])
+    return conn
+
+
+@pytest.fixture
+def db_path(tmp_path) -> Path:
+    """Chemin d'une base jetable créée par creer_base"""
+    chemin = tmp_path / 'ventes.db'
+    creer_base(chemin).close()
+    return chemin
+
+
+@pytest.fixture
+def conn(db_path):
+    """Connexion à la base jetable, fermée en fin de test"""
+    connexion = connecter(db_path)
+    yield connexion
+    connexion.close()
+
+
+def vente_pendant(monkeypatch, module, fonction: str, db_path: Path, vente: tuple) -> threading.Thread:
+    """
+    Remplace `module.fonction` : au premier appel, une autre connexion
+    enregistre `vente` (produit_id, client_id, date, quantite) pendant que
+    l'appelant lit, puis la lecture reprend. Retourne le thread écrivain, à
+    attendre (join) avant de vérifier que la vente n'est pas perdue.
+    """
+    originale = getattr(module, fonction)
+    ecrivain = threading.Thread(target=_enregistrer_vente, args=(db_path, vente))
+
+    def interceptee(*args, **kwargs):
+        if not ecrivain.is_alive() and ecrivain.ident is None:
+            ecrivain.start()
+            ecrivain.join(timeout=0.3)  # Bloqué par le verrou d'écriture de l'appelant, ou déjà validé
+        return originale(*args, **kwargs)
+
+    monkeypatch.setattr(module, fonction, interceptee)
+    return ecrivain
+
+
+def _enregistrer_vente(db_path: Path, vente: tuple) -> None:
+    conn = connecter(db_path)
+    try:
+        with conn:
+            conn.execute("INSERT INTO ventes (produit_id, client_id, date, quantite) VALUES (?, ?, ?, ?)", vente)
+    finally:
+        conn.close()
@@ -0,0 +1,57 @@
+"""Archivage des ventes : aller-retour, fermeture des périodes, regroupement"""
+
+import sqlite3
+
+import pytest
+
+from archives import archiver, attacher, historique_complet, regrouper
+
+VENTES = [(1 + i % 2, 1 + i % 2, f"{2022 + i // 12 % 3}-{1 + i % 12:02d}-{1 + i % 28:02d}", 1 + i % 5)
+          for i in range(360)]
+
+
+def _totaux(conn):
+    return conn.execute("SELECT COUNT(*), SUM(quantite), ROUND(SUM(prix_unitaire * quantite), 6) FROM ventes").fetchone()
+
+
+@pytest.fixture
+def base_remplie(conn):
+    with conn:
+        conn.executemany("INSERT INTO ventes (produit_id, client_id, date, quantite) VALUES (?, ?, ?, ?)", VENTES)
+    return conn
+
+
+def test_aller_retour_mensuel(base_remplie, tmp_path):
+    conn = base_remplie
+    avant = _totaux(conn)
+    periodes = archiver(conn, '2024-01-01', 'mois', dossier=tmp_path / 'archives')
+
+    assert len(periodes) == 24
+    assert conn.execute("SELECT MIN(date) FROM ventes").fetchone()[0] >= '2024-01-01'
+    # 24 archives mensuelles regroupées sous la limite des bases attachables
+    assert len(list((tmp_path / 'archives').glob('*.db'))) <= 8
+    with historique_complet(conn):
+        assert _totaux(conn) == avant
+    with historique_complet(conn, '2022-03-01', '2022-03-31'):
+        assert conn.execute("SELECT COUNT(*) FROM ventes WHERE date LIKE '2022-03%'").fetchone()[0] == \
+            sum(1 for v in VENTES if v[2].startswith('2022-03'))
+
+
+def test_periode_archivee_fermee(base_remplie, tmp_path):
+    conn = base_remplie
+    archiver(conn, '2024-01-01', dossier=tmp_path / 'archives')
+    with pytest.raises(sqlite3.IntegrityError):
+        with conn:
+            conn.execute("INSERT INTO ventes (produit_id, client_id, date, quantite) VALUES (1, 1, '2023-06-01', 1)")
+    with pytest.raises(ValueError):
+        archiver(conn, '2023-01-01', dossier=tmp_path / 'archives')
+
+
+def test_regroupement_conserve_les_ventes(base_remplie, tmp_path):
+    conn = base_remplie
+    avant = _totaux(conn)
+    archiver(conn, '2024-01-01', dossier=tmp_path / 'archives')
+    assert regrouper(conn, maximum=1, dossier=tmp_path / 'archives') == 1
+    assert [p.name for p in (tmp_path / 'archives').glob('*.db')] == ['ventes_2022_2023.db']
+    assert attacher(conn) == ['2022', '2023']
+    assert _totaux(conn) == avant
@@ -0,0 +1,33 @@
+"""Publication des tables entre étapes du pipeline"""
+
+import pandas as pd
+
+from echanges import lire, publier
+
+
+def _table(ca: float) -> pd.DataFrame:
+    return pd.DataFrame({'ca_eur': [ca], 'ca_devise': [ca], 'nb_ventes': [3], 'clients_uniques': [2],
+                         'devise': ['EUR']})
+
+
+def test_republication_remplace_la_version_courante(tmp_path):
+    publier(_table(10.0), 'ca_total', tmp_path)
+    lecteur = lire('ca_total', tmp_path)
+    publier(_table(20.0), 'ca_total', tmp_path)
+
+    assert lire('ca_total', tmp_path)['ca_eur'].tolist() == [20.0]
+    assert lecteur['ca_eur'].tolist() == [10.0]
+    # Le lien et la seule version courante : l'ancienne est supprimée
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_publication_anterieure_sans_lien_remplacee(tmp_path):
+    publier(_table(10.0), 'ca_total', tmp_path)
+    version = (tmp_path / 'ca_total').resolve()
+    (tmp_path / 'ca_total').unlink()
+    version.rename(tmp_path / 'ca_total')
+
+    publier(_table(20.0), 'ca_total', tmp_path)
+    assert (tmp_path / 'ca_total').is_symlink()
+    assert lire('ca_total', tmp_path)['ca_eur'].tolist() == [20.0]
+    assert len(list(tmp_path.iterdir())) == 2
@@ -0,0 +1,57 @@
+"""Esquisses journalières : précision et actualisation incrémentale"""
+
+import numpy as np
+import pytest
+
+import esquisses
+from esquisses import QUANTILES, EsquisseQuantiles, HyperLogLog, actualiser, resume
+from conftest import vente_pendant
+
+
+def test_hyperloglog_dans_l_erreur_annoncee():
+    rng = np.random.default_rng(1)
+    valeurs = rng.choice(10**12, size=200_000, replace=False)
+    hll = HyperLogLog().ajouter(valeurs)
+    assert abs(hll.estimer() / len(valeurs) - 1) < 4 * hll.erreur_relative
+
+    # Fusion : esquisse de l'union, doublons compris
+    moitie = HyperLogLog().ajouter(valeurs[:120_000]).fusionner(HyperLogLog().ajouter(valeurs[80_000:]))
+    assert np.array_equal(moitie.registres, hll.registres)
+    assert HyperLogLog().ajouter(np.arange(50)).estimer() == pytest.approx(50, rel=0.05)
+
+
+def test_quantiles_a_erreur_relative_bornee():
+    rng = np.random.default_rng(2)
+    valeurs = np.concatenate([rng.lognormal(3, 1.5, 100_000), np.zeros(1_000)])
+    esquisse = EsquisseQuantiles().ajouter(valeurs[:60_000]).fusionner(EsquisseQuantiles().ajouter(valeurs[60_000:]))
+    tries = np.sort(valeurs)
+    for q in QUANTILES:
+        exact = tries[int(q * (len(tries) - 1))]
+        assert abs(esquisse.quantile(q) - exact) <= esquisse.erreur * exact + 1e-9
+
+    restituee = EsquisseQuantiles.depuis_octets(esquisse.en_octets())
+    assert [restituee.quantile(q) for q in QUANTILES] == [esquisse.quantile(q) for q in QUANTILES]
+
+
+def test_resume_egal_aux_ventes(conn):
+    with conn:
+        conn.executemany("INSERT INTO ventes (produit_id, client_id, date, quantite) VALUES (?, ?, ?, ?)",
+                         [(1, 1, '2024-01-02', 2), (2, 2, '2024-01-02', 1), (1, 2, '2024-01-03', 4)])
+    assert actualiser(conn) == 2
+    stats = resume(conn)
+    assert stats['nb_ventes'] == 3
+    assert stats['clients_uniques'] == pytest.approx(2, abs=0.1)
+    assert stats['quantite_p50'] == pytest.approx(2, rel=esquisses.ERREUR_QUANTILES)
+
+
+def test_vente_concurrente_non_perdue(monkeypatch, db_path, conn):
+    with conn:
+        conn.execute("INSERT INTO ventes (produit_id, client_id, date, quantite) VALUES (1, 1, '2024-01-02', 1)")
+    ecrivain = vente_pendant(monkeypatch, esquisses, '_esquisser_jours', db_path, (2, 2, '2024-01-02', 1))
+    actualiser(conn)
+    ecrivain.join()
+
+    # La vente validée pendant l'actualisation a laissé son marqueur : elle est comptée ensuite
+    assert conn.execute("SELECT jour FROM esquisses_a_recalculer").fetchall() == [('2024-01-02',)]
+    actualiser(conn)
+    assert resume(conn)['nb_ventes'] == 2
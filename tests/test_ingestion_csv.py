@@ -0,0 +1,29 @@
+"""Clés d'import des exports de caisse"""
+
+import numpy as np
+
+from ingestion_csv import Occurrences, importer_fichier
+
+
+def test_rangs_d_occurrence_continuent_d_un_chunk_a_l_autre():
+    occurrences = Occurrences()
+    assert occurrences.rangs(np.array([5, 3, 5, 5, 1])).tolist() == [0, 0, 1, 2, 0]
+    assert occurrences.rangs(np.array([3, 5, 7, 3])).tolist() == [1, 3, 0, 2]
+
+
+def test_ventes_identiques_sans_ticket_sont_conservees(db_path, conn, tmp_path):
+    export = tmp_path / 'export.csv'
+    export.write_text(
+        "date,produit,client,quantite,prix\n"
+        "2024-01-02,Souris sans fil,Jean Dupont,1,25.99\n"
+        "2024-01-02,Souris sans fil,Jean Dupont,1,25.99\n"
+        "2024-01-02,Clavier mécanique,Jean Dupont,1,89.99\n",
+        encoding='utf-8'
+    )
+    importer_fichier(export, db_path, taille_chunk=1)
+    assert conn.execute("SELECT COUNT(*) FROM ventes").fetchone()[0] == 3
+
+    # Réimport (export qui recoupe le précédent) : mêmes clés, aucune vente en double
+    stats = importer_fichier(export, db_path, taille_chunk=1)
+    assert stats['ecrites'] == 0
+    assert conn.execute("SELECT COUNT(*) FROM ventes").fetchone()[0] == 3
@@ -0,0 +1,104 @@
+"""Équivalence entre les triggers d'insertion de ventes et insertions_en_masse"""
+
+import sqlite3
+
+import pytest
+
+from base_donnees import connecter, insertions_en_masse
+from conftest import creer_base
+
+# (produit_id, client_id, date, quantite, prix_unitaire) : avec et sans client,
+# prix fourni ou complété depuis l'historique, de part et d'autre d'un changement de prix
+VENTES = [
+    (1, 1, '2024-01-02 10:00:00', 2, None),
+    (1, 1, '2024-01-02 10:00:00', 2, None),
+    (2, None, '2024-01-15', 1, None),
+    (2, 2, '2024-02-01', 3, 79.0),
+    (1, 2, '2024-03-10', 1, None),
+    (2, 1, '2024-03-31 23:59:59', 5, None),
+]
+
+# Tables alimentées par les triggers remplacés, hors échantillon (tirage aléatoire)
+TABLES = {
+    'ventes': "SELECT id, produit_id, client_id, date, quantite, prix_unitaire FROM ventes",
+    'mouvements_stock': "SELECT produit_id, date, quantite, type, vente_id FROM mouvements_stock",
+    'strates_echantillon': "SELECT * FROM strates_echantillon",
+    'esquisses_a_recalculer': "SELECT * FROM esquisses_a_recalculer",
+    'palmares_a_recalculer': "SELECT * FROM palmares_a_recalculer",
+    'rfm_a_recalculer': "SELECT * FROM rfm_a_recalculer",
+    'cohortes_a_recalculer': "SELECT * FROM cohortes_a_recalculer",
+}
+
+INSERT = "INSERT INTO ventes (produit_id, client_id, date, quantite, prix_unitaire) VALUES (?, ?, ?, ?, ?)"
+
+
+def _contenu(conn: sqlite3.Connection) -> dict:
+    return {table: sorted(conn.execute(requete).fetchall(), key=repr) for table, requete in TABLES.items()}
+
+
+def _triggers(conn: sqlite3.Connection) -> set:
+    return {nom for (nom,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+
+
+def _preparer(chemin) -> sqlite3.Connection:
+    conn = creer_base(chemin)
+    with conn:
+        conn.execute("INSERT INTO prix_produits VALUES (1, '2024-03-01', 27.5)")
+        conn.execute(INSERT, (1, 1, '2023-12-30', 1, None))  # Vente antérieure, hors du bloc
+    return conn
+
+
+def test_insertion_en_masse_equivaut_aux_triggers(tmp_path):
+    ligne_a_ligne = _preparer(tmp_path / 'triggers.db')
+    en_masse = _preparer(tmp_path / 'masse.db')
+
+    with ligne_a_ligne:
+        ligne_a_ligne.executemany(INSERT, VENTES)
+    with en_masse, insertions_en_masse(en_masse):
+        en_masse.executemany(INSERT, VENTES)
+
+    assert _contenu(en_masse) == _contenu(ligne_a_ligne)
+    assert _triggers(en_masse) == _triggers(ligne_a_ligne)
+    prix = dict(en_masse.execute("SELECT date, prix_unitaire FROM ventes WHERE produit_id = 1"))
+    assert prix['2024-01-02 10:00:00'] == 25.99
+    assert prix['2024-03-10'] == 27.5
+
+    # Échantillon : mêmes colonnes dérivées que le trigger, quel que soit le tirage
+    incoherents = en_masse.execute("""
+        SELECT COUNT(*) FROM echantillon_ventes e JOIN ventes v ON v.id = e.vente_id
+        WHERE e.mois != substr(v.date, 1, 7) OR e.produit_id != v.produit_id
+           OR e.client_id IS NOT v.client_id OR e.montant_eur != v.prix_unitaire * v.quantite
+    """).fetchone()[0]
+    assert incoherents == 0
+    ligne_a_ligne.close()
+    en_masse.close()
+
+
+def test_erreur_dans_le_bloc_retablit_les_triggers(conn):
+    triggers = _triggers(conn)
+    with pytest.raises(ValueError):
+        with conn:
+            conn.execute(INSERT, (1, 1, '2024-01-01', 1, None))
+            with insertions_en_masse(conn):
+                conn.executemany(INSERT, VENTES)
+                raise ValueError("échec de l'appelant")
+    assert _triggers(conn) == triggers
+    assert conn.execute("SELECT COUNT(*) FROM ventes").fetchone()[0] == 0
+
+
+def test_periode_archivee_annule_le_bloc_seulement(conn):
+    triggers = _triggers(conn)
+    with conn:
+        conn.execute("INSERT INTO archives_ventes VALUES ('2023', 'ventes_2023.db', '2023-01-01', '2024-01-01', 0)")
+    with conn:
+        conn.execute(INSERT, (1, 1, '2024-06-01', 1, None))
+        with pytest.raises(sqlite3.IntegrityError):
+            with insertions_en_masse(conn):
+                conn.executemany(INSERT, [(1, 1, '2024-06-02', 1, None), (2, 2, '2023-05-01', 1, None)])
+        assert _triggers(conn) == triggers
+
+    # Seule la vente hors du bloc est validée, avec ses effets de trigger
+    lecteur = connecter(conn.execute("PRAGMA database_list").fetchone()[2])
+    assert lecteur.execute("SELECT date FROM ventes").fetchall() == [('2024-06-01',)]
+    assert lecteur.execute("SELECT COUNT(*) FROM mouvements_stock").fetchone()[0] == 1
+    lecteur.close()
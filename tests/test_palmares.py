@@ -0,0 +1,61 @@
+"""Palmarès top-K : bornes des résumés fusionnés et actualisation incrémentale"""
+
+import numpy as np
+import pandas as pd
+
+import palmares
+from palmares import actualiser, meilleurs
+from conftest import vente_pendant
+
+
+def _ventes_zipf(conn, nb_produits: int = 300, nb_ventes: int = 20_000) -> None:
+    """Ventes de trois mois, CA très inégal entre produits (loi de Zipf)"""
+    rng = np.random.default_rng(3)
+    with conn:
+        conn.executemany("INSERT INTO produits (nom, prix) VALUES (?, ?)",
+                         [(f"Produit {i}", 10.0) for i in range(nb_produits)])
+        produits = np.minimum(rng.zipf(1.3, nb_ventes), nb_produits) + 2  # Ids 3.. : produits ajoutés
+        jours = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 91, nb_ventes), unit='D')
+        conn.executemany(
+            "INSERT INTO ventes (produit_id, client_id, date, quantite, prix_unitaire) VALUES (?, ?, ?, ?, ?)",
+            zip(produits.tolist(), rng.integers(1, 3, nb_ventes).tolist(), jours.strftime('%Y-%m-%d'),
+                rng.integers(1, 5, nb_ventes).tolist(), rng.uniform(1, 50, nb_ventes).round(2).tolist())
+        )
+
+
+def _exact(conn, debut: str, fin: str) -> pd.Series:
+    return pd.read_sql(
+        "SELECT produit_id, SUM(prix_unitaire * quantite) AS ca FROM ventes "
+        "WHERE date >= ? AND date <= ? GROUP BY 1", conn, params=(debut, fin)
+    ).set_index('produit_id')['ca'].sort_values(ascending=False)
+
+
+def test_top_k_borne_et_garanti(conn):
+    _ventes_zipf(conn)
+    actualiser(conn)
+    debut, fin = '2024-01-10', '2024-03-20'  # Mois entamés (journaliers) et mois entier (mensuel)
+    exact = _exact(conn, debut, fin)
+
+    approche = meilleurs(conn, 'produit', debut, fin, k=10, exact_si_incertain=False)
+    assert len(approche) == 10
+    for ligne in approche.itertuples():
+        assert ligne.ca_eur - ligne.erreur - 1e-6 <= exact[ligne.cle] <= ligne.ca_eur + 1e-6
+    garantis = set(approche.loc[approche['garanti'], 'cle'])
+    assert garantis and garantis <= set(exact.index[:10])
+
+    recalcule = meilleurs(conn, 'produit', debut, fin, k=10)
+    assert recalcule['cle'].tolist() == exact.index[:10].tolist()
+    assert np.allclose(recalcule['ca_eur'], exact.iloc[:10])
+
+
+def test_vente_concurrente_non_perdue(monkeypatch, db_path, conn):
+    with conn:
+        conn.execute("INSERT INTO ventes (produit_id, client_id, date, quantite, prix_unitaire) "
+                     "VALUES (1, 1, '2024-01-02', 1, 10.0)")
+    ecrivain = vente_pendant(monkeypatch, palmares, 'totaux_jours', db_path, (2, 2, '2024-01-02', 1))
+    actualiser(conn)
+    ecrivain.join()
+
+    assert conn.execute("SELECT jour FROM palmares_a_recalculer").fetchall() == [('2024-01-02',)]
+    actualiser(conn)
+    assert sorted(meilleurs(conn, 'produit', '2024-01-01', '2024-01-31')['cle']) == [1, 2]
@@ -0,0 +1,45 @@
+"""Historique des prix : prix facturés conservés, ventes à venir valorisées"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from prix_historique import definir_prix
+
+
+def _jour(decalage: int) -> str:
+    return (date.today() + timedelta(days=decalage)).isoformat()
+
+
+@pytest.fixture
+def ventes(conn):
+    """Ventes du produit 1 (25,99) : passée, d'aujourd'hui et à venir"""
+    with conn:
+        conn.executemany("INSERT INTO ventes (produit_id, client_id, date, quantite) VALUES (1, 1, ?, 1)",
+                         [(_jour(-10),), (_jour(0),), (_jour(5),)])
+    return conn
+
+
+def _prix(conn) -> list:
+    return [p for (p,) in conn.execute("SELECT prix_unitaire FROM ventes ORDER BY date")]
+
+
+def test_prix_futur_valorise_seulement_les_ventes_a_venir(ventes):
+    assert _prix(ventes) == [25.99, 25.99, 25.99]
+    definir_prix(ventes, 1, 30.0, _jour(3))
+    assert _prix(ventes) == [25.99, 25.99, 30.0]
+    # Pas encore en vigueur : le prix catalogue ne change pas
+    assert ventes.execute("SELECT prix FROM produits WHERE id = 1").fetchone() == (25.99,)
+
+
+def test_prix_retroactif_garde_les_prix_factures(ventes):
+    definir_prix(ventes, 1, 28.0, _jour(-20))
+    assert _prix(ventes) == [25.99, 25.99, 28.0]
+    assert ventes.execute("SELECT prix FROM produits WHERE id = 1").fetchone() == (28.0,)
+    # Aucune date d'historique ajoutée par le trigger de modification du catalogue
+    assert ventes.execute("SELECT COUNT(*) FROM prix_produits WHERE produit_id = 1").fetchone() == (2,)
+
+
+def test_revalorisation_corrige_les_ventes_passees(ventes):
+    definir_prix(ventes, 1, 28.0, _jour(-20), revaloriser=True)
+    assert _prix(ventes) == [28.0, 28.0, 28.0]
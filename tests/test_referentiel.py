@@ -0,0 +1,25 @@
+"""Cache des noms et annulation des transactions"""
+
+import sqlite3
+
+import pytest
+
+from referentiel import IndexNoms, transaction_referentiel
+
+
+def test_annulation_retire_les_noms_crees_du_cache(conn):
+    produits = IndexNoms(conn, 'produits')
+    with conn:
+        conn.execute("INSERT INTO archives_ventes VALUES ('2023', 'ventes_2023.db', '2023-01-01', '2024-01-01', 0)")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        with transaction_referentiel(conn, produits):
+            ids = produits.resoudre_ou_creer(['Webcam HD'], prix={'Webcam HD': 75.0})
+            conn.execute("INSERT INTO ventes (produit_id, date, quantite) VALUES (?, '2023-06-01', 1)",
+                         (ids['Webcam HD'],))
+    assert produits.resoudre('Webcam HD') is None
+
+    # Le nom est recréé, et l'id du cache est celui de la base
+    with transaction_referentiel(conn, produits):
+        ids = produits.resoudre_ou_creer(['Webcam HD'], prix={'Webcam HD': 75.0})
+    assert conn.execute("SELECT nom FROM produits WHERE id = ?", (ids['Webcam HD'],)).fetchone() == ('Webcam HD',)
@@ -0,0 +1,50 @@
+"""Instantanés de la base et de ses archives"""
+
+import pytest
+
+from archives import archiver, historique_complet
+from conftest import creer_base
+from sauvegarde import elaguer, instantane, restaurer, verifier
+
+
+@pytest.fixture
+def base_archivee(tmp_path):
+    conn = creer_base(tmp_path / 'magasin' / 'ventes.db')
+    with conn:
+        conn.executemany("INSERT INTO ventes (produit_id, client_id, date, quantite) VALUES (1, 1, ?, 1)",
+                         [('2022-05-01',), ('2023-03-01',), ('2023-04-01',), ('2024-02-01',)])
+    archiver(conn, '2024-01-01', dossier=tmp_path / 'magasin' / 'archives')
+    yield conn
+    conn.close()
+
+
+def test_instantane_restaure_ailleurs_avec_ses_archives(base_archivee, tmp_path):
+    assert [c for (c,) in base_archivee.execute("SELECT chemin FROM archives_ventes ORDER BY 1")] == \
+        ['archives/ventes_2022.db', 'archives/ventes_2023.db']
+    archive = instantane(base_archivee, tmp_path / 'sauvegardes')
+    verifier(archive)
+
+    cible = creer_base(tmp_path / 'ailleurs' / 'ventes.db')
+    restaurer(archive, cible)
+    assert sorted(p.name for p in (tmp_path / 'ailleurs' / 'archives').iterdir()) == \
+        ['ventes_2022.db', 'ventes_2023.db']
+    with historique_complet(cible):
+        assert cible.execute("SELECT COUNT(*) FROM ventes").fetchone()[0] == 4
+    cible.close()
+
+
+def test_archive_alteree_invalide_l_instantane(base_archivee, tmp_path):
+    archive = instantane(base_archivee, tmp_path / 'sauvegardes')
+    compressee = next((tmp_path / 'sauvegardes').glob('*.archives/ventes_2022.db.gz'))
+    compressee.write_bytes(compressee.read_bytes() + b'\0')
+    with pytest.raises(ValueError, match='ventes_2022'):
+        verifier(archive)
+
+
+def test_instantanes_rapproches_distincts_et_elagues(base_archivee, tmp_path):
+    dossier = tmp_path / 'sauvegardes'
+    premier, second = instantane(base_archivee, dossier), instantane(base_archivee, dossier)
+    assert premier != second
+    assert elaguer(1, dossier) == [premier]
+    assert sorted(p.name for p in dossier.iterdir()) == \
+        sorted([second.name, second.name + '.sha256', second.name[:-len('.db.gz')] + '.archives'])
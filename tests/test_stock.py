@@ -0,0 +1,25 @@
+"""Snapshots quotidiens du stock"""
+
+from datetime import date, timedelta
+
+from stock import snapshots_quotidiens
+
+
+def _jour(decalage: int) -> str:
+    return (date.today() + timedelta(days=decalage)).isoformat()
+
+
+def test_snapshot_efface_d_un_produit_est_repris(conn):
+    with conn:
+        conn.executemany("INSERT INTO mouvements_stock (produit_id, date, quantite, type) VALUES (?, ?, 10, 'reception')",
+                         [(1, _jour(-3)), (2, _jour(-3))])
+    assert snapshots_quotidiens(conn) == 2
+    assert snapshots_quotidiens(conn) == 0
+
+    # Réception antidatée : seul le snapshot du produit 1 est invalidé
+    with conn:
+        conn.execute("INSERT INTO mouvements_stock (produit_id, date, quantite, type) VALUES (1, ?, 5, 'reception')",
+                     (_jour(-2),))
+    assert snapshots_quotidiens(conn) == 1
+    assert conn.execute("SELECT produit_id, stock FROM snapshots_stock WHERE date = ? ORDER BY produit_id",
+                        (_jour(-1),)).fetchall() == [(1, 15), (2, 10)]